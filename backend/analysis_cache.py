@@ -0,0 +1,126 @@
+"""
+cache دائم لنتائج تحليل المستندات مفهرس بـ SHA-256 لمحتوى الملف
+
+العملاء يعيدون رفع نفس ملفات المحاضرات عند تعديل الخيارات في معالج الطلب،
+فبدلاً من إعادة التحليل في كل مرة: نحسب الـ hash أثناء قراءة الملف على شكل قطع،
+ونبحث في LRU بالذاكرة ثم في جدول document_analysis_cache، ونحلل فقط عند عدم الوجود.
+الدوال متزامنة (قراءة الملف + قاعدة البيانات) وتُشغَّل على مجمع عمال التحليل
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from cache import LRUCache
+from database import SessionLocal
+from document_analysis import analyze_document_isolated
+from models import DocumentAnalysisCache
+
+# نسخة منطق التحليل - تُرفع عند تغيير طريقة العد أو الحقول فتُهمل النتائج القديمة
+ANALYSIS_VERSION = 4
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_memory_cache = LRUCache(max_items=ANALYSIS_CACHE_SIZE)
+
+
+def hash_stream(fp: BinaryIO) -> Tuple[str, int]:
+    """SHA-256 وحجم الملف بقراءته على شكل قطع (بدون تحميله كاملاً في الذاكرة)"""
+    digest = hashlib.sha256()
+    size = 0
+    fp.seek(0)
+    while True:
+        chunk = fp.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    fp.seek(0)
+    return digest.hexdigest(), size
+
+
+def _row_to_result(row: DocumentAnalysisCache) -> Dict[str, Any]:
+    result = {
+        "pages": row.page_count,
+        "page_sizes": row.page_sizes or [],
+        "file_type": row.file_type,
+    }
+    if row.color_pages is not None:
+        result["color"] = row.color_pages
+    if row.page_count_source is not None:
+        result["page_count_source"] = row.page_count_source
+    return result
+
+
+def get_cached_analysis(content_hash: str) -> Optional[Dict[str, Any]]:
+    """البحث في الذاكرة ثم في قاعدة البيانات"""
+    cached = _memory_cache.get(content_hash)
+    if cached is not None:
+        return cached
+
+    db = SessionLocal()
+    try:
+        row = db.query(DocumentAnalysisCache).filter(
+            DocumentAnalysisCache.content_hash == content_hash,
+            DocumentAnalysisCache.analysis_version == ANALYSIS_VERSION
+        ).first()
+        if not row:
+            return None
+        row.hit_count = (row.hit_count or 0) + 1
+        row.last_used_at = datetime.now()
+        db.commit()
+        result = _row_to_result(row)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Analysis cache lookup failed: {e}")
+        return None
+    finally:
+        db.close()
+
+    _memory_cache.set(content_hash, result)
+    return result
+
+
+def store_analysis(content_hash: str, file_size: int, result: Dict[str, Any]) -> None:
+    """حفظ النتيجة في الذاكرة وفي قاعدة البيانات (فشل قاعدة البيانات لا يُفشل التحليل)"""
+    _memory_cache.set(content_hash, result)
+    db = SessionLocal()
+    try:
+        db.merge(DocumentAnalysisCache(
+            content_hash=content_hash,
+            analysis_version=ANALYSIS_VERSION,
+            file_type=result["file_type"],
+            file_size=file_size,
+            page_count=result["pages"],
+            page_sizes=result.get("page_sizes"),
+            color_pages=result.get("color"),
+            page_count_source=result.get("page_count_source"),
+            hit_count=0,
+            last_used_at=datetime.now(),
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed to store analysis cache entry: {e}")
+    finally:
+        db.close()
+
+
+def analyze_document_cached(fp: BinaryIO, suffix: str) -> Dict[str, Any]:
+    """تحليل مستند مع الـ cache - يعيد النتيجة مع content_hash و cached"""
+    content_hash, file_size = hash_stream(fp)
+    suffix = suffix.lower()
+
+    cached = get_cached_analysis(content_hash)
+    if cached is not None and cached["file_type"] == suffix:
+        return {**cached, "content_hash": content_hash, "cached": True}
+
+    result = analyze_document_isolated(fp, suffix)
+    store_analysis(content_hash, file_size, result)
+    return {**result, "content_hash": content_hash, "cached": False}
+
+
+def analyze_local_file_cached(path: str) -> Dict[str, Any]:
+    """تحليل ملف محفوظ على القرص (مرفقات الطلبات) مع الـ cache"""
+    with open(path, "rb") as fp:
+        return analyze_document_cached(fp, os.path.splitext(path)[1])
@@ -0,0 +1,441 @@
+"""
+أرشفة الأقسام الشهرية القديمة من visitor_tracking و page_views إلى ملفات يومية مضغوطة بتخزين عمودي
+
+- كل ليلة (ANALYTICS_ARCHIVE_HOUR) الأقسام التي انتهى شهرها قبل ANALYTICS_ARCHIVE_AFTER_DAYS يوماً،
+  وجمّعت مهمة التجميع كل صفوفها، تُقرأ يوماً بيوم عبر cursor من جهة الخادم (دفعات _FETCH_SIZE)
+  وتُكتب في {table}/{YYYY-MM-DD}.kac ثم يُحذف القسم من قاعدة البيانات (DETACH + DROP)
+- الملف عمودي: ترويسة JSON بمواضع الأعمدة ثم كتلة zlib مستقلة لكل عمود - القراءة تفك الأعمدة المطلوبة فقط
+  الأرقام والأوقات array('q')، النصوص قاموس (القيم المميزة) + أرقام array('i') مثل جداول الأبعاد
+- الصفوف تُكتب بعد فك الأبعاد (page_path، referrer، browser...) فالملف مستقل عن قاعدة البيانات
+- manifest.json يسجل كل ملف (الجدول، اليوم، عدد الصفوف، الحجم) وكل قسم مؤرشف - يُكتب بإعادة تسمية ذرية
+- الأرشفة معطلة ما لم يُضبط ANALYTICS_ARCHIVE_DIR على تخزين دائم (قرص Railway المؤقت يُمسح عند النشر)
+- تعمل على خيطها واتصالها الخاصين (ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT) - تصدير شهر كامل يتجاوز مهلة
+  الـ 30 ثانية لمحرك التحليلات، ولا يجوز أن يحجز خيط الكتابة الوحيد عن تفريغ الدفعات لدقائق
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from analytics_partitions import PARTITIONED_TABLES, list_partitions, month_start, relation_kind
+
+ANALYTICS_ARCHIVE_DIR = os.getenv("ANALYTICS_ARCHIVE_DIR")
+ANALYTICS_ARCHIVE_AFTER_DAYS = int(os.getenv("ANALYTICS_ARCHIVE_AFTER_DAYS", "35"))
+ANALYTICS_ARCHIVE_HOUR = int(os.getenv("ANALYTICS_ARCHIVE_HOUR", "3"))
+# بالمللي ثانية - لكل استعلام في جلسة الأرشفة (تصدير يوم، DETACH)
+ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT = int(os.getenv("ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT", "1800000"))
+
+_FETCH_SIZE = 5000
+_MAGIC = b"KAC1"
+_NULL = -(2 ** 63)
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+INT = "int"
+BOOL = "bool"
+TIME = "time"
+TEXT = "text"
+
+# استعلام التصدير لكل جدول (الأبعاد مفكوكة) وأعمدته بالترتيب
+_EXPORTS: Dict[str, Tuple[str, Sequence[Tuple[str, str]]]] = {
+    "page_views": ("""
+        SELECT f.id, f.visitor_id, f.session_id, p.path, f.time_spent, f.scroll_depth, f.actions::text, f.created_at
+        FROM {partition} f
+        LEFT JOIN analytics_pages p ON p.id = f.page_id
+        WHERE f.created_at >= %s AND f.created_at < %s
+        ORDER BY f.created_at, f.id
+    """, (
+        ("id", INT), ("visitor_id", INT), ("session_id", TEXT), ("page_path", TEXT),
+        ("time_spent", INT), ("scroll_depth", INT), ("actions", TEXT), ("created_at", TIME),
+    )),
+    "visitor_tracking": ("""
+        SELECT f.id, f.session_id, f.user_id, p.path, r.referrer, u.user_agent, u.browser, u.os, u.device_type,
+               f.ip_address, f.country, f.city, f.time_on_page, f.entry_page, f.exit_page, f.visit_count, f.created_at
+        FROM {partition} f
+        LEFT JOIN analytics_pages p ON p.id = f.page_id
+        LEFT JOIN analytics_referrers r ON r.id = f.referrer_id
+        LEFT JOIN analytics_user_agents u ON u.id = f.user_agent_id
+        WHERE f.created_at >= %s AND f.created_at < %s
+        ORDER BY f.created_at, f.id
+    """, (
+        ("id", INT), ("session_id", TEXT), ("user_id", INT), ("page_path", TEXT), ("referrer", TEXT),
+        ("user_agent", TEXT), ("browser", TEXT), ("os", TEXT), ("device_type", TEXT),
+        ("ip_address", TEXT), ("country", TEXT), ("city", TEXT), ("time_on_page", INT),
+        ("entry_page", BOOL), ("exit_page", BOOL), ("visit_count", INT), ("created_at", TIME),
+    )),
+}
+# عمود علامة التجميع في analytics_rollup_state لكل جدول
+_ROLLUP_MARKERS = {"visitor_tracking": "last_visit_id", "page_views": "last_view_id"}
+
+_manifest_lock = threading.Lock()
+_archive_task: Optional[asyncio.Task] = None
+_archive_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics-archive")
+_archive_engine = None
+_engine_lock = threading.Lock()
+archive_status: Dict[str, Any] = {
+    "enabled": bool(ANALYTICS_ARCHIVE_DIR), "last_run_at": None, "last_run_ms": None, "last_error": None,
+}
+
+
+class ArchiveError(ValueError):
+    """ملف أرشيف أو طلب قراءة غير صالح"""
+
+
+# ---------- صيغة الملف ----------
+
+def _encode(kind: str, values: List[Any]) -> bytes:
+    if kind == TEXT:
+        dictionary: Dict[Optional[str], int] = {}
+        codes = array("i", (dictionary.setdefault(value, len(dictionary)) for value in values))
+        words = json.dumps(list(dictionary), ensure_ascii=False).encode("utf-8")
+        return struct.pack("<I", len(words)) + words + codes.tobytes()
+    if kind == BOOL:
+        return array("b", (-1 if value is None else int(value) for value in values)).tobytes()
+    if kind == TIME:
+        return array("q", (_NULL if value is None else (value - _EPOCH) // _MICROSECOND for value in values)).tobytes()
+    return array("q", (_NULL if value is None else value for value in values)).tobytes()
+
+
+def _decode(kind: str, data: bytes, swap: bool) -> List[Any]:
+    if kind == TEXT:
+        (length,) = struct.unpack_from("<I", data)
+        words = json.loads(data[4:4 + length].decode("utf-8"))
+        codes = array("i")
+        codes.frombytes(data[4 + length:])
+        if swap:
+            codes.byteswap()
+        return [words[code] for code in codes]
+    values = array("b" if kind == BOOL else "q")
+    values.frombytes(data)
+    if swap:
+        values.byteswap()
+    if kind == BOOL:
+        return [None if value < 0 else bool(value) for value in values]
+    if kind == TIME:
+        return [None if value == _NULL else _EPOCH + value * _MICROSECOND for value in values]
+    return [None if value == _NULL else value for value in values]
+
+
+def write_day_file(path: str, table: str, day: date, columns: Sequence[Tuple[str, str]], data: Dict[str, List[Any]]) -> int:
+    """كتابة ملف يوم (إلى .tmp ثم إعادة تسمية) - يعيد حجمه بالبايت"""
+    blocks = []
+    header_columns = []
+    offset = 0
+    for name, kind in columns:
+        block = zlib.compress(_encode(kind, data[name]), 6)
+        header_columns.append({"name": name, "type": kind, "offset": offset, "length": len(block)})
+        blocks.append(block)
+        offset += len(block)
+    header = json.dumps({
+        "table": table,
+        "day": day.isoformat(),
+        "rows": len(data[columns[0][0]]) if columns else 0,
+        "byteorder": sys.byteorder,
+        "columns": header_columns,
+    }).encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as handle:
+        handle.write(_MAGIC + struct.pack("<I", len(header)) + header)
+        for block in blocks:
+            handle.write(block)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+    return os.path.getsize(path)
+
+
+def read_day_file(path: str, columns: Optional[Sequence[str]] = None) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """(الترويسة، {العمود: القيم}) - تُفك كتل الأعمدة المطلوبة فقط"""
+    with open(path, "rb") as handle:
+        if handle.read(4) != _MAGIC:
+            raise ArchiveError(f"ليس ملف أرشيف تحليلات: {path}")
+        (length,) = struct.unpack("<I", handle.read(4))
+        header = json.loads(handle.read(length).decode("utf-8"))
+        start = 8 + length
+        swap = header["byteorder"] != sys.byteorder
+        available = {column["name"]: column for column in header["columns"]}
+        unknown = [name for name in columns or () if name not in available]
+        if unknown:
+            raise ArchiveError(f"أعمدة غير موجودة في {header['table']}: {', '.join(unknown)}")
+        data = {}
+        for name in columns or list(available):
+            column = available[name]
+            handle.seek(start + column["offset"])
+            data[name] = _decode(column["type"], zlib.decompress(handle.read(column["length"])), swap)
+    return header, data
+
+
+# ---------- manifest ----------
+
+def _manifest_path() -> str:
+    return os.path.join(ANALYTICS_ARCHIVE_DIR, "manifest.json")
+
+
+def load_manifest() -> Dict[str, Any]:
+    if not ANALYTICS_ARCHIVE_DIR or not os.path.exists(_manifest_path()):
+        return {"files": {}, "partitions": []}
+    with open(_manifest_path(), encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def archived_partitions(table: str) -> Set[str]:
+    """الأقسام المصدّرة بالكامل إلى ملفات الأيام (من الـ manifest) - يمكن حذفها من قاعدة البيانات بأمان"""
+    return {entry["partition"] for entry in load_manifest()["partitions"] if entry["table"] == table}
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    temporary = _manifest_path() + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, ensure_ascii=False, indent=1, sort_keys=True)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, _manifest_path())
+
+
+# ---------- التصدير ----------
+
+def get_archive_engine():
+    """
+    محرك الأرشفة: اتصال جديد لكل تشغيل (NullPool) بمهلة ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT
+    lock_timeout يجعل DETACH يتراجع بدل أن يوقف الكتابة خلفه إذا كان الجدول مشغولاً - يُعاد في الليلة التالية
+    """
+    global _archive_engine
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    from database import DATABASE_URL
+
+    with _engine_lock:
+        if _archive_engine is None:
+            _archive_engine = create_engine(
+                DATABASE_URL,
+                poolclass=NullPool,
+                echo=False,
+                connect_args={
+                    "connect_timeout": 10,
+                    "application_name": "khawam-analytics-archive",
+                    "options": f"-c statement_timeout={ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT} -c lock_timeout=10000",
+                },
+            )
+        return _archive_engine
+
+
+def _export_day(connection, table: str, partition: str, day: date) -> Dict[str, Any]:
+    query, columns = _EXPORTS[table]
+    data: Dict[str, List[Any]] = {name: [] for name, _ in columns}
+    names = [name for name, _ in columns]
+    with connection.cursor(name=f"archive_{partition}") as cursor:
+        cursor.itersize = _FETCH_SIZE
+        cursor.execute(query.format(partition=partition), (day, day + timedelta(days=1)))
+        while True:
+            rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                for name, value in zip(names, row):
+                    data[name].append(value)
+    rows = len(data["id"])
+    entry = {"table": table, "day": day.isoformat(), "rows": rows, "partition": partition}
+    if rows:
+        relative = os.path.join(table, f"{day.isoformat()}.kac")
+        entry.update(
+            path=relative,
+            bytes=write_day_file(os.path.join(ANALYTICS_ARCHIVE_DIR, relative), table, day, columns, data),
+            min_id=min(data["id"]),
+            max_id=max(data["id"]),
+        )
+    return entry
+
+
+def archive_partition(connection, table: str, partition: str, month: date) -> Optional[int]:
+    """
+    تصدير قسم شهري كاملاً ثم حذفه - None إذا لم تُجمّع كل صفوفه بعد (يُعاد في الليلة التالية)
+    الملفات والـ manifest تُكتب قبل الحذف، فتوقف العملية في المنتصف يعيد التصدير فقط ولا يفقد صفوفاً
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MAX(id), COUNT(*) FROM {partition}")
+        max_id, total = cursor.fetchone()
+        cursor.execute(f"SELECT {_ROLLUP_MARKERS[table]} FROM analytics_rollup_state WHERE name = 'analytics'")
+        marker = cursor.fetchone()
+    connection.rollback()
+    if max_id is not None and (marker is None or marker[0] < max_id):
+        return None
+
+    entries = []
+    day = month
+    while day < month_start(month, 1):
+        entries.append(_export_day(connection, table, partition, day))
+        connection.rollback()
+        day += timedelta(days=1)
+    exported = sum(entry["rows"] for entry in entries)
+    if exported != total:
+        raise RuntimeError(f"{partition}: exported {exported} rows but the partition has {total}")
+
+    with _manifest_lock:
+        manifest = load_manifest()
+        for entry in entries:
+            if entry["rows"]:
+                manifest["files"][f"{table}/{entry['day']}"] = entry
+        # قسم صُدّر سابقاً ولم يُحذف (تراجع DETACH) يُسجل مرة واحدة
+        manifest["partitions"] = [
+            entry for entry in manifest["partitions"] if (entry["table"], entry["partition"]) != (table, partition)
+        ]
+        manifest["partitions"].append({
+            "table": table, "partition": partition, "rows": total, "archived_at": datetime.now().isoformat(),
+        })
+        _save_manifest(manifest)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        cursor.execute(f"DROP TABLE {partition}")
+    connection.commit()
+    return total
+
+
+def run_archive(today: Optional[date] = None) -> Dict[str, Dict[str, int]]:
+    """أرشفة كل الأقسام المؤهلة (متزامن - على خيط الأرشفة) - يعيد {الجدول: {القسم: عدد الصفوف}}"""
+    if not ANALYTICS_ARCHIVE_DIR:
+        return {}
+    cutoff = (today or date.today()) - timedelta(days=ANALYTICS_ARCHIVE_AFTER_DAYS)
+    started = time.perf_counter()
+    result: Dict[str, Dict[str, int]] = {}
+    connection = get_archive_engine().raw_connection()
+    try:
+        for table in PARTITIONED_TABLES:
+            with connection.cursor() as cursor:
+                if relation_kind(cursor, table) != "p":
+                    continue
+                partitions = list_partitions(cursor, table)
+            connection.rollback()
+            for partition, month in partitions:
+                if month_start(month, 1) > cutoff:
+                    continue
+                rows = archive_partition(connection, table, partition, month)
+                if rows is not None:
+                    result.setdefault(table, {})[partition] = rows
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    archive_status.update(
+        last_run_at=datetime.now().isoformat(), last_run_ms=round((time.perf_counter() - started) * 1000, 1)
+    )
+    return result
+
+
+# ---------- القراءة ----------
+
+def archived_days(table: str, start: date, end: date) -> List[Dict[str, Any]]:
+    """ملفات الجدول بين يومين (شاملة) من الـ manifest مرتبة"""
+    if table not in _EXPORTS:
+        raise ArchiveError(f"جدول غير مؤرشف: {table}")
+    files = load_manifest()["files"].values()
+    return sorted(
+        (entry for entry in files
+         if entry["table"] == table and start.isoformat() <= entry["day"] <= end.isoformat() and entry.get("path")),
+        key=lambda entry: entry["day"],
+    )
+
+
+def scan_archive(
+    table: str,
+    start: date,
+    end: date,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    صفوف الأرشيف يوماً بيوم كـ dict - ملف واحد في الذاكرة في كل مرة
+    filters: {العمود: القيمة} للمساواة - أعمدة الشرط تُقرأ حتى لو لم تُطلب
+    """
+    filters = filters or {}
+    if table not in _EXPORTS:
+        raise ArchiveError(f"جدول غير مؤرشف: {table}")
+    known = [name for name, _ in _EXPORTS[table][1]]
+    unknown = [name for name in list(columns or ()) + list(filters) if name not in known]
+    if unknown:
+        raise ArchiveError(f"أعمدة غير موجودة في {table}: {', '.join(unknown)}")
+    wanted = list(columns or known)
+    needed = list(dict.fromkeys(wanted + list(filters)))
+    for entry in archived_days(table, start, end):
+        _, data = read_day_file(os.path.join(ANALYTICS_ARCHIVE_DIR, entry["path"]), needed)
+        for index in range(entry["rows"]):
+            if all(data[name][index] == value for name, value in filters.items()):
+                yield {name: data[name][index] for name in wanted}
+
+
+def query_archive(
+    table: str,
+    start: date,
+    end: date,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 1000,
+) -> Dict[str, Any]:
+    """عدد الصفوف المطابقة وأول limit منها - متزامن، على مجمع التحليل"""
+    rows = []
+    matched = 0
+    for row in scan_archive(table, start, end, columns, filters):
+        matched += 1
+        if len(rows) < limit:
+            rows.append({
+                name: value.isoformat() if isinstance(value, datetime) else value for name, value in row.items()
+            })
+    return {"table": table, "matched": matched, "rows": rows, "files": len(archived_days(table, start, end))}
+
+
+# ---------- المهمة الليلية ----------
+
+async def run_in_archive_thread(func, *args) -> Any:
+    """خيط مستقل عن خيط كتابة التحليلات - الأرشفة الطويلة لا تؤخر تفريغ الدفعات"""
+    return await asyncio.get_running_loop().run_in_executor(_archive_pool, partial(func, *args))
+
+
+async def _archive_loop() -> None:
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=ANALYTICS_ARCHIVE_HOUR, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        try:
+            result = await run_in_archive_thread(run_archive)
+            archive_status["last_error"] = None
+            for table, partitions in result.items():
+                print(f"🗄️ Archived {table} partitions: {partitions}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            archive_status["last_error"] = str(e)[:200]
+            print(f"⚠️ Error in analytics archive task: {str(e)[:200]}")
+
+
+def start_archive() -> None:
+    """بدء الأرشفة الليلية (من lifespan في main.py) - فقط إذا ضُبط ANALYTICS_ARCHIVE_DIR"""
+    global _archive_task
+    if ANALYTICS_ARCHIVE_DIR:
+        _archive_task = asyncio.get_running_loop().create_task(_archive_loop())
+
+
+async def stop_archive() -> None:
+    global _archive_task
+    if _archive_task is not None:
+        _archive_task.cancel()
+        try:
+            await _archive_task
+        except asyncio.CancelledError:
+            pass
+        _archive_task = None
+    # أرشفة جارية لا تُنتظر عند الإغلاق - الملفات والـ manifest تُكتب قبل الحذف فتُعاد في التشغيل التالي
+    _archive_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,148 @@
+"""
+تحليل دفعات التتبع المرسلة بـ navigator.sendBeacon
+
+الواجهة تجمع أحداث الجلسة وترسلها في طلب واحد (كل بضع ثوان وعند إخفاء الصفحة) بدلاً من طلب لكل حدث.
+sendBeacon لا يضيف headers مخصصة ويرسل النص كـ text/plain (بدون preflight)، لذلك الجسم يُقرأ خاماً هنا.
+
+الصيغة (مصفوفات بدلاً من كائنات لتصغير الحجم على الجوال):
+    {"sid": "session_...", "now": <وقت الإرسال ms>, "e": [
+        ["v", "/path", "referrer" أو null, flags (1 دخول، 2 خروج), ts],
+        ["p", "/path", time_spent, scroll_depth, ts],
+        ["a", "/path", "اسم الحدث", data أو null, ts]
+    ]}
+ts بتوقيت جهاز الزائر (ms) - يُحوَّل لتوقيت الخادم بالفرق عن now حتى لا تؤثر ساعة الجهاز الخاطئة
+أحداث "a" تُضم إلى actions في مشاهدة نفس الصفحة ضمن الدفعة (أو مشاهدة جديدة إن لم توجد)
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from analytics_ingest import PAGE_VIEW, VISIT
+
+BEACON_MAX_BYTES = int(os.getenv("ANALYTICS_BEACON_MAX_BYTES", str(64 * 1024)))
+BEACON_MAX_EVENTS = int(os.getenv("ANALYTICS_BEACON_MAX_EVENTS", "200"))
+# أقدم حدث مقبول في الدفعة - ما هو أقدم يُسجل بهذا العمر
+BEACON_MAX_AGE_SECONDS = 24 * 3600
+ACTION_DATA_MAX_BYTES = 2048
+
+_FLAG_ENTRY = 1
+_FLAG_EXIT = 2
+
+
+class BeaconError(ValueError):
+    """جسم الدفعة غير صالح كاملاً (وليس حدثاً واحداً فيها)"""
+
+
+def _text(value: Any, max_length: int, required: bool = False) -> Optional[str]:
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value):
+        raise ValueError
+    return value[:max_length]
+
+
+def _count(value: Any, maximum: int) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError
+    return int(min(max(value, 0), maximum))
+
+
+def parse_beacon(
+    body: bytes, visit_defaults: Dict[str, Any], now: Optional[datetime] = None
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], int]:
+    """
+    التحقق من كل الأحداث في مرور واحد وتحويلها لأحداث طابور analytics_ingest
+    visit_defaults: حقول مشتركة لكل زيارات الدفعة (user_agent، browser، os، device_type، ip_address، user_id)
+    يعيد (الأحداث، عدد الأحداث المرفوضة) - الحدث غير الصالح يُتجاهل وحده ولا يُسقط الدفعة
+    """
+    if len(body) > BEACON_MAX_BYTES:
+        raise BeaconError(f"حجم الدفعة أكبر من {BEACON_MAX_BYTES} بايت")
+    try:
+        payload = json.loads(body)
+    except (UnicodeDecodeError, ValueError):
+        raise BeaconError("جسم الدفعة ليس JSON صالحاً")
+    if not isinstance(payload, dict) or not isinstance(payload.get("e"), list):
+        raise BeaconError("الدفعة يجب أن تحتوي sid و e (قائمة الأحداث)")
+    try:
+        session_id = _text(payload.get("sid"), 255, required=True)
+    except ValueError:
+        raise BeaconError("sid مطلوب")
+
+    now = now or datetime.now()
+    client_now = payload.get("now")
+    if isinstance(client_now, bool) or not isinstance(client_now, (int, float)):
+        client_now = None
+
+    raw_events = payload["e"]
+    rejected = max(0, len(raw_events) - BEACON_MAX_EVENTS)
+    events: List[Tuple[str, Dict[str, Any]]] = []
+    page_views: Dict[str, Dict[str, Any]] = {}
+    actions: Dict[str, List[Dict[str, Any]]] = {}
+
+    for raw in raw_events[:BEACON_MAX_EVENTS]:
+        try:
+            if not isinstance(raw, list) or len(raw) < 2:
+                raise ValueError
+            kind = raw[0]
+            page_path = _text(raw[1], 500, required=True)
+            ts = raw[4] if len(raw) > 4 else None
+            created_at = now
+            if client_now is not None and isinstance(ts, (int, float)) and not isinstance(ts, bool):
+                age = min(max((client_now - ts) / 1000, 0), BEACON_MAX_AGE_SECONDS)
+                created_at = now - timedelta(seconds=age)
+
+            if kind == "v":
+                flags = _count(raw[3], 3) if len(raw) > 3 and raw[3] is not None else 0
+                event = dict(visit_defaults)
+                event.update(
+                    session_id=session_id,
+                    page_path=page_path,
+                    referrer=_text(raw[2] if len(raw) > 2 else None, 2000),
+                    entry_page=bool(flags & _FLAG_ENTRY),
+                    exit_page=bool(flags & _FLAG_EXIT),
+                    created_at=created_at,
+                )
+                events.append((VISIT, event))
+            elif kind == "p":
+                event = {
+                    "session_id": session_id,
+                    "page_path": page_path,
+                    "time_spent": _count(raw[2], 86400) if len(raw) > 2 else 0,
+                    "scroll_depth": _count(raw[3], 100) if len(raw) > 3 else 0,
+                    "actions": None,
+                    "created_at": created_at,
+                }
+                events.append((PAGE_VIEW, event))
+                page_views[page_path] = event
+            elif kind == "a":
+                data = raw[3] if len(raw) > 3 else None
+                if data is not None and (
+                    not isinstance(data, dict) or len(json.dumps(data, ensure_ascii=False)) > ACTION_DATA_MAX_BYTES
+                ):
+                    raise ValueError
+                # الحدث يُتحقق منه كاملاً قبل الإضافة - لا تبقى قائمة فارغة لصفحة حدثها مرفوض
+                action = {
+                    "name": _text(raw[2] if len(raw) > 2 else None, 100, required=True),
+                    "data": data,
+                    "at": created_at.isoformat(),
+                }
+                actions.setdefault(page_path, []).append(action)
+            else:
+                raise ValueError
+        except (ValueError, TypeError):
+            rejected += 1
+
+    for page_path, page_actions in actions.items():
+        event = page_views.get(page_path)
+        if event is None:
+            event = {
+                "session_id": session_id,
+                "page_path": page_path,
+                "time_spent": 0,
+                "scroll_depth": 0,
+                "created_at": datetime.fromisoformat(page_actions[-1]["at"]),
+            }
+            events.append((PAGE_VIEW, event))
+        event["actions"] = {"events": page_actions}
+    return events, rejected
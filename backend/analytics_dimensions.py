@@ -0,0 +1,202 @@
+"""
+جداول أبعاد (dimensions) للنصوص المتكررة في أحداث التحليلات
+
+صفوف visitor_tracking و page_views تخزن أرقاماً صغيرة بدلاً من النصوص:
+- page_id → analytics_pages (path)
+- referrer_id → analytics_referrers (referrer)
+- user_agent_id → analytics_user_agents (user_agent, browser, os, device_type) - تحليل المتصفح يُخزن مرة لكل user agent
+
+كل قيمة تُعرّف بـ hash (md5 للقيم مفصولة بـ \\x1f) عليه قيد فريد، فالإدخال المتزامن لنفس القيمة آمن بـ ON CONFLICT.
+أثناء الاستقبال الأرقام تأتي من LRUCache في الذاكرة؛ القيم الجديدة فقط تكلف INSERT + SELECT واحد لكل بعد في الدفعة.
+الأرقام لا تُحذف ولا تتغير، فالذاكرة المؤقتة لا تحتاج إبطالاً.
+"""
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cache import LRUCache
+
+_SEPARATOR = "\x1f"
+_NULL = "\x1e"
+
+
+class Dimension:
+    def __init__(self, table: str, columns: Sequence[str], ddl: str, cache_size: int) -> None:
+        self.table = table
+        self.columns = tuple(columns)
+        self.ddl = ddl
+        self.cache = LRUCache(max_items=cache_size)
+
+    @staticmethod
+    def key(values: Tuple[Optional[str], ...]) -> bytes:
+        joined = _SEPARATOR.join(_NULL if value is None else value for value in values)
+        return hashlib.md5(joined.encode("utf-8")).digest()
+
+    @staticmethod
+    def hash_sql(expressions: Sequence[str]) -> str:
+        """نفس key() في SQL - لتحويل الصفوف القديمة داخل قاعدة البيانات"""
+        parts = ", ".join(f"COALESCE({expression}::text, chr(30))" for expression in expressions)
+        return f"decode(md5(concat_ws(chr(31), {parts})), 'hex')"
+
+    def resolve(self, cursor, values: Iterable[Tuple[Optional[str], ...]]) -> Dict[Tuple[Optional[str], ...], int]:
+        """
+        أرقام القيم (القيم غير الموجودة تُضاف) - لا يحدّث الذاكرة المؤقتة؛
+        remember() بعد commit حتى لا يُحفظ رقم صف تراجعت معاملته
+        """
+        from psycopg2 import Binary
+        from psycopg2.extras import execute_values
+
+        ids: Dict[Tuple[Optional[str], ...], int] = {}
+        missing: Dict[bytes, Tuple[Optional[str], ...]] = {}
+        for value in set(values):
+            cached = self.cache.get(value)
+            if cached is not None:
+                ids[value] = cached
+            else:
+                missing[self.key(value)] = value
+        if not missing:
+            return ids
+
+        execute_values(
+            cursor,
+            f"INSERT INTO {self.table} (hash, {', '.join(self.columns)}) VALUES %s ON CONFLICT (hash) DO NOTHING",
+            [(Binary(key),) + value for key, value in missing.items()],
+            page_size=1000,
+        )
+        cursor.execute(
+            f"SELECT hash, id FROM {self.table} WHERE hash = ANY(%s)", ([Binary(key) for key in missing],)
+        )
+        for key, dimension_id in cursor.fetchall():
+            ids[missing[bytes(key)]] = dimension_id
+        return ids
+
+    def remember(self, ids: Dict[Tuple[Optional[str], ...], int]) -> None:
+        for value, dimension_id in ids.items():
+            self.cache.set(value, dimension_id)
+
+
+pages = Dimension("analytics_pages", ("path",), """
+    CREATE TABLE IF NOT EXISTS analytics_pages (
+        id SERIAL PRIMARY KEY,
+        hash BYTEA NOT NULL UNIQUE,
+        path VARCHAR(500) NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_analytics_pages_path ON analytics_pages(path);
+""", cache_size=20000)
+referrers = Dimension("analytics_referrers", ("referrer",), """
+    CREATE TABLE IF NOT EXISTS analytics_referrers (
+        id SERIAL PRIMARY KEY,
+        hash BYTEA NOT NULL UNIQUE,
+        referrer TEXT NOT NULL
+    );
+""", cache_size=20000)
+user_agents = Dimension("analytics_user_agents", ("user_agent", "browser", "os", "device_type"), """
+    CREATE TABLE IF NOT EXISTS analytics_user_agents (
+        id SERIAL PRIMARY KEY,
+        hash BYTEA NOT NULL UNIQUE,
+        user_agent TEXT,
+        browser VARCHAR(100),
+        os VARCHAR(100),
+        device_type VARCHAR(50)
+    );
+""", cache_size=5000)
+
+DIMENSIONS = (pages, referrers, user_agents)
+
+
+def create_dimension_tables(cursor) -> None:
+    for dimension in DIMENSIONS:
+        cursor.execute(dimension.ddl)
+
+
+def _user_agent_value(visit: Dict[str, Any]) -> Optional[Tuple[Optional[str], ...]]:
+    value = tuple(visit.get(column) for column in user_agents.columns)
+    return value if any(part is not None for part in value) else None
+
+
+def encode_events(connection, visits: List[Dict[str, Any]], page_views: List[Dict[str, Any]]) -> None:
+    """
+    إضافة page_id / referrer_id / user_agent_id لأحداث الدفعة - الأبعاد الجديدة تُكتب في معاملة
+    مستقلة قبل الحقائق، فبعد commit يمكن حفظ أرقامها في الذاكرة بأمان حتى لو فشلت الدفعة نفسها لاحقاً
+    """
+    with connection.cursor() as cursor:
+        page_ids = pages.resolve(cursor, ((event["page_path"],) for event in visits + page_views))
+        referrer_ids = referrers.resolve(
+            cursor, ((visit["referrer"],) for visit in visits if visit.get("referrer"))
+        )
+        agent_ids = user_agents.resolve(
+            cursor, (value for value in map(_user_agent_value, visits) if value is not None)
+        )
+    connection.commit()
+    pages.remember(page_ids)
+    referrers.remember(referrer_ids)
+    user_agents.remember(agent_ids)
+
+    for event in visits + page_views:
+        event["page_id"] = page_ids[(event["page_path"],)]
+    for visit in visits:
+        visit["referrer_id"] = referrer_ids.get((visit.get("referrer"),))
+        agent = _user_agent_value(visit)
+        visit["user_agent_id"] = agent_ids[agent] if agent is not None else None
+
+
+# أعمدة النص القديمة في كل جدول حقائق → (البعد، أعمدة الجدول المقابلة لأعمدة البعد)
+_LEGACY_COLUMNS = {
+    "visitor_tracking": (
+        ("page_id", pages, ("page_path",)),
+        ("referrer_id", referrers, ("referrer",)),
+        ("user_agent_id", user_agents, ("user_agent", "browser", "os", "device_type")),
+    ),
+    "page_views": (
+        ("page_id", pages, ("page_path",)),
+    ),
+}
+
+
+def has_legacy_columns(cursor, table: str) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'page_path'", (table,)
+    )
+    return cursor.fetchone() is not None
+
+
+def encode_legacy_table(connection, table: str) -> bool:
+    """
+    تحويل جدول حقائق بأعمدة نصية (قبل الأبعاد) في معاملة واحدة: إضافة أعمدة الأرقام، ملء الأبعاد
+    من القيم المميزة، تعبئة الأرقام، ثم حذف أعمدة النص - يعيد False إذا كان الجدول محولاً مسبقاً
+    """
+    try:
+        with connection.cursor() as cursor:
+            if not has_legacy_columns(cursor, table):
+                return False
+            create_dimension_tables(cursor)
+            cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            dropped = []
+            for id_column, dimension, source_columns in _LEGACY_COLUMNS[table]:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {id_column} INTEGER")
+                aliased = ", ".join(
+                    f"{source} AS {column}" for source, column in zip(source_columns, dimension.columns)
+                )
+                present = " OR ".join(f"{source} IS NOT NULL" for source in source_columns)
+                cursor.execute(f"""
+                    INSERT INTO {dimension.table} (hash, {', '.join(dimension.columns)})
+                    SELECT {dimension.hash_sql([f"d.{column}" for column in dimension.columns])}, d.*
+                    FROM (SELECT DISTINCT {aliased} FROM {table} WHERE {present}) d
+                    ON CONFLICT (hash) DO NOTHING
+                """)
+                cursor.execute(f"""
+                    UPDATE {table} f SET {id_column} = d.id
+                    FROM {dimension.table} d
+                    WHERE d.hash = {dimension.hash_sql([f"f.{source}" for source in source_columns])}
+                """)
+                dropped.extend(source_columns)
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN page_id SET NOT NULL")
+            for column in dict.fromkeys(dropped):
+                cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {column}")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_page_id ON {table} (page_id)")
+        connection.commit()
+        print(f"✅ {table}: text columns replaced by dimension ids")
+        return True
+    except Exception:
+        connection.rollback()
+        raise
+
@@ -0,0 +1,165 @@
+"""
+محرك القمع (funnel): تحويل مرتب بين خطوات حقيقية في نفس الجلسة بمسح واحد للأحداث
+
+- الأحداث (الزيارات ومشاهدات الصفحات التي تطابق إحدى الخطوات) تُقرأ بترتيب (session_id, created_at)
+  عبر cursor من جهة الخادم (named cursor) - لا تُحمّل كلها في الذاكرة مهما طالت الفترة
+- لكل جلسة نتقدم خطوة فقط عندما تأتي صفحة الخطوة التالية بعد السابقة، فالقمع تسلسلي فعلاً
+- فجوة خمول أطول من ANALYTICS_SESSION_GAP_MINUTES تبدأ جلسة جديدة حتى لو بقي session_id نفسه
+- الخطوة مسار كامل ("/contact") أو بادئة تنتهي بـ * ("/work/*")
+- القمع معرف بالاسم (DEFAULT_FUNNELS أو ANALYTICS_FUNNELS من البيئة كـ JSON) أو بخطوات مباشرة
+- النتيجة تُحفظ لكل (الخطوات، الفترة) وتُعاد حسابها كل FUNNEL_CACHE_SECONDS (exact يتجاوز ذلك)
+- المسح على محرك التحليلات (analytics_ingest.get_analytics_engine) وليس مجمع اتصالات الموقع
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cache import LRUCache
+
+ANALYTICS_SESSION_GAP_MINUTES = int(os.getenv("ANALYTICS_SESSION_GAP_MINUTES", "30"))
+FUNNEL_CACHE_SECONDS = int(os.getenv("FUNNEL_CACHE_SECONDS", "600"))
+FUNNEL_MAX_STEPS = 10
+_FETCH_SIZE = 5000
+
+DEFAULT_FUNNELS: Dict[str, List[str]] = {
+    "main": ["/", "/services", "/portfolio", "/contact", "/orders"],
+    "order": ["/services", "/orders"],
+}
+
+_funnel_cache = LRUCache(max_items=128)
+
+
+class FunnelError(ValueError):
+    """تعريف قمع غير صالح"""
+
+
+def configured_funnels() -> Dict[str, List[str]]:
+    funnels = dict(DEFAULT_FUNNELS)
+    raw = os.getenv("ANALYTICS_FUNNELS")
+    if raw:
+        try:
+            funnels.update({str(name): list(steps) for name, steps in json.loads(raw).items()})
+        except (ValueError, AttributeError, TypeError):
+            print("⚠️ ANALYTICS_FUNNELS is not valid JSON ({name: [steps]}) - using defaults")
+    return funnels
+
+
+def parse_steps(steps: Sequence[str]) -> List[str]:
+    cleaned = [step.strip() for step in steps if step and step.strip()]
+    if len(cleaned) < 2:
+        raise FunnelError("القمع يحتاج خطوتين على الأقل")
+    if len(cleaned) > FUNNEL_MAX_STEPS:
+        raise FunnelError(f"الحد الأقصى {FUNNEL_MAX_STEPS} خطوات")
+    for step in cleaned:
+        if not step.startswith("/") or "*" in step[:-1]:
+            raise FunnelError(f"خطوة غير صالحة: {step} - مسار يبدأ بـ / و * مسموحة في النهاية فقط")
+    return cleaned
+
+
+def _matcher(step: str) -> Callable[[str], bool]:
+    if step.endswith("*"):
+        prefix = step[:-1]
+        return lambda path: path.startswith(prefix)
+    return lambda path: path == step
+
+
+def _path_filter(steps: Sequence[str]) -> Tuple[str, Dict[str, Any]]:
+    """شرط SQL على analytics_pages لصفحات الخطوات - المسح يُحصر بعدها في أرقام هذه الصفحات فقط"""
+    exact = [step for step in steps if not step.endswith("*")]
+    prefixes = [
+        step[:-1].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        for step in steps if step.endswith("*")
+    ]
+    return "(path = ANY(%(exact)s) OR path LIKE ANY(%(prefixes)s))", {"exact": exact, "prefixes": prefixes}
+
+
+def _scan(steps: List[str], start: datetime, end: datetime) -> Dict[str, Any]:
+    """المسح الواحد - متزامن، يعمل على مجمع عمال التحليل"""
+    from analytics_ingest import get_analytics_engine
+
+    condition, params = _path_filter(steps)
+    query = """
+        SELECT session_id, page_id, created_at FROM (
+            SELECT session_id, page_id, created_at FROM visitor_tracking
+            WHERE created_at >= %(start)s AND created_at <= %(end)s AND page_id = ANY(%(page_ids)s)
+            UNION ALL
+            SELECT session_id, page_id, created_at FROM page_views
+            WHERE created_at >= %(start)s AND created_at <= %(end)s AND page_id = ANY(%(page_ids)s)
+        ) events
+        ORDER BY session_id, created_at
+    """
+    matchers = [_matcher(step) for step in steps]
+    counts = [0] * len(steps)
+    seconds = [0.0] * len(steps)
+    gap = timedelta(minutes=ANALYTICS_SESSION_GAP_MINUTES)
+    sessions = events = 0
+    current: Optional[str] = None
+    last_at: Optional[datetime] = None
+    reached = 0
+    reached_at: Optional[datetime] = None
+
+    connection = get_analytics_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id, path FROM analytics_pages WHERE {condition}", params)
+            paths = dict(cursor.fetchall())
+        with connection.cursor(name="funnel_scan") as cursor:
+            cursor.itersize = _FETCH_SIZE
+            cursor.execute(query, {"page_ids": list(paths), "start": start, "end": end})
+            for session_id, page_id, created_at in cursor:
+                page_path = paths[page_id]
+                events += 1
+                if session_id != current or created_at - last_at > gap:
+                    current = session_id
+                    sessions += 1
+                    reached = 0
+                last_at = created_at
+                if reached < len(steps) and matchers[reached](page_path):
+                    counts[reached] += 1
+                    if reached:
+                        seconds[reached] += (created_at - reached_at).total_seconds()
+                    reached_at = created_at
+                    reached += 1
+        connection.rollback()
+    finally:
+        connection.close()
+
+    funnel = []
+    for index, step in enumerate(steps):
+        previous = counts[index - 1] if index else counts[0]
+        funnel.append({
+            "page": step,
+            "visitors": counts[index],
+            "conversion_rate": round(counts[index] / previous * 100, 2) if previous else 0,
+            "from_start_rate": round(counts[index] / counts[0] * 100, 2) if counts[0] else 0,
+            "avg_seconds_from_previous": round(seconds[index] / counts[index], 1) if index and counts[index] else None,
+        })
+    return {"funnel": funnel, "sessions": sessions, "events_scanned": events}
+
+
+async def compute_funnel(
+    steps: List[str], period: timedelta, now: Optional[datetime] = None, exact: bool = False
+) -> Dict[str, Any]:
+    """
+    نتيجة القمع لفترة تنتهي الآن - نهاية الفترة تُقرّب لـ FUNNEL_CACHE_SECONDS
+    حتى تشترك الطلبات المتقاربة في نفس النتيجة المحفوظة
+    exact: الفترة تنتهي الآن بالضبط ويُعاد المسح دون النتيجة المحفوظة (للتدقيق - أبطأ)
+    """
+    from workers import run_in_analysis_pool
+
+    now = now or datetime.now()
+    if exact:
+        start = now - period
+        result = await run_in_analysis_pool(_scan, steps, start, now)
+        result["computed_at"] = datetime.now().isoformat()
+        return {**result, "start": start.isoformat(), "end": now.isoformat(), "exact": True}
+    end = datetime.fromtimestamp(now.timestamp() // FUNNEL_CACHE_SECONDS * FUNNEL_CACHE_SECONDS)
+    start = end - period
+    key = (tuple(steps), start, end)
+    result = _funnel_cache.get(key)
+    if result is None:
+        result = await run_in_analysis_pool(_scan, steps, start, end)
+        result["computed_at"] = datetime.now().isoformat()
+        _funnel_cache.set(key, result)
+    return {**result, "start": start.isoformat(), "end": end.isoformat()}
@@ -0,0 +1,433 @@
+"""
+استقبال أحداث التحليلات (الزيارات ومشاهدات الصفحات) بشكل مخزّن ومجمّع
+
+- المسارات تضع الحدث في طابور محدود في الذاكرة وترد فوراً بـ 202 - بدون أي استعلام أثناء الطلب
+- مهمة خلفية تفرغ الطابور كل ANALYTICS_FLUSH_SECONDS أو عند امتلاء ANALYTICS_BATCH_SIZE حدث
+  بـ INSERT متعدد الصفوف (execute_values) في معاملة واحدة لكل دفعة
+- الكتابة تتم عبر محرك منفصل وخيط واحد، فلا تنافس التحليلات الطلبات على مجمع الاتصالات
+  (اتصال للكتابة والصيانة واتصال لقراءات التحليل الطويلة كمسح القمع)
+- عند امتلاء الطابور تُرفض الأحداث الجديدة وتُعد في dropped بدلاً من إبطاء الموقع
+- الدفعة التي ترفض قاعدة البيانات صفاً فيها تُقسم نصفين حتى يُعزل الصف السيئ وحده،
+  والدفعة التي فشلت بسبب الاتصال تعود لأول الطابور لتُكتب في المحاولة التالية
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import create_engine
+
+from analytics_dimensions import create_dimension_tables, encode_events, has_legacy_columns
+from analytics_partitions import PARTITIONED_TABLES, create_partitioned, ensure_partitions, relation_kind
+from cache import LRUCache
+from database import DATABASE_URL
+from geoip import lookup as geo_lookup
+
+ANALYTICS_QUEUE_MAX = int(os.getenv("ANALYTICS_QUEUE_MAX", "20000"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "2"))
+# اتصال لخيط الكتابة واتصال لمسح القمع (analytics_funnels) - حتى لا ينتظر أحدهما الآخر
+ANALYTICS_DB_POOL_SIZE = int(os.getenv("ANALYTICS_DB_POOL_SIZE", "2"))
+
+VISIT = "visit"
+PAGE_VIEW = "page_view"
+
+# أحداث الطابور تحمل النصوص (page_path، referrer، user_agent...) - تُحوّل لأرقام الأبعاد عند الكتابة
+_VISIT_COLUMNS = (
+    "session_id", "user_id", "page_id", "referrer_id", "user_agent_id",
+    "ip_address", "country", "city", "entry_page", "exit_page", "visit_count", "created_at",
+)
+_PAGE_VIEW_COLUMNS = (
+    "visitor_id", "session_id", "page_id", "time_spent", "scroll_depth", "actions", "created_at",
+)
+
+# user_id يمر عبر LEFT JOIN على users حتى لا يُسقط token قديم لمستخدم محذوف الدفعة كاملة بخطأ FK
+_INSERT_VISITS = """
+    INSERT INTO visitor_tracking (
+        session_id, user_id, page_id, referrer_id, user_agent_id,
+        ip_address, country, city, entry_page, exit_page, visit_count, created_at, updated_at
+    )
+    SELECT v.session_id, u.id, v.page_id, v.referrer_id, v.user_agent_id,
+           v.ip_address, v.country, v.city, v.entry_page, v.exit_page, v.visit_count, v.created_at, v.created_at
+    FROM (VALUES %s) AS v (
+        session_id, user_id, page_id, referrer_id, user_agent_id,
+        ip_address, country, city, entry_page, exit_page, visit_count, created_at
+    )
+    LEFT JOIN users u ON u.id = v.user_id
+    RETURNING id, session_id, created_at
+"""
+_VISIT_TEMPLATE = (
+    "(%s, %s::integer, %s::integer, %s::integer, %s::integer, %s, %s, %s, "
+    "%s::boolean, %s::boolean, %s::integer, %s::timestamp)"
+)
+_INSERT_PAGE_VIEWS = """
+    INSERT INTO page_views (visitor_id, session_id, page_id, time_spent, scroll_depth, actions, created_at)
+    VALUES %s
+"""
+_PAGE_VIEW_TEMPLATE = "(%s, %s, %s, %s, %s, %s::jsonb, %s)"
+
+_analytics_engine = None
+_engine_lock = threading.Lock()
+_tables_ready = False
+
+# خيط واحد للكتابة - الدفعات تُكتب بالترتيب ولا تتزاحم على الاتصال
+_flush_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics")
+
+# آخر visitor_id لكل جلسة - مشاهدات الصفحة تُربط بآخر زيارة لجلستها بدون استعلام في أغلب الحالات
+_session_visitors = LRUCache(max_items=20000)
+
+
+def get_analytics_engine():
+    """محرك خاص بالتحليلات (ANALYTICS_DB_POOL_SIZE اتصال) منفصل عن database.engine"""
+    global _analytics_engine
+    with _engine_lock:
+        if _analytics_engine is None:
+            _analytics_engine = create_engine(
+                DATABASE_URL,
+                pool_pre_ping=True,
+                pool_recycle=300,
+                pool_size=ANALYTICS_DB_POOL_SIZE,
+                max_overflow=0,
+                echo=False,
+                connect_args={
+                    "connect_timeout": 10,
+                    "application_name": "khawam-analytics",
+                    "options": "-c statement_timeout=30000",
+                },
+            )
+        return _analytics_engine
+
+
+async def run_in_analytics_thread(func, *args) -> Any:
+    """تشغيل عمل قاعدة بيانات للتحليلات على خيط الكتابة الوحيد - لا يتزاحم مع تفريغ الدفعات على الاتصال"""
+    return await asyncio.get_running_loop().run_in_executor(_flush_pool, partial(func, *args))
+
+
+class IngestQueue:
+    """طابور أحداث محدود - الإضافة لا تنتظر أبداً، والحدث يُرفض ويُعد إذا كان الطابور ممتلئاً"""
+
+    def __init__(self, max_size: int = ANALYTICS_QUEUE_MAX) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._events: List[Tuple[str, Dict[str, Any]]] = []
+        self.accepted = 0
+        self.dropped = 0
+        # طلبات من زواحف (user_agents.is_bot) رُفضت قبل الطابور
+        self.bots = 0
+        self.flushed = 0
+        self.failed = 0
+        # أحداث أعيدت للطابور بعد فشل الاتصال
+        self.retried = 0
+        self.batches = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def put_many(self, events: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """إضافة أحداث بقفل واحد - يعيد عدد المقبول منها"""
+        events = list(events)
+        with self._lock:
+            room = max(0, self.max_size - len(self._events))
+            accepted = events[:room]
+            self._events.extend(accepted)
+            self.accepted += len(accepted)
+            self.dropped += len(events) - len(accepted)
+        return len(accepted)
+
+    def put_back(self, batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """إعادة دفعة لم تُكتب إلى أول الطابور (بترتيبها) - ما لا يتسع منها يُعد في dropped"""
+        with self._lock:
+            room = max(0, self.max_size - len(self._events))
+            kept = batch[:room]
+            self._events[:0] = kept
+            self.dropped += len(batch) - len(kept)
+        return len(kept)
+
+    def take(self, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            batch, self._events = self._events[:limit], self._events[limit:]
+        return batch
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._events),
+            "max_size": self.max_size,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "bots": self.bots,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "batch_size": ANALYTICS_BATCH_SIZE,
+            "flush_seconds": ANALYTICS_FLUSH_SECONDS,
+            "last_flush_at": datetime.fromtimestamp(self.last_flush_at).isoformat() if self.last_flush_at else None,
+            "last_flush_ms": self.last_flush_ms,
+            "last_error": self.last_error,
+        }
+
+
+ingest_queue = IngestQueue()
+_wakeup: Optional[asyncio.Event] = None
+_flusher_task: Optional[asyncio.Task] = None
+
+
+def enqueue(kind: str, event: Dict[str, Any]) -> bool:
+    return enqueue_many([(kind, event)]) == 1
+
+
+def enqueue_many(events: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    """
+    إضافة أحداث (النوع، الحقول) للطابور - created_at يُضاف هنا إن لم يكن موجوداً
+    حتى يبقى وقت الحدث صحيحاً مهما تأخرت الكتابة
+    """
+    now = datetime.now()
+    stamped = []
+    for kind, event in events:
+        event.setdefault("created_at", now)
+        stamped.append((kind, event))
+    accepted = ingest_queue.put_many(stamped)
+    if _wakeup is not None and len(ingest_queue) >= ANALYTICS_BATCH_SIZE:
+        _wakeup.set()
+    return accepted
+
+
+class AnalyticsMigrationRequired(RuntimeError):
+    """جداول الحقائق ما زالت بأعمدة النص القديمة - التحويل يتم فقط بـ migrate_partition_analytics.py"""
+
+
+def ensure_fact_tables(connection) -> None:
+    """
+    جداول الحقائق والأبعاد جاهزة (إنشاء، شهر حالي) - مرة واحدة لكل عملية
+    تحويل الجداول القديمة (UPDATE كامل + DROP COLUMN تحت قفل حصري) لا يتم هنا أبداً:
+    نتحقق فقط أنه طُبق، وإلا نرفع AnalyticsMigrationRequired
+    """
+    global _tables_ready
+    if _tables_ready:
+        return
+    with connection.cursor() as cursor:
+        create_dimension_tables(cursor)
+        legacy = [table for table in PARTITIONED_TABLES if has_legacy_columns(cursor, table)]
+    connection.commit()
+    if legacy:
+        raise AnalyticsMigrationRequired(
+            f"{', '.join(legacy)} still use text columns - `python migrate_partition_analytics.py` "
+            "(run by start.sh on deploy) has not completed; events are kept queued but not stored"
+        )
+    with connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            kind = relation_kind(cursor, table)
+            if kind is None:
+                print(f"⚠️ Analytics table {table} not found - creating (monthly partitions)...")
+                create_partitioned(cursor, table)
+            elif kind == "p":
+                # جدول أنشأه create_all بدون أقسام - الشهر الحالي يجب أن يوجد قبل أول دفعة
+                ensure_partitions(cursor, table)
+    connection.commit()
+    _tables_ready = True
+
+
+def _write_batch(batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """
+    كتابة دفعة في معاملة واحدة: استعلام لعدد الزيارات السابقة، INSERT للزيارات، واحد للمشاهدات
+    (أرقام الأبعاد تُحل قبلها - من الذاكرة غالباً)
+    """
+    from psycopg2.extras import Json, execute_values
+
+    visits = [event for kind, event in batch if kind == VISIT]
+    page_views = [event for kind, event in batch if kind == PAGE_VIEW]
+
+    connection = get_analytics_engine().raw_connection()
+    try:
+        ensure_fact_tables(connection)
+        encode_events(connection, visits, page_views)
+        with connection.cursor() as cursor:
+            if visits:
+                for visit in visits:
+                    # الدولة والمدينة من جدول النطاقات المحلي - bisect في الذاكرة بدون أي طلب خارجي
+                    if not visit.get("country") and visit.get("ip_address"):
+                        visit["country"], visit["city"] = geo_lookup(visit["ip_address"])
+                sessions = list({visit["session_id"] for visit in visits})
+                cursor.execute(
+                    "SELECT session_id, MAX(visit_count) FROM visitor_tracking "
+                    "WHERE session_id = ANY(%s) GROUP BY session_id",
+                    (sessions,),
+                )
+                counts = {session_id: count or 0 for session_id, count in cursor.fetchall()}
+                rows = []
+                for visit in visits:
+                    counts[visit["session_id"]] = counts.get(visit["session_id"], 0) + 1
+                    visit["visit_count"] = counts[visit["session_id"]]
+                    rows.append(tuple(visit.get(column) for column in _VISIT_COLUMNS))
+                inserted = execute_values(
+                    cursor, _INSERT_VISITS, rows, template=_VISIT_TEMPLATE, page_size=len(rows), fetch=True
+                )
+                latest: Dict[str, Tuple[datetime, int]] = {}
+                for visitor_id, session_id, created_at in inserted:
+                    if session_id not in latest or (created_at, visitor_id) > latest[session_id]:
+                        latest[session_id] = (created_at, visitor_id)
+                for session_id, (_, visitor_id) in latest.items():
+                    _session_visitors.set(session_id, visitor_id)
+
+            if page_views:
+                missing = list({view["session_id"] for view in page_views if view["session_id"] not in _session_visitors})
+                if missing:
+                    cursor.execute(
+                        "SELECT DISTINCT ON (session_id) session_id, id FROM visitor_tracking "
+                        "WHERE session_id = ANY(%s) ORDER BY session_id, created_at DESC, id DESC",
+                        (missing,),
+                    )
+                    for session_id, visitor_id in cursor.fetchall():
+                        _session_visitors.set(session_id, visitor_id)
+                rows = []
+                for view in page_views:
+                    view["visitor_id"] = _session_visitors.get(view["session_id"])
+                    actions = view.get("actions")
+                    # الحدث قد يُكتب مرة ثانية بعد تقسيم دفعة فاشلة
+                    if actions is not None and not isinstance(actions, Json):
+                        view["actions"] = Json(actions)
+                    rows.append(tuple(view.get(column) for column in _PAGE_VIEW_COLUMNS))
+                execute_values(cursor, _INSERT_PAGE_VIEWS, rows, template=_PAGE_VIEW_TEMPLATE, page_size=len(rows))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+class _BatchInterrupted(Exception):
+    """فشل غير متعلق بالبيانات أثناء كتابة دفعة مقسمة - written كُتب فعلاً و remaining لم يُكتب بعد"""
+
+    def __init__(self, cause: Exception, written: int, remaining: List[Tuple[str, Dict[str, Any]]]) -> None:
+        super().__init__(str(cause))
+        self.cause = cause
+        self.written = written
+        self.remaining = remaining
+
+
+def _write_or_split(batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """
+    كتابة دفعة؛ إذا رفضت قاعدة البيانات قيمة فيها (DataError / IntegrityError) تُقسم نصفين ويُكتب
+    كل نصف وحده بالترتيب - صف سيئ واحد يكلف log2(حجم الدفعة) محاولة إضافية ويُسقط وحده
+    يعيد عدد الأحداث المكتوبة؛ أي خطأ آخر يُرفع كـ _BatchInterrupted مع ما لم يُكتب بعد
+    """
+    from psycopg2 import DataError, IntegrityError
+
+    written = 0
+    parts = [batch]
+    while parts:
+        part = parts.pop()
+        try:
+            _write_batch(part)
+            written += len(part)
+        except (DataError, IntegrityError) as e:
+            if len(part) == 1:
+                ingest_queue.failed += 1
+                ingest_queue.last_error = str(e)[:200]
+                print(f"⚠️ Analytics event dropped (rejected by database): {str(e)[:200]}")
+                continue
+            middle = len(part) // 2
+            parts.extend((part[middle:], part[:middle]))
+        except Exception as e:
+            remaining = part + [event for pending in reversed(parts) for event in pending]
+            raise _BatchInterrupted(e, written, remaining) from e
+    return written
+
+
+def flush_once(limit: int = ANALYTICS_BATCH_SIZE) -> int:
+    """كتابة دفعة واحدة (متزامنة) - يعيد عدد الأحداث المكتوبة"""
+    from psycopg2 import OperationalError as DriverOperationalError
+    from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+    batch = ingest_queue.take(limit)
+    if not batch:
+        return 0
+    started = time.perf_counter()
+    try:
+        written = _write_or_split(batch)
+    except _BatchInterrupted as interrupted:
+        error, remaining = interrupted.cause, interrupted.remaining
+        ingest_queue.flushed += interrupted.written
+        ingest_queue.last_error = str(error)[:200]
+        if isinstance(error, (DriverOperationalError, OperationalError, PoolTimeoutError, AnalyticsMigrationRequired)):
+            # قاعدة البيانات غير متاحة مؤقتاً (أو التحويل لم يُشغّل بعد) - ما لم يُكتب يعود لأول الطابور
+            # ويُكتب في الدورة التالية (الطابور محدود: إذا طال الانقطاع تُرفض الأحداث الجديدة كالعادة)
+            ingest_queue.retried += ingest_queue.put_back(remaining)
+            if isinstance(error, AnalyticsMigrationRequired):
+                print(f"❌ Analytics: {len(remaining)} events deferred: {error}")
+            else:
+                print(f"⚠️ Analytics: {len(remaining)} events deferred (database unavailable): {str(error)[:200]}")
+        else:
+            # خطأ غير متوقع (في الكود أو المخطط) - إعادة المحاولة لن تنجح، فالأحداث تُسقط وتُعد
+            ingest_queue.failed += len(remaining)
+            print(f"⚠️ Analytics batch of {len(remaining)} events failed (non-critical): {str(error)[:200]}")
+        return interrupted.written
+    ingest_queue.flushed += written
+    ingest_queue.batches += 1
+    ingest_queue.last_flush_at = time.time()
+    ingest_queue.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+    return written
+
+
+def flush_all() -> int:
+    """تفريغ الطابور كاملاً - عند الإغلاق"""
+    total = 0
+    while len(ingest_queue):
+        queued = len(ingest_queue)
+        total += flush_once()
+        # دفعة أعيدت للطابور (قاعدة البيانات غير متاحة) - لا فائدة من المحاولة الآن
+        if len(ingest_queue) >= queued:
+            break
+    return total
+
+
+async def _flusher_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=ANALYTICS_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            # دفعات متتالية حتى ينزل الطابور عن حجم دفعة كاملة
+            while len(ingest_queue):
+                queued = len(ingest_queue)
+                await run_in_analytics_thread(flush_once)
+                # الدفعة أعيدت للطابور (انقطاع) - ننتظر الدورة التالية بدل تكرار المحاولة فوراً
+                if len(ingest_queue) < ANALYTICS_BATCH_SIZE or len(ingest_queue) >= queued:
+                    break
+        except Exception as e:
+            print(f"⚠️ Error in analytics flusher loop: {e}")
+
+
+def start_flusher() -> None:
+    """بدء مهمة التفريغ الخلفية (من lifespan في main.py)"""
+    global _wakeup, _flusher_task
+    _wakeup = asyncio.Event()
+    _flusher_task = asyncio.get_running_loop().create_task(_flusher_loop())
+    print(f"📊 Analytics ingestion: batches of {ANALYTICS_BATCH_SIZE} every {ANALYTICS_FLUSH_SECONDS}s")
+
+
+async def stop_flusher() -> None:
+    """إيقاف المهمة وكتابة ما بقي في الطابور قبل الإغلاق"""
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+        _flusher_task = None
+    remaining = len(ingest_queue)
+    if remaining:
+        written = await run_in_analytics_thread(flush_all)
+        print(f"📊 Analytics: flushed {written}/{remaining} queued events on shutdown")
+    _flush_pool.shutdown(wait=True)
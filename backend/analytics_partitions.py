@@ -0,0 +1,308 @@
+"""
+تقسيم جداول التحليلات الخام (visitor_tracking، page_views) شهرياً بـ Postgres range partitioning
+
+- كل شهر جدول فرعي ({table}_yYYYYmMM) وجدول {table}_default لما يقع خارج الأشهر المعرفة
+- الاستعلامات بمدى created_at تقرأ أشهرها فقط (partition pruning)
+- مهمة صيانة يومية تنشئ أشهر ANALYTICS_PARTITIONS_AHEAD القادمة مسبقاً، وتحذف الأشهر الأقدم من
+  ANALYTICS_RETENTION_MONTHS بـ DETACH + DROP - عملية على البيانات الوصفية فقط بدلاً من DELETE يضخم الجدول
+  (الإحصاءات تبقى في جداول analytics_rollup)
+- تحويل جدول قديم غير مقسم يتم مرة واحدة بـ convert_to_partitioned (سكربت migrate_partition_analytics.py)
+  لأنه يعيد كتابة الجدول تحت قفل
+
+المفتاح الأساسي يصبح (id, created_at) لأن Postgres يشترط عمود التقسيم في كل قيد فريد، لذلك
+page_views.visitor_id لم يعد مفتاحاً خارجياً (يبقى رقماً يشير للزيارة)
+النصوص المتكررة (الصفحة، المرجع، user agent) أرقام في جداول analytics_dimensions
+"""
+import asyncio
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "13"))
+ANALYTICS_PARTITIONS_AHEAD = int(os.getenv("ANALYTICS_PARTITIONS_AHEAD", "2"))
+ANALYTICS_MAINTENANCE_HOURS = int(os.getenv("ANALYTICS_MAINTENANCE_HOURS", "24"))
+
+PARTITIONED_TABLES = ("visitor_tracking", "page_views")
+
+_COLUMNS = {
+    "visitor_tracking": """
+        id {id_type},
+        session_id VARCHAR(255) NOT NULL,
+        user_id INTEGER REFERENCES users(id),
+        page_id INTEGER NOT NULL,
+        referrer_id INTEGER,
+        user_agent_id INTEGER,
+        ip_address VARCHAR(45),
+        country VARCHAR(100),
+        city VARCHAR(100),
+        time_on_page INTEGER DEFAULT 0,
+        exit_page BOOLEAN DEFAULT FALSE,
+        entry_page BOOLEAN DEFAULT FALSE,
+        visit_count INTEGER DEFAULT 1,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    """,
+    "page_views": """
+        id {id_type},
+        visitor_id INTEGER,
+        session_id VARCHAR(255) NOT NULL,
+        page_id INTEGER NOT NULL,
+        time_spent INTEGER DEFAULT 0,
+        scroll_depth INTEGER DEFAULT 0,
+        actions JSONB,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    """,
+}
+_INDEXES = {
+    "visitor_tracking": ("session_id", "created_at", "user_id"),
+    "page_views": ("session_id", "created_at", "page_id", "visitor_id"),
+}
+_PARTITION_NAME = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def relation_kind(cursor, table: str) -> Optional[str]:
+    """'p' مقسم، 'r' جدول عادي، None غير موجود"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row[0].decode() if isinstance(row[0], bytes) else row[0]
+
+
+def _create_parent(cursor, table: str, name: str, id_type: str) -> None:
+    cursor.execute(
+        f"CREATE TABLE {name} ({_COLUMNS[table].format(id_type=id_type)}) PARTITION BY RANGE (created_at)"
+    )
+    cursor.execute(f"CREATE TABLE {name}_default PARTITION OF {name} DEFAULT")
+
+
+def _finish_parent(cursor, table: str) -> None:
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+    for column in _INDEXES[table]:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+
+def list_partitions(cursor, table: str) -> List[Tuple[str, date]]:
+    """الأشهر الموجودة (الاسم، أول يوم) مرتبة - بدون الجدول الافتراضي"""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+        (table,),
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def _add_month(cursor, table: str, month: date) -> bool:
+    """
+    إنشاء جدول الشهر إن لم يكن موجوداً - صفوف هذا الشهر في الجدول الافتراضي (إن وجدت)
+    تُنقل إليه، لأن Postgres يرفض إنشاء قسم يتداخل مع صفوف في الجدول الافتراضي
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cursor.fetchone()[0]:
+        return False
+    bounds = (month, month_start(month, 1))
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE created_at >= %s AND created_at < %s)", bounds
+    )
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f"CREATE TEMP TABLE analytics_moved ON COMMIT DROP AS "
+            f"SELECT * FROM {table}_default WHERE created_at >= %s AND created_at < %s",
+            bounds,
+        )
+        cursor.execute(f"DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s", bounds)
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM analytics_moved")
+        cursor.execute("DROP TABLE analytics_moved")
+    else:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return True
+
+
+def create_partitioned(cursor, table: str) -> None:
+    """إنشاء جدول مقسم جديد (قاعدة بيانات جديدة) مع أشهر الحالي والقادمة"""
+    _create_parent(cursor, table, table, "SERIAL")
+    _finish_parent(cursor, table)
+    ensure_partitions(cursor, table)
+
+
+def ensure_partitions(cursor, table: str, today: Optional[date] = None) -> List[str]:
+    today = today or date.today()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    created = []
+    for offset in range(ANALYTICS_PARTITIONS_AHEAD + 1):
+        month = month_start(today, offset)
+        if _add_month(cursor, table, month):
+            created.append(partition_name(table, month))
+    return created
+
+
+def apply_retention(cursor, table: str, months: int = ANALYTICS_RETENTION_MONTHS, today: Optional[date] = None) -> List[str]:
+    """
+    حذف الأشهر التي انتهت قبل بداية نافذة الاحتفاظ كاملة
+    مع تفعيل الأرشفة (ANALYTICS_ARCHIVE_DIR) يُحذف فقط ما سجله الـ manifest كمؤرشف -
+    القسم الذي لم تصل إليه الأرشفة بعد (تجميع متأخر، خطأ تصدير) يبقى حتى تُصدّر صفوفه
+    """
+    from analytics_archive import ANALYTICS_ARCHIVE_DIR, archived_partitions
+
+    cutoff = month_start(today or date.today(), -months)
+    archived = archived_partitions(table) if ANALYTICS_ARCHIVE_DIR else None
+    dropped = []
+    for name, month in list_partitions(cursor, table):
+        if month_start(month, 1) <= cutoff:
+            if archived is not None and name not in archived:
+                print(f"⚠️ Analytics retention: {name} is past retention but not archived yet - kept")
+                continue
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(connection, table: str) -> bool:
+    """
+    تحويل جدول عادي موجود إلى جدول مقسم بنفس الاسم والأعمدة والـ sequence في معاملة واحدة:
+    جدول مقسم مؤقت، أشهر تغطي كل البيانات، نسخ الصفوف، حذف القديم، ثم إعادة التسمية
+    يعيد False إذا كان الجدول مقسماً مسبقاً أو غير موجود
+    """
+    new_name = f"{table}_partitioned"
+    try:
+        with connection.cursor() as cursor:
+            if relation_kind(cursor, table) != "r":
+                return False
+            cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+            sequence = cursor.fetchone()[0]
+            id_type = f"INTEGER NOT NULL DEFAULT nextval('{sequence}'::regclass)" if sequence else "SERIAL"
+            _create_parent(cursor, table, new_name, id_type)
+
+            cursor.execute(f"SELECT MIN(created_at) FROM {table}")
+            oldest = cursor.fetchone()[0]
+            month = month_start((oldest or datetime.now()).date())
+            last = month_start(date.today(), ANALYTICS_PARTITIONS_AHEAD)
+            while month <= last:
+                cursor.execute(
+                    f"CREATE TABLE {partition_name(table, month)} PARTITION OF {new_name} FOR VALUES FROM (%s) TO (%s)",
+                    (month, month_start(month, 1)),
+                )
+                month = month_start(month, 1)
+
+            columns = [line.split()[0] for line in _COLUMNS[table].strip().splitlines()]
+            selected = ", ".join(
+                "COALESCE(created_at, CURRENT_TIMESTAMP)" if column == "created_at" else column for column in columns
+            )
+            cursor.execute(f"INSERT INTO {new_name} ({', '.join(columns)}) SELECT {selected} FROM {table}")
+            copied = cursor.rowcount
+            if sequence:
+                # الـ sequence مملوكة للعمود القديم - تُفصل قبل حذف الجدول حتى لا تُحذف معه
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+            # CASCADE يحذف المفتاح الخارجي page_views.visitor_id الذي يشير للجدول القديم
+            cursor.execute(f"DROP TABLE {table} CASCADE")
+            cursor.execute(f"ALTER TABLE {new_name} RENAME TO {table}")
+            cursor.execute(f"ALTER TABLE {new_name}_default RENAME TO {table}_default")
+            _finish_parent(cursor, table)
+            if sequence:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+        connection.commit()
+        print(f"✅ {table}: converted to monthly partitions ({copied} rows)")
+        return True
+    except Exception:
+        connection.rollback()
+        raise
+
+
+partition_status: Dict[str, Any] = {
+    "retention_months": ANALYTICS_RETENTION_MONTHS,
+    "last_run": None,
+    "last_error": None,
+    "partitions": {},
+}
+
+
+def run_maintenance(today: Optional[date] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    إنشاء الأشهر القادمة وتطبيق الاحتفاظ على كل الجداول المقسمة (متزامن - على خيط التحليلات)
+    analytics_session_pages_hourly (صف لكل جلسة وصفحة وساعة) يتبع نفس نافذة الاحتفاظ
+    """
+    from analytics_ingest import get_analytics_engine
+
+    result: Dict[str, Dict[str, List[str]]] = {}
+    partitions: Dict[str, List[str]] = {}
+    connection = get_analytics_engine().raw_connection()
+    try:
+        for table in PARTITIONED_TABLES:
+            with connection.cursor() as cursor:
+                if relation_kind(cursor, table) != "p":
+                    continue
+                result[table] = {
+                    "created": ensure_partitions(cursor, table, today),
+                    "dropped": apply_retention(cursor, table, today=today),
+                }
+                partitions[table] = [name for name, _ in list_partitions(cursor, table)]
+            connection.commit()
+        with connection.cursor() as cursor:
+            if relation_kind(cursor, "analytics_session_pages_hourly") is not None:
+                cutoff = month_start(today or date.today(), -ANALYTICS_RETENTION_MONTHS)
+                cursor.execute("DELETE FROM analytics_session_pages_hourly WHERE bucket < %s", (cutoff,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    partition_status["partitions"] = partitions
+    return result
+
+
+async def _maintenance_loop() -> None:
+    from analytics_ingest import run_in_analytics_thread
+
+    await asyncio.sleep(30)
+    while True:
+        try:
+            result = await run_in_analytics_thread(run_maintenance)
+            for table, changes in result.items():
+                if changes["created"] or changes["dropped"]:
+                    print(f"📅 {table} partitions: created {changes['created']}, dropped {changes['dropped']}")
+            partition_status["last_error"] = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            partition_status["last_error"] = str(e)[:200]
+            print(f"⚠️ Error in analytics partition maintenance: {str(e)[:200]}")
+        partition_status["last_run"] = datetime.now().isoformat()
+        await asyncio.sleep(ANALYTICS_MAINTENANCE_HOURS * 3600)
+
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def start_maintenance() -> None:
+    global _maintenance_task
+    _maintenance_task = asyncio.get_running_loop().create_task(_maintenance_loop())
+
+
+async def stop_maintenance() -> None:
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
@@ -0,0 +1,487 @@
+"""
+جداول تجميع مسبق (rollups) للتحليلات - لوحة التحليلات تقرأ منها بدلاً من مسح الجداول الخام
+
+- analytics_rollup_hourly / analytics_rollup_daily: لكل (ساعة/يوم، صفحة): الزيارات، الدخول، الخروج،
+  المشاهدات، ومجموع وقت البقاء وعمق التمرير (المتوسطات تُحسب من المجاميع)
+- analytics_session_pages_hourly: (ساعة، صفحة، جلسة) مرة واحدة مع flags - للعدّ المميز الدقيق (exact)
+  (1 زيارة في visitor_tracking، 2 صفحة دخول، 4 مشاهدة في page_views)
+- analytics_sketches_hourly / analytics_sketches_daily: مخطط HyperLogLog لجلسات كل (ساعة/يوم، صفحة، نوع)
+  وصفحة '' لكل الموقع - عدد الزوار لأي فترة يأتي من دمج عشرات المخططات بدلاً من COUNT(DISTINCT)
+- مهمة خلفية كل ANALYTICS_ROLLUP_SECONDS تعالج فقط الصفوف الجديدة بعد العلامة (آخر id مُعالج لكل جدول)
+  والتجميع وتحديث العلامة في نفس المعاملة، فلا يُحسب صف مرتين حتى لو توقفت المهمة في المنتصف
+- الصفوف الأحدث من ANALYTICS_ROLLUP_LAG_SECONDS تُترك للدورة التالية حتى تكتمل الدفعات التي ما زالت تُكتب
+- الفترة تُقرأ من الجداول اليومية للأيام الكاملة ومن الساعية لأطرافها - عدد صفوف ثابت مهما كبرت الجداول الخام
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from hyperloglog import HyperLogLog
+
+ANALYTICS_ROLLUP_SECONDS = int(os.getenv("ANALYTICS_ROLLUP_SECONDS", "60"))
+ANALYTICS_ROLLUP_LAG_SECONDS = int(os.getenv("ANALYTICS_ROLLUP_LAG_SECONDS", "120"))
+# أقصى عدد صفوف خام في معاملة واحدة - أول تشغيل على بيانات قديمة يُقسّم على عدة معاملات
+ANALYTICS_ROLLUP_CHUNK = int(os.getenv("ANALYTICS_ROLLUP_CHUNK", "100000"))
+
+FLAG_VISIT = 1
+FLAG_ENTRY = 2
+FLAG_VIEW = 4
+# page_path للمخطط الذي يجمع جلسات كل الصفحات
+ALL_PAGES = ""
+
+PERIODS = {"day": timedelta(days=1), "week": timedelta(days=7), "month": timedelta(days=30)}
+
+_ROLLUP_COLUMNS = """
+        page_path VARCHAR(500) NOT NULL,
+        visits INTEGER NOT NULL DEFAULT 0,
+        entries INTEGER NOT NULL DEFAULT 0,
+        exits INTEGER NOT NULL DEFAULT 0,
+        views INTEGER NOT NULL DEFAULT 0,
+        time_spent BIGINT NOT NULL DEFAULT 0,
+        scroll_depth BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, page_path)
+"""
+_CREATE_TABLES = f"""
+    CREATE TABLE IF NOT EXISTS analytics_rollup_hourly (
+        bucket TIMESTAMP NOT NULL,{_ROLLUP_COLUMNS}
+    );
+    CREATE TABLE IF NOT EXISTS analytics_rollup_daily (
+        bucket TIMESTAMP NOT NULL,{_ROLLUP_COLUMNS}
+    );
+    CREATE TABLE IF NOT EXISTS analytics_session_pages_hourly (
+        bucket TIMESTAMP NOT NULL,
+        page_path VARCHAR(500) NOT NULL,
+        session_id VARCHAR(255) NOT NULL,
+        flags SMALLINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, page_path, session_id)
+    );
+    CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+        name VARCHAR(50) PRIMARY KEY,
+        last_visit_id BIGINT NOT NULL DEFAULT 0,
+        last_view_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO analytics_rollup_state (name) VALUES ('analytics') ON CONFLICT (name) DO NOTHING;
+"""
+_SKETCH_COLUMNS = """
+        bucket TIMESTAMP NOT NULL,
+        page_path VARCHAR(500) NOT NULL,
+        kind SMALLINT NOT NULL,
+        sketch BYTEA NOT NULL,
+        PRIMARY KEY (bucket, page_path, kind)
+"""
+_CREATE_SKETCH_TABLES = f"""
+    CREATE TABLE IF NOT EXISTS analytics_sketches_hourly ({_SKETCH_COLUMNS});
+    CREATE TABLE IF NOT EXISTS analytics_sketches_daily ({_SKETCH_COLUMNS});
+"""
+
+# التجميع الساعي يُحسب مرة واحدة من الصفوف الخام ثم يُجمع منه اليومي - مسح واحد للدفعة
+_ROLLUP_UPSERT = """
+    INSERT INTO {table} AS r (bucket, page_path, {columns})
+    SELECT {bucket}, page_path, {sums} FROM chunk GROUP BY 1, 2
+    ON CONFLICT (bucket, page_path) DO UPDATE SET {updates}
+"""
+
+
+def _rollup_statement(source: str, measures: Dict[str, str]) -> str:
+    columns = ", ".join(measures)
+    sums = ", ".join(f"SUM({name})" for name in measures)
+    updates = ", ".join(f"{name} = r.{name} + EXCLUDED.{name}" for name in measures)
+    hourly = _ROLLUP_UPSERT.format(
+        table="analytics_rollup_hourly", bucket="bucket", columns=columns, sums=sums, updates=updates
+    )
+    daily = _ROLLUP_UPSERT.format(
+        table="analytics_rollup_daily", bucket="date_trunc('day', bucket)", columns=columns, sums=sums, updates=updates
+    )
+    expressions = ", ".join(f"{expression} AS {name}" for name, expression in measures.items())
+    return f"""
+        WITH chunk AS (
+            SELECT c.bucket, p.path AS page_path, {columns}
+            FROM (
+                SELECT date_trunc('hour', created_at) AS bucket, page_id, {expressions}
+                FROM {source}
+                WHERE id > %(low)s AND id <= %(high)s AND created_at IS NOT NULL
+                GROUP BY 1, 2
+            ) c
+            JOIN analytics_pages p ON p.id = c.page_id
+        ), hourly AS ({hourly})
+        {daily}
+    """
+
+
+_VISITS_ROLLUP = _rollup_statement("visitor_tracking", {
+    "visits": "COUNT(*)",
+    "entries": "COUNT(*) FILTER (WHERE entry_page)",
+    "exits": "COUNT(*) FILTER (WHERE exit_page)",
+})
+_VIEWS_ROLLUP = _rollup_statement("page_views", {
+    "views": "COUNT(*)",
+    "time_spent": "COALESCE(SUM(time_spent), 0)",
+    "scroll_depth": "COALESCE(SUM(scroll_depth), 0)",
+})
+_SESSION_ROWS = """
+    SELECT date_trunc('hour', f.created_at), p.path, f.session_id, bit_or({flags})::smallint
+    FROM {source} f
+    JOIN analytics_pages p ON p.id = f.page_id
+    WHERE f.id > %(low)s AND f.id <= %(high)s AND f.created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+_SESSIONS_UPSERT = """
+    INSERT INTO analytics_session_pages_hourly AS s (bucket, page_path, session_id, flags)
+    {rows}
+    ON CONFLICT (bucket, page_path, session_id) DO UPDATE SET flags = s.flags | EXCLUDED.flags
+"""
+_VISIT_SESSION_ROWS = _SESSION_ROWS.format(
+    source="visitor_tracking",
+    flags=f"CASE WHEN entry_page THEN {FLAG_VISIT | FLAG_ENTRY} ELSE {FLAG_VISIT} END",
+)
+_VIEW_SESSION_ROWS = _SESSION_ROWS.format(source="page_views", flags=str(FLAG_VIEW))
+_VISIT_SESSIONS = _SESSIONS_UPSERT.format(rows=_VISIT_SESSION_ROWS)
+_VIEW_SESSIONS = _SESSIONS_UPSERT.format(rows=_VIEW_SESSION_ROWS)
+
+_LOAD_SKETCHES = """
+    SELECT s.bucket, s.page_path, s.kind, s.sketch
+    FROM analytics_sketches_{grain} s
+    JOIN unnest(%s::timestamp[], %s::varchar[], %s::smallint[]) AS k (bucket, page_path, kind)
+      ON k.bucket = s.bucket AND k.page_path = s.page_path AND k.kind = s.kind
+"""
+_SAVE_SKETCHES = """
+    INSERT INTO analytics_sketches_{grain} (bucket, page_path, kind, sketch) VALUES %s
+    ON CONFLICT (bucket, page_path, kind) DO UPDATE SET sketch = EXCLUDED.sketch
+"""
+
+_tables_ready = False
+_rollup_task: Optional[asyncio.Task] = None
+rollup_status: Dict[str, Any] = {
+    "runs": 0, "visits": 0, "views": 0, "last_run_at": None, "last_run_ms": None, "last_error": None,
+}
+
+
+def _ensure_tables(connection) -> None:
+    global _tables_ready
+    if _tables_ready:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(_CREATE_TABLES)
+        cursor.execute("SELECT to_regclass('analytics_sketches_hourly') IS NOT NULL")
+        sketches_exist = cursor.fetchone()[0]
+        cursor.execute(_CREATE_SKETCH_TABLES)
+    connection.commit()
+    if not sketches_exist:
+        _backfill_sketches(connection)
+    _tables_ready = True
+
+
+def _merge_sketches(cursor, rows: Iterable[Tuple[datetime, str, str, int]]) -> int:
+    """
+    إضافة جلسات (ساعة، صفحة، جلسة، flags) إلى المخططات الساعية واليومية لكل صفحة ولكل الموقع
+    المخططات الموجودة تُقرأ باستعلام واحد لكل جدول وتُكتب باستعلام واحد - يعيد عدد المخططات المحدثة
+    """
+    from psycopg2 import Binary
+    from psycopg2.extras import execute_values
+
+    added: Dict[Tuple[str, datetime, str, int], Set[str]] = {}
+    for hour, page_path, session_id, flags in rows:
+        day = hour.replace(hour=0)
+        for kind in (FLAG_VISIT, FLAG_ENTRY, FLAG_VIEW):
+            if not flags & kind:
+                continue
+            for grain, bucket in (("hourly", hour), ("daily", day)):
+                for path in (page_path, ALL_PAGES):
+                    added.setdefault((grain, bucket, path, kind), set()).add(session_id)
+
+    updated = 0
+    for grain in ("hourly", "daily"):
+        keys = [key[1:] for key in added if key[0] == grain]
+        if not keys:
+            continue
+        cursor.execute(_LOAD_SKETCHES.format(grain=grain), (
+            [key[0] for key in keys], [key[1] for key in keys], [key[2] for key in keys],
+        ))
+        existing = {(bucket, page_path, kind): sketch for bucket, page_path, kind, sketch in cursor.fetchall()}
+        values = []
+        for key in keys:
+            sketch = HyperLogLog.from_bytes(bytes(existing[key])) if key in existing else HyperLogLog()
+            sketch.update(added[(grain,) + key])
+            values.append(key + (Binary(sketch.to_bytes()),))
+        execute_values(cursor, _SAVE_SKETCHES.format(grain=grain), values, page_size=1000)
+        updated += len(values)
+    return updated
+
+
+def _backfill_sketches(connection) -> None:
+    """بناء المخططات مرة واحدة من analytics_session_pages_hourly لما جُمّع قبل إضافتها - يوماً بيوم"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT date_trunc('day', bucket) FROM analytics_session_pages_hourly ORDER BY 1")
+        days = [row[0] for row in cursor.fetchall()]
+        for day in days:
+            cursor.execute(
+                "SELECT bucket, page_path, session_id, flags FROM analytics_session_pages_hourly "
+                "WHERE bucket >= %s AND bucket < %s",
+                (day, day + timedelta(days=1)),
+            )
+            _merge_sketches(cursor, cursor.fetchall())
+            connection.commit()
+    if days:
+        print(f"✅ Analytics sketches backfilled for {len(days)} days")
+
+
+def _next_range(cursor, table: str, low: int, cutoff: datetime) -> Tuple[int, int]:
+    """
+    (آخر id يمكن معالجته، عدد الصفوف حتى هناك): حتى ANALYTICS_ROLLUP_CHUNK صف بعد low
+    والتوقف قبل أول صف أحدث من cutoff حتى لا تتجاوزه العلامة فيضيع
+    """
+    cursor.execute(f"""
+        WITH next_rows AS (
+            SELECT id, created_at FROM {table} WHERE id > %(low)s ORDER BY id LIMIT %(limit)s
+        )
+        SELECT COALESCE(MAX(id), %(low)s), COUNT(*) FROM next_rows
+        WHERE id < COALESCE((SELECT MIN(id) FROM next_rows WHERE created_at >= %(cutoff)s), 9223372036854775807)
+    """, {"low": low, "limit": ANALYTICS_ROLLUP_CHUNK, "cutoff": cutoff})
+    return cursor.fetchone()
+
+
+def _rollup_chunk(connection, cutoff: datetime) -> Tuple[int, int]:
+    """معاملة واحدة: قفل العلامة، تجميع الصفوف الجديدة من الجدولين، وتقديم العلامة - يعيد عدد الصفوف"""
+    with connection.cursor() as cursor:
+        # القفل يمنع عمليتين (workers) من تجميع نفس الصفوف مرتين
+        cursor.execute(
+            "SELECT last_visit_id, last_view_id FROM analytics_rollup_state WHERE name = 'analytics' FOR UPDATE"
+        )
+        last_visit_id, last_view_id = cursor.fetchone()
+        cursor.execute(
+            "SELECT to_regclass('visitor_tracking') IS NOT NULL, to_regclass('page_views') IS NOT NULL"
+        )
+        has_visits, has_views = cursor.fetchone()
+        visit_high, visit_rows = (last_visit_id, 0)
+        view_high, view_rows = (last_view_id, 0)
+        if has_visits:
+            visit_high, visit_rows = _next_range(cursor, "visitor_tracking", last_visit_id, cutoff)
+        if has_views:
+            view_high, view_rows = _next_range(cursor, "page_views", last_view_id, cutoff)
+        if visit_rows:
+            params = {"low": last_visit_id, "high": visit_high}
+            cursor.execute(_VISITS_ROLLUP, params)
+            cursor.execute(_VISIT_SESSIONS, params)
+            cursor.execute(_VISIT_SESSION_ROWS, params)
+            _merge_sketches(cursor, cursor.fetchall())
+        if view_rows:
+            params = {"low": last_view_id, "high": view_high}
+            cursor.execute(_VIEWS_ROLLUP, params)
+            cursor.execute(_VIEW_SESSIONS, params)
+            cursor.execute(_VIEW_SESSION_ROWS, params)
+            _merge_sketches(cursor, cursor.fetchall())
+        cursor.execute(
+            "UPDATE analytics_rollup_state SET last_visit_id = %s, last_view_id = %s, updated_at = %s "
+            "WHERE name = 'analytics'",
+            (visit_high, view_high, datetime.now()),
+        )
+    connection.commit()
+    return visit_rows, view_rows
+
+
+def run_rollup() -> Dict[str, int]:
+    """
+    تجميع كل الصفوف الجديدة حتى cutoff (متزامن - يعمل على خيط التحليلات)
+    يعيد عدد الصفوف الخام المُعالجة من كل جدول
+    """
+    from analytics_ingest import ensure_fact_tables, get_analytics_engine
+
+    cutoff = datetime.now() - timedelta(seconds=ANALYTICS_ROLLUP_LAG_SECONDS)
+    started = time.perf_counter()
+    visits = views = 0
+    connection = get_analytics_engine().raw_connection()
+    try:
+        # الصفوف تُربط بـ analytics_pages - يرفع AnalyticsMigrationRequired إذا لم تُحوّل الجداول القديمة
+        ensure_fact_tables(connection)
+        _ensure_tables(connection)
+        while True:
+            chunk_visits, chunk_views = _rollup_chunk(connection, cutoff)
+            visits += chunk_visits
+            views += chunk_views
+            if chunk_visits < ANALYTICS_ROLLUP_CHUNK and chunk_views < ANALYTICS_ROLLUP_CHUNK:
+                break
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    rollup_status.update(
+        runs=rollup_status["runs"] + 1,
+        visits=rollup_status["visits"] + visits,
+        views=rollup_status["views"] + views,
+        last_run_at=datetime.now().isoformat(),
+        last_run_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    return {"visits": visits, "views": views}
+
+
+async def _rollup_loop() -> None:
+    from analytics_ingest import run_in_analytics_thread
+
+    # انتظر قليلاً حتى يكون التطبيق جاهزاً
+    await asyncio.sleep(15)
+    while True:
+        try:
+            result = await run_in_analytics_thread(run_rollup)
+            rollup_status["last_error"] = None
+            if result["visits"] or result["views"]:
+                print(f"📊 Analytics rollup: {result['visits']} visits, {result['views']} page views")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            rollup_status["last_error"] = str(e)[:200]
+            print(f"⚠️ Error in analytics rollup task: {str(e)[:200]}")
+        await asyncio.sleep(ANALYTICS_ROLLUP_SECONDS)
+
+
+def start_rollups() -> None:
+    """بدء مهمة التجميع الخلفية (من lifespan في main.py)"""
+    global _rollup_task
+    _rollup_task = asyncio.get_running_loop().create_task(_rollup_loop())
+
+
+async def stop_rollups() -> None:
+    global _rollup_task
+    if _rollup_task is not None:
+        _rollup_task.cancel()
+        try:
+            await _rollup_task
+        except asyncio.CancelledError:
+            pass
+        _rollup_task = None
+
+
+# ---------------- القراءة (لوحة التحليلات) ----------------
+
+def period_window(period: str, now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """(بداية، نهاية) الفترة - البداية تُقرّب لبداية الساعة لأن أصغر وحدة تجميع هي الساعة"""
+    now = now or datetime.now()
+    start = (now - PERIODS.get(period, PERIODS["day"])).replace(minute=0, second=0, microsecond=0)
+    return start, now
+
+
+def rollups_available(db: Session) -> bool:
+    return bool(db.execute(text(
+        "SELECT to_regclass('analytics_rollup_hourly') IS NOT NULL "
+        "AND to_regclass('analytics_session_pages_hourly') IS NOT NULL "
+        "AND to_regclass('analytics_sketches_daily') IS NOT NULL"
+    )).scalar())
+
+
+def _window_params(start: datetime, end: datetime) -> Dict[str, datetime]:
+    """الأيام الكاملة داخل الفترة تُقرأ من الجدول اليومي، وما قبلها وبعدها من الساعي"""
+    first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if first_day < start:
+        first_day += timedelta(days=1)
+    last_day = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {"start": start, "end": end, "first_day": first_day, "last_day": last_day}
+
+
+_WINDOW_ROWS = """
+    SELECT page_path, visits, entries, exits, views, time_spent, scroll_depth
+    FROM analytics_rollup_daily WHERE bucket >= :first_day AND bucket < :last_day
+    UNION ALL
+    SELECT page_path, visits, entries, exits, views, time_spent, scroll_depth
+    FROM analytics_rollup_hourly
+    WHERE bucket >= :start AND bucket <= :end AND (bucket < :first_day OR bucket >= :last_day)
+"""
+
+
+def page_totals(db: Session, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """مجاميع كل صفحة في الفترة"""
+    rows = db.execute(text(f"""
+        SELECT page_path, SUM(visits), SUM(entries), SUM(exits), SUM(views), SUM(time_spent), SUM(scroll_depth)
+        FROM ({_WINDOW_ROWS}) r
+        GROUP BY page_path
+    """), _window_params(start, end)).fetchall()
+    return [
+        {
+            "page_path": row[0],
+            "visits": int(row[1] or 0),
+            "entries": int(row[2] or 0),
+            "exits": int(row[3] or 0),
+            "views": int(row[4] or 0),
+            "time_spent": int(row[5] or 0),
+            "scroll_depth": int(row[6] or 0),
+        }
+        for row in rows
+    ]
+
+
+def unique_sessions(db: Session, start: datetime, end: datetime, flag: int = FLAG_VISIT) -> int:
+    return db.execute(text("""
+        SELECT COUNT(DISTINCT session_id) FROM analytics_session_pages_hourly
+        WHERE bucket >= :start AND bucket <= :end AND flags & :flag <> 0
+    """), {"start": start, "end": end, "flag": flag}).scalar() or 0
+
+
+def page_sessions(
+    db: Session, paths: Sequence[str], start: datetime, end: datetime
+) -> Dict[str, Dict[str, int]]:
+    """لكل صفحة: عدد الجلسات التي دخلت منها (entered) والتي شاهدتها (viewed) - استعلام واحد لكل الصفحات"""
+    rows = db.execute(text(f"""
+        SELECT page_path,
+               COUNT(DISTINCT session_id) FILTER (WHERE flags & {FLAG_ENTRY} <> 0),
+               COUNT(DISTINCT session_id) FILTER (WHERE flags & {FLAG_VIEW} <> 0)
+        FROM analytics_session_pages_hourly
+        WHERE bucket >= :start AND bucket <= :end AND page_path = ANY(:paths)
+        GROUP BY page_path
+    """), {"start": start, "end": end, "paths": list(paths)}).fetchall()
+    return {row[0]: {"entered": row[1] or 0, "viewed": row[2] or 0} for row in rows}
+
+
+def _sketch_counts(
+    db: Session, start: datetime, end: datetime, kinds: Sequence[int], paths: Optional[Sequence[str]]
+) -> Dict[Tuple[str, int], int]:
+    """
+    دمج مخططات الفترة لكل (صفحة، نوع) - paths=None لكل الصفحات (بدون مخطط الموقع)
+    الصفوف تُقرأ تدفقياً وكل مخطط يُدمج فوراً في مخطط واحد لمفتاحه، فالذاكرة مخطط واحد لكل صفحة
+    مهما طالت الفترة
+    """
+    path_filter = "page_path = ANY(:paths)" if paths is not None else "page_path <> ''"
+    rows = db.execute(text(f"""
+        SELECT page_path, kind, sketch FROM analytics_sketches_daily
+        WHERE bucket >= :first_day AND bucket < :last_day AND kind = ANY(:kinds) AND {path_filter}
+        UNION ALL
+        SELECT page_path, kind, sketch FROM analytics_sketches_hourly
+        WHERE bucket >= :start AND bucket <= :end AND (bucket < :first_day OR bucket >= :last_day)
+          AND kind = ANY(:kinds) AND {path_filter}
+    """).execution_options(stream_results=True), {**_window_params(start, end), "kinds": list(kinds), "paths": list(paths or [])})
+    merged: Dict[Tuple[str, int], HyperLogLog] = {}
+    for page_path, kind, sketch in rows:
+        sketch = HyperLogLog.from_bytes(bytes(sketch))
+        current = merged.get((page_path, kind))
+        if current is None:
+            merged[(page_path, kind)] = sketch
+        else:
+            current.merge(sketch)
+    return {key: sketch.count() for key, sketch in merged.items()}
+
+
+def unique_visitors(db: Session, start: datetime, end: datetime, exact: bool = False) -> int:
+    """عدد الجلسات المميزة في الفترة - تقريبي من المخططات (±1%) أو دقيق (exact) للتدقيق"""
+    if exact:
+        return unique_sessions(db, start, end, FLAG_VISIT)
+    return _sketch_counts(db, start, end, [FLAG_VISIT], [ALL_PAGES]).get((ALL_PAGES, FLAG_VISIT), 0)
+
+
+def page_reach(
+    db: Session, start: datetime, end: datetime, paths: Optional[Sequence[str]] = None, exact: bool = False
+) -> Dict[str, Dict[str, int]]:
+    """لكل صفحة: الجلسات التي دخلت منها (entered) والتي شاهدتها (viewed)"""
+    if exact:
+        if paths is None:
+            paths = [row[0] for row in db.execute(text(
+                "SELECT DISTINCT page_path FROM analytics_session_pages_hourly WHERE bucket >= :start AND bucket <= :end"
+            ), {"start": start, "end": end}).fetchall()]
+        return page_sessions(db, paths, start, end)
+    reach: Dict[str, Dict[str, int]] = {}
+    for (page_path, kind), count in _sketch_counts(db, start, end, [FLAG_ENTRY, FLAG_VIEW], paths).items():
+        reach.setdefault(page_path, {"entered": 0, "viewed": 0})["entered" if kind == FLAG_ENTRY else "viewed"] = count
+    return reach
@@ -0,0 +1,251 @@
+"""
+تجهيز النص العربي للرسم بـ Pillow (الشهادات، الفواتير)
+
+Pillow بدون libraqm يرسم الحروف كما هي: منفصلة ومن اليسار لليمين. لذلك:
+- إذا كانت libraqm متوفرة نتركها تشكّل النص وترتبه (أفضل نتيجة، تدعم التشكيل والخطوط المركبة)
+- وإلا نستخدم arabic_reshaper + python-bidi إن كانتا مثبتتين
+- وإلا مشكّل داخلي بسيط: أشكال الحروف (معزول/أول/وسط/آخر) من Presentation Forms-B
+  مع لام-ألف، ثم ترتيب بصري للنص من اليمين لليسار مع إبقاء الأرقام والكلمات اللاتينية بترتيبها
+الخطوط تُقرأ من FONT_DIR (مجلد fonts بجانب الكود افتراضياً)
+"""
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from PIL import ImageFont, features
+
+FONT_DIR = os.getenv("FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+DEFAULT_FONT = os.getenv("DEFAULT_FONT", "Amiri-Regular.ttf")
+DEFAULT_BOLD_FONT = os.getenv("DEFAULT_BOLD_FONT", "Amiri-Bold.ttf")
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+RAQM_AVAILABLE = features.check("raqm")
+
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    RESHAPER_AVAILABLE = True
+except ImportError:
+    RESHAPER_AVAILABLE = False
+
+# الحرف: (أول شكل في Presentation Forms-B، عدد الأشكال)
+# الأشكال بالترتيب: معزول، آخر، أول، وسط - الحروف ذات الشكلين لا تتصل بما بعدها
+_FORMS: Dict[str, Tuple[int, int]] = {
+    "ء": (0xFE80, 1), "آ": (0xFE81, 2), "أ": (0xFE83, 2), "ؤ": (0xFE85, 2),
+    "إ": (0xFE87, 2), "ئ": (0xFE89, 4), "ا": (0xFE8D, 2), "ب": (0xFE8F, 4),
+    "ة": (0xFE93, 2), "ت": (0xFE95, 4), "ث": (0xFE99, 4), "ج": (0xFE9D, 4),
+    "ح": (0xFEA1, 4), "خ": (0xFEA5, 4), "د": (0xFEA9, 2), "ذ": (0xFEAB, 2),
+    "ر": (0xFEAD, 2), "ز": (0xFEAF, 2), "س": (0xFEB1, 4), "ش": (0xFEB5, 4),
+    "ص": (0xFEB9, 4), "ض": (0xFEBD, 4), "ط": (0xFEC1, 4), "ظ": (0xFEC5, 4),
+    "ع": (0xFEC9, 4), "غ": (0xFECD, 4), "ف": (0xFED1, 4), "ق": (0xFED5, 4),
+    "ك": (0xFED9, 4), "ل": (0xFEDD, 4), "م": (0xFEE1, 4), "ن": (0xFEE5, 4),
+    "ه": (0xFEE9, 4), "و": (0xFEED, 2), "ى": (0xFEEF, 2), "ي": (0xFEF1, 4),
+}
+# لام + ألف: (معزول، آخر)
+_LAM_ALEF = {
+    "آ": ("ﻵ", "ﻶ"),
+    "أ": ("ﻷ", "ﻸ"),
+    "إ": ("ﻹ", "ﻺ"),
+    "ا": ("ﻻ", "ﻼ"),
+}
+_LAM = "ل"
+_TATWEEL = "ـ"
+_MIRRORED = str.maketrans("()[]{}<>«»", ")(][}{><»«")
+_NUMBER_SEPARATORS = "/.,:-"
+
+
+def _is_mark(char: str) -> bool:
+    """حركات التشكيل - لا تؤثر على اتصال الحروف وتبقى مع الحرف السابق"""
+    return "ً" <= char <= "ٟ" or char == "ٰ"
+
+
+def _is_rtl(char: str) -> bool:
+    return "؀" <= char <= "ۿ" and not "٠" <= char <= "٩" or "ﭐ" <= char <= "﻿"
+
+
+def _is_ltr(char: str) -> bool:
+    return char.isdigit() or (char.isalpha() and not _is_rtl(char))
+
+
+def _joins_next(char: Optional[str]) -> bool:
+    return char == _TATWEEL or (char in _FORMS and _FORMS[char][1] == 4)
+
+
+def _joins_previous(char: Optional[str]) -> bool:
+    return char == _TATWEEL or (char in _FORMS and _FORMS[char][1] > 1)
+
+
+def _shape(text: str) -> str:
+    """استبدال الحروف بأشكالها المتصلة (الترتيب المنطقي يبقى كما هو)"""
+    letters = [index for index, char in enumerate(text) if not _is_mark(char)]
+    output: List[str] = []
+    skip = set()
+    for position, index in enumerate(letters):
+        if index in skip:
+            continue
+        char = text[index]
+        previous = text[letters[position - 1]] if position > 0 and letters[position - 1] not in skip else None
+        if position > 0 and letters[position - 1] in skip:
+            # الحرف السابق ألف مدمجة في لام-ألف - لا تتصل بما بعدها
+            previous = None
+        following = text[letters[position + 1]] if position + 1 < len(letters) else None
+        marks = text[index + 1:letters[position + 1] if position + 1 < len(letters) else len(text)]
+
+        if char == _LAM and following in _LAM_ALEF:
+            isolated, final = _LAM_ALEF[following]
+            output.append((final if _joins_next(previous) else isolated) + marks)
+            alef_index = letters[position + 1]
+            skip.add(alef_index)
+            end = letters[position + 2] if position + 2 < len(letters) else len(text)
+            output.append(text[alef_index + 1:end])
+            continue
+
+        form = _FORMS.get(char)
+        if form is None:
+            output.append(char + marks)
+            continue
+        start, count = form
+        after = _joins_next(previous)
+        before = count == 4 and _joins_previous(following)
+        if after and before:
+            shaped = start + 3
+        elif after and count > 1:
+            shaped = start + 1
+        elif before:
+            shaped = start + 2
+        else:
+            shaped = start
+        output.append(chr(shaped) + marks)
+    return "".join(output)
+
+
+def _clusters(text: str) -> List[str]:
+    clusters: List[str] = []
+    for char in text:
+        if clusters and _is_mark(char):
+            clusters[-1] += char
+        else:
+            clusters.append(char)
+    return clusters
+
+
+def _visual_order(text: str) -> str:
+    """
+    ترتيب بصري لسطر اتجاهه من اليمين لليسار: المقاطع تُعكس، والمقاطع العربية تُعكس حروفها
+    (مع حركاتها) والمقاطع اللاتينية والأرقام تبقى كما هي
+    """
+    clusters = _clusters(text)
+    kinds: List[Optional[str]] = []
+    for cluster in clusters:
+        first = cluster[0]
+        kinds.append("num" if first.isdigit() else "ltr" if _is_ltr(first) else "rtl" if _is_rtl(first) else None)
+    resolved = []
+    for index, kind in enumerate(kinds):
+        if kind is None:
+            previous = kinds[index - 1] if index > 0 else None
+            following = kinds[index + 1] if index + 1 < len(kinds) else None
+            before = next((k for k in reversed(kinds[:index]) if k), None)
+            after = next((k for k in kinds[index + 1:] if k), None)
+            if previous == following == "num" and clusters[index] in _NUMBER_SEPARATORS:
+                # فاصل داخل رقم أو تاريخ (12/05/2026، 3.5)
+                kind = "ltr"
+            elif clusters[index] in "%٪" and "num" in (previous, following):
+                kind = "ltr"
+            elif {before, after} <= {"ltr", "num"} and "ltr" in (before, after):
+                # فاصل بين كلمتين لاتينيتين - أما بين رقمين منفصلين فيتبع اتجاه السطر كما في bidi
+                kind = "ltr"
+            else:
+                kind = "rtl"
+        resolved.append("rtl" if kind == "rtl" else "ltr")
+
+    runs: List[Tuple[str, List[str]]] = []
+    for cluster, kind in zip(clusters, resolved):
+        if runs and runs[-1][0] == kind:
+            runs[-1][1].append(cluster)
+        else:
+            runs.append((kind, [cluster]))
+    output = []
+    for kind, run in reversed(runs):
+        if kind == "rtl":
+            output.append("".join(reversed(run)).translate(_MIRRORED))
+        else:
+            output.append("".join(run))
+    return "".join(output)
+
+
+def has_arabic(text: str) -> bool:
+    return any(_is_rtl(char) for char in text)
+
+
+class FontNotFoundError(ValueError):
+    """الخط المطلوب غير موجود في FONT_DIR"""
+
+
+class FontsMissingError(FontNotFoundError):
+    """لا يوجد أي خط في FONT_DIR - خطأ إعداد في الخادم وليس في الطلب"""
+
+
+def available_fonts() -> List[str]:
+    if not os.path.isdir(FONT_DIR):
+        return []
+    return sorted(name for name in os.listdir(FONT_DIR) if name.lower().endswith(FONT_EXTENSIONS))
+
+
+def check_fonts() -> Optional[str]:
+    """فحص الخطوط عند بدء التطبيق - يعيد الخط الافتراضي أو None مع رسالة واضحة في السجل"""
+    try:
+        path = font_path()
+    except FontsMissingError:
+        print(
+            f"❌ No fonts in {FONT_DIR}: certificates and order documents (invoices, labels) will return 503 "
+            f"until an Arabic font such as {DEFAULT_FONT} is added (or FONT_DIR points to one)"
+        )
+        return None
+    print(f"✅ Fonts: {os.path.basename(path)} ({len(available_fonts())} available, {shaping_engine()} shaping)")
+    return path
+
+
+def font_path(name: Optional[str] = None, bold: bool = False) -> str:
+    """مسار خط من FONT_DIR (الاسم فقط بدون مسار) - أو الخط الافتراضي (العريض) ثم أول خط متوفر"""
+    if name:
+        path = os.path.join(FONT_DIR, os.path.basename(name))
+        if not os.path.isfile(path):
+            raise FontNotFoundError(f"الخط غير موجود: {name}. الخطوط المتاحة: {', '.join(available_fonts()) or 'لا يوجد'}")
+        return path
+    fonts = available_fonts()
+    # حزم التوزيعات قد تسمي الملفات بأحرف صغيرة (amiri-regular.ttf)
+    by_name = {name.lower(): name for name in fonts}
+    for default in ((DEFAULT_BOLD_FONT, DEFAULT_FONT) if bold else (DEFAULT_FONT,)):
+        if default.lower() in by_name:
+            return os.path.join(FONT_DIR, by_name[default.lower()])
+    if not fonts:
+        raise FontsMissingError(f"لا توجد خطوط في {FONT_DIR} - أضف خطاً عربياً (مثل Amiri)")
+    return os.path.join(FONT_DIR, fonts[0])
+
+
+def shaping_engine() -> str:
+    if RAQM_AVAILABLE:
+        return "raqm"
+    return "arabic_reshaper" if RESHAPER_AVAILABLE else "builtin"
+
+
+@lru_cache(maxsize=4096)
+def prepare_text(text: str) -> Tuple[str, Optional[str]]:
+    """
+    النص الجاهز للرسم واتجاهه لـ Pillow: (النص، "rtl" أو None)
+    الاتجاه يُمرر فقط مع libraqm - في الحالات الأخرى النص يُعاد بترتيبه البصري
+    """
+    if not has_arabic(text):
+        return text, None
+    if RAQM_AVAILABLE:
+        return text, "rtl"
+    if RESHAPER_AVAILABLE:
+        return get_display(arabic_reshaper.reshape(text)), None
+    return _visual_order(_shape(text)), None
+
+
+@lru_cache(maxsize=64)
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """تحميل خط مرة واحدة لكل (ملف، حجم) - مع libraqm إن توفرت"""
+    layout = ImageFont.Layout.RAQM if RAQM_AVAILABLE else ImageFont.Layout.BASIC
+    return ImageFont.truetype(path, size, layout_engine=layout)
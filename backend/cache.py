@@ -101,3 +101,69 @@ def get_cache_stats() -> Dict[str, Any]:
             'memory_usage': 'N/A'  # يمكن إضافة حساب حجم الذاكرة لاحقاً
         }
 
+
+
+class LRUCache:
+    """
+    cache محدود بعدد العناصر (واختيارياً بالحجم) - يُحذف الأقدم استخداماً عند الامتلاء
+    مناسب للقيم الكبيرة (صور، نتائج تحليل) التي لا يصلح لها الـ cache العام غير المحدود
+    """
+
+    def __init__(self, max_items: int = 128, max_bytes: Optional[int] = None, sizeof=None):
+        from collections import OrderedDict
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: len(value) if hasattr(value, "__len__") else 0)
+        self._items: "OrderedDict[Any, tuple]" = OrderedDict()  # key: (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Any, value: Any) -> None:
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._items and (
+                len(self._items) > self.max_items
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,306 @@
+"""
+طباعة شهادات دفعة واحدة (إجازات حفظ القرآن الكريم، شهادات تقدير المدارس)
+
+- قالب واحد (صورة أو صفحة PDF) + حقول نصية مسماة بمواضعها + قائمة أسماء (CSV/JSON)
+  -> ملف PDF واحد متعدد الصفحات يُرسل تدفقياً
+- القالب يُضمّن في الملف مرة واحدة وكل الصفحات تشير إليه (PDF يبقى متجهياً، JPEG بدون إعادة ضغط)،
+  ومعلوماته تُحفظ في LRU حسب SHA-256 فتكرار الدفعة بنفس القالب لا يعيد قراءته
+- نص كل شهادة يُرسم بدقة CERTIFICATE_TEXT_DPI كقناع شفافية فوق القالب - الرسم بالتوازي على
+  مجمع عمال الصور والصفحات تُكتب بالترتيب، والخطوط تُحمّل مرة واحدة قبل البدء
+- النص العربي يُشكّل عبر arabic_text (libraqm أو arabic_reshaper أو المشكّل الداخلي)
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import string
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from arabic_text import FontNotFoundError, FontsMissingError, font_path, load_font, prepare_text
+from cache import LRUCache
+from document_analysis import POINTS_PER_MM, _open_pdf
+from production_pdf import OUTPUT_CHUNK_SIZE, PdfAssembler, placement_matrix
+from workers import map_in_imaging_pool
+
+CERTIFICATE_BATCH_MAX = int(os.getenv("CERTIFICATE_BATCH_MAX", "1000"))
+CERTIFICATE_TEMPLATE_CACHE_MB = int(os.getenv("CERTIFICATE_TEMPLATE_CACHE_MB", "64"))
+# دقة رسم النص - أعلى من دقة الطباعة المعتادة حتى تبقى حواف الحروف حادة
+CERTIFICATE_TEXT_DPI = 600
+# دقة قالب الصورة إذا لم تكن محفوظة في الملف
+TEMPLATE_IMAGE_DPI = 300
+# أصغر تصغير للخط عند تجاوز النص max_width_mm (الاسم الطويل يُصغّر بدل أن يخرج عن الإطار)
+MIN_FONT_SCALE = 0.5
+
+ALIGNMENTS = {"left": "l", "center": "m", "right": "r"}
+
+_template_cache = LRUCache(
+    max_items=32,
+    max_bytes=CERTIFICATE_TEMPLATE_CACHE_MB * 1024 * 1024,
+    sizeof=lambda template: len(template.data),
+)
+
+
+class CertificateError(ValueError):
+    """قالب أو حقول أو قائمة أسماء غير صالحة"""
+
+
+class CertificateTemplate:
+    """القالب المقروء: نوعه ومحتواه الأصلي وقياس الصفحة بالنقاط (مع /Rotate لصفحات PDF)"""
+
+    def __init__(self, kind: str, data: bytes, width: float, height: float, rotate: int = 0) -> None:
+        self.kind = kind
+        self.data = data
+        self.width = width
+        self.height = height
+        self.rotate = rotate
+
+
+# ---------------- الخطوط ----------------
+
+def _font_pixels(size_pt: float) -> int:
+    return max(1, round(size_pt * CERTIFICATE_TEXT_DPI / 72))
+
+
+# ---------------- المدخلات ----------------
+
+def _parse_color(value: Any) -> Tuple[int, int, int]:
+    text = str(value or "#000000").strip().lstrip("#")
+    if len(text) == 3:
+        text = "".join(char * 2 for char in text)
+    try:
+        if len(text) != 6:
+            raise ValueError
+        return int(text[0:2], 16), int(text[2:4], 16), int(text[4:6], 16)
+    except ValueError:
+        raise CertificateError(f"لون غير صالح: {value} (الصيغة #RRGGBB)")
+
+
+def _check_text_template(text: str, index: int) -> None:
+    """
+    text يقبل أسماء أعمدة فقط: {name} - بدون ترقيم ({} أو {0}) أو تحويل (!r) أو تنسيق (:d)
+    أو وصول لخصائص وعناصر ({name.x} أو {name[0]})، حتى لا يفشل الرسم في منتصف الدفعة
+    """
+    try:
+        parts = list(string.Formatter().parse(text))
+    except ValueError:
+        raise CertificateError(f"الحقل رقم {index}: الأقواس في text غير متوازنة")
+    for _, name, format_spec, conversion in parts:
+        if name is None:
+            continue
+        if not name.strip() or name.strip().isdigit():
+            raise CertificateError(f"الحقل رقم {index}: استخدم اسم عمود بين القوسين مثل {{name}} وليس {{{name}}}")
+        if "." in name or "[" in name:
+            raise CertificateError(f"الحقل رقم {index}: {{{name}}} غير مدعوم - اسم العمود فقط بدون . أو []")
+        if conversion is not None or format_spec:
+            raise CertificateError(f"الحقل رقم {index}: التنسيق غير مدعوم في {{{name}}} - اسم العمود فقط")
+
+
+def parse_fields(raw: str) -> List[Dict[str, Any]]:
+    """
+    الحقول (JSON): [{name, x_mm, y_mm, font_size_pt?, font?, color?, align?, max_width_mm?, text?}]
+    - x_mm, y_mm من أعلى يسار الصفحة، وy هو منتصف السطر؛ align يحدد هل x يسار النص أو منتصفه أو يمينه
+    - text اختياري لنص ثابت يحوي قيم القائمة: "أتم حفظ {juz} جزءاً" - وإلا تُستخدم قيمة العمود name
+    الخطوط تُحمّل هنا مرة واحدة (وتبقى في cache) قبل بدء الرسم المتوازي
+    """
+    try:
+        fields = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise CertificateError(f"تعريف الحقول ليس JSON صالحاً: {e}")
+    if isinstance(fields, dict):
+        fields = fields.get("fields")
+    if not isinstance(fields, list) or not fields:
+        raise CertificateError("يجب تعريف حقل نصي واحد على الأقل")
+
+    parsed = []
+    for index, field in enumerate(fields, start=1):
+        if not isinstance(field, dict) or not (field.get("name") or field.get("text")):
+            raise CertificateError(f"الحقل رقم {index} يحتاج name أو text")
+        try:
+            x_mm, y_mm = float(field["x_mm"]), float(field["y_mm"])
+            size_pt = float(field.get("font_size_pt", 24))
+            max_width_mm = float(field["max_width_mm"]) if field.get("max_width_mm") else None
+        except (KeyError, TypeError, ValueError):
+            raise CertificateError(f"الحقل رقم {index}: x_mm و y_mm مطلوبة والقياسات يجب أن تكون أرقاماً")
+        if size_pt <= 0:
+            raise CertificateError(f"الحقل رقم {index}: حجم الخط يجب أن يكون أكبر من صفر")
+        align = str(field.get("align") or "center").lower()
+        if align not in ALIGNMENTS:
+            raise CertificateError(f"الحقل رقم {index}: المحاذاة يجب أن تكون {', '.join(ALIGNMENTS)}")
+        if field.get("text"):
+            _check_text_template(str(field["text"]), index)
+        try:
+            path = font_path(field.get("font"))
+        except FontsMissingError:
+            raise
+        except FontNotFoundError as e:
+            raise CertificateError(str(e))
+        try:
+            load_font(path, _font_pixels(size_pt))
+        except OSError as e:
+            raise CertificateError(f"تعذر تحميل الخط {os.path.basename(path)}: {e}")
+        parsed.append({
+            "name": field.get("name"),
+            "text": str(field["text"]) if field.get("text") else None,
+            "x_mm": x_mm,
+            "y_mm": y_mm,
+            "font_size_pt": size_pt,
+            "font_path": path,
+            "color": _parse_color(field.get("color")),
+            "anchor": ALIGNMENTS[align] + "m",
+            "max_width_mm": max_width_mm,
+        })
+    return parsed
+
+
+def parse_recipients(content: bytes, filename: str = "") -> List[Dict[str, str]]:
+    """قائمة الأسماء: CSV بسطر عناوين (أسماء الأعمدة = أسماء الحقول) أو JSON (قائمة كائنات)"""
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise CertificateError("ملف الأسماء يجب أن يكون بترميز UTF-8")
+    stripped = text.lstrip()
+    if filename.lower().endswith(".json") or stripped.startswith(("[", "{")):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise CertificateError(f"ملف الأسماء ليس JSON صالحاً: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("recipients")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise CertificateError("ملف JSON يجب أن يكون قائمة كائنات (أو {\"recipients\": [...]})")
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    recipients = [
+        {str(key).strip(): "" if value is None else str(value).strip() for key, value in row.items() if key}
+        for row in rows
+    ]
+    recipients = [row for row in recipients if any(row.values())]
+    if not recipients:
+        raise CertificateError("قائمة الأسماء فارغة")
+    if len(recipients) > CERTIFICATE_BATCH_MAX:
+        raise CertificateError(f"الحد الأقصى {CERTIFICATE_BATCH_MAX} شهادة في الدفعة الواحدة")
+    return recipients
+
+
+def load_template(content: bytes) -> CertificateTemplate:
+    """قراءة القالب (الصفحة الأولى من PDF أو صورة) - مرة واحدة لكل محتوى"""
+    key = hashlib.sha256(content).hexdigest()
+    template = _template_cache.get(key)
+    if template is not None:
+        return template
+
+    if content[:5] == b"%PDF-":
+        try:
+            reader = _open_pdf(io.BytesIO(content))
+            page = reader.pages[0]
+        except Exception as e:
+            raise CertificateError(f"تعذر قراءة قالب PDF: {e}")
+        rotate = int(page.get("/Rotate", 0) or 0) % 360
+        width, height = float(page.cropbox.width), float(page.cropbox.height)
+        if rotate % 180:
+            width, height = height, width
+        template = CertificateTemplate("pdf", content, width, height, rotate)
+    else:
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                dpi = image.info.get("dpi") or (TEMPLATE_IMAGE_DPI, TEMPLATE_IMAGE_DPI)
+                dpi_x, dpi_y = (float(value) or TEMPLATE_IMAGE_DPI for value in dpi[:2])
+                width, height = image.size[0] * 72 / dpi_x, image.size[1] * 72 / dpi_y
+        except Exception as e:
+            raise CertificateError(f"القالب يجب أن يكون PDF أو صورة: {e}")
+        template = CertificateTemplate("image", content, width, height)
+    _template_cache.set(key, template)
+    return template
+
+
+# ---------------- الرسم ----------------
+
+class _Missing(dict):
+    """القيم الناقصة في نص الحقل تُترك فارغة بدل KeyError"""
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+def _field_text(field: Dict[str, Any], recipient: Dict[str, str]) -> str:
+    if field["text"]:
+        return field["text"].format_map(_Missing(recipient))
+    return recipient.get(field["name"], "")
+
+
+def _render_field(
+    field: Dict[str, Any], value: str, page_height: float
+) -> Optional[Tuple[bytes, Tuple[int, int], Tuple[int, int, int], List[float]]]:
+    """نص حقل واحد -> (قناع مضغوط، أبعاده بالبكسل، اللون، مصفوفة وضعه على الصفحة)"""
+    text, direction = prepare_text(value)
+    if not text.strip():
+        return None
+    options = {"anchor": field["anchor"]}
+    if direction:
+        options["direction"] = direction
+
+    size = _font_pixels(field["font_size_pt"])
+    font = load_font(field["font_path"], size)
+    left, top, right, bottom = font.getbbox(text, **options)
+    if field["max_width_mm"]:
+        limit = field["max_width_mm"] * CERTIFICATE_TEXT_DPI / 25.4
+        if right - left > limit:
+            # تصغير بخطوات 5% حتى يبقى عدد الأحجام المحملة في cache الخطوط صغيراً
+            scale = max(MIN_FONT_SCALE, int(limit / (right - left) * 20) / 20)
+            font = load_font(field["font_path"], max(1, int(size * scale)))
+            left, top, right, bottom = font.getbbox(text, **options)
+
+    width, height = right - left, bottom - top
+    if width <= 0 or height <= 0:
+        return None
+    mask = Image.new("L", (width, height), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, **options)
+
+    to_points = 72 / CERTIFICATE_TEXT_DPI
+    x = field["x_mm"] * POINTS_PER_MM + left * to_points
+    top_edge = field["y_mm"] * POINTS_PER_MM + top * to_points
+    matrix = [width * to_points, 0, 0, height * to_points, x, page_height - top_edge - height * to_points]
+    # المستوى 3: ثلث زمن المستوى 6 مقابل ~20% حجماً أكبر - الضغط هو أبطأ خطوة في رسم الشهادة
+    return zlib.compress(mask.tobytes(), 3), (width, height), field["color"], matrix
+
+
+def render_certificate(
+    recipient: Dict[str, str], fields: List[Dict[str, Any]], page_height: float
+) -> List[Tuple[bytes, Tuple[int, int], Tuple[int, int, int], List[float]]]:
+    """كل حقول شهادة واحدة (تعمل على مجمع عمال الصور)"""
+    rendered = []
+    for field in fields:
+        layer = _render_field(field, _field_text(field, recipient), page_height)
+        if layer:
+            rendered.append(layer)
+    return rendered
+
+
+async def stream_certificates(
+    template: CertificateTemplate,
+    fields: List[Dict[str, Any]],
+    recipients: List[Dict[str, str]],
+) -> AsyncIterator[bytes]:
+    """ملف الشهادات على دفعات - الشهادات تُرسم بالتوازي وتُكتب بترتيب القائمة"""
+    writer = PdfAssembler()
+    if template.kind == "pdf":
+        reader = _open_pdf(io.BytesIO(template.data))
+        template_form, box = writer.add_form(reader.pages[0], 0)
+    else:
+        template_form, box = writer.add_image(template.data)
+    background = (template_form, placement_matrix(box, template.rotate, (0, 0, template.width, template.height)))
+
+    async for layers in map_in_imaging_pool(render_certificate, recipients, fields, template.height):
+        placements = [background]
+        for mask, size, color, matrix in layers:
+            placements.append((writer.add_masked_color(mask, size, color), matrix))
+        writer.add_sheet(template.width, template.height, placements)
+        chunk = writer.drain(OUTPUT_CHUNK_SIZE)
+        if chunk:
+            yield chunk
+    yield writer.finish()
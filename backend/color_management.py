@@ -0,0 +1,229 @@
+"""
+تحويل الألوان للطباعة (RGB → CMYK) عبر ImageCms وملفات ICC
+
+المطبعة تحتاج ملفات CMYK بينما كل مخرجات الاستوديو والمرفوعات RGB.
+- ملفات ICC تُقرأ من مجلد icc_profiles (أو ICC_PROFILE_DIR) وتُحمَّل مرة واحدة
+- كائن التحويل (transform) يُبنى مرة واحدة لكل زوج ملفات/وضع/نية ويُخزن مؤقتاً
+- التحويل يتم شريطاً شريطاً عبر imaging.convert_for_print فلا نحتاج نسخة كاملة من الصورة
+- إذا لم يتوفر ملف CMYK نستخدم تحويل Pillow البسيط ونوضح ذلك في النتيجة
+"""
+import hashlib
+import io
+import os
+import threading
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageCms
+
+from cache import LRUCache
+from imaging import ImageSource, convert_for_print, flatten_to_rgb, open_large
+
+ICC_PROFILE_DIR = os.getenv(
+    "ICC_PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "icc_profiles")
+)
+# ملف CMYK الافتراضي للمطبعة (اسم الملف بدون الامتداد)
+DEFAULT_CMYK_PROFILE = os.getenv("CMYK_PROFILE", "CoatedFOGRA39")
+# نية التحويل: relative colorimetric هي المعتمدة لتحضير ملفات الطباعة
+DEFAULT_RENDERING_INTENT = ImageCms.Intent.RELATIVE_COLORIMETRIC
+
+# اسم التحويل البسيط (بدون ICC) عند عدم توفر ملف CMYK
+NAIVE_PROFILE = "naive"
+
+_RENDERING_INTENTS = {
+    "perceptual": ImageCms.Intent.PERCEPTUAL,
+    "relative": ImageCms.Intent.RELATIVE_COLORIMETRIC,
+    "saturation": ImageCms.Intent.SATURATION,
+    "absolute": ImageCms.Intent.ABSOLUTE_COLORIMETRIC,
+}
+
+# NOTCACHE: يلغي ذاكرة آخر بكسل داخل lcms فيصبح نفس كائن التحويل آمناً بين العمال
+_TRANSFORM_FLAGS = ImageCms.FLAGS["NOTCACHE"] | ImageCms.FLAGS["BLACKPOINTCOMPENSATION"]
+
+_profiles_lock = threading.Lock()
+# ملفات ICC المضمَّنة في صور العملاء - محدودة العدد (كل ملف مختلف يضيف عنصراً)
+_embedded_profiles = LRUCache(max_items=int(os.getenv("EMBEDDED_ICC_CACHE_SIZE", "32")))
+
+
+class ColorProfileError(ValueError):
+    """ملف ICC غير موجود أو غير صالح"""
+
+
+def parse_rendering_intent(name: Optional[str]) -> int:
+    if not name:
+        return DEFAULT_RENDERING_INTENT
+    intent = _RENDERING_INTENTS.get(name.lower())
+    if intent is None:
+        raise ColorProfileError(f"نية تحويل غير معروفة: {name}")
+    return intent
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """ملفات ICC المتوفرة في مجلد الملفات"""
+    profiles: List[Dict[str, Any]] = []
+    if not os.path.isdir(ICC_PROFILE_DIR):
+        return profiles
+    for filename in sorted(os.listdir(ICC_PROFILE_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in (".icc", ".icm"):
+            continue
+        try:
+            profile = _load_profile(name)
+            profiles.append({
+                "name": name,
+                "description": ImageCms.getProfileDescription(profile).strip(),
+                "color_space": profile.profile.xcolor_space.strip(),
+                "default": name == DEFAULT_CMYK_PROFILE,
+            })
+        except ColorProfileError as e:
+            print(f"⚠️ Skipping ICC profile {filename}: {e}")
+    return profiles
+
+
+@lru_cache(maxsize=16)
+def _load_profile(name: str) -> ImageCms.ImageCmsProfile:
+    """تحميل ملف ICC بالاسم مرة واحدة (srgb مدمج في Pillow)"""
+    if name.lower() == "srgb":
+        return ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+    if os.path.basename(name) != name:
+        raise ColorProfileError(f"اسم ملف ICC غير صالح: {name}")
+    for ext in (".icc", ".icm", ".ICC", ".ICM"):
+        path = os.path.join(ICC_PROFILE_DIR, name + ext)
+        if os.path.isfile(path):
+            try:
+                return ImageCms.ImageCmsProfile(path)
+            except (OSError, ImageCms.PyCMSError) as e:
+                raise ColorProfileError(f"ملف ICC تالف: {name}") from e
+    raise ColorProfileError(f"ملف ICC غير موجود: {name}")
+
+
+def _profile_for(key: str) -> ImageCms.ImageCmsProfile:
+    if key.startswith("embedded:"):
+        profile = _embedded_profiles.get(key)
+        if profile is None:
+            raise ColorProfileError("ملف ICC المضمَّن لم يعد في الذاكرة")
+        return profile
+    return _load_profile(key)
+
+
+def _source_profile_key(icc_bytes: Optional[bytes]) -> str:
+    """مفتاح ملف المصدر: ملف ICC المضمَّن في الصورة (مفهرس بالـ hash) أو sRGB"""
+    if not icc_bytes:
+        return "srgb"
+    key = "embedded:" + hashlib.sha1(icc_bytes).hexdigest()
+    with _profiles_lock:
+        if key not in _embedded_profiles:
+            try:
+                _embedded_profiles.set(key, ImageCms.ImageCmsProfile(io.BytesIO(icc_bytes)))
+            except (OSError, ImageCms.PyCMSError):
+                return "srgb"
+    return key
+
+
+@lru_cache(maxsize=32)
+def _build_transform(source_key: str, target_key: str, in_mode: str, intent: int) -> ImageCms.ImageCmsTransform:
+    """بناء كائن التحويل مرة واحدة لكل (مصدر، هدف، وضع، نية) - البناء أبطأ بكثير من التطبيق"""
+    print(f"🎨 Building color transform {source_key} → {target_key} ({in_mode}, intent={intent})")
+    return ImageCms.buildTransform(
+        _profile_for(source_key),
+        _profile_for(target_key),
+        in_mode,
+        "CMYK",
+        renderingIntent=intent,
+        flags=_TRANSFORM_FLAGS,
+    )
+
+
+def resolve_cmyk_profile(name: Optional[str] = None) -> str:
+    """
+    اسم ملف CMYK الذي سيُستخدم فعلاً
+    عند عدم تحديد اسم وعدم توفر الملف الافتراضي نعيد NAIVE_PROFILE
+    """
+    if name and name != NAIVE_PROFILE:
+        profile = _load_profile(name)
+        if profile.profile.xcolor_space.strip() != "CMYK":
+            raise ColorProfileError(f"الملف {name} ليس ملف CMYK")
+        return name
+    if name == NAIVE_PROFILE:
+        return NAIVE_PROFILE
+    try:
+        _load_profile(DEFAULT_CMYK_PROFILE)
+        return DEFAULT_CMYK_PROFILE
+    except ColorProfileError:
+        return NAIVE_PROFILE
+
+
+def target_profile_bytes(profile_name: str) -> Optional[bytes]:
+    """محتوى ملف ICC الهدف لتضمينه في الملف الناتج"""
+    if profile_name == NAIVE_PROFILE:
+        return None
+    return _load_profile(profile_name).tobytes()
+
+
+def make_cmyk_transform(
+    icc_bytes: Optional[bytes],
+    profile_name: str,
+    intent: int = DEFAULT_RENDERING_INTENT,
+):
+    """
+    دالة تحويل شريط واحد إلى CMYK (تُمرر إلى convert_for_print)
+    الشفافية تُدمج على أبيض، والصور الرمادية تُحول كـ RGB
+    """
+    transform = None
+
+    def convert(strip: Image.Image) -> Image.Image:
+        nonlocal transform
+        if strip.mode == "CMYK":
+            return strip
+        strip = flatten_to_rgb(strip)
+        if profile_name == NAIVE_PROFILE:
+            return strip.convert("CMYK")
+        if transform is None:
+            # الملف المضمَّن يُسجل مباشرة قبل البناء - قد يكون LRU أخرجه لصالح صور أخرى منذ آخر استخدام
+            transform = _build_transform(_source_profile_key(icc_bytes), profile_name, "RGB", intent)
+        return ImageCms.applyTransform(strip, transform)
+
+    return convert
+
+
+def convert_image_to_cmyk(
+    image: Image.Image,
+    profile: Optional[str] = None,
+    intent: int = DEFAULT_RENDERING_INTENT,
+) -> Tuple[Image.Image, str]:
+    """تحويل صورة محمّلة في الذاكرة إلى CMYK - يعيد (الصورة، اسم الملف المستخدم)"""
+    profile_name = resolve_cmyk_profile(profile)
+    convert = make_cmyk_transform(image.info.get("icc_profile"), profile_name, intent)
+    return convert(image), profile_name
+
+
+def convert_file_to_cmyk(
+    source: ImageSource,
+    dst: BinaryIO,
+    dpi: int = 300,
+    profile: Optional[str] = None,
+    intent: int = DEFAULT_RENDERING_INTENT,
+) -> Dict[str, Any]:
+    """
+    تحويل ملف صورة إلى TIFF بصيغة CMYK شريطاً شريطاً مع تضمين ملف ICC الهدف
+    دالة متزامنة - تُشغَّل على مجمع عمال الصور
+    """
+    profile_name = resolve_cmyk_profile(profile)
+    img = open_large(source)
+    source_icc = img.info.get("icc_profile")
+    size = convert_for_print(
+        source,
+        dst,
+        dpi=dpi,
+        mode="CMYK",
+        transform=make_cmyk_transform(source_icc, profile_name, intent),
+        icc_profile=target_profile_bytes(profile_name),
+    )
+    return {
+        "width": size[0],
+        "height": size[1],
+        "dpi": dpi,
+        "profile_used": profile_name,
+        "source_profile": "embedded" if source_icc else "srgb",
+    }
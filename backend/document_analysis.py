@@ -0,0 +1,219 @@
+"""
+تحليل ملفات المستندات (PDF/Word) لعد الصفحات مباشرة من الملف المرفوع
+
+- الملفات تُقرأ من ملف الرفع نفسه (SpooledTemporaryFile) بدون نسخها إلى ملف مؤقت آخر
+- عدد صفحات PDF يُقرأ من /Root → /Pages → /Count عبر جدول xref فقط،
+  بدلاً من len(reader.pages) التي تحمّل كائنات كل الصفحات
+- قياسات الصفحات تُقرأ من MediaBox فقط، ومرة واحدة لكل ملف (النتيجة تُخزن في analysis_cache)
+- كل صفحة PDF تُصنف ملونة أو أبيض وأسود من أوامر الألوان والصور (pdf_color) لتسعير المحاضرات
+- الدوال هنا متزامنة وتُشغَّل على مجمع عمال التحليل (workers.run_in_analysis_pool)؛
+  التحليل نفسه كود Python خالص يمسك GIL، فـ analyze_document_isolated يرسله إلى عملية منفصلة
+"""
+import io
+import os
+import shutil
+import tempfile
+from collections import Counter
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from pdf_color import classify_pdf_pages
+
+PDF_EXTENSIONS = {".pdf"}
+WORD_EXTENSIONS = {".doc", ".docx"}
+DOCUMENT_EXTENSIONS = PDF_EXTENSIONS | WORD_EXTENSIONS
+
+# أقصى عدد صفحات نصنف ألوانها - الباقي يُعاد كـ unclassified
+COLOR_SCAN_LIMIT = 2000
+# عدد الصفحات التي نقرأ قياسها (MediaBox) - عينة موزعة بالتساوي على المستند،
+# وعدد صفحات كل قياس يُقدّر بنسبته في العينة (القياس غالباً واحد لكل الملف)
+PAGE_SIZE_SAMPLE = int(os.getenv("PAGE_SIZE_SAMPLE", "64"))
+# مهلة تحليل ملف واحد داخل عملية التحليل - بعدها تتوقف العملية وتعود للمجمع
+ANALYSIS_PROCESS_TIMEOUT = float(os.getenv("ANALYSIS_PROCESS_TIMEOUT", "20"))
+SPILL_CHUNK_SIZE = 1024 * 1024
+
+POINTS_PER_MM = 72 / 25.4
+EMU_PER_MM = 36000
+
+
+class DocumentAnalysisError(ValueError):
+    """الملف تالف أو غير مدعوم"""
+
+
+def sample_page_indices(total_pages: int, sample: int = PAGE_SIZE_SAMPLE) -> List[int]:
+    """أرقام صفحات العينة: كل الصفحات إذا كانت أقل من sample، وإلا sample صفحة بتباعد متساوٍ تشمل الأولى والأخيرة"""
+    if total_pages <= sample:
+        return list(range(total_pages))
+    if sample <= 1:
+        return [0]
+    step = (total_pages - 1) / (sample - 1)
+    return sorted({round(index * step) for index in range(sample)})
+
+
+def summarize_page_sizes(
+    sizes_mm: List[Tuple[float, float]],
+    total_pages: Optional[int] = None,
+    sampled: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    تجميع قياسات الصفحات (بالمليمتر) إلى [{width_mm, height_mm, paper, pages}] مرتبة حسب عدد الصفحات
+    sampled: القياسات عينة موزعة على المستند - total_pages يُوزع على القياسات بنسبها في العينة؛
+    وإلا فالصفحات غير المقروءة تُضاف إلى القياس الأكثر تكراراً
+    """
+    from routers.advanced_pricing import detect_paper_size
+
+    counts = Counter((round(width), round(height)) for width, height in sizes_mm)
+    if total_pages and counts and total_pages > len(sizes_mm):
+        if sampled:
+            # أكبر باقٍ: الأعداد المقدّرة مجموعها total_pages بالضبط
+            shares = {size: count * total_pages / len(sizes_mm) for size, count in counts.items()}
+            counts = Counter({size: int(share) for size, share in shares.items()})
+            remainder = total_pages - sum(counts.values())
+            for size in sorted(shares, key=lambda size: shares[size] - int(shares[size]), reverse=True)[:remainder]:
+                counts[size] += 1
+        else:
+            counts[counts.most_common(1)[0][0]] += total_pages - len(sizes_mm)
+    return [
+        {
+            "width_mm": width,
+            "height_mm": height,
+            "paper": detect_paper_size(width / 10, height / 10),
+            "pages": pages,
+        }
+        for (width, height), pages in counts.most_common()
+    ]
+
+
+def _open_pdf(fp: BinaryIO):
+    from PyPDF2 import PdfReader
+
+    fp.seek(0)
+    reader = PdfReader(fp, strict=False)
+    if reader.is_encrypted:
+        # أغلب ملفات المحاضرات "مشفرة" بكلمة مرور فارغة لمنع النسخ فقط
+        try:
+            reader.decrypt("")
+        except Exception:
+            pass
+    return reader
+
+
+def _pdf_page_count(reader) -> int:
+    """
+    عد صفحات PDF من شجرة الصفحات الجذرية
+    إذا كانت /Count مفقودة أو غير منطقية نعود لعدّ الصفحات الكامل
+    """
+    from PyPDF2.errors import PdfReadError
+
+    try:
+        count = reader.trailer["/Root"]["/Pages"]["/Count"]
+        if isinstance(count, int) and count > 0:
+            return int(count)
+    except (KeyError, TypeError, AttributeError, PdfReadError):
+        pass
+    return len(reader.pages)
+
+
+def count_pdf_pages(fp: BinaryIO) -> int:
+    try:
+        return _pdf_page_count(_open_pdf(fp))
+    except Exception as e:
+        raise DocumentAnalysisError(f"خطأ في قراءة ملف PDF: {str(e)}") from e
+
+
+def analyze_pdf(fp: BinaryIO) -> Dict[str, Any]:
+    """
+    عدد الصفحات وقياساتها - القياس من MediaBox فقط دون قراءة محتوى الصفحات،
+    ولعينة من PAGE_SIZE_SAMPLE صفحة على الأكثر وليس لكل صفحة
+    """
+    try:
+        reader = _open_pdf(fp)
+        pages = _pdf_page_count(reader)
+        sizes_mm: List[Tuple[float, float]] = []
+        for index in sample_page_indices(min(pages, len(reader.pages))):
+            page = reader.pages[index]
+            box = page.mediabox
+            width, height = float(box.width) / POINTS_PER_MM, float(box.height) / POINTS_PER_MM
+            if int(page.get("/Rotate", 0) or 0) % 180:
+                width, height = height, width
+            sizes_mm.append((width, height))
+        color = classify_pdf_pages(reader, COLOR_SCAN_LIMIT)
+    except Exception as e:
+        raise DocumentAnalysisError(f"خطأ في قراءة ملف PDF: {str(e)}") from e
+    if color["color"] + color["bw"] < pages:
+        color["unclassified"] = pages - color["color"] - color["bw"]
+    return {"pages": pages, "page_sizes": summarize_page_sizes(sizes_mm, pages, sampled=True), "color": color}
+
+
+def analyze_word(fp: BinaryIO) -> Dict[str, Any]:
+    """عدد صفحات DOCX من البيانات الوصفية أو مقدّر التخطيط (docx_analysis)"""
+    from docx_analysis import analyze_docx
+
+    fp.seek(0)
+    if fp.read(4) != b"PK\x03\x04":
+        raise DocumentAnalysisError("صيغة DOC القديمة غير مدعومة، يرجى حفظ الملف بصيغة DOCX")
+    try:
+        result = analyze_docx(fp)
+    except Exception as e:
+        raise DocumentAnalysisError(f"خطأ في قراءة ملف Word: {str(e)}") from e
+    pages = result["pages"]
+    return {
+        "pages": pages,
+        "page_sizes": summarize_page_sizes(result["section_sizes_mm"], pages),
+        "page_count_source": result["page_count_source"],
+    }
+
+
+def count_word_pages(fp: BinaryIO) -> int:
+    return analyze_word(fp)["pages"]
+
+
+def analyze_document(fp: BinaryIO, suffix: str) -> Dict[str, Any]:
+    """تحليل مستند واحد وإرجاع {pages, page_sizes, file_type}"""
+    suffix = suffix.lower()
+    if suffix in PDF_EXTENSIONS:
+        result = analyze_pdf(fp)
+    elif suffix in WORD_EXTENSIONS:
+        result = analyze_word(fp)
+    else:
+        raise DocumentAnalysisError(f"نوع الملف غير مدعوم: {suffix}")
+    return {**result, "file_type": suffix}
+
+
+def _analyze_source(source: Any, suffix: str) -> Dict[str, Any]:
+    """نقطة الدخول داخل عملية التحليل: مسار ملف على القرص أو محتواه (bytes)"""
+    if isinstance(source, str):
+        with open(source, "rb") as fp:
+            return analyze_document(fp, suffix)
+    return analyze_document(io.BytesIO(source), suffix)
+
+
+def analyze_document_isolated(fp: BinaryIO, suffix: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    analyze_document في عملية منفصلة (workers.run_in_process_pool) فتتوازى الملفات على أكثر من نواة
+    الملف المفتوح لا يُنقل بين العمليات: الملفات المسماة على القرص تُرسل بالمسار، وغيرها (ملفات الرفع
+    في الذاكرة أو TemporaryFile بدون اسم) يُنسخ على شكل قطع لملف مؤقت ويُرسل مساره بدل تحميله كاملاً
+    timeout: مهلة التحليل داخل العملية (ANALYSIS_PROCESS_TIMEOUT افتراضياً) - TimeoutError عند انتهائها
+    """
+    import workers
+
+    if timeout is None:
+        timeout = ANALYSIS_PROCESS_TIMEOUT
+    if workers.ANALYSIS_PROCESSES <= 0:
+        fp.seek(0)
+        return analyze_document(fp, suffix)
+
+    name = getattr(fp, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return workers.run_in_process_pool(_analyze_source, name, suffix, timeout=timeout)
+
+    fp.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spill:
+        shutil.copyfileobj(fp, spill, SPILL_CHUNK_SIZE)
+    try:
+        return workers.run_in_process_pool(_analyze_source, spill.name, suffix, timeout=timeout)
+    finally:
+        fp.seek(0)
+        try:
+            os.unlink(spill.name)
+        except OSError:
+            pass
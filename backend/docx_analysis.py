@@ -0,0 +1,452 @@
+"""
+عد صفحات ملفات DOCX بدقة بدون بناء DOM للمستند
+
+1. docProps/app.xml → <Pages>: العدد الذي حسبه Word عند آخر حفظ (أسرع وأدق مصدر)
+2. إذا كان مفقوداً أو قديماً (ملفات مولدة برمجياً تحمل Pages=1 من القالب):
+   مقدّر تخطيط يقرأ word/document.xml بـ iterparse ويحسب ارتفاع كل فقرة
+   حسب قياس الصفحة والهوامش وحجم الخط والتباعد والجداول والصور وفواصل الصفحات
+
+كل قراءة XML تدفقية (iterparse + clear) فتبقى الذاكرة ثابتة حتى لأطروحة من 500 صفحة
+"""
+import math
+import re
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+WP_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+
+# القيم الافتراضية لـ Word (A4، هوامش 2.54 سم، Calibri 11، تباعد 1.08 و 8pt بعد الفقرة)
+DEFAULT_PAGE_TWIPS = (11906, 16838)
+DEFAULT_MARGINS_TWIPS = (1440, 1440, 1440, 1440)  # top, right, bottom, left
+DEFAULT_FONT_PT = 11.0
+DEFAULT_SPACING_AFTER_PT = 8.0
+DEFAULT_LINE_MULTIPLIER = 259 / 240
+
+# متوسط عرض الحرف كنسبة من حجم الخط، وارتفاع السطر الواحد (single) كنسبة من حجم الخط
+AVG_CHAR_WIDTH_EM = 0.5
+LINE_HEIGHT_EM = 1.17
+# الحشوة الأفقية الافتراضية لخلية الجدول (يمين + يسار) بالنقطة
+TABLE_CELL_PADDING_PT = 10.8
+# عدد الأحرف التي تُحسب لكل tab
+TAB_CHARS = 4
+
+# ملف document.xml أكبر من هذا مع Characters=0 في app.xml يعني أن البيانات الوصفية قديمة
+STALE_METADATA_MIN_XML_BYTES = 4 * 1024
+SCAN_CHUNK_SIZE = 256 * 1024
+
+_PGSZ_RE = re.compile(rb"<(?:\w+:)?pgSz\b([^>]*)>")
+_ATTR_RE = re.compile(rb"(?:\w+:)?(w|h|orient)=\"([^\"]*)\"")
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+def _twips_attr(element, name: str) -> Optional[float]:
+    value = element.get(_w(name))
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# ============================================
+# البيانات الوصفية
+# ============================================
+
+def read_app_properties(zf: zipfile.ZipFile) -> Dict[str, int]:
+    """Pages/Words/Characters من docProps/app.xml"""
+    try:
+        stream = zf.open("docProps/app.xml")
+    except KeyError:
+        return {}
+    properties: Dict[str, int] = {}
+    with stream:
+        for _, element in iterparse(stream, events=("end",)):
+            name = element.tag.rsplit("}", 1)[-1]
+            if name in ("Pages", "Words", "Characters", "CharactersWithSpaces", "Paragraphs"):
+                try:
+                    properties[name] = int((element.text or "").strip())
+                except ValueError:
+                    pass
+            element.clear()
+    return properties
+
+
+def _metadata_is_stale(properties: Dict[str, int], zf: zipfile.ZipFile) -> bool:
+    """ملف مولد برمجياً يحمل app.xml القالب (Pages=1، Characters=0) مع محتوى كبير"""
+    if properties.get("Characters") or properties.get("Words"):
+        return False
+    try:
+        return zf.getinfo("word/document.xml").file_size > STALE_METADATA_MIN_XML_BYTES
+    except KeyError:
+        return False
+
+
+def scan_section_page_sizes(zf: zipfile.ZipFile) -> List[Tuple[float, float]]:
+    """
+    قياسات صفحات الأقسام (مم) بالبحث عن pgSz في document.xml خاماً بدون تحليل XML
+    أسرع بكثير من iterparse عندما لا نحتاج إلا القياسات
+    """
+    sizes: List[Tuple[float, float]] = []
+    tail = b""
+    with zf.open("word/document.xml") as stream:
+        while True:
+            chunk = stream.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer = tail + chunk
+            last_end = 0
+            for match in _PGSZ_RE.finditer(buffer):
+                attributes = {key: value for key, value in _ATTR_RE.findall(match.group(1))}
+                try:
+                    width, height = float(attributes[b"w"]), float(attributes[b"h"])
+                    sizes.append((width / 56.6929, height / 56.6929))  # twips → مم
+                except (KeyError, ValueError):
+                    pass
+                last_end = match.end()
+            tail = buffer[max(last_end, len(buffer) - 512):]
+    return sizes
+
+
+# ============================================
+# الأنماط (styles.xml)
+# ============================================
+
+class _StyleTable:
+    """حجم الخط والتباعد الافتراضي لكل نمط فقرة مع الوراثة عبر basedOn"""
+
+    def __init__(self) -> None:
+        self.default_font = DEFAULT_FONT_PT
+        self.default_spacing = {"before": 0.0, "after": DEFAULT_SPACING_AFTER_PT, "line": ("auto", DEFAULT_LINE_MULTIPLIER)}
+        self.default_style: Optional[str] = None
+        self._styles: Dict[str, Dict[str, Any]] = {}
+        self._resolved: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, zf: zipfile.ZipFile) -> "_StyleTable":
+        table = cls()
+        try:
+            stream = zf.open("word/styles.xml")
+        except KeyError:
+            return table
+        with stream:
+            current: Optional[Dict[str, Any]] = None
+            in_defaults = False
+            for event, element in iterparse(stream, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    if tag == _w("docDefaults"):
+                        in_defaults = True
+                    elif tag == _w("style") and element.get(_w("type")) == "paragraph":
+                        current = {"id": element.get(_w("styleId"))}
+                        if element.get(_w("default")) in ("1", "true"):
+                            table.default_style = current["id"]
+                    continue
+
+                if tag == _w("sz"):
+                    size = _twips_attr(element, "val")
+                    if size:
+                        if current is not None:
+                            current["font"] = size / 2
+                        elif in_defaults:
+                            table.default_font = size / 2
+                elif tag == _w("spacing"):
+                    target = current if current is not None else (table.default_spacing if in_defaults else None)
+                    if target is not None:
+                        target.update(_parse_spacing(element))
+                elif tag == _w("basedOn") and current is not None:
+                    current["based_on"] = element.get(_w("val"))
+                elif tag == _w("docDefaults"):
+                    in_defaults = False
+                elif tag == _w("style"):
+                    if current is not None and current.get("id"):
+                        table._styles[current["id"]] = current
+                    current = None
+                    element.clear()
+        return table
+
+    def resolve(self, style_id: Optional[str], depth: int = 0) -> Dict[str, Any]:
+        style_id = style_id or self.default_style
+        if not style_id or style_id not in self._styles or depth > 16:
+            return {"font": self.default_font, **self.default_spacing}
+        if style_id not in self._resolved:
+            style = self._styles[style_id]
+            based_on = style.get("based_on")
+            base = self.resolve(based_on, depth + 1) if based_on and based_on != style_id else {"font": self.default_font, **self.default_spacing}
+            self._resolved[style_id] = {**base, **{key: value for key, value in style.items() if key in ("font", "before", "after", "line")}}
+        return self._resolved[style_id]
+
+
+def _parse_spacing(element) -> Dict[str, Any]:
+    spacing: Dict[str, Any] = {}
+    before, after, line = _twips_attr(element, "before"), _twips_attr(element, "after"), _twips_attr(element, "line")
+    if before is not None:
+        spacing["before"] = before / 20
+    if after is not None:
+        spacing["after"] = after / 20
+    if line:
+        rule = element.get(_w("lineRule")) or "auto"
+        spacing["line"] = ("auto", line / 240) if rule == "auto" else ("exact", line / 20)
+    return spacing
+
+
+# ============================================
+# مقدّر التخطيط
+# ============================================
+
+class _Section:
+    def __init__(self) -> None:
+        self.page_twips = DEFAULT_PAGE_TWIPS
+        self.margins_twips = DEFAULT_MARGINS_TWIPS
+        self.columns = 1
+        self.column_space_twips = 720.0
+        self.continuous = False
+
+    @classmethod
+    def from_element(cls, sect_pr) -> "_Section":
+        section = cls()
+        page_size = sect_pr.find(_w("pgSz"))
+        if page_size is not None:
+            width, height = _twips_attr(page_size, "w"), _twips_attr(page_size, "h")
+            if width and height:
+                section.page_twips = (width, height)
+        margins = sect_pr.find(_w("pgMar"))
+        if margins is not None:
+            section.margins_twips = tuple(
+                abs(_twips_attr(margins, side) or default)
+                for side, default in zip(("top", "right", "bottom", "left"), DEFAULT_MARGINS_TWIPS)
+            )
+        columns = sect_pr.find(_w("cols"))
+        if columns is not None:
+            section.columns = max(1, int(_twips_attr(columns, "num") or 1))
+            section.column_space_twips = _twips_attr(columns, "space") or 720.0
+        section_type = sect_pr.find(_w("type"))
+        section.continuous = section_type is not None and section_type.get(_w("val")) == "continuous"
+        return section
+
+    @property
+    def size_mm(self) -> Tuple[float, float]:
+        return self.page_twips[0] / 56.6929, self.page_twips[1] / 56.6929
+
+    @property
+    def text_width_pt(self) -> float:
+        top, right, bottom, left = self.margins_twips
+        width = (self.page_twips[0] - left - right) / 20
+        space = self.column_space_twips / 20 * (self.columns - 1)
+        return max(36.0, (width - space) / self.columns)
+
+    @property
+    def text_height_pt(self) -> float:
+        top, right, bottom, left = self.margins_twips
+        return max(72.0, (self.page_twips[1] - top - bottom) / 20)
+
+
+def _paragraph_height(paragraph: Dict[str, Any], width_pt: float) -> float:
+    font = paragraph["font"]
+    chars_per_line = max(1.0, width_pt / (font * AVG_CHAR_WIDTH_EM))
+    lines = max(1, math.ceil(paragraph["chars"] / chars_per_line))
+    rule, value = paragraph["line"]
+    line_height = value if rule == "exact" else font * LINE_HEIGHT_EM * value
+    return paragraph["before"] + paragraph["after"] + lines * line_height + paragraph["images"]
+
+
+class _Paginator:
+    """محاكاة ملء الصفحات بالكتل (فقرات، صفوف جداول، فواصل)"""
+
+    def __init__(self) -> None:
+        self.pages = 1
+        self.used = 0.0
+        self.has_content = False
+
+    def new_page(self) -> None:
+        self.pages += 1
+        self.used = 0.0
+
+    def add(self, height: float, page_height: float, splittable: bool = True) -> None:
+        self.has_content = True
+        if self.used + height <= page_height:
+            self.used += height
+            return
+        if not splittable and height <= page_height:
+            self.new_page()
+            self.used = height
+            return
+        overflow = self.used + height - page_height
+        self.pages += 1 + int(overflow // page_height)
+        self.used = overflow % page_height
+
+
+def estimate_layout(zf: zipfile.ZipFile) -> Dict[str, Any]:
+    """
+    تقدير عدد الصفحات من التخطيط - الكتل تُجمع لكل قسم ثم تُوزع على الصفحات عند معرفة
+    إعدادات القسم (sectPr يأتي في نهاية القسم في DOCX)
+    """
+    styles = _StyleTable.load(zf)
+    paginator = _Paginator()
+    section_pages: List[Tuple[Tuple[float, float], int]] = []
+    rendered_breaks = 0
+
+    blocks: List[Tuple[str, Any]] = []  # ("p", paragraph) | ("row", [cells]) | ("break", None)
+    paragraph: Optional[Dict[str, Any]] = None
+    table_depth = 0
+    row_cells: Optional[List[List[Dict[str, Any]]]] = None
+    first_section = True
+    body = None
+
+    def new_paragraph() -> Dict[str, Any]:
+        style = styles.resolve(None)
+        return {"chars": 0, "images": 0.0, "font": 0.0, "style_font": style["font"],
+                "before": style["before"], "after": style["after"], "line": style["line"]}
+
+    def flush_paragraph(target: Dict[str, Any]) -> Dict[str, Any]:
+        target["font"] = target["font"] or target["style_font"]
+        return target
+
+    def close_section(sect_pr) -> None:
+        nonlocal blocks, first_section
+        section = _Section.from_element(sect_pr) if sect_pr is not None else _Section()
+        if not first_section and not section.continuous:
+            paginator.new_page()
+        start_pages = paginator.pages
+        page_height = section.text_height_pt * section.columns if section.columns > 1 else section.text_height_pt
+        width = section.text_width_pt
+        for kind, block in blocks:
+            if kind == "break":
+                paginator.new_page()
+            elif kind == "p":
+                paginator.add(_paragraph_height(block, width), page_height)
+            elif kind == "row":
+                cell_width = max(18.0, width / max(1, len(block)) - TABLE_CELL_PADDING_PT)
+                height = max((sum(_paragraph_height(p, cell_width) for p in cell) for cell in block), default=0.0)
+                paginator.add(height, page_height, splittable=height > page_height)
+        section_pages.append((section.size_mm, paginator.pages - start_pages + 1))
+        blocks = []
+        first_section = False
+
+    with zf.open("word/document.xml") as stream:
+        for event, element in iterparse(stream, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == _w("body"):
+                    body = element
+                elif tag == _w("p"):
+                    paragraph = new_paragraph()
+                elif tag == _w("tbl"):
+                    table_depth += 1
+                elif tag == _w("tr") and table_depth == 1:
+                    row_cells = []
+                elif tag == _w("tc") and table_depth == 1 and row_cells is not None:
+                    row_cells.append([])
+                continue
+
+            # event == "end"
+            if paragraph is not None:
+                if tag == _w("t"):
+                    paragraph["chars"] += len(element.text or "")
+                elif tag == _w("tab"):
+                    paragraph["chars"] += TAB_CHARS
+                elif tag == _w("sz"):
+                    size = _twips_attr(element, "val")
+                    if size:
+                        paragraph["font"] = max(paragraph["font"], size / 2)
+                elif tag == _w("pStyle"):
+                    style = styles.resolve(element.get(_w("val")))
+                    paragraph.update(style_font=style["font"], before=style["before"], after=style["after"], line=style["line"])
+                elif tag == _w("spacing"):
+                    paragraph.update(_parse_spacing(element))
+                elif tag == "{%s}extent" % WP_NS:
+                    try:
+                        paragraph["images"] += float(element.get("cy")) / 12700  # EMU → نقطة
+                    except (TypeError, ValueError):
+                        pass
+                elif tag == _w("lastRenderedPageBreak"):
+                    rendered_breaks += 1
+                elif tag == _w("pageBreakBefore") and element.get(_w("val")) not in ("0", "false"):
+                    if table_depth == 0:
+                        blocks.append(("break", None))
+                elif tag == _w("br") and element.get(_w("type")) == "page" and table_depth == 0:
+                    # ما قبل الفاصل يبقى في الصفحة الحالية، وما بعده يبدأ صفحة جديدة
+                    blocks.append(("p", flush_paragraph(dict(paragraph))))
+                    blocks.append(("break", None))
+                    paragraph.update(chars=0, images=0.0, before=0.0)
+
+            if tag == _w("p"):
+                if paragraph is not None:
+                    finished = flush_paragraph(paragraph)
+                    if table_depth >= 1 and row_cells:
+                        row_cells[-1].append(finished)
+                    else:
+                        blocks.append(("p", finished))
+                    section_properties = element.find(f"{_w('pPr')}/{_w('sectPr')}")
+                    if section_properties is not None and table_depth == 0:
+                        close_section(section_properties)
+                paragraph = None
+                if table_depth == 0 and body is not None:
+                    body.clear()
+            elif tag == _w("tr") and table_depth == 1:
+                if row_cells:
+                    blocks.append(("row", row_cells))
+                row_cells = None
+                element.clear()
+            elif tag == _w("tbl"):
+                table_depth -= 1
+                if table_depth == 0 and body is not None:
+                    body.clear()
+            elif tag == _w("sectPr") and table_depth == 0 and paragraph is None:
+                # sectPr الأخير في body يخص القسم الأخير
+                close_section(element)
+                if body is not None:
+                    body.clear()
+
+    if blocks:
+        close_section(None)
+
+    return {
+        "pages": max(1, paginator.pages),
+        "section_pages": section_pages,
+        "rendered_page_breaks": rendered_breaks,
+    }
+
+
+# ============================================
+# الواجهة
+# ============================================
+
+def analyze_docx(fp: BinaryIO) -> Dict[str, Any]:
+    """
+    عدد صفحات DOCX وقياساتها (مم)
+    page_count_source: metadata | rendered_breaks | estimate
+    """
+    fp.seek(0)
+    with zipfile.ZipFile(fp) as zf:
+        properties = read_app_properties(zf)
+        metadata_pages = properties.get("Pages") or 0
+
+        if metadata_pages > 0 and not _metadata_is_stale(properties, zf):
+            return {
+                "pages": metadata_pages,
+                "section_sizes_mm": scan_section_page_sizes(zf),
+                "page_count_source": "metadata",
+            }
+
+        layout = estimate_layout(zf)
+        sizes: List[Tuple[float, float]] = []
+        for size, pages in layout["section_pages"]:
+            sizes.extend([size] * pages)
+
+        # Word يكتب lastRenderedPageBreak عند كل حد صفحة في آخر عرض للمستند - أدق من التقدير إن وجد
+        if layout["rendered_page_breaks"] > 0:
+            return {
+                "pages": layout["rendered_page_breaks"] + 1,
+                "estimated_pages": layout["pages"],
+                "section_sizes_mm": sizes,
+                "page_count_source": "rendered_breaks",
+            }
+        return {
+            "pages": layout["pages"],
+            "section_sizes_mm": sizes,
+            "page_count_source": "estimate",
+        }
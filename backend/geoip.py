@@ -0,0 +1,202 @@
+"""
+تحديد الدولة والمدينة من IP محلياً - بدون أي خدمة خارجية
+
+- قاعدة البيانات ملف CSV (أو CSV.gz) لنطاقات: بداية، نهاية، ... الدولة، ... المدينة
+  (صيغة DB-IP / IP2Location lite: العناوين نصاً "1.0.0.0" أو أرقاماً "16777216")
+  أرقام أعمدة الدولة والمدينة من GEOIP_COUNTRY_COLUMN و GEOIP_CITY_COLUMN
+- النطاقات تُحمّل في مصفوفات أرقام مرتبة (array للـ IPv4، قوائم int للـ IPv6 لأنها 128 بت)
+  والموقع رقم في قائمة (الدولة، المدينة) المميزة - البحث bisect واحد: ميكروثوانٍ لكل عنوان
+- مهمة خلفية تفحص تاريخ تعديل الملف كل GEOIP_RELOAD_SECONDS وتحمّل الجديد على مجمع التحليل
+  ثم تستبدل الجدول بإسناد واحد - الاستعلامات أثناء التحميل تستخدم الجدول القديم
+  (حدّث الملف بإعادة تسمية نسخة مكتملة فوقه - mv - حتى لا يُقرأ نصف مكتوب)
+"""
+import asyncio
+import csv
+import gzip
+import os
+import socket
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+GEOIP_DATABASE = os.getenv("GEOIP_DATABASE", os.path.join(os.path.dirname(__file__), "geoip", "ip-location.csv.gz"))
+GEOIP_COUNTRY_COLUMN = int(os.getenv("GEOIP_COUNTRY_COLUMN", "2"))
+GEOIP_CITY_COLUMN = int(os.getenv("GEOIP_CITY_COLUMN", "-1"))
+GEOIP_RELOAD_SECONDS = int(os.getenv("GEOIP_RELOAD_SECONDS", "300"))
+
+_IPV4_MAX = 0xFFFFFFFF
+_MAPPED_PREFIX = 0xFFFF00000000
+# قيم "غير معروف" في ملفات النطاقات المجانية
+_UNKNOWN = {"", "-", "ZZ"}
+
+Location = Tuple[Optional[str], Optional[str]]
+
+
+class GeoTable:
+    def __init__(self, path: str, mtime: float) -> None:
+        self.path = path
+        self.mtime = mtime
+        self.v4_starts = array("L")
+        self.v4_ends = array("L")
+        self.v4_locations = array("L")
+        self.v6_starts: List[int] = []
+        self.v6_ends: List[int] = []
+        self.v6_locations = array("L")
+        self.locations: List[Location] = []
+        self.load_ms: Optional[float] = None
+
+    def lookup(self, address: int, version: int) -> Optional[Location]:
+        if version == 4:
+            starts, ends, locations = self.v4_starts, self.v4_ends, self.v4_locations
+        else:
+            starts, ends, locations = self.v6_starts, self.v6_ends, self.v6_locations
+        index = bisect_right(starts, address) - 1
+        if index >= 0 and address <= ends[index]:
+            return self.locations[locations[index]]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "modified_at": datetime.fromtimestamp(self.mtime).isoformat(),
+            "ipv4_ranges": len(self.v4_starts),
+            "ipv6_ranges": len(self.v6_starts),
+            "locations": len(self.locations),
+            "load_ms": self.load_ms,
+        }
+
+
+def _address(value: str) -> Tuple[int, int]:
+    """(الرقم، الإصدار) - عنوان نصي أو رقم؛ عناوين IPv4 داخل IPv6 (::ffff:a.b.c.d) تُعامل كـ IPv4"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        version = 4 if number <= _IPV4_MAX else 6
+    else:
+        # inet_pton أسرع بكثير من ipaddress في مسار الاستقبال
+        family, version = (socket.AF_INET6, 6) if ":" in value else (socket.AF_INET, 4)
+        try:
+            number = int.from_bytes(socket.inet_pton(family, value.split("%")[0]), "big")
+        except OSError:
+            raise ValueError(f"عنوان IP غير صالح: {value}")
+    if version == 6 and number >> 32 == _MAPPED_PREFIX >> 32:
+        return number & _IPV4_MAX, 4
+    return number, version
+
+
+def _column(row: List[str], index: int) -> Optional[str]:
+    if index < 0 or index >= len(row):
+        return None
+    value = row[index].strip()
+    return None if value in _UNKNOWN else value[:100]
+
+
+def load_table(path: str) -> GeoTable:
+    """قراءة ملف النطاقات كاملاً (متزامن - على مجمع التحليل)"""
+    started = time.perf_counter()
+    table = GeoTable(path, os.path.getmtime(path))
+    location_ids: Dict[Location, int] = {}
+    v4: List[Tuple[int, int, int]] = []
+    v6: List[Tuple[int, int, int]] = []
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as handle:
+        for row in csv.reader(handle):
+            if len(row) < 3:
+                continue
+            try:
+                start, version = _address(row[0])
+                end, end_version = _address(row[1])
+            except ValueError:
+                # سطر العناوين أو سطر تالف
+                continue
+            if version != end_version or end < start:
+                continue
+            location = (_column(row, GEOIP_COUNTRY_COLUMN), _column(row, GEOIP_CITY_COLUMN))
+            if location == (None, None):
+                continue
+            location_id = location_ids.setdefault(location, len(location_ids))
+            (v4 if version == 4 else v6).append((start, end, location_id))
+
+    for ranges, starts, ends, locations in (
+        (v4, table.v4_starts, table.v4_ends, table.v4_locations),
+        (v6, table.v6_starts, table.v6_ends, table.v6_locations),
+    ):
+        ranges.sort()
+        for start, end, location_id in ranges:
+            starts.append(start)
+            ends.append(end)
+            locations.append(location_id)
+    table.locations = list(location_ids)
+    table.load_ms = round((time.perf_counter() - started) * 1000, 1)
+    return table
+
+
+_table: Optional[GeoTable] = None
+_reload_task: Optional[asyncio.Task] = None
+geoip_status: Dict[str, Any] = {"enabled": False, "table": None, "last_check_at": None, "last_error": None}
+
+
+def lookup(ip_address: Optional[str]) -> Location:
+    """(الدولة، المدينة) أو (None, None) - بدون قاعدة بيانات أو لعنوان غير صالح/خاص"""
+    table = _table
+    if table is None or not ip_address:
+        return None, None
+    try:
+        address, version = _address(ip_address)
+    except ValueError:
+        return None, None
+    return table.lookup(address, version) or (None, None)
+
+
+def reload_if_changed(path: str = GEOIP_DATABASE) -> bool:
+    """تحميل الملف إذا تغير تاريخ تعديله منذ آخر تحميل - يعيد True عند الاستبدال"""
+    global _table
+    geoip_status["last_check_at"] = datetime.now().isoformat()
+    if not os.path.exists(path):
+        geoip_status["enabled"] = _table is not None
+        return False
+    if _table is not None and _table.path == path and _table.mtime == os.path.getmtime(path):
+        return False
+    table = load_table(path)
+    _table = table
+    geoip_status.update(enabled=True, table=table.stats(), last_error=None)
+    return True
+
+
+async def _reload_loop() -> None:
+    from workers import run_in_analysis_pool
+
+    while True:
+        try:
+            if await run_in_analysis_pool(reload_if_changed):
+                stats = geoip_status["table"]
+                print(
+                    f"🌍 GeoIP database loaded: {stats['ipv4_ranges']} IPv4 + {stats['ipv6_ranges']} IPv6 ranges "
+                    f"in {stats['load_ms']} ms"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # الجدول السابق (إن وجد) يبقى مستخدماً
+            geoip_status["last_error"] = str(e)[:200]
+            print(f"⚠️ Error loading GeoIP database: {str(e)[:200]}")
+        await asyncio.sleep(GEOIP_RELOAD_SECONDS)
+
+
+def start_geoip() -> None:
+    """التحميل الأول ثم مراقبة الملف (من lifespan في main.py)"""
+    global _reload_task
+    _reload_task = asyncio.get_running_loop().create_task(_reload_loop())
+
+
+async def stop_geoip() -> None:
+    global _reload_task
+    if _reload_task is not None:
+        _reload_task.cancel()
+        try:
+            await _reload_task
+        except asyncio.CancelledError:
+            pass
+        _reload_task = None
@@ -0,0 +1,81 @@
+"""
+HyperLogLog: عدّ تقريبي للعناصر المميزة (الزوار) في مساحة ثابتة، مع إمكانية دمج أي عدد من المخططات
+
+- بدقة 14 (16384 سجل) الخطأ المعياري ≈ 0.81%
+- السجلات تُخزن bytes مضغوطة بـ zlib - مخطط ساعة فيه عشرات الجلسات يأخذ بضع مئات من البايتات
+- الدمج (أكبر قيمة لكل سجل) والعدّ يتمان بـ Pillow كصورة L: ImageChops.lighter هو max عنصراً بعنصر
+  و histogram يعطي توزيع القيم - كلاهما في C، فدمج عشرات المخططات يستغرق أجزاء من الملي ثانية بدون numpy
+"""
+import hashlib
+import math
+import zlib
+from typing import Iterable, Optional
+
+from PIL import Image, ImageChops
+
+DEFAULT_PRECISION = 14
+_MAGIC = b"H"
+_WIDTH = 128
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytearray] = None) -> None:
+        if not 7 <= precision <= 16:
+            raise ValueError("دقة HyperLogLog يجب أن تكون بين 7 و 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("عدد السجلات لا يطابق الدقة")
+
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def _image(self) -> Image.Image:
+        return Image.frombytes("L", (_WIDTH, self.size // _WIDTH), bytes(self.registers))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("لا يمكن دمج مخططات بدقة مختلفة")
+        self.registers = bytearray(ImageChops.lighter(self._image(), other._image()).tobytes())
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        merged = None
+        for sketch in sketches:
+            if sketch.precision != precision:
+                raise ValueError("لا يمكن دمج مخططات بدقة مختلفة")
+            image = sketch._image()
+            merged = image if merged is None else ImageChops.lighter(merged, image)
+        if merged is None:
+            return cls(precision)
+        return cls(precision, bytearray(merged.tobytes()))
+
+    def count(self) -> int:
+        histogram = self._image().histogram()
+        harmonic = sum(count * 2.0 ** -value for value, count in enumerate(histogram) if count)
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / harmonic
+        zeros = histogram[0]
+        if estimate <= 2.5 * self.size and zeros:
+            # تصحيح المدى الصغير (linear counting) - أدق بكثير عندما تكون أغلب السجلات فارغة
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return _MAGIC + bytes([self.precision]) + zlib.compress(bytes(self.registers), 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        if data[:1] != _MAGIC:
+            raise ValueError("بيانات HyperLogLog غير صالحة")
+        return cls(data[1], bytearray(zlib.decompress(data[2:])))
@@ -0,0 +1,281 @@
+"""
+فحص الصور من الترويسة فقط (بدون فك البكسلات) لمعرفة الأبعاد و DPI
+يقرأ مقاطع JPEG (SOF/APP0/APP1)، مقاطع PNG (IHDR/pHYs)، و IFD الأول في TIFF
+ويُستخدم للتحقق من دقة الطباعة الفعلية بالقياس المطلوب للخدمات المسعّرة بالمساحة
+"""
+import base64
+import io
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+# أقل دقة مقبولة للطباعة العادية (بوسترات، غلاسي)
+MIN_PRINT_DPI = int(os.getenv("MIN_PRINT_DPI", "150"))
+# الفليكس والبانرات تُشاهد من مسافة - دقة أقل مقبولة
+MIN_LARGE_FORMAT_DPI = int(os.getenv("MIN_LARGE_FORMAT_DPI", "72"))
+# ابتداءً من هذه المساحة (متر مربع) نعتبر العمل طباعة كبيرة
+LARGE_FORMAT_AREA_M2 = 1.0
+
+# حد أعلى لعدد البايتات التي نقرأها بحثاً عن الترويسة
+MAX_HEADER_SCAN = 4 * 1024 * 1024
+
+_UNIT_TO_CM = {"cm": 1.0, "mm": 0.1, "m": 100.0, "in": 2.54, "inch": 2.54}
+
+# علامات SOF التي تحتوي أبعاد الصورة (باستثناء DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _read_exact(fp: BinaryIO, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError("ترويسة الصورة مقطوعة")
+    return data
+
+
+def _tiff_resolution(fp: BinaryIO, base: int) -> Dict[str, Any]:
+    """قراءة الأبعاد والدقة من أول IFD في بنية TIFF (ملف TIFF أو مقطع Exif)"""
+    fp.seek(base)
+    byte_order = _read_exact(fp, 2)
+    if byte_order == b"II":
+        endian = "<"
+    elif byte_order == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("ترويسة TIFF غير صالحة")
+    magic, ifd_offset = struct.unpack(endian + "HI", _read_exact(fp, 6))
+    if magic != 42:
+        raise ValueError("ترويسة TIFF غير صالحة")
+
+    fp.seek(base + ifd_offset)
+    (count,) = struct.unpack(endian + "H", _read_exact(fp, 2))
+    tags: Dict[int, Any] = {}
+    rationals: Dict[int, int] = {}
+    for _ in range(min(count, 512)):
+        tag, field_type, value_count, raw = struct.unpack(endian + "HHI4s", _read_exact(fp, 12))
+        if tag not in (256, 257, 282, 283, 296):
+            continue
+        if field_type == 3:
+            tags[tag] = struct.unpack(endian + "H", raw[:2])[0]
+        elif field_type == 4:
+            tags[tag] = struct.unpack(endian + "I", raw)[0]
+        elif field_type == 5:
+            rationals[tag] = struct.unpack(endian + "I", raw)[0]
+
+    for tag, offset in rationals.items():
+        fp.seek(base + offset)
+        numerator, denominator = struct.unpack(endian + "II", _read_exact(fp, 8))
+        if denominator:
+            tags[tag] = numerator / denominator
+
+    result: Dict[str, Any] = {}
+    if 256 in tags and 257 in tags:
+        result["width"], result["height"] = tags[256], tags[257]
+    x_res, y_res = tags.get(282), tags.get(283)
+    unit = tags.get(296, 2)
+    if x_res and y_res and unit in (2, 3):
+        factor = 2.54 if unit == 3 else 1.0
+        result["dpi"] = (round(x_res * factor, 2), round(y_res * factor, 2))
+    return result
+
+
+def _inspect_jpeg(fp: BinaryIO) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"format": "JPEG"}
+    fp.seek(2)
+    while fp.tell() < MAX_HEADER_SCAN:
+        byte = fp.read(1)
+        if not byte:
+            break
+        if byte != b"\xff":
+            continue
+        marker = fp.read(1)
+        while marker == b"\xff":
+            marker = fp.read(1)
+        if not marker:
+            break
+        code = marker[0]
+        if code in (0x01, 0xD8) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):  # EOI / SOS - انتهت الترويسات
+            break
+        (length,) = struct.unpack(">H", _read_exact(fp, 2))
+        segment_start = fp.tell()
+
+        if code == 0xE0 and length >= 14:
+            payload = _read_exact(fp, 12)
+            if payload[:5] == b"JFIF\x00":
+                units, x_density, y_density = struct.unpack(">BHH", payload[7:12])
+                if units in (1, 2) and x_density and y_density and "dpi" not in info:
+                    factor = 2.54 if units == 2 else 1.0
+                    info["dpi"] = (round(x_density * factor, 2), round(y_density * factor, 2))
+        elif code == 0xE1 and length > 8:
+            if fp.read(6) == b"Exif\x00\x00":
+                try:
+                    exif = _tiff_resolution(fp, segment_start + 6)
+                    # دقة Exif أدق من JFIF الافتراضية (72) في معظم الكاميرات والبرامج
+                    if exif.get("dpi"):
+                        info["dpi"] = exif["dpi"]
+                except (ValueError, struct.error):
+                    pass
+        elif code in _JPEG_SOF_MARKERS:
+            precision, height, width, components = struct.unpack(">BHHB", _read_exact(fp, 6))
+            info.update(width=width, height=height, components=components)
+            break
+        fp.seek(segment_start + length - 2)
+    return info
+
+
+def _inspect_png(fp: BinaryIO) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"format": "PNG"}
+    fp.seek(8)
+    while fp.tell() < MAX_HEADER_SCAN:
+        header = fp.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IHDR":
+            width, height, bit_depth, color_type = struct.unpack(">IIBB", _read_exact(fp, 10))
+            info.update(width=width, height=height, bit_depth=bit_depth, color_type=color_type)
+            fp.seek(length - 10 + 4, io.SEEK_CUR)
+            continue
+        if chunk_type == b"pHYs" and length == 9:
+            ppu_x, ppu_y, unit = struct.unpack(">IIB", _read_exact(fp, 9))
+            if unit == 1 and ppu_x and ppu_y:
+                info["dpi"] = (round(ppu_x * 0.0254, 2), round(ppu_y * 0.0254, 2))
+            fp.seek(4, io.SEEK_CUR)
+            continue
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+        fp.seek(length + 4, io.SEEK_CUR)
+    return info
+
+
+class Base64Reader:
+    """
+    ملف للقراءة فوق نص base64 يفك فقط المقاطع التي تُقرأ فعلاً (كل 4 أحرف = 3 بايت)
+    فحص الترويسة يصل إلى SOF مهما كبرت مقاطع Exif/ICC قبله، والقفز فوق مقطع لا يفكه
+    """
+
+    def __init__(self, encoded: str) -> None:
+        self._encoded = encoded
+        self._position = 0
+        padding = len(encoded) - len(encoded.rstrip("="))
+        self._length = len(encoded) // 4 * 3 - padding
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._length}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length - self._position
+        start = self._position // 3 * 4
+        end = min(len(self._encoded), -(-(self._position + size) // 3) * 4)
+        if start >= end:
+            return b""
+        data = base64.b64decode(self._encoded[start:end])[self._position % 3:][:size]
+        self._position += len(data)
+        return data
+
+
+def inspect_data_url(data_url: str) -> Optional[Dict[str, Any]]:
+    """inspect_image_header لصورة في data URL بدون فك الـ base64 كاملاً"""
+    if "," not in data_url:
+        return None
+    return inspect_image_header(Base64Reader(data_url.split(",", 1)[1]))
+
+
+def inspect_image_header(source: Union[bytes, BinaryIO, str]) -> Optional[Dict[str, Any]]:
+    """
+    قراءة الأبعاد (width, height) و DPI من الترويسة فقط
+    يعيد None إذا لم تكن الصيغة مدعومة أو الترويسة تالفة
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as fp:
+            return inspect_image_header(fp)
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    try:
+        fp.seek(0)
+        signature = fp.read(8)
+        if signature[:3] == b"\xff\xd8\xff":
+            info = _inspect_jpeg(fp)
+        elif signature == b"\x89PNG\r\n\x1a\n":
+            info = _inspect_png(fp)
+        elif signature[:4] in (b"II*\x00", b"MM\x00*"):
+            info = {"format": "TIFF", **_tiff_resolution(fp, 0)}
+        else:
+            return None
+    except (ValueError, struct.error, OSError) as e:
+        print(f"⚠️ Failed to inspect image header: {e}")
+        return None
+    finally:
+        try:
+            fp.seek(0)
+        except Exception:
+            pass
+
+    if "width" not in info:
+        return None
+    return info
+
+
+def dimensions_to_cm(dimensions: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """تحويل أبعاد الطلب {width, height, widthUnit, heightUnit} إلى سنتيمتر"""
+    if not isinstance(dimensions, dict):
+        return None
+    try:
+        width = float(dimensions.get("width") or 0)
+        height = float(dimensions.get("height") or dimensions.get("length") or 0)
+    except (TypeError, ValueError):
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    width_unit = _UNIT_TO_CM.get(str(dimensions.get("widthUnit") or "cm").lower(), 1.0)
+    height_unit = _UNIT_TO_CM.get(str(dimensions.get("heightUnit") or "cm").lower(), 1.0)
+    return width * width_unit, height * height_unit
+
+
+def recommended_min_dpi(width_cm: float, height_cm: float) -> int:
+    """الدقة الدنيا المقترحة حسب مساحة الطباعة"""
+    if (width_cm / 100) * (height_cm / 100) >= LARGE_FORMAT_AREA_M2:
+        return MIN_LARGE_FORMAT_DPI
+    return MIN_PRINT_DPI
+
+
+def check_print_resolution(
+    info: Dict[str, Any],
+    width_cm: float,
+    height_cm: float,
+    min_dpi: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    حساب الدقة الفعلية عند طباعة الصورة بالقياس المطلوب
+    يطابق اتجاه الصورة مع اتجاه القياس (طولي/عرضي) قبل الحساب
+    """
+    min_dpi = min_dpi or recommended_min_dpi(width_cm, height_cm)
+    pixel_w, pixel_h = info["width"], info["height"]
+    print_w, print_h = width_cm, height_cm
+    if (pixel_w >= pixel_h) != (print_w >= print_h):
+        print_w, print_h = print_h, print_w
+
+    effective_dpi = round(min(pixel_w / (print_w / 2.54), pixel_h / (print_h / 2.54)), 1)
+    result: Dict[str, Any] = {
+        "width_px": pixel_w,
+        "height_px": pixel_h,
+        "embedded_dpi": info.get("dpi"),
+        "print_width_cm": round(width_cm, 2),
+        "print_height_cm": round(height_cm, 2),
+        "effective_dpi": effective_dpi,
+        "min_dpi": min_dpi,
+        "ok": effective_dpi >= min_dpi,
+        "warning": None,
+    }
+    if not result["ok"]:
+        result["warning"] = (
+            f"دقة الصورة منخفضة: {effective_dpi:.0f} DPI عند الطباعة بقياس "
+            f"{width_cm:g}×{height_cm:g} سم (المطلوب {min_dpi} DPI على الأقل)"
+        )
+    return result
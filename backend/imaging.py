@@ -0,0 +1,414 @@
+"""
+معالجة الصور الكبيرة (فليكس، بانرات، رول أب) ضمن ميزانية ذاكرة محددة
+
+ملفات هذه الخدمات قد تتجاوز عشرات آلاف البكسلات في كل ضلع، و Image.open(...).convert(...)
+يحجز نسخة كاملة من الصورة في كل خطوة. هنا:
+- نحسب حجم الصورة بعد فك الترميز من الترويسة فقط ونحجزه من ميزانية مشتركة قبل أي فك
+- المعاينات تستخدم draft (فك JPEG مصغّر مباشرة) و reduce بدلاً من فك الصورة كاملة
+- تعديل DPI لملفات JPEG/PNG يتم بنسخ تدفقي للترويسة دون لمس البكسلات
+- التحويل للطباعة يتم على شكل شرائط (strips) ويُكتب مباشرة إلى TIFF بدون نسخة كاملة ثانية
+"""
+import io
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple, Union
+
+from PIL import Image
+
+# الميزانية الكلية للذاكرة المخصصة لفك الصور (لكل العمال معاً)
+IMAGING_MEMORY_BUDGET_MB = int(os.getenv("IMAGING_MEMORY_BUDGET_MB", "512"))
+# ارتفاع الشريط الواحد عند المعالجة على شكل شرائط
+STRIP_HEIGHT = int(os.getenv("IMAGING_STRIP_HEIGHT", "256"))
+# حجم القطعة عند النسخ التدفقي للملفات
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# حد البكسلات لملفات البانرات (حد Pillow الافتراضي ~89 مليون) - يُرفع فقط أثناء فتحها عبر open_large
+IMAGING_MAX_PIXELS = int(os.getenv("IMAGING_MAX_PIXELS", "1000000000"))
+# المدة المقترحة للعميل قبل إعادة المحاولة عندما تكون الميزانية مشغولة (Retry-After)
+IMAGING_RETRY_AFTER_SECONDS = int(os.getenv("IMAGING_RETRY_AFTER_SECONDS", "30"))
+# صيغة TIFF العادية تخزن المواضع بـ 32 بت
+TIFF_MAX_BYTES = 0xFFFFFFFF
+
+ImageSource = Union[str, bytes, BinaryIO]
+
+
+class ImageTooLargeError(ValueError):
+    """الصورة تحتاج ذاكرة أكبر من الميزانية المسموحة"""
+
+
+class ImagingBusyError(RuntimeError):
+    """الميزانية مشغولة بصور أخرى حالياً - الطلب صالح ويمكن إعادته لاحقاً"""
+
+
+class MemoryBudget:
+    """ميزانية ذاكرة مشتركة بين العمال - كل عملية فك تحجز حجمها قبل البدء وتنتظر إن لم يتوفر"""
+
+    def __init__(self, limit_bytes: int) -> None:
+        self.limit_bytes = limit_bytes
+        self._used = 0
+        self._cond = threading.Condition()
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = 120.0):
+        if nbytes > self.limit_bytes:
+            raise ImageTooLargeError(
+                f"الصورة تحتاج {nbytes / 1024 / 1024:.0f}MB والحد المسموح {self.limit_bytes / 1024 / 1024:.0f}MB"
+            )
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._used + nbytes <= self.limit_bytes, timeout=timeout):
+                raise ImagingBusyError("الخادم مشغول بمعالجة صور أخرى، يرجى المحاولة بعد قليل")
+            self._used += nbytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._used -= nbytes
+                self._cond.notify_all()
+
+
+image_budget = MemoryBudget(IMAGING_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def bytes_per_pixel(mode: str) -> int:
+    """عدد البايتات لكل بكسل في ذاكرة Pillow (وليس في الملف)"""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def decoded_size(size: Tuple[int, int], mode: str) -> int:
+    """حجم الصورة في الذاكرة بعد فك الترميز"""
+    return size[0] * size[1] * bytes_per_pixel(mode)
+
+
+def open_lazy(source: ImageSource) -> Image.Image:
+    """فتح الصورة بدون فك البكسلات (Pillow يقرأ الترويسة فقط)"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return Image.open(source)
+
+
+_pixel_limit_lock = threading.Lock()
+_pixel_limit_users = 0
+_default_max_pixels = Image.MAX_IMAGE_PIXELS
+
+
+@contextmanager
+def large_image_limit():
+    """
+    رفع Image.MAX_IMAGE_PIXELS إلى IMAGING_MAX_PIXELS مؤقتاً ثم إرجاع القيمة السابقة
+    الحد متغير عام في Pillow، فالعدّاد يضمن ألا يُرجعه عامل بينما عامل آخر ما زال يفتح ملفاً كبيراً
+    Pillow يفحص الحد عند قراءة الترويسة فقط، فالنافذة قصيرة وبقية المسارات تبقى بالحد الافتراضي
+    """
+    global _pixel_limit_users, _default_max_pixels
+    with _pixel_limit_lock:
+        if _pixel_limit_users == 0:
+            _default_max_pixels = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = max(IMAGING_MAX_PIXELS, _default_max_pixels or 0)
+        _pixel_limit_users += 1
+    try:
+        yield
+    finally:
+        with _pixel_limit_lock:
+            _pixel_limit_users -= 1
+            if _pixel_limit_users == 0:
+                Image.MAX_IMAGE_PIXELS = _default_max_pixels
+
+
+def open_large(source: ImageSource) -> Image.Image:
+    """open_lazy لملفات الطباعة الكبيرة - الوحيدة المسموح لها بتجاوز حد Pillow الافتراضي"""
+    with large_image_limit():
+        return open_lazy(source)
+
+
+def _raw_layout(img: Image.Image) -> Optional[Tuple[int, str, int, int]]:
+    """
+    إرجاع (offset, rawmode, stride, orientation) إذا كانت البكسلات مخزنة بدون ضغط
+    (TIFF غير مضغوط، BMP، PPM) بحيث يمكن قراءة أي شريط مباشرة من الملف
+    """
+    if len(img.tile) != 1:
+        return None
+    codec, extents, offset, args = img.tile[0][:4]
+    if codec != "raw" or img.mode == "P" or tuple(extents) != (0, 0) + img.size:
+        return None
+    if isinstance(args, tuple):
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+    else:
+        rawmode, stride, orientation = args, 0, 1
+    try:
+        bytes_per_8px = len(Image.new(img.mode, (8, 1)).tobytes("raw", rawmode))
+    except Exception:
+        return None
+    if bytes_per_8px % 8:
+        return None
+    if not stride:
+        stride = img.size[0] * bytes_per_8px // 8
+    return offset, rawmode, stride, orientation
+
+
+def iter_strips(img: Image.Image, strip_height: int = STRIP_HEIGHT) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    توليد الصورة على شكل شرائط أفقية (y, strip)
+    للصيغ غير المضغوطة نقرأ كل شريط مباشرة من الملف فتبقى الذاكرة بحجم الشريط،
+    ولبقية الصيغ نفك الصورة مرة واحدة فقط بعد حجز حجمها من الميزانية
+    """
+    width, height = img.size
+    layout = _raw_layout(img) if img.fp is not None else None
+
+    if layout:
+        offset, rawmode, stride, orientation = layout
+        for y0 in range(0, height, strip_height):
+            rows = min(strip_height, height - y0)
+            with image_budget.reserve(decoded_size((width, rows), img.mode) + rows * stride):
+                first_row = y0 if orientation > 0 else height - y0 - rows
+                img.fp.seek(offset + first_row * stride)
+                data = img.fp.read(rows * stride)
+                yield y0, Image.frombytes(img.mode, (width, rows), data, "raw", rawmode, stride, orientation)
+        return
+
+    with image_budget.reserve(decoded_size(img.size, img.mode)):
+        img.load()
+        for y0 in range(0, height, strip_height):
+            yield y0, img.crop((0, y0, width, min(height, y0 + strip_height)))
+
+
+def make_preview(source: ImageSource, max_side: int = 1600) -> Image.Image:
+    """
+    معاينة مصغّرة لصورة كبيرة بدون فكها كاملة:
+    JPEG يُفك مباشرة بمقياس 1/2..1/8 عبر draft، وبقية الصيغ تُصغَّر شريطاً شريطاً عبر reduce
+    """
+    img = open_large(source)
+    img.draft("RGB", (max_side, max_side))
+
+    factor = max(1, max(img.size) // max_side)
+    if factor == 1 or _raw_layout(img) is None:
+        with image_budget.reserve(decoded_size(img.size, img.mode)):
+            img.load()
+            preview = img.reduce(factor) if factor > 1 else img.copy()
+    else:
+        # الصيغ غير المضغوطة: نصغّر كل شريط على حدة ونلصقه في المعاينة
+        width, height = img.size
+        preview = Image.new(img.mode, ((width + factor - 1) // factor, (height + factor - 1) // factor))
+        strip_height = max(factor, STRIP_HEIGHT // factor * factor)
+        for y0, strip in iter_strips(img, strip_height):
+            preview.paste(strip.reduce(factor), (0, y0 // factor))
+
+    preview.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return flatten_to_rgb(preview)
+
+
+def flatten_to_rgb(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    """تحويل أي وضع إلى RGB مع دمج الشفافية على خلفية بيضاء"""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        flat = Image.new("RGB", image.size, background)
+        flat.paste(image, mask=image.getchannel("A"))
+        return flat
+    return image.convert("RGB")
+
+
+# ============================================
+# تعديل DPI بدون فك البكسلات
+# ============================================
+
+def _copy_stream(src: BinaryIO, dst: BinaryIO, length: Optional[int] = None) -> None:
+    if length is None:
+        while True:
+            chunk = src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                return
+            dst.write(chunk)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length))
+        if not chunk:
+            raise ValueError("الملف مقطوع")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _stamp_jpeg_dpi(src: BinaryIO, dst: BinaryIO, dpi: int) -> None:
+    dst.write(src.read(2))  # SOI
+    marker = src.read(4)
+    if marker[:2] == b"\xff\xe0":
+        length = struct.unpack(">H", marker[2:4])[0]
+        segment = bytearray(src.read(length - 2))
+        if segment[:5] == b"JFIF\x00":
+            # units=1 (dpi), Xdensity, Ydensity
+            segment[7:12] = struct.pack(">BHH", 1, dpi, dpi)
+            dst.write(marker + bytes(segment))
+            _copy_stream(src, dst)
+            return
+        dst.write(marker + bytes(segment))
+    else:
+        src.seek(-len(marker), io.SEEK_CUR)
+    jfif = b"JFIF\x00\x01\x01" + struct.pack(">BHH", 1, dpi, dpi) + b"\x00\x00"
+    dst.write(b"\xff\xe0" + struct.pack(">H", len(jfif) + 2) + jfif)
+    _copy_stream(src, dst)
+
+
+def _stamp_png_dpi(src: BinaryIO, dst: BinaryIO, dpi: int) -> None:
+    dst.write(src.read(8))  # PNG signature
+    ppm = int(round(dpi / 0.0254))
+    phys = struct.pack(">IIB", ppm, ppm, 1)
+    while True:
+        header = src.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"pHYs":
+            src.seek(length + 4, io.SEEK_CUR)
+            continue
+        dst.write(header)
+        _copy_stream(src, dst, length + 4)  # البيانات + CRC
+        if chunk_type == b"IHDR":
+            crc = zlib.crc32(b"pHYs" + phys) & 0xFFFFFFFF
+            dst.write(struct.pack(">I4s", len(phys), b"pHYs") + phys + struct.pack(">I", crc))
+        elif chunk_type == b"IEND":
+            return
+
+
+def stamp_dpi(src: BinaryIO, dst: BinaryIO, dpi: int) -> Optional[str]:
+    """
+    كتابة DPI في ترويسة JPEG (JFIF) أو PNG (pHYs) مع نسخ بقية الملف كما هو
+    يعيد صيغة الملف، أو None إذا كانت الصيغة غير مدعومة (يجب فك الصورة في هذه الحالة)
+    """
+    src.seek(0)
+    signature = src.read(8)
+    src.seek(0)
+    if signature[:3] == b"\xff\xd8\xff":
+        _stamp_jpeg_dpi(src, dst, dpi)
+        return "JPEG"
+    if signature == b"\x89PNG\r\n\x1a\n":
+        _stamp_png_dpi(src, dst, dpi)
+        return "PNG"
+    return None
+
+
+# ============================================
+# كتابة TIFF على شكل شرائط
+# ============================================
+
+_TIFF_PHOTOMETRIC = {"L": 1, "RGB": 2, "CMYK": 5}
+
+
+def write_tiff_strips(
+    dst: BinaryIO,
+    size: Tuple[int, int],
+    mode: str,
+    strips: Iterator[Tuple[int, Image.Image]],
+    dpi: int = 300,
+    icc_profile: Optional[bytes] = None,
+) -> None:
+    """
+    كتابة TIFF غير مضغوط شريطاً شريطاً - لا نحتاج الصورة الناتجة كاملة في الذاكرة
+    الشرائط يجب أن تأتي بالترتيب من الأعلى للأسفل وبنفس الوضع mode
+    icc_profile: ملف ICC يُضمَّن في الملف (وسم 34675) ليعرف الـ RIP مساحة الألوان
+    """
+    if mode not in _TIFF_PHOTOMETRIC:
+        raise ValueError(f"وضع غير مدعوم لكتابة TIFF: {mode}")
+    width, height = size
+    samples = len(mode)
+    data_size = width * height * samples
+
+    # الترويسة: II*\0 ثم IFD مباشرة بعدها، ثم القيم الإضافية، ثم البكسلات
+    entries = []
+    extra = b""
+    ifd_offset = 8
+    entry_count = 12 + (mode == "CMYK") + bool(icc_profile)
+    extra_offset = ifd_offset + 2 + entry_count * 12 + 4
+
+    def add_extra(payload: bytes) -> int:
+        nonlocal extra
+        offset = extra_offset + len(extra)
+        extra += payload
+        return offset
+
+    bits_value = 8
+    if samples > 1:
+        bits_value = add_extra(struct.pack("<" + "H" * samples, *([8] * samples)))
+    resolution = add_extra(struct.pack("<II", dpi, 1))
+    icc_offset = add_extra(icc_profile + b"\x00" * (len(icc_profile) % 2)) if icc_profile else 0
+    data_offset = extra_offset + len(extra)
+    if data_offset + data_size > TIFF_MAX_BYTES:
+        # StripOffsets و StripByteCounts بـ 32 بت - ملف أكبر من 4GB يُكتب بمواضع خاطئة
+        raise ImageTooLargeError(
+            f"ملف TIFF الناتج ({data_size / 1024 ** 3:.1f}GB) يتجاوز حد 4GB لصيغة TIFF - قلل الأبعاد"
+        )
+
+    entries.append((256, 4, 1, width))              # ImageWidth
+    entries.append((257, 4, 1, height))             # ImageLength
+    entries.append((258, 3, samples, bits_value))   # BitsPerSample
+    entries.append((259, 3, 1, 1))                  # Compression = none
+    entries.append((262, 3, 1, _TIFF_PHOTOMETRIC[mode]))
+    entries.append((273, 4, 1, data_offset))        # StripOffsets
+    entries.append((277, 3, 1, samples))            # SamplesPerPixel
+    entries.append((278, 4, 1, height))             # RowsPerStrip
+    entries.append((279, 4, 1, data_size))          # StripByteCounts
+    entries.append((282, 5, 1, resolution))         # XResolution
+    entries.append((283, 5, 1, resolution))         # YResolution
+    entries.append((296, 3, 1, 2))                  # ResolutionUnit = inch
+    if mode == "CMYK":
+        entries.append((332, 3, 1, 1))              # InkSet = CMYK
+    if icc_profile:
+        entries.append((34675, 7, len(icc_profile), icc_offset))  # ICC Profile
+
+    header = b"II*\x00" + struct.pack("<I", ifd_offset) + struct.pack("<H", len(entries))
+    for tag, field_type, count, value in entries:
+        if field_type == 3 and count == 1:
+            header += struct.pack("<HHIHH", tag, field_type, count, value, 0)
+        else:
+            header += struct.pack("<HHII", tag, field_type, count, value)
+    header += struct.pack("<I", 0) + extra
+    dst.write(header)
+
+    written_rows = 0
+    for y0, strip in strips:
+        if y0 != written_rows or strip.mode != mode or strip.size[0] != width:
+            raise ValueError("الشرائط يجب أن تكون متتالية وبنفس الوضع والعرض")
+        dst.write(strip.tobytes())
+        written_rows += strip.size[1]
+    if written_rows != height:
+        raise ValueError("عدد الأسطر المكتوبة لا يطابق ارتفاع الصورة")
+
+
+def convert_for_print(
+    source: ImageSource,
+    dst: BinaryIO,
+    dpi: int = 300,
+    mode: str = "RGB",
+    transform: Optional[Callable[[Image.Image], Image.Image]] = None,
+    icc_profile: Optional[bytes] = None,
+) -> Tuple[int, int]:
+    """
+    تحويل صورة كبيرة إلى TIFF جاهز للطباعة بالـ DPI المطلوب، شريطاً شريطاً
+    transform: تحويل اختياري يُطبق على كل شريط (مثل تحويل الألوان) ويجب أن يعيد الوضع mode
+    icc_profile: ملف ICC لمساحة الألوان الناتجة يُضمَّن في TIFF
+    """
+    img = open_large(source)
+
+    def converted():
+        for y0, strip in iter_strips(img):
+            if transform is not None:
+                strip = transform(strip)
+            elif strip.mode != mode:
+                strip = flatten_to_rgb(strip) if mode == "RGB" else strip.convert(mode)
+            yield y0, strip
+
+    write_tiff_strips(dst, img.size, mode, converted(), dpi=dpi, icc_profile=icc_profile)
+    return img.size
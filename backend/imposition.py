@@ -0,0 +1,342 @@
+"""
+تركيب القطع الصغيرة (كروت شخصية، صور شخصية...) على أفرخ الطباعة (SRA3/A3)
+
+- compute_layout: أفضل توزيع لقياس قطعة على فرخ مع الـ bleed والهامش: شبكة بأحد الاتجاهين،
+  أو شبكة + شريط بالاتجاه المعاكس في المساحة المتبقية - حساب مباشر بدون تجريب مواقع
+- plan_gang_run: جمع عدة طلبات بنفس القياس على أفرخ مشتركة: لكل طلب عدد خانات متناسب مع كميته،
+  والطلبات بكميات متقاربة تُجمع في فئة بطول تشغيل واحد (عدد الأفرخ لكل قالب) يقلل مجموع الأفرخ
+  مع تكلفة تجهيز كل قالب - طلب لا يوفر دمجه شيئاً يُطبع على قوالبه وحده
+- render_gang_pdf: ملف PDF متجهي للقوالب مع علامات القص (التصاميم PDF تبقى متجهية)
+"""
+import os
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from production_pdf import (
+    PRODUCTION_PAPER_SIZES_MM,
+    OUTPUT_CHUNK_SIZE,
+    PdfAssembler,
+    ProductionPdfError,
+    placement_matrix,
+)
+from document_analysis import POINTS_PER_MM, _open_pdf
+
+# قياسات القطع الشائعة (ملم)
+ITEM_PRESETS_MM = {
+    "business_card": (90, 50),
+    "passport_photo": (35, 48),
+}
+DEFAULT_SHEET = os.getenv("IMPOSITION_SHEET", "SRA3")
+DEFAULT_BLEED_MM = 2.0
+# المساحة غير القابلة للطباعة على حواف الفرخ (مسكة الماكينة) + مكان علامات القص
+DEFAULT_MARGIN_MM = 10.0
+# تكلفة تجهيز كل قالب بعدد الأفرخ (هدر الضبط)
+FORM_SETUP_SHEETS = int(os.getenv("IMPOSITION_SETUP_SHEETS", "5"))
+# أقصى عدد قوالب إضافية نجربها فوق الحد الأدنى عند اختيار طول التشغيل
+MAX_EXTRA_FORMS = 50
+CROP_MARK_LENGTH_MM = 4.0
+CROP_MARK_OFFSET_MM = 1.5
+
+IMAGE_DESIGN_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp"}
+
+
+def _fit(length: float, cell: float, gutter: float) -> int:
+    return max(0, int((length + gutter + 1e-6) // cell))
+
+
+def compute_layout(
+    item_width: float,
+    item_height: float,
+    sheet: str = DEFAULT_SHEET,
+    bleed: float = DEFAULT_BLEED_MM,
+    margin: float = DEFAULT_MARGIN_MM,
+    gutter: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    أفضل توزيع لقطعة (بالملم، بدون bleed) على الفرخ
+    يعيد {count, slots: [{x, y, width, height, rotated}], ...} - الخانات بإطار القص ومن أسفل يسار الفرخ
+    """
+    sheet_size = PRODUCTION_PAPER_SIZES_MM.get((sheet or "").upper())
+    if not sheet_size:
+        raise ProductionPdfError(f"قياس الفرخ غير مدعوم: {sheet}. المتاح: {', '.join(PRODUCTION_PAPER_SIZES_MM)}")
+    if item_width <= 0 or item_height <= 0:
+        raise ProductionPdfError("قياس القطعة غير صالح")
+    sheet_width, sheet_height = sheet_size
+    area_width, area_height = sheet_width - 2 * margin, sheet_height - 2 * margin
+
+    def cell(rotated: bool) -> Tuple[float, float]:
+        width, height = (item_height, item_width) if rotated else (item_width, item_height)
+        return width + 2 * bleed + gutter, height + 2 * bleed + gutter
+
+    # (العدد، عدد الكتل، الكتل [(x, y, أعمدة، صفوف، مدورة)])
+    best: Tuple[int, int, List[Tuple[float, float, int, int, bool]]] = (0, 0, [])
+    for rotated in (False, True):
+        cell_width, cell_height = cell(rotated)
+        other_width, other_height = cell(not rotated)
+        columns = _fit(area_width, cell_width, gutter)
+        max_rows = _fit(area_height, cell_height, gutter)
+        # شبكة رئيسية بعدد صفوف أقل + شريط مدور فوقها
+        for rows in range(max_rows, -1, -1):
+            used = rows * cell_height
+            strip_columns = _fit(area_width, other_width, gutter)
+            strip_rows = _fit(area_height - used, other_height, gutter)
+            blocks = [(0.0, 0.0, columns, rows, rotated)] if rows and columns else []
+            if strip_columns and strip_rows:
+                blocks.append((0.0, used, strip_columns, strip_rows, not rotated))
+            count = sum(block[2] * block[3] for block in blocks)
+            if count > best[0] or (count == best[0] and count and len(blocks) < best[1]):
+                best = (count, len(blocks), blocks)
+        # شبكة رئيسية بعدد أعمدة أقل + شريط مدور بجانبها
+        for main_columns in range(columns, -1, -1):
+            used = main_columns * cell_width
+            strip_columns = _fit(area_width - used, other_width, gutter)
+            strip_rows = _fit(area_height, other_height, gutter)
+            blocks = [(0.0, 0.0, main_columns, max_rows, rotated)] if main_columns and max_rows else []
+            if strip_columns and strip_rows:
+                blocks.append((used, 0.0, strip_columns, strip_rows, not rotated))
+            count = sum(block[2] * block[3] for block in blocks)
+            if count > best[0] or (count == best[0] and count and len(blocks) < best[1]):
+                best = (count, len(blocks), blocks)
+
+    count, _, blocks = best
+    slots: List[Dict[str, Any]] = []
+    for block_x, block_y, columns, rows, rotated in blocks:
+        cell_width, cell_height = cell(rotated)
+        width, height = (item_height, item_width) if rotated else (item_width, item_height)
+        for row in range(rows):
+            for column in range(columns):
+                slots.append({
+                    "x": block_x + column * cell_width + bleed,
+                    "y": block_y + row * cell_height + bleed,
+                    "width": width,
+                    "height": height,
+                    "rotated": rotated,
+                })
+
+    # توسيط المجموعة داخل المساحة القابلة للطباعة
+    if slots:
+        used_width = max(slot["x"] + slot["width"] for slot in slots) + bleed
+        used_height = max(slot["y"] + slot["height"] for slot in slots) + bleed
+        offset_x = margin + (area_width - used_width) / 2
+        offset_y = margin + (area_height - used_height) / 2
+        for slot in slots:
+            slot["x"] = round(slot["x"] + offset_x, 3)
+            slot["y"] = round(slot["y"] + offset_y, 3)
+
+    return {
+        "sheet": sheet.upper(),
+        "sheet_mm": [sheet_width, sheet_height],
+        "item_mm": [item_width, item_height],
+        "bleed_mm": bleed,
+        "margin_mm": margin,
+        "count": count,
+        "blocks": len(blocks),
+        "utilization": round(count * item_width * item_height / (sheet_width * sheet_height), 3),
+        "slots": slots,
+    }
+
+
+def crop_mark_lines(slots: List[Dict[str, Any]], bleed: float) -> List[Tuple[float, float, float, float]]:
+    """خطوط علامات القص (x1, y1, x2, y2 بالملم) على محيط المجموعة عند كل خط قص"""
+    if not slots:
+        return []
+    left = min(slot["x"] for slot in slots) - bleed
+    right = max(slot["x"] + slot["width"] for slot in slots) + bleed
+    bottom = min(slot["y"] for slot in slots) - bleed
+    top = max(slot["y"] + slot["height"] for slot in slots) + bleed
+    cuts_x = sorted({round(value, 3) for slot in slots for value in (slot["x"], slot["x"] + slot["width"])})
+    cuts_y = sorted({round(value, 3) for slot in slots for value in (slot["y"], slot["y"] + slot["height"])})
+
+    lines = []
+    start, end = CROP_MARK_OFFSET_MM, CROP_MARK_OFFSET_MM + CROP_MARK_LENGTH_MM
+    for x in cuts_x:
+        lines.append((x, bottom - start, x, bottom - end))
+        lines.append((x, top + start, x, top + end))
+    for y in cuts_y:
+        lines.append((left - start, y, left - end, y))
+        lines.append((right + start, y, right + end, y))
+    return lines
+
+
+def _sheets_for_forms(quantities: List[int], slots_per_form: int, forms: int) -> int:
+    """أقل طول تشغيل يكفي كل الكميات بعدد قوالب معين (بحث ثنائي - مجموع الخانات يتناقص مع الطول)"""
+    low, high = 1, max(quantities)
+    capacity = slots_per_form * forms
+    while low < high:
+        run_length = (low + high) // 2
+        if sum(-(-quantity // run_length) for quantity in quantities) <= capacity:
+            high = run_length
+        else:
+            low = run_length + 1
+    return low
+
+
+def _plan_run(quantities: List[int], per_form: int, setup_sheets: int) -> Tuple[int, int, int]:
+    """(الأفرخ مع التجهيز، عدد القوالب، طول التشغيل) لطلبات تُطبع معاً بطول تشغيل واحد"""
+    min_forms = -(-len(quantities) // per_form)
+    best: Optional[Tuple[int, int, int]] = None
+    for forms in range(min_forms, min_forms + MAX_EXTRA_FORMS + 1):
+        run_length = _sheets_for_forms(quantities, per_form, forms)
+        needed_forms = -(-sum(-(-quantity // run_length) for quantity in quantities) // per_form)
+        cost = needed_forms * (run_length + setup_sheets)
+        if best is None or cost < best[0]:
+            best = (cost, needed_forms, run_length)
+        if run_length == 1:
+            break
+    return best
+
+
+def _run_classes(quantities: List[int], per_form: int, setup_sheets: int) -> List[Tuple[int, int, Tuple[int, int, int]]]:
+    """
+    تقسيم الطلبات (مرتبة تنازلياً بالكمية) إلى فئات متتالية، لكل فئة قوالبها وطول تشغيلها
+    البداية فئة لكل طلب (= طباعته منفصلاً)، ثم دمج فئتين متجاورتين ما دام الدمج يوفر أفرخاً -
+    فالخطة لا تكلف أكثر من الطباعة المنفصلة أبداً، والكميات المتقاربة فقط تشترك في تشغيل واحد
+    يعيد [(البداية، النهاية، (الأفرخ، القوالب، طول التشغيل))]
+    """
+    classes = [(index, index + 1, _plan_run([quantity], per_form, setup_sheets)) for index, quantity in enumerate(quantities)]
+    merged: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+
+    def merge_plan(position: int) -> Tuple[int, int, int]:
+        span = (classes[position][0], classes[position + 1][1])
+        if span not in merged:
+            merged[span] = _plan_run(quantities[span[0]:span[1]], per_form, setup_sheets)
+        return merged[span]
+
+    while len(classes) > 1:
+        best_saving, best_position = 0, None
+        for position in range(len(classes) - 1):
+            saving = classes[position][2][0] + classes[position + 1][2][0] - merge_plan(position)[0]
+            if saving > best_saving:
+                best_saving, best_position = saving, position
+        if best_position is None:
+            break
+        plan = merge_plan(best_position)
+        classes[best_position:best_position + 2] = [(classes[best_position][0], classes[best_position + 1][1], plan)]
+    return classes
+
+
+def plan_gang_run(
+    jobs: List[Dict[str, Any]],
+    sheet: str = DEFAULT_SHEET,
+    bleed: float = DEFAULT_BLEED_MM,
+    margin: float = DEFAULT_MARGIN_MM,
+    setup_sheets: int = FORM_SETUP_SHEETS,
+) -> Dict[str, Any]:
+    """
+    jobs: [{key, width_mm, height_mm, quantity}] - الطلبات بنفس القياس (بأي اتجاه) تُجمع على قوالب مشتركة
+    لكل مجموعة قياس: فئات طول تشغيل (_run_classes)، كل قالب يحمل خانات لعدة طلبات ويُطبع "sheets" فرخاً
+    """
+    groups: Dict[Tuple[float, float], List[Dict[str, Any]]] = {}
+    for job in jobs:
+        width, height = float(job["width_mm"]), float(job["height_mm"])
+        size_key = (round(max(width, height), 1), round(min(width, height), 1))
+        groups.setdefault(size_key, []).append(job)
+
+    planned_groups = []
+    total_sheets = separate_sheets = 0
+    for (width, height), group_jobs in groups.items():
+        layout = compute_layout(width, height, sheet, bleed, margin)
+        per_form = layout["count"]
+        if not per_form:
+            raise ProductionPdfError(f"القطعة {width}×{height} ملم أكبر من الفرخ {sheet}")
+
+        # الطلبات الأكبر أولاً، وخانات كل طلب متتالية
+        order = sorted(group_jobs, key=lambda job: -max(1, int(job["quantity"])))
+        quantities = [max(1, int(job["quantity"])) for job in order]
+        forms = []
+        job_summaries = []
+        cost = 0
+        for start, end, (class_cost, form_count, run_length) in _run_classes(quantities, per_form, setup_sheets):
+            sequence: List[Hashable] = []
+            for job, quantity in zip(order[start:end], quantities[start:end]):
+                slot_count = -(-quantity // run_length)
+                sequence.extend([job["key"]] * slot_count)
+                job_summaries.append({
+                    "key": job["key"],
+                    "quantity": quantity,
+                    "slots": slot_count,
+                    "run_length": run_length,
+                    "produced": slot_count * run_length,
+                })
+            sequence.extend([None] * (form_count * per_form - len(sequence)))
+            forms.extend(
+                {"sheets": run_length, "slots": sequence[offset:offset + per_form]}
+                for offset in range(0, len(sequence), per_form)
+            )
+            cost += class_cost
+
+        group_separate = sum(-(-quantity // per_form) + setup_sheets for quantity in quantities)
+        total_sheets += cost
+        separate_sheets += group_separate
+        planned_groups.append({
+            "item_mm": [width, height],
+            "layout": layout,
+            "run_lengths": sorted({form["sheets"] for form in forms}, reverse=True),
+            "forms": forms,
+            "jobs": job_summaries,
+            "total_sheets": cost,
+            "separate_sheets": group_separate,
+        })
+
+    return {
+        "sheet": sheet.upper(),
+        "setup_sheets": setup_sheets,
+        "groups": planned_groups,
+        "total_sheets": total_sheets,
+        "separate_sheets": separate_sheets,
+        "sheets_saved": separate_sheets - total_sheets,
+    }
+
+
+def render_gang_pdf(plan: Dict[str, Any], designs: Dict[Hashable, str], crop_marks: bool = True) -> Iterator[bytes]:
+    """
+    قوالب الخطة كملف PDF (صفحة لكل قالب) - designs: مسار ملف التصميم (PDF أو صورة) لكل key
+    تصاميم PDF تُضمَّن كـ Form XObject فتبقى متجهية، وكل تصميم يُكتب مرة واحدة مهما تكرر
+    """
+    writer = PdfAssembler()
+    forms_by_key: Dict[Hashable, Tuple[int, Tuple[float, float, float, float], int]] = {}
+    files = []
+    try:
+        for group in plan["groups"]:
+            layout = group["layout"]
+            bleed = layout["bleed_mm"]
+            sheet_width, sheet_height = (value * POINTS_PER_MM for value in layout["sheet_mm"])
+            marks = ""
+            if crop_marks:
+                segments = [
+                    "{:.3f} {:.3f} m {:.3f} {:.3f} l".format(*(value * POINTS_PER_MM for value in line))
+                    for line in crop_mark_lines(layout["slots"], bleed)
+                ]
+                # لون التسجيل (كل الأحبار) حتى تظهر العلامات على كل لوح
+                marks = "q 0.25 w 1 1 1 1 K " + " ".join(segments) + " S Q"
+
+            for form in group["forms"]:
+                placements, clips = [], []
+                for slot, key in zip(layout["slots"], form["slots"]):
+                    if key is None or key not in designs:
+                        continue
+                    if key not in forms_by_key:
+                        path = designs[key]
+                        if os.path.splitext(path)[1].lower() in IMAGE_DESIGN_EXTENSIONS:
+                            number, box = writer.add_image(path)
+                            rotate = 0
+                        else:
+                            fp = open(path, "rb")
+                            files.append(fp)
+                            page = _open_pdf(fp).pages[0]
+                            number, box = writer.add_form(page, len(files))
+                            rotate = int(page.get("/Rotate", 0) or 0)
+                        forms_by_key[key] = (number, box, rotate)
+                    number, box, rotate = forms_by_key[key]
+                    bleed_box = tuple(value * POINTS_PER_MM for value in (
+                        slot["x"] - bleed, slot["y"] - bleed, slot["width"] + 2 * bleed, slot["height"] + 2 * bleed
+                    ))
+                    placements.append((number, placement_matrix(box, rotate, bleed_box)))
+                    clips.append(bleed_box)
+                writer.add_sheet(sheet_width, sheet_height, placements, clips, marks)
+                chunk = writer.drain(OUTPUT_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+        yield writer.finish()
+    finally:
+        for fp in files:
+            fp.close()
@@ -45,8 +45,21 @@ async def lifespan(app: FastAPI):
         loop.create_task(_ensure_order_archive_columns())
         loop.create_task(_init_advanced_pricing_data())
         loop.create_task(_init_hero_slides_table())
+        loop.create_task(_init_document_analysis_cache_table())
         loop.create_task(_daily_archive_task())
         loop.create_task(_monthly_archive_task())
+        from analytics_archive import start_archive
+        from analytics_ingest import start_flusher
+        from analytics_partitions import start_maintenance
+        from analytics_rollup import start_rollups
+        from geoip import start_geoip
+        start_geoip()
+        start_flusher()
+        start_rollups()
+        start_maintenance()
+        start_archive()
+        from arabic_text import check_fonts
+        check_fonts()
         print("✅ Startup tasks initiated in background")
     except Exception as e:
         print(f"⚠️ Warning: Failed to create startup tasks: {str(e)[:200]}")
@@ -60,6 +73,18 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("🛑 Application shutting down")
+    from analytics_archive import stop_archive
+    from analytics_ingest import stop_flusher
+    from analytics_partitions import stop_maintenance
+    from analytics_rollup import stop_rollups
+    from geoip import stop_geoip
+    await stop_archive()
+    await stop_maintenance()
+    await stop_rollups()
+    await stop_flusher()
+    await stop_geoip()
+    from workers import shutdown_pools
+    shutdown_pools()
 
 app = FastAPI(
     title="Khawam API",
@@ -1788,6 +1813,52 @@ async def _init_hero_slides_table():
             except:
                 pass
 
+async def _init_document_analysis_cache_table():
+    """إنشاء جدول document_analysis_cache (نتائج تحليل الملفات حسب SHA-256) إذا لم يكن موجوداً"""
+    import asyncio
+    await asyncio.sleep(3)
+
+    conn = None
+    try:
+        conn = engine.connect()
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS document_analysis_cache (
+                content_hash VARCHAR(64) PRIMARY KEY,
+                analysis_version INTEGER NOT NULL DEFAULT 1,
+                file_type VARCHAR(10) NOT NULL,
+                file_size INTEGER,
+                page_count INTEGER NOT NULL,
+                page_sizes JSON,
+                color_pages JSON,
+                page_count_source VARCHAR(20),
+                hit_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT NOW(),
+                last_used_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        conn.execute(text("""
+            ALTER TABLE document_analysis_cache ADD COLUMN IF NOT EXISTS page_count_source VARCHAR(20)
+        """))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_document_analysis_cache_last_used_at
+            ON document_analysis_cache (last_used_at)
+        """))
+        conn.commit()
+        print("✅ document_analysis_cache table verified")
+    except Exception as e:
+        print(f"❌ Error initializing document_analysis_cache table: {str(e)}")
+        if conn:
+            try:
+                conn.rollback()
+            except:
+                pass
+    finally:
+        if conn:
+            try:
+                conn.close()
+            except:
+                pass
+
 async def _ensure_default_services():
     """التأكد من وجود الخدمات الأساسية في قاعدة البيانات"""
     import asyncio
@@ -1916,7 +1987,7 @@ app.add_middleware(
 )
 
 # Include routers
-from routers import auth, services, orders, portfolio, products, admin, studio, service_workflows, pricing, advanced_pricing, hero_slides, analytics
+from routers import auth, services, orders, portfolio, products, admin, studio, service_workflows, pricing, advanced_pricing, hero_slides, analytics, file_analysis
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(services.router, prefix="/api/services", tags=["services"])
@@ -1930,6 +2001,7 @@ app.include_router(pricing.router, prefix="/api", tags=["pricing"])
 app.include_router(advanced_pricing.router, prefix="/api", tags=["advanced-pricing"])
 app.include_router(hero_slides.router, prefix="/api", tags=["hero-slides"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(file_analysis.router, prefix="/api/files", tags=["files"])
 
 # Static files
 # إنشاء مجلدات uploads إذا لم تكن موجودة
@@ -0,0 +1,74 @@
+"""
+Migration script to bring visitor_tracking and page_views to the current analytics schema:
+dimension ids instead of text columns, and monthly partitioned tables
+
+Runs on every deploy from start.sh before the app starts (a no-op once applied):
+- fresh database: the dimension tables and partitioned fact tables are created directly
+- older database: legacy text columns are converted to dimension ids (encode_legacy_table),
+  then each table is rewritten once as a partitioned table under an exclusive lock
+
+This is the only place legacy tables are converted; the running app only checks that it has been
+done (analytics_ingest.ensure_fact_tables). Exits with status 1 if the migration failed
+"""
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from analytics_dimensions import create_dimension_tables, encode_legacy_table
+from analytics_ingest import get_analytics_engine
+from analytics_partitions import (
+    PARTITIONED_TABLES,
+    convert_to_partitioned,
+    create_partitioned,
+    relation_kind,
+    run_maintenance,
+)
+
+
+def migrate() -> bool:
+    """Create or convert the analytics fact tables - returns False if a table could not be migrated"""
+    connection = get_analytics_engine().raw_connection()
+    try:
+        # المحرك يضبط statement_timeout=30s للتطبيق - إعادة كتابة جدول كامل تحتاج أكثر
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = 0")
+            create_dimension_tables(cursor)
+        connection.commit()
+        for table in PARTITIONED_TABLES:
+            try:
+                with connection.cursor() as cursor:
+                    kind = relation_kind(cursor, table)
+                    if kind is None:
+                        # قاعدة بيانات جديدة: الجدول المقسم بأعمدة الأرقام مباشرة
+                        create_partitioned(cursor, table)
+                connection.commit()
+                if kind is None:
+                    print(f"✅ {table}: created with monthly partitions")
+                    continue
+                # النصوص تُحوّل لأرقام الأبعاد أولاً - الجدول المقسم بأعمدة الأرقام فقط
+                encode_legacy_table(connection, table)
+                if not convert_to_partitioned(connection, table):
+                    print(f"ℹ️ {table} is already partitioned")
+            except Exception as e:
+                connection.rollback()
+                print(f"❌ Failed to migrate {table}: {e}")
+                import traceback
+                traceback.print_exc()
+                return False
+    finally:
+        connection.close()
+
+    # الأقسام القادمة + حذف ما هو خارج نافذة الاحتفاظ مباشرة (المهمة اليومية تعيدها إن فشلت هنا)
+    try:
+        for table, changes in run_maintenance().items():
+            print(f"📅 {table}: created {changes['created']}, dropped {changes['dropped']}")
+    except Exception as e:
+        print(f"⚠️ Partition maintenance failed (the daily task will retry): {e}")
+    print("\n✅ Analytics migration completed successfully!")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if migrate() else 1)
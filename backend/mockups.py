@@ -0,0 +1,261 @@
+"""
+معاينة الطباعة على الملابس (mockup): دمج تصميم العميل على صورة القطعة في موضع الطباعة
+
+- قوالب القطع (hoodie، كنزة صيفي...) تُقرأ من MOCKUP_TEMPLATE_DIR وتُفك مرة واحدة في LRU محدود،
+  وإذا لم تتوفر صورة للقالب نرسم قطعة بسيطة بلون الطلب حتى لا تتوقف المعاينة
+- التصاميم المرفوعة تُصغَّر وتُخزن مرة واحدة مفهرسة بـ SHA-256، فتعديل الموضع والحجم لا يعيد الرفع
+- نتيجة المعاينة (JPEG) تُخزن حسب (القالب، التصاميم، المواضع) فتكرار نفس الطلب لا يعيد الرسم
+"""
+import hashlib
+import io
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw
+
+from cache import LRUCache
+from imaging import ImageSource, decoded_size, image_budget, open_lazy
+
+MOCKUP_TEMPLATE_DIR = os.getenv(
+    "MOCKUP_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "mockup_templates")
+)
+MOCKUP_TEMPLATE_CACHE_SIZE = int(os.getenv("MOCKUP_TEMPLATE_CACHE_SIZE", "24"))
+MOCKUP_RESULT_CACHE_MB = int(os.getenv("MOCKUP_RESULT_CACHE_MB", "64"))
+MOCKUP_DESIGN_CACHE_MB = int(os.getenv("MOCKUP_DESIGN_CACHE_MB", "128"))
+
+# أبعاد القالب الافتراضي (بكسل) وأقصى ضلع للتصميم المخزن
+TEMPLATE_SIZE = (1000, 1200)
+MAX_DESIGN_SIDE = 1200
+MOCKUP_JPEG_QUALITY = 85
+
+# القطع المتوفرة في خدمة الطباعة على الملابس (نفس معرفات step_config في main.py)
+GARMENTS = {
+    "hoodie": "كنزة هودي",
+    "summer_cotton_sweatshirt": "كنزة صيفي قطن",
+    "tshirt": "تيشيرت",
+}
+# ملابس العميل نفسه تُعرض على تيشيرت عام
+DEFAULT_GARMENT = "tshirt"
+
+GARMENT_COLORS = {
+    "أبيض": (246, 246, 244),
+    "أسود": (38, 38, 40),
+    "رمادي": (150, 152, 156),
+    "كحلي": (33, 44, 77),
+    "أحمر": (170, 32, 40),
+}
+
+# مناطق الطباعة كنسبة من أبعاد القالب (left, top, right, bottom) والوجه الذي تظهر عليه
+# ملاحظة: يمين/يسار القطعة بالنسبة للابس، أي معكوس بالنسبة للناظر
+PRINT_AREAS = {
+    "logo": ("front", (0.56, 0.27, 0.68, 0.37)),
+    "front": ("front", (0.31, 0.30, 0.69, 0.64)),
+    "back": ("back", (0.28, 0.24, 0.72, 0.66)),
+    "shoulder_right": ("front", (0.15, 0.24, 0.26, 0.34)),
+    "shoulder_left": ("front", (0.74, 0.24, 0.85, 0.34)),
+}
+SIDES = ("front", "back")
+
+_design_cache = LRUCache(
+    max_items=256,
+    max_bytes=MOCKUP_DESIGN_CACHE_MB * 1024 * 1024,
+    sizeof=lambda image: decoded_size(image.size, image.mode),
+)
+_result_cache = LRUCache(max_items=2048, max_bytes=MOCKUP_RESULT_CACHE_MB * 1024 * 1024)
+
+
+class MockupError(ValueError):
+    """طلب معاينة غير صالح (قالب/موضع غير معروف أو تصميم منتهي الصلاحية)"""
+
+
+def _template_path(garment: str, color: str, side: str) -> Optional[str]:
+    """
+    mockup_templates/<garment>/<color>-<side>.png ثم <garment>/<side>.png (يُلوَّن)
+    القيم تدخل في مسار الملف، فلا يُقبل إلا ما في GARMENTS و GARMENT_COLORS و SIDES
+    """
+    if garment not in GARMENTS or color not in GARMENT_COLORS or side not in SIDES:
+        raise MockupError(f"قالب غير معروف: {garment} / {color} / {side}")
+    for filename in (f"{color}-{side}.png", f"{side}.png"):
+        path = os.path.join(MOCKUP_TEMPLATE_DIR, garment, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _draw_garment(garment: str, fill: Tuple[int, int, int], side: str) -> Image.Image:
+    """رسم قطعة بسيطة عند عدم توفر صورة قالب"""
+    width, height = TEMPLATE_SIZE
+    image = Image.new("RGB", TEMPLATE_SIZE, (238, 238, 236))
+    draw = ImageDraw.Draw(image)
+    outline = tuple(max(0, channel - 45) for channel in fill)
+    long_sleeves = garment == "hoodie"
+
+    def px(points: Sequence[Tuple[float, float]]) -> List[Tuple[int, int]]:
+        return [(int(x * width), int(y * height)) for x, y in points]
+
+    sleeve_end = 0.62 if long_sleeves else 0.38
+    body = [
+        (0.30, 0.16), (0.40, 0.13), (0.60, 0.13), (0.70, 0.16),
+        (0.93, 0.28), (0.97 if long_sleeves else 0.88, sleeve_end),
+        (0.86 if long_sleeves else 0.78, sleeve_end + 0.02), (0.75, 0.34),
+        (0.76, 0.90), (0.24, 0.90), (0.25, 0.34),
+        (0.14 if long_sleeves else 0.22, sleeve_end + 0.02), (0.03 if long_sleeves else 0.12, sleeve_end),
+        (0.07, 0.28),
+    ]
+    draw.polygon(px(body), fill=fill, outline=outline)
+
+    if garment == "hoodie":
+        if side == "front":
+            draw.ellipse(px([(0.38, 0.06), (0.62, 0.22)]), fill=fill, outline=outline, width=3)
+            draw.ellipse(px([(0.43, 0.10), (0.57, 0.20)]), fill=outline)
+            draw.rectangle(px([(0.36, 0.70), (0.64, 0.82)]), outline=outline, width=3)
+        else:
+            draw.ellipse(px([(0.37, 0.04), (0.63, 0.24)]), fill=fill, outline=outline, width=3)
+    else:
+        collar = [(0.40, 0.13), (0.60, 0.13), (0.56, 0.19 if side == "front" else 0.15), (0.44, 0.19 if side == "front" else 0.15)]
+        draw.polygon(px(collar), fill=outline)
+    return image
+
+
+@lru_cache(maxsize=MOCKUP_TEMPLATE_CACHE_SIZE)
+def load_template(garment: str, color: str, side: str) -> Image.Image:
+    """
+    صورة القالب مفكوكة (RGB) - مشتركة بين الطلبات ويجب عدم تعديلها مباشرة
+    """
+    path = _template_path(garment, color, side)
+    fill = GARMENT_COLORS[color]
+    if path is None:
+        return _draw_garment(garment, fill, side)
+
+    image = open_lazy(path)
+    with image_budget.reserve(decoded_size(image.size, image.mode)):
+        image.load()
+        if image.size != TEMPLATE_SIZE:
+            image = image.resize(TEMPLATE_SIZE, Image.Resampling.LANCZOS)
+        if os.path.basename(path) == f"{side}.png":
+            # قالب رمادي واحد لكل القطعة - نلونه بضرب الإضاءة في لون القطعة
+            shade = image.convert("L")
+            colored = Image.merge("RGB", [shade.point(lambda v, c=c: v * c // 255) for c in fill])
+            if image.mode in ("RGBA", "LA"):
+                background = Image.new("RGB", TEMPLATE_SIZE, (238, 238, 236))
+                background.paste(colored, mask=image.getchannel("A"))
+                colored = background
+            return colored
+        return image.convert("RGB")
+
+
+def register_design(source: ImageSource) -> Dict[str, Any]:
+    """
+    تخزين التصميم المرفوع مصغّراً (RGBA) وإرجاع معرفه (SHA-256 لمحتوى الملف)
+    دالة متزامنة - تُشغَّل على مجمع عمال الصور
+    """
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        source.seek(0)
+        data = source.read()
+    design_id = hashlib.sha256(data).hexdigest()
+
+    design = _design_cache.get(design_id)
+    if design is None:
+        image = open_lazy(data)
+        image.draft("RGB", (MAX_DESIGN_SIDE, MAX_DESIGN_SIDE))
+        with image_budget.reserve(decoded_size(image.size, image.mode)):
+            image.load()
+            design = image.convert("RGBA")
+            design.thumbnail((MAX_DESIGN_SIDE, MAX_DESIGN_SIDE), Image.Resampling.LANCZOS)
+        _design_cache.set(design_id, design)
+    return {"design_id": design_id, "width": design.size[0], "height": design.size[1]}
+
+
+def _normalize_placement(placement: Dict[str, Any]) -> Tuple[str, str, float, float, float]:
+    """(location, design_id, scale, offset_x, offset_y) بعد التقريب ليتكرر مفتاح الـ cache"""
+    location = placement.get("location")
+    if location not in PRINT_AREAS:
+        raise MockupError(f"موضع طباعة غير معروف: {location}")
+    design_id = str(placement.get("design_id") or "")
+    scale = min(1.5, max(0.1, float(placement.get("scale") or 1.0)))
+    offset_x = min(1.0, max(-1.0, float(placement.get("offset_x") or 0.0)))
+    offset_y = min(1.0, max(-1.0, float(placement.get("offset_y") or 0.0)))
+    return location, design_id, round(scale, 2), round(offset_x, 2), round(offset_y, 2)
+
+
+def _composite(base: Image.Image, design: Image.Image, box: Tuple[float, float, float, float],
+               scale: float, offset_x: float, offset_y: float) -> None:
+    width, height = base.size
+    area_left, area_top = box[0] * width, box[1] * height
+    area_w, area_h = (box[2] - box[0]) * width, (box[3] - box[1]) * height
+
+    ratio = min(area_w / design.size[0], area_h / design.size[1]) * scale
+    target = (max(1, int(design.size[0] * ratio)), max(1, int(design.size[1] * ratio)))
+    resized = design.resize(target, Image.Resampling.LANCZOS)
+
+    # offset = -1..1 يحرك مركز التصميم حتى حافة منطقة الطباعة
+    center_x = area_left + area_w / 2 + offset_x * area_w / 2
+    center_y = area_top + area_h / 2 + offset_y * area_h / 2
+    base.paste(resized, (int(center_x - target[0] / 2), int(center_y - target[1] / 2)), resized)
+
+
+def render_mockup(
+    garment: str,
+    color: str,
+    side: str,
+    placements: List[Dict[str, Any]],
+) -> Tuple[bytes, bool]:
+    """
+    رسم المعاينة وإرجاع (JPEG، هل جاءت من الـ cache)
+    المواضع التي لا تنتمي لهذا الوجه (front/back) تُتجاهل
+    دالة متزامنة - تُشغَّل على مجمع عمال الصور
+    """
+    garment = garment if garment in GARMENTS else DEFAULT_GARMENT
+    if side not in SIDES:
+        raise MockupError(f"وجه غير معروف: {side}")
+    if color not in GARMENT_COLORS:
+        raise MockupError(f"لون غير متوفر: {color}")
+
+    normalized = sorted(
+        placement for placement in map(_normalize_placement, placements)
+        if PRINT_AREAS[placement[0]][0] == side
+    )
+    cache_key = (garment, color, side, tuple(normalized))
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    designs = {}
+    for _, design_id, _, _, _ in normalized:
+        design = _design_cache.get(design_id)
+        if design is None:
+            raise MockupError("انتهت صلاحية التصميم المرفوع، يرجى رفعه مرة أخرى")
+        designs[design_id] = design
+
+    base = load_template(garment, color, side).copy()
+    for location, design_id, scale, offset_x, offset_y in normalized:
+        _composite(base, designs[design_id], PRINT_AREAS[location][1], scale, offset_x, offset_y)
+
+    buffer = io.BytesIO()
+    base.save(buffer, format="JPEG", quality=MOCKUP_JPEG_QUALITY, optimize=True)
+    result = buffer.getvalue()
+    _result_cache.set(cache_key, result)
+    return result, False
+
+
+def mockup_options() -> Dict[str, Any]:
+    """القطع والألوان ومواضع الطباعة المتاحة للواجهة"""
+    return {
+        "garments": [{"id": key, "name": name} for key, name in GARMENTS.items()],
+        "colors": list(GARMENT_COLORS.keys()),
+        "locations": [{"id": key, "side": side} for key, (side, _) in PRINT_AREAS.items()],
+        "sides": list(SIDES),
+    }
+
+
+def mockup_cache_stats() -> Dict[str, Any]:
+    info = load_template.cache_info()
+    return {
+        "templates": {"items": info.currsize, "hits": info.hits, "misses": info.misses},
+        "designs": _design_cache.stats(),
+        "results": _result_cache.stats(),
+    }
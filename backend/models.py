@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DECIMAL, TIMESTAMP, Date, ForeignKey, ARRAY, JSON
+from sqlalchemy import Column, Integer, String, Text, Boolean, DECIMAL, TIMESTAMP, Date, ForeignKey, ARRAY, JSON, LargeBinary
 from sqlalchemy.sql import func
 from database import Base
 
@@ -285,18 +285,18 @@ class PricingRule(Base):
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
 class VisitorTracking(Base):
-    """تتبع الزوار والزيارات"""
+    """تتبع الزوار والزيارات - مقسم شهرياً حسب created_at (analytics_partitions)"""
     __tablename__ = "visitor_tracking"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
     
-    id = Column(Integer, primary_key=True, index=True)
+    # المفتاح مركب (id, created_at) - autoincrement صريح حتى يبقى id من sequence (SERIAL) وليس INTEGER بلا قيمة
+    # (وليس IDENTITY: أعمدة IDENTITY غير مدعومة على الجداول المقسمة قبل PostgreSQL 17)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     session_id = Column(String(255), nullable=False, index=True)  # معرف الجلسة
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # المستخدم المسجل (إن وجد)
-    page_path = Column(String(500), nullable=False)  # مسار الصفحة
-    referrer = Column(Text, nullable=True)  # الصفحة المرجعية
-    user_agent = Column(Text, nullable=True)  # معلومات المتصفح
-    device_type = Column(String(50), nullable=True)  # desktop, mobile, tablet
-    browser = Column(String(100), nullable=True)  # Chrome, Firefox, Safari, etc.
-    os = Column(String(100), nullable=True)  # Windows, macOS, Linux, iOS, Android
+    page_id = Column(Integer, nullable=False)  # مسار الصفحة (analytics_pages)
+    referrer_id = Column(Integer, nullable=True)  # الصفحة المرجعية (analytics_referrers)
+    user_agent_id = Column(Integer, nullable=True)  # المتصفح ونظام التشغيل ونوع الجهاز (analytics_user_agents)
     ip_address = Column(String(45), nullable=True)  # IPv4 or IPv6
     country = Column(String(100), nullable=True)
     city = Column(String(100), nullable=True)
@@ -304,21 +304,49 @@ class VisitorTracking(Base):
     exit_page = Column(Boolean, default=False)  # هل هذه صفحة الخروج؟
     entry_page = Column(Boolean, default=False)  # هل هذه صفحة الدخول؟
     visit_count = Column(Integer, default=1)  # عدد الزيارات لهذا المستخدم
-    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+    created_at = Column(TIMESTAMP, primary_key=True, server_default=func.now(), index=True)  # مفتاح التقسيم - جزء من المفتاح الأساسي
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
 class PageView(Base):
-    """تتبع مشاهدات الصفحات"""
+    """تتبع مشاهدات الصفحات - مقسم شهرياً حسب created_at (analytics_partitions)"""
     __tablename__ = "page_views"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
     
-    id = Column(Integer, primary_key=True, index=True)
-    visitor_id = Column(Integer, ForeignKey("visitor_tracking.id"), nullable=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)  # SERIAL - انظر VisitorTracking.id
+    visitor_id = Column(Integer, nullable=True, index=True)  # معرف الزيارة - بدون FK لأن مفتاح visitor_tracking مركب (id, created_at)
     session_id = Column(String(255), nullable=False, index=True)  # معرف الجلسة
-    page_path = Column(String(500), nullable=False, index=True)  # مسار الصفحة
+    page_id = Column(Integer, nullable=False, index=True)  # مسار الصفحة (analytics_pages)
     time_spent = Column(Integer, default=0)  # الوقت على الصفحة بالثواني
     scroll_depth = Column(Integer, default=0)  # عمق التمرير (0-100)
     actions = Column(JSON, nullable=True)  # الأحداث (clicks, form submissions, etc.)
-    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+    created_at = Column(TIMESTAMP, primary_key=True, server_default=func.now(), index=True)
+
+class AnalyticsPage(Base):
+    """بعد مسارات الصفحات - page_id في visitor_tracking و page_views"""
+    __tablename__ = "analytics_pages"
+    
+    id = Column(Integer, primary_key=True)
+    hash = Column(LargeBinary, nullable=False, unique=True)  # md5 للمسار
+    path = Column(String(500), nullable=False, index=True)
+
+class AnalyticsReferrer(Base):
+    """بعد الصفحات المرجعية"""
+    __tablename__ = "analytics_referrers"
+    
+    id = Column(Integer, primary_key=True)
+    hash = Column(LargeBinary, nullable=False, unique=True)
+    referrer = Column(Text, nullable=False)
+
+class AnalyticsUserAgent(Base):
+    """بعد user agent مع تحليله (browser، os، device_type) مرة واحدة لكل قيمة"""
+    __tablename__ = "analytics_user_agents"
+    
+    id = Column(Integer, primary_key=True)
+    hash = Column(LargeBinary, nullable=False, unique=True)
+    user_agent = Column(Text, nullable=True)
+    browser = Column(String(100), nullable=True)
+    os = Column(String(100), nullable=True)
+    device_type = Column(String(50), nullable=True)
 
 class OrderStatusHistory(Base):
     """تاريخ تغييرات حالة الطلب"""
@@ -329,4 +357,21 @@ class OrderStatusHistory(Base):
     status = Column(String(20), nullable=False)  # الحالة الجديدة
     changed_by = Column(Integer, ForeignKey("users.id"), nullable=True)  # المستخدم الذي غيّر الحالة
     notes = Column(Text, nullable=True)  # ملاحظات التغيير
-    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
\ No newline at end of file
+    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+
+
+class DocumentAnalysisCache(Base):
+    """نتائج تحليل الملفات المرفوعة مفهرسة بـ SHA-256 لمحتوى الملف"""
+    __tablename__ = "document_analysis_cache"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 (hex)
+    analysis_version = Column(Integer, nullable=False, default=1)  # نسخة منطق التحليل - النتائج الأقدم تُعاد
+    file_type = Column(String(10), nullable=False)  # .pdf, .docx
+    file_size = Column(Integer, nullable=True)  # بالبايت
+    page_count = Column(Integer, nullable=False)
+    page_sizes = Column(JSON, nullable=True)  # [{width_mm, height_mm, paper, pages}]
+    color_pages = Column(JSON, nullable=True)  # تصنيف الصفحات ملون/أبيض وأسود
+    page_count_source = Column(String(20), nullable=True)  # Word: metadata, rendered_breaks, estimate
+    hit_count = Column(Integer, default=0)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    last_used_at = Column(TIMESTAMP, server_default=func.now(), index=True)
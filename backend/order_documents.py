@@ -0,0 +1,405 @@
+"""
+فواتير وبطاقات عمل (job tickets) للطلبات بصيغة PDF جاهزة للطباعة
+
+- لكل نوع مستند قالب ثابت (الترويسة، العناوين، رؤوس الجدول، مربعات مراحل الإنتاج) يُرسم مرة واحدة
+  ويبقى في الذاكرة، وكل مستند ينسخه ويكتب فوقه بيانات الطلب فقط
+- رمز QR يشير إلى /api/orders/{id} (يحتاج مكتبة qrcode الاختيارية، وبدونها يُطبع الرابط نصاً)
+- الدفعة (مثلاً كل طلبات اليوم المقبولة) تُرسم بالتوازي على مجمع عمال الصور وتُكتب بالترتيب
+  في ملف PDF واحد يُرسل تدفقياً - الضغط يتم داخل العامل فلا يبقى على event loop إلا الكتابة
+- الطلبات بعناصر كثيرة تُكمل على صفحات إضافية بنفس القالب
+"""
+import os
+import zlib
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw
+from sqlalchemy import text
+
+from arabic_text import font_path, load_font, prepare_text
+from production_pdf import OUTPUT_CHUNK_SIZE, PdfAssembler
+from workers import map_in_imaging_pool
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+DOCUMENT_DPI = 200
+DOCUMENT_BATCH_MAX = int(os.getenv("DOCUMENT_BATCH_MAX", "500"))
+SHOP_NAME = os.getenv("SHOP_NAME", "مطبعة خوام")
+CURRENCY = "ل.س"
+
+# النوع: (العنوان، قياس الورقة بالملم)
+DOCUMENT_KINDS = {
+    "invoice": ("فاتورة", (210, 297)),
+    "ticket": ("بطاقة عمل", (148, 210)),
+}
+MARGIN_MM = 10
+QR_SIZE_MM = 24
+ROW_HEIGHT_MM = 7
+# عرض عمود العناوين في الترويسة (القيم تُكتب على يساره)
+INFO_LABEL_WIDTH_MM = 32
+# أعلى منطقة الجدول وأسفلها (من أسفل الصفحة)
+BODY_TOP_MM = 96
+BODY_BOTTOM_MM = 28
+
+# حقول الطلب في الترويسة: (العنوان، المفتاح)
+INFO_ROWS = (
+    ("رقم الطلب", "order_number"),
+    ("التاريخ", "created_at"),
+    ("العميل", "customer"),
+    ("الهاتف", "customer_phone"),
+    ("موعد التسليم", "delivery_date"),
+    ("الاستلام", "delivery"),
+)
+# أعمدة الفاتورة: (العنوان، بعد الحافة اليمنى عن الهامش بالملم، المحاذاة)
+INVOICE_COLUMNS = (
+    ("الصنف", 0, "ra"),
+    ("الكمية", 100, "ma"),
+    ("سعر الوحدة", 130, "ma"),
+    ("المجموع", 165, "ma"),
+)
+# مراحل الإنتاج في أسفل بطاقة العمل (يؤشر عليها العامل يدوياً)
+TICKET_STAGES = ("طباعة", "قص", "تغليف", "تسليم")
+SPEC_LABELS = {
+    "paper_size": "القياس",
+    "paper_type": "الورق",
+    "print_type": "الطباعة",
+    "print_color": "الألوان",
+    "print_sides": "الوجه",
+    "print_quality": "الجودة",
+    "number_of_pages": "الصفحات",
+    "binding": "التجليد",
+    "lamination": "التغليف",
+    "notes": "ملاحظات",
+}
+_SKIPPED_SPECS = {"design_files", "files", "attachments", "file_analysis", "clothing_designs"}
+
+DocumentPage = Tuple[bytes, Tuple[int, int]]
+Row = Tuple[float, Callable[[ImageDraw.ImageDraw, int], None]]
+
+_ORDERS_QUERY = """
+    SELECT id, order_number, customer_name, customer_phone, shop_name, status, total_amount,
+           final_amount, paid_amount, remaining_amount, delivery_type, delivery_address,
+           delivery_date, notes, created_at
+    FROM orders
+    WHERE id = ANY(:order_ids)
+"""
+_ITEMS_QUERY = """
+    SELECT order_id, product_name, quantity, unit_price, total_price, specifications, production_notes
+    FROM order_items
+    WHERE order_id = ANY(:order_ids)
+    ORDER BY order_id, id
+"""
+
+
+class DocumentError(ValueError):
+    """نوع مستند غير معروف أو دفعة أكبر من المسموح"""
+
+
+def _px(mm: float) -> int:
+    return round(mm * DOCUMENT_DPI / 25.4)
+
+
+def _font(size_pt: float, bold: bool = False):
+    return load_font(font_path(bold=bold), round(size_pt * DOCUMENT_DPI / 72))
+
+
+def _draw_text(
+    draw: ImageDraw.ImageDraw, xy: Tuple[int, int], value: Any, size_pt: float, bold: bool = False, anchor: str = "ra"
+) -> None:
+    shaped, direction = prepare_text(str(value))
+    options = {"direction": direction} if direction else {}
+    draw.text(xy, shaped, font=_font(size_pt, bold), fill=0, anchor=anchor, **options)
+
+
+def _text_width(value: str, size_pt: float, bold: bool = False) -> float:
+    shaped, direction = prepare_text(value)
+    options = {"direction": direction} if direction else {}
+    return _font(size_pt, bold).getlength(shaped, **options)
+
+
+def _fit(value: Any, size_pt: float, width_mm: float, bold: bool = False) -> str:
+    """قص النص الطويل (اسم صنف) حتى يتسع في عموده"""
+    value = str(value or "")
+    limit = _px(width_mm)
+    if _text_width(value, size_pt, bold) <= limit:
+        return value
+    # بحث ثنائي على طول النص - قياس النص هو أبطأ خطوة في رسم المستند
+    low, high = 0, len(value)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _text_width(value[:middle] + "…", size_pt, bold) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return value[:low].rstrip() + "…"
+
+
+def _wrap(value: str, size_pt: float, width_mm: float) -> List[str]:
+    """
+    تقسيم النص على أسطر بعرض width_mm - كل كلمة تُقاس مرة واحدة
+    (المسافة تفصل اتصال الحروف العربية، فعرض السطر = مجموع عروض كلماته)
+    """
+    limit = _px(width_mm)
+    space = _text_width(" ", size_pt)
+    lines: List[str] = []
+    line, line_width = "", 0.0
+    for word in value.split():
+        word_width = _text_width(word, size_pt)
+        if line and line_width + space + word_width > limit:
+            lines.append(line)
+            line, line_width = word, word_width
+        elif line:
+            line, line_width = f"{line} {word}", line_width + space + word_width
+        else:
+            line, line_width = word, word_width
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _amount(value: Any) -> str:
+    return f"{float(value or 0):,.0f} {CURRENCY}"
+
+
+def _format_date(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%Y/%m/%d %H:%M")
+    if isinstance(value, date):
+        return value.strftime("%Y/%m/%d")
+    return str(value or "-")
+
+
+@lru_cache(maxsize=len(DOCUMENT_KINDS))
+def _template(kind: str) -> Image.Image:
+    """الأجزاء الثابتة من المستند - تُرسم مرة واحدة لكل نوع"""
+    title, (width_mm, height_mm) = DOCUMENT_KINDS[kind]
+    page = Image.new("L", (_px(width_mm), _px(height_mm)), 255)
+    draw = ImageDraw.Draw(page)
+    right = _px(width_mm - MARGIN_MM)
+    left = _px(MARGIN_MM)
+
+    _draw_text(draw, (right, _px(MARGIN_MM)), SHOP_NAME, 18, bold=True)
+    _draw_text(draw, (right, _px(MARGIN_MM + 10)), title, 14, bold=True)
+    header_bottom = _px(MARGIN_MM + QR_SIZE_MM + 3)
+    draw.line((left, header_bottom, right, header_bottom), fill=0, width=3)
+
+    for index, (label, _) in enumerate(INFO_ROWS):
+        _draw_text(draw, (right, _px(MARGIN_MM + QR_SIZE_MM + 8 + index * ROW_HEIGHT_MM)), f"{label}:", 10, bold=True)
+
+    table_top = _px(BODY_TOP_MM - 9)
+    if kind == "invoice":
+        for label, offset_mm, anchor in INVOICE_COLUMNS:
+            _draw_text(draw, (right - _px(offset_mm), table_top), label, 10, bold=True, anchor=anchor)
+    else:
+        _draw_text(draw, (right, table_top), "الأعمال المطلوبة", 11, bold=True)
+    draw.line((left, _px(BODY_TOP_MM - 2), right, _px(BODY_TOP_MM - 2)), fill=0, width=2)
+
+    footer_top = page.height - _px(BODY_BOTTOM_MM - 6)
+    draw.line((left, footer_top, right, footer_top), fill=0, width=2)
+    if kind == "ticket":
+        box = _px(5)
+        step = (right - left) // len(TICKET_STAGES)
+        for index, stage in enumerate(TICKET_STAGES):
+            x = right - index * step
+            top = footer_top + _px(5)
+            draw.rectangle((x - box, top, x, top + box), outline=0, width=2)
+            _draw_text(draw, (x - box - _px(2), top), stage, 10)
+    else:
+        _draw_text(draw, (page.width // 2, footer_top + _px(5)), "شكراً لتعاملكم معنا", 10, anchor="ma")
+    return page
+
+
+def _qr(url: str, size: int) -> Optional[Image.Image]:
+    if qrcode is None:
+        return None
+    code = qrcode.QRCode(border=0, box_size=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    code.add_data(url)
+    code.make(fit=True)
+    # من مصفوفة الوحدات مباشرة - واجهة make_image تختلف بين إصدارات qrcode
+    modules = code.get_matrix()
+    matrix = Image.new("L", (len(modules), len(modules)))
+    matrix.putdata([0 if dark else 255 for row in modules for dark in row])
+    return matrix.resize((size, size), Image.NEAREST)
+
+
+def _specs_text(specs: Any) -> str:
+    if not isinstance(specs, dict):
+        return ""
+    parts = []
+    for key, value in specs.items():
+        if key in _SKIPPED_SPECS or value in (None, "", [], {}) or isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, bool):
+            value = "نعم" if value else "لا"
+        parts.append(f"{SPEC_LABELS.get(key, key)}: {value}")
+    return " · ".join(parts)
+
+
+def _invoice_rows(order: Dict[str, Any], right: int) -> List[Row]:
+    rows: List[Row] = []
+    columns = [right - _px(offset_mm) for _, offset_mm, _ in INVOICE_COLUMNS]
+
+    for item in order["items"]:
+        def draw_item(draw, y, item=item):
+            _draw_text(draw, (columns[0], y), _fit(item["product_name"], 10, 90), 10)
+            _draw_text(draw, (columns[1], y), item["quantity"] or 0, 10, anchor="ma")
+            _draw_text(draw, (columns[2], y), _amount(item["unit_price"]), 10, anchor="ma")
+            _draw_text(draw, (columns[3], y), _amount(item["total_price"]), 10, anchor="ma")
+        rows.append((ROW_HEIGHT_MM, draw_item))
+
+    totals = [("المجموع", order["total_amount"])]
+    if order["final_amount"] is not None and order["final_amount"] != order["total_amount"]:
+        totals.append(("بعد الخصم", order["final_amount"]))
+    totals += [("المدفوع", order["paid_amount"]), ("المتبقي", order["remaining_amount"])]
+    rows.append((3, lambda draw, y: draw.line((columns[3] - _px(40), y, right, y), fill=0, width=2)))
+    for label, value in totals:
+        def draw_total(draw, y, label=label, value=value):
+            _draw_text(draw, (columns[2], y), label, 10, bold=True, anchor="ma")
+            _draw_text(draw, (columns[3], y), _amount(value), 10, bold=True, anchor="ma")
+        rows.append((ROW_HEIGHT_MM, draw_total))
+    return rows
+
+
+def _ticket_rows(order: Dict[str, Any], right: int, width_mm: float) -> List[Row]:
+    rows: List[Row] = []
+    text_width = width_mm - 2 * MARGIN_MM - 6
+    for number, item in enumerate(order["items"], start=1):
+        title = f"{number}. {item['product_name'] or '-'} × {item['quantity'] or 0}"
+        rows.append((ROW_HEIGHT_MM, lambda draw, y, title=_fit(title, 11, text_width + 6): _draw_text(draw, (right, y), title, 11, bold=True)))
+        details = _specs_text(item["specifications"])
+        if item["production_notes"]:
+            details = f"{details} · ملاحظات الإنتاج: {item['production_notes']}" if details else f"ملاحظات الإنتاج: {item['production_notes']}"
+        for line in _wrap(details, 9, text_width):
+            rows.append((5.5, lambda draw, y, line=line: _draw_text(draw, (right - _px(6), y), line, 9)))
+        rows.append((2, lambda draw, y: None))
+    if order["notes"]:
+        rows.append((ROW_HEIGHT_MM, lambda draw, y: _draw_text(draw, (right, y), "ملاحظات العميل:", 10, bold=True)))
+        for line in _wrap(str(order["notes"]), 9, text_width):
+            rows.append((5.5, lambda draw, y, line=line: _draw_text(draw, (right - _px(6), y), line, 9)))
+    return rows
+
+
+def render_document(job: Tuple[str, Dict[str, Any], str]) -> List[DocumentPage]:
+    """
+    مستند طلب واحد (يعمل على مجمع عمال الصور): (النوع، الطلب، رابط QR)
+    يعيد صفحاته مضغوطة جاهزة للكتابة في PDF
+    """
+    kind, order, url = job
+    template = _template(kind)
+    _, (width_mm, height_mm) = DOCUMENT_KINDS[kind]
+    right, left = _px(width_mm - MARGIN_MM), _px(MARGIN_MM)
+
+    rows = _invoice_rows(order, right) if kind == "invoice" else _ticket_rows(order, right, width_mm)
+    capacity = height_mm - BODY_TOP_MM - BODY_BOTTOM_MM
+    pages_rows: List[List[Row]] = [[]]
+    used = 0.0
+    for row in rows:
+        if used + row[0] > capacity and pages_rows[-1]:
+            pages_rows.append([])
+            used = 0.0
+        pages_rows[-1].append(row)
+        used += row[0]
+
+    qr = _qr(url, _px(QR_SIZE_MM))
+    info = {
+        "order_number": order["order_number"] or order["id"],
+        "created_at": _format_date(order["created_at"]),
+        "customer": " - ".join(value for value in (order["customer_name"], order["shop_name"]) if value) or "-",
+        "customer_phone": order["customer_phone"] or "-",
+        "delivery_date": _format_date(order["delivery_date"]) if order["delivery_date"] else "-",
+        "delivery": _fit(
+            f"توصيل: {order['delivery_address'] or '-'}" if order["delivery_type"] == "delivery" else "من المحل",
+            10, width_mm - 2 * MARGIN_MM - INFO_LABEL_WIDTH_MM - QR_SIZE_MM,
+        ),
+    }
+
+    pages: List[DocumentPage] = []
+    for page_number, page_rows in enumerate(pages_rows, start=1):
+        page = template.copy()
+        draw = ImageDraw.Draw(page)
+        value_x = right - _px(INFO_LABEL_WIDTH_MM)
+        for index, (_, key) in enumerate(INFO_ROWS):
+            y = _px(MARGIN_MM + QR_SIZE_MM + 8 + index * ROW_HEIGHT_MM)
+            _draw_text(draw, (value_x, y), info[key], 10, bold=key == "order_number")
+        if qr is not None:
+            page.paste(qr, (left, _px(MARGIN_MM)))
+        else:
+            _draw_text(draw, (left, _px(MARGIN_MM)), url, 7, anchor="la")
+
+        y = _px(BODY_TOP_MM)
+        for height_mm, draw_row in page_rows:
+            draw_row(draw, y)
+            y += _px(height_mm)
+        if len(pages_rows) > 1:
+            _draw_text(draw, (left, page.height - _px(BODY_BOTTOM_MM - 1)), f"{page_number}/{len(pages_rows)}", 9, anchor="la")
+        # المستند أبيض في معظمه - المستوى 3 يكفي ويوفر ثلثي زمن الضغط
+        pages.append((zlib.compress(page.tobytes(), 3), page.size))
+    return pages
+
+
+def load_orders(db, order_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """الطلبات مع عناصرها بترتيب order_ids - استعلامان فقط مهما كان عدد الطلبات"""
+    if not order_ids:
+        return []
+    params = {"order_ids": list(order_ids)}
+    orders = {row._mapping["id"]: dict(row._mapping, items=[]) for row in db.execute(text(_ORDERS_QUERY), params)}
+    for row in db.execute(text(_ITEMS_QUERY), params):
+        order = orders.get(row._mapping["order_id"])
+        if order is not None:
+            order["items"].append(dict(row._mapping))
+    return [orders[order_id] for order_id in order_ids if order_id in orders]
+
+
+def batch_order_ids(db, status: str, day: date) -> List[int]:
+    """طلبات بحالة status أُنشئت أو انتقلت إليها في اليوم day (بترتيب الإنشاء)"""
+    rows = db.execute(text("""
+        SELECT o.id FROM orders o
+        WHERE o.status = :status
+          AND (
+            CAST(o.created_at AS DATE) = :day
+            OR EXISTS (
+                SELECT 1 FROM order_status_history h
+                WHERE h.order_id = o.id AND h.status = :status AND CAST(h.created_at AS DATE) = :day
+            )
+          )
+        ORDER BY o.created_at, o.id
+        LIMIT :limit
+    """), {"status": status, "day": day, "limit": DOCUMENT_BATCH_MAX + 1}).fetchall()
+    if len(rows) > DOCUMENT_BATCH_MAX:
+        raise DocumentError(f"الحد الأقصى {DOCUMENT_BATCH_MAX} طلب في الدفعة الواحدة")
+    return [row[0] for row in rows]
+
+
+def parse_kinds(kind: str) -> List[str]:
+    """invoice | ticket | both (بطاقة العمل ثم الفاتورة لكل طلب)"""
+    kind = (kind or "").lower()
+    if kind == "both":
+        return ["ticket", "invoice"]
+    if kind not in DOCUMENT_KINDS:
+        raise DocumentError(f"نوع المستند غير مدعوم: {kind}. المتاح: {', '.join(DOCUMENT_KINDS)}, both")
+    return [kind]
+
+
+def prepare_templates(kinds: Sequence[str]) -> None:
+    """رسم القوالب (والتحقق من وجود الخطوط) قبل بدء الإرسال حتى يظهر الخطأ كاستجابة لا كملف مقطوع"""
+    for kind in kinds:
+        _template(kind)
+
+
+async def stream_documents(
+    orders: List[Dict[str, Any]], kinds: Sequence[str], order_url: Callable[[int], str]
+) -> AsyncIterator[bytes]:
+    """ملف PDF واحد لكل المستندات - ترتيب الطلبات ثم الأنواع محفوظ"""
+    writer = PdfAssembler(title="Orders")
+    jobs = [(kind, order, order_url(order["id"])) for order in orders for kind in kinds]
+    async for pages in map_in_imaging_pool(render_document, jobs):
+        for data, size in pages:
+            writer.add_encoded_image_page(data, "/FlateDecode", "L", size, DOCUMENT_DPI)
+        chunk = writer.drain(OUTPUT_CHUNK_SIZE)
+        if chunk:
+            yield chunk
+    yield writer.finish()
@@ -0,0 +1,306 @@
+"""
+تصنيف صفحات PDF إلى ملونة أو أبيض وأسود بدون تحويل الصفحات إلى صور
+
+لكل صفحة نفحص:
+- أوامر الألوان في محتوى الصفحة (rg/RG، k/K، sc/scn مع مساحة اللون الحالية، sh) - بدون تحليل كامل للمحتوى
+- مساحة ألوان الصور المضمنة: الرمادية/أحادية البت = أبيض وأسود، وRGB/CMYK تُفحص من عينة مصغرة
+  (JPEG يُفك بمقياس 1/8 عبر draft) لأن كثيراً من الملفات الممسوحة رمادية مخزنة كـ RGB
+- كائنات Form والأنماط (Pattern) بشكل متداخل
+
+نتيجة الصور والـ Forms تُحفظ حسب رقم الكائن فالشعار المكرر في كل صفحة يُفحص مرة واحدة
+"""
+import io
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# فرق القنوات (0..1) الذي يُعتبر لوناً وليس رمادياً
+COLOR_TOLERANCE = 0.05
+# نسبة بكسلات العينة المشبعة التي تجعل الصورة ملونة
+IMAGE_COLOR_PIXEL_RATIO = 0.01
+IMAGE_SATURATION_THRESHOLD = 48
+IMAGE_SAMPLE_SIDE = 64
+# أكبر صورة غير JPEG نفك بياناتها للعينة (بالبايت بعد فك الضغط)، الأكبر تُعتبر ملونة
+MAX_IMAGE_DECODE_BYTES = 16 * 1024 * 1024
+# أقصى عمق لتداخل Forms/Patterns
+MAX_NESTING = 8
+# أسماء أحبار Separation التي لا تُعتبر لوناً
+NEUTRAL_SEPARATIONS = {"/Black", "/All", "/None"}
+
+# المعاملات التي تهمنا - g/G غير مدرجة لأنها تضبط لوناً رمادياً دائماً
+_OPERATORS = {b"rg", b"RG", b"k", b"K", b"scn", b"SCN", b"sc", b"SC", b"cs", b"CS", b"Do", b"sh"}
+# معاملات لا تعتمد على مساحة اللون الحالية - نتيجتها تُحفظ حسب نص المعاملات
+_DEVICE_OPERATORS = {b"rg": "rgb", b"RG": "rgb", b"k": "cmyk", b"K": "cmyk"}
+
+
+def _operands(tokens: List[bytes]) -> Tuple[Optional[str], List[float], Optional[str]]:
+    """(اسم قبل الأرقام، الأرقام، اسم بعد الأرقام) من الكلمات السابقة للمعامل"""
+    tokens = list(tokens)
+    trailing_name = None
+    if tokens and tokens[-1].startswith(b"/"):
+        trailing_name = tokens.pop().decode("latin-1")
+    numbers: List[float] = []
+    while tokens and len(numbers) < 4:
+        try:
+            numbers.insert(0, float(tokens[-1]))
+        except ValueError:
+            break
+        tokens.pop()
+    if not numbers:
+        return trailing_name, numbers, None
+    return None, numbers, trailing_name
+
+
+def _resolve(obj: Any) -> Any:
+    return obj.get_object() if hasattr(obj, "get_object") else obj
+
+
+def _object_key(obj: Any) -> Optional[int]:
+    return getattr(obj, "idnum", None)
+
+
+def _is_neutral(components: List[float], family: str) -> bool:
+    if family == "gray" or len(components) == 1:
+        return True
+    if family == "cmyk" or len(components) == 4:
+        c, m, y = components[:3]
+        # c = m = y (أسود غني / رمادي) ليس لوناً
+        return max(c, m, y) - min(c, m, y) <= COLOR_TOLERANCE
+    if len(components) == 3:
+        return max(components) - min(components) <= COLOR_TOLERANCE
+    return True
+
+
+class PdfColorClassifier:
+    """مصنف لكل مستند - يحتفظ بنتائج الصور والـ Forms المشتركة بين الصفحات"""
+
+    def __init__(self) -> None:
+        self._xobject_results: Dict[int, bool] = {}
+
+    # ---------------- مساحات الألوان ----------------
+
+    def _color_space_family(self, cs: Any, resources: Any, depth: int = 0) -> str:
+        """gray | rgb | cmyk | lab | indexed-gray | indexed-color | spot | pattern"""
+        cs = _resolve(cs)
+        if isinstance(cs, str) and not cs.startswith("/Device") and cs != "/Pattern" and resources is not None:
+            named = _resolve(_resolve(resources).get("/ColorSpace")) or {}
+            if cs in named:
+                return self._color_space_family(named[cs], None, depth + 1)
+        name = cs[0] if isinstance(cs, list) and cs else cs
+        name = str(_resolve(name))
+        if name in ("/DeviceGray", "/CalGray", "/G"):
+            return "gray"
+        if name in ("/DeviceRGB", "/CalRGB", "/RGB"):
+            return "rgb"
+        if name in ("/DeviceCMYK", "/CMYK"):
+            return "cmyk"
+        if name == "/Lab":
+            return "lab"
+        if name == "/Pattern":
+            return "pattern"
+        if name == "/ICCBased" and isinstance(cs, list) and len(cs) > 1:
+            components = int(_resolve(cs[1]).get("/N", 3))
+            return {1: "gray", 3: "rgb", 4: "cmyk"}.get(components, "rgb")
+        if name in ("/Indexed", "/I") and isinstance(cs, list) and len(cs) >= 4 and depth < MAX_NESTING:
+            base = self._color_space_family(cs[1], resources, depth + 1)
+            if base == "gray":
+                return "indexed-gray"
+            return "indexed-color" if self._palette_has_color(cs, base) else "indexed-gray"
+        if name == "/Separation" and isinstance(cs, list) and len(cs) > 1:
+            return "gray" if str(_resolve(cs[1])) in NEUTRAL_SEPARATIONS else "spot"
+        if name == "/DeviceN" and isinstance(cs, list) and len(cs) > 1:
+            inks = {str(_resolve(ink)) for ink in _resolve(cs[1])}
+            return "gray" if inks <= NEUTRAL_SEPARATIONS else "spot"
+        return "rgb"
+
+    def _palette_has_color(self, cs: List[Any], base: str) -> bool:
+        lookup = _resolve(cs[3])
+        if hasattr(lookup, "get_data"):
+            data = lookup.get_data()
+        elif isinstance(lookup, bytes):
+            data = lookup
+        else:
+            data = str(lookup).encode("latin-1", "ignore")
+        step = 4 if base == "cmyk" else 3
+        for offset in range(0, len(data) - step + 1, step):
+            components = [value / 255 for value in data[offset:offset + step]]
+            if not _is_neutral(components, base):
+                return True
+        return False
+
+    # ---------------- الصور ----------------
+
+    def _image_is_color(self, image: Any, resources: Any) -> bool:
+        # القناع (ImageMask) يُرسم بلون التعبئة الحالي، ولو كان ملوناً لتوقف الفحص عند أمر اللون
+        if image.get("/ImageMask"):
+            return False
+        family = self._color_space_family(image.get("/ColorSpace", "/DeviceGray"), resources)
+        if family in ("gray", "indexed-gray") or int(image.get("/BitsPerComponent", 8) or 8) == 1:
+            return False
+        if family in ("spot", "indexed-color"):
+            return True
+
+        filters = image.get("/Filter")
+        filters = [str(f) for f in _resolve(filters)] if isinstance(_resolve(filters), list) else [str(filters)]
+        try:
+            if filters and filters[-1] == "/DCTDecode" and len(filters) == 1:
+                sample = Image.open(io.BytesIO(image._data))
+                sample.draft("RGB", (IMAGE_SAMPLE_SIDE, IMAGE_SAMPLE_SIDE))
+            elif "/JPXDecode" in filters:
+                return True
+            else:
+                width, height = int(image["/Width"]), int(image["/Height"])
+                mode = "CMYK" if family == "cmyk" else "RGB"
+                if width * height * len(mode) > MAX_IMAGE_DECODE_BYTES or int(image.get("/BitsPerComponent", 8)) != 8:
+                    return True
+                sample = Image.frombytes(mode, (width, height), image.get_data())
+        except Exception:
+            return True
+        return _sample_is_color(sample)
+
+    # ---------------- المحتوى ----------------
+
+    def _stream_is_color(self, data: bytes, resources: Any, depth: int) -> bool:
+        resources = _resolve(resources) or {}
+        fill_family = stroke_family = "gray"
+
+        # تقسيم المحتوى مرة واحدة (في C) ثم تحديد مواقع المعاملات فقط - بدون regex بمعاملات
+        tokens = data.split()
+        positions = [index for index, token in enumerate(tokens) if token in _OPERATORS]
+        device_results: Dict[bytes, bool] = {}
+        for index in positions:
+            token = tokens[index]
+            previous = tokens[max(0, index - 5):index]
+            device_family = _DEVICE_OPERATORS.get(token)
+            if device_family:
+                # النصوص تكرر نفس اللون آلاف المرات ("0 0 0 rg") فنحسبه مرة واحدة
+                key = b" ".join(tokens[max(0, index - 4):index + 1])
+                is_color = device_results.get(key)
+                if is_color is None:
+                    _, numbers, _ = _operands(previous)
+                    is_color = bool(numbers) and not _is_neutral(numbers, device_family)
+                    device_results[key] = is_color
+                if is_color:
+                    return True
+                continue
+
+            operator = token.decode()
+            name_operand, numbers, trailing_name = _operands(previous)
+            if operator in ("cs", "CS"):
+                family = self._color_space_family(name_operand, resources) if name_operand else "gray"
+                if family == "spot":
+                    return True
+                if operator == "cs":
+                    fill_family = family
+                else:
+                    stroke_family = family
+                continue
+            if operator == "Do" and name_operand:
+                if self._xobject_is_color(name_operand, resources, depth):
+                    return True
+                continue
+            if operator == "sh" and name_operand:
+                shadings = _resolve(resources.get("/Shading", {}))
+                shading = _resolve(shadings.get(name_operand)) if shadings else None
+                if shading is not None and self._color_space_family(shading.get("/ColorSpace", "/DeviceGray"), resources) != "gray":
+                    return True
+                continue
+
+            if operator in ("scn", "SCN") and (trailing_name or (name_operand and not numbers)):
+                pattern_name = trailing_name or name_operand
+                if self._pattern_is_color(pattern_name, resources, depth):
+                    return True
+                continue
+            if not numbers:
+                continue
+
+            family = fill_family if operator in ("sc", "scn") else stroke_family
+            if family == "indexed-color":
+                return True
+            if family in ("gray", "indexed-gray"):
+                continue
+            if family == "lab":
+                # a*, b* قريبة من الصفر = رمادي
+                if len(numbers) >= 3 and max(abs(numbers[1]), abs(numbers[2])) > 5:
+                    return True
+                continue
+            if not _is_neutral(numbers, family):
+                return True
+        return False
+
+    def _xobject_is_color(self, name: str, resources: Any, depth: int) -> bool:
+        xobjects = _resolve(resources.get("/XObject", {}))
+        reference = xobjects.get(name) if xobjects else None
+        if reference is None:
+            return False
+        key = _object_key(reference)
+        if key is not None and key in self._xobject_results:
+            return self._xobject_results[key]
+
+        xobject = _resolve(reference)
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            result = self._image_is_color(xobject, resources)
+        elif subtype == "/Form" and depth < MAX_NESTING:
+            result = self._stream_is_color(xobject.get_data(), xobject.get("/Resources") or resources, depth + 1)
+        else:
+            result = False
+        if key is not None:
+            self._xobject_results[key] = result
+        return result
+
+    def _pattern_is_color(self, name: str, resources: Any, depth: int) -> bool:
+        patterns = _resolve(resources.get("/Pattern", {}))
+        pattern = _resolve(patterns.get(name)) if patterns else None
+        if pattern is None or depth >= MAX_NESTING:
+            return False
+        if int(pattern.get("/PatternType", 1)) == 2:
+            shading = _resolve(pattern.get("/Shading"))
+            return shading is not None and self._color_space_family(shading.get("/ColorSpace", "/DeviceGray"), resources) != "gray"
+        return self._stream_is_color(pattern.get_data(), pattern.get("/Resources") or resources, depth + 1)
+
+    def page_is_color(self, page: Any) -> bool:
+        contents = _resolve(page.get("/Contents"))
+        if contents is None:
+            return False
+        if isinstance(contents, list):
+            data = b"\n".join(_resolve(part).get_data() for part in contents)
+        else:
+            data = contents.get_data()
+        return self._stream_is_color(data, page.get("/Resources"), 0)
+
+
+def _sample_is_color(sample: Image.Image) -> bool:
+    sample.thumbnail((IMAGE_SAMPLE_SIDE, IMAGE_SAMPLE_SIDE))
+    hsv = sample.convert("RGB").convert("HSV")
+    saturation, _, value = hsv.split()
+    # البكسلات الداكنة جداً لا يظهر فيها اللون حتى لو كانت مشبعة
+    mask = value.point(lambda v: 255 if v > 40 else 0)
+    histogram = saturation.histogram(mask=mask)
+    colored = sum(histogram[IMAGE_SATURATION_THRESHOLD:])
+    total = sum(histogram) or 1
+    return colored / total > IMAGE_COLOR_PIXEL_RATIO
+
+
+def classify_pdf_pages(reader: Any, page_limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    تصنيف صفحات المستند: {color: عدد، bw: عدد، color_pages: [أرقام الصفحات الملونة]}
+    الصفحة التي يفشل تحليلها تُعتبر ملونة (التسعير الأعلى أسلم من خسارة المطبعة)
+    """
+    classifier = PdfColorClassifier()
+    color_pages: List[int] = []
+    pages = reader.pages
+    total = len(pages) if page_limit is None else min(len(pages), page_limit)
+    for index in range(total):
+        try:
+            is_color = classifier.page_is_color(pages[index])
+        except Exception as e:
+            print(f"⚠️ Failed to classify PDF page {index + 1}: {e}")
+            is_color = True
+        if is_color:
+            color_pages.append(index + 1)
+    return {
+        "color": len(color_pages),
+        "bw": total - len(color_pages),
+        "color_pages": color_pages,
+    }
@@ -0,0 +1,224 @@
+"""
+طابور الطباعة: تجميع عناصر الطلبات المعلقة حسب (الخدمة، قياس الورق، نوع الورق، نوع الطباعة، الجودة)
+حتى تُطبع الأعمال المتوافقة معاً بأقل عدد من تبديلات الورق والحبر
+
+- الفهرس في الذاكرة يُبنى مرة واحدة من قاعدة البيانات ثم يُحدَّث لكل طلب عند إنشائه أو تغيير حالته
+  (refresh_order يقرأ عناصر طلب واحد فقط) بدلاً من إعادة مسح كل الطلبات مع كل طلب للطابور
+- ملخص كل مجموعة (أقرب موعد تسليم، أقدم طلب، الكمية) يُعاد حسابه فقط للمجموعات التي تغيرت
+- لكل عملية (worker) فهرسها الخاص، لذلك يُعاد التحميل الكامل كل QUEUE_RELOAD_SECONDS
+  لالتقاط التغييرات التي تمت في عمليات أخرى
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+# حالات الطلب التي تبقى عناصرها في الطابور
+QUEUE_ORDER_STATUSES = ("pending", "accepted", "preparing")
+# حالات العنصر التي تعني أنه طُبع وخرج من الطابور
+DONE_ITEM_STATUSES = ("printed", "completed", "cancelled")
+QUEUE_RELOAD_SECONDS = int(os.getenv("QUEUE_RELOAD_SECONDS", "300"))
+
+BatchKey = Tuple[str, str, str, str, str]
+
+_ITEMS_QUERY = """
+    SELECT oi.id, oi.order_id, oi.product_name, oi.quantity, oi.specifications, oi.status,
+           o.order_number, o.customer_name, o.status, o.delivery_date, o.created_at
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    WHERE o.status = ANY(:order_statuses)
+      AND NOT (COALESCE(oi.status, 'pending') = ANY(:done_statuses))
+"""
+
+
+def _spec(specs: Dict[str, Any], *keys: str) -> str:
+    for key in keys:
+        value = specs.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def batch_key(service: Optional[str], specs: Any) -> BatchKey:
+    """مفتاح التجميع - العناصر بنفس المفتاح تُطبع بدون تبديل ورق أو إعدادات"""
+    specs = specs if isinstance(specs, dict) else {}
+    return (
+        (service or "").strip(),
+        _spec(specs, "paper_size").upper(),
+        _spec(specs, "paper_type"),
+        _spec(specs, "print_type", "print_color"),
+        _spec(specs, "print_quality"),
+    )
+
+
+def batch_id(key: BatchKey) -> str:
+    return hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()[:12]
+
+
+class PrintQueue:
+    """فهرس عناصر الطباعة المعلقة مجمعة حسب التوافق"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._items: Dict[int, Dict[str, Any]] = {}
+        self._batches: Dict[BatchKey, Set[int]] = {}
+        self._by_order: Dict[int, Set[int]] = {}
+        self._summaries: Dict[BatchKey, Dict[str, Any]] = {}
+        self._dirty: Set[BatchKey] = set()
+        self._loaded_at: Optional[float] = None
+
+    # ---------------- تعديل الفهرس ----------------
+
+    def _add(self, row: Any) -> None:
+        item_id, order_id, service, quantity, specs, _, order_number, customer_name, _, delivery_date, created_at = row
+        key = batch_key(service, specs)
+        self._items[item_id] = {
+            "item_id": item_id,
+            "order_id": order_id,
+            "order_number": order_number,
+            "customer_name": customer_name,
+            "quantity": quantity or 0,
+            "delivery_date": delivery_date,
+            "created_at": created_at,
+            "print_sides": _spec(specs if isinstance(specs, dict) else {}, "print_sides"),
+            "key": key,
+        }
+        self._batches.setdefault(key, set()).add(item_id)
+        self._by_order.setdefault(order_id, set()).add(item_id)
+        self._dirty.add(key)
+
+    def _remove_items(self, item_ids: Iterable[int]) -> None:
+        for item_id in list(item_ids):
+            entry = self._items.pop(item_id, None)
+            if not entry:
+                continue
+            key = entry["key"]
+            members = self._batches.get(key)
+            if members is not None:
+                members.discard(item_id)
+                if members:
+                    self._dirty.add(key)
+                else:
+                    del self._batches[key]
+                    self._summaries.pop(key, None)
+                    self._dirty.discard(key)
+            order_items = self._by_order.get(entry["order_id"])
+            if order_items is not None:
+                order_items.discard(item_id)
+                if not order_items:
+                    del self._by_order[entry["order_id"]]
+
+    def _query(self, db, extra: str = "", params: Optional[Dict[str, Any]] = None) -> List[Any]:
+        return db.execute(text(_ITEMS_QUERY + extra), {
+            "order_statuses": list(QUEUE_ORDER_STATUSES),
+            "done_statuses": list(DONE_ITEM_STATUSES),
+            **(params or {}),
+        }).fetchall()
+
+    def load(self, db) -> None:
+        """تحميل كامل من قاعدة البيانات (عند أول استخدام ثم كل QUEUE_RELOAD_SECONDS)"""
+        rows = self._query(db)
+        with self._lock:
+            self._items.clear()
+            self._batches.clear()
+            self._by_order.clear()
+            self._summaries.clear()
+            self._dirty.clear()
+            for row in rows:
+                self._add(row)
+            self._loaded_at = time.monotonic()
+        print(f"🖨️ Print queue loaded: {len(rows)} items in {len(self._batches)} batches")
+
+    def ensure_loaded(self, db) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > QUEUE_RELOAD_SECONDS:
+            self.load(db)
+
+    def refresh_order(self, db, order_id: int) -> None:
+        """إعادة فهرسة عناصر طلب واحد (بعد إنشائه أو تغيير حالته أو حالة عناصره)"""
+        if self._loaded_at is None:
+            return  # سيُحمّل كاملاً عند أول طلب للطابور
+        rows = self._query(db, " AND o.id = :order_id", {"order_id": order_id})
+        with self._lock:
+            self._remove_items(self._by_order.get(order_id, ()))
+            for row in rows:
+                self._add(row)
+
+    def remove_orders(self, order_ids: Iterable[int]) -> None:
+        with self._lock:
+            for order_id in order_ids:
+                self._remove_items(self._by_order.get(order_id, ()))
+
+    def remove_items(self, item_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._remove_items(item_ids)
+
+    # ---------------- القراءة ----------------
+
+    def _summary(self, key: BatchKey) -> Dict[str, Any]:
+        if key in self._dirty or key not in self._summaries:
+            entries = [self._items[item_id] for item_id in self._batches[key]]
+            delivery_dates = [entry["delivery_date"] for entry in entries if entry["delivery_date"]]
+            created = [entry["created_at"] for entry in entries if entry["created_at"]]
+            service, paper_size, paper_type, print_type, print_quality = key
+            self._summaries[key] = {
+                "batch_id": batch_id(key),
+                "service": service,
+                "paper_size": paper_size or None,
+                "paper_type": paper_type or None,
+                "print_type": print_type or None,
+                "print_quality": print_quality or None,
+                "items_count": len(entries),
+                "orders_count": len({entry["order_id"] for entry in entries}),
+                "total_quantity": sum(entry["quantity"] for entry in entries),
+                "earliest_delivery": min(delivery_dates) if delivery_dates else None,
+                "oldest_created_at": min(created) if created else None,
+            }
+            self._dirty.discard(key)
+        return self._summaries[key]
+
+    @staticmethod
+    def _sort_key(delivery: Optional[date], created: Optional[datetime]) -> Tuple[date, datetime]:
+        # المجموعات بموعد تسليم أولاً (الأقرب)، ثم الأقدم انتظاراً
+        return delivery or date.max, created or datetime.max
+
+    def _items_sorted(self, key: BatchKey) -> List[Dict[str, Any]]:
+        entries = [self._items[item_id] for item_id in self._batches[key]]
+        entries.sort(key=lambda entry: self._sort_key(entry["delivery_date"], entry["created_at"]))
+        return [{k: v for k, v in entry.items() if k != "key"} for entry in entries]
+
+    def snapshot(self, include_items: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            summaries = [(key, self._summary(key)) for key in self._batches]
+            summaries.sort(key=lambda pair: self._sort_key(pair[1]["earliest_delivery"], pair[1]["oldest_created_at"]))
+            if limit:
+                summaries = summaries[:limit]
+            batches = []
+            for key, summary in summaries:
+                batch = dict(summary)
+                if include_items:
+                    batch["items"] = self._items_sorted(key)
+                batches.append(batch)
+            return batches
+
+    def batch(self, identifier: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for key in self._batches:
+                if batch_id(key) == identifier:
+                    return {**self._summary(key), "items": self._items_sorted(key)}
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "batches": len(self._batches),
+                "orders": len(self._by_order),
+                "loaded_seconds_ago": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            }
+
+
+print_queue = PrintQueue()
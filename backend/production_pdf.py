@@ -0,0 +1,556 @@
+"""
+تجميع ملف إنتاج PDF واحد لطلب كامل (محاضرات، بروشورات) جاهز للطباعة
+
+- كل صفحة من ملفات العميل تتحول إلى Form XObject وتوضع على ورقة بقياس الطلب (A4/A5...)
+  مع تدوير تلقائي وتكبير/تصغير للملاءمة، أو صفحتين في الورقة (2up)، أو كتيب (booklet)
+- الكتابة تزايدية: كل كائن يُكتب فور تجهيزه ويُرسل للعميل على دفعات. ما يبقى في الذاكرة:
+  جدول مواقع الكائنات (8 بايت لكل كائن مكتوب) وأرقام الصفحات، وخريطة نسخ محدودة (COPIED_OBJECTS_LIMIT)
+- صفحات المصدر تُقرأ بالنزول في شجرة الصفحات (page_at) دون بناء قائمة كل الصفحات،
+  وcache القارئ يُفرغ دورياً (READER_CACHE_LIMIT)
+- الموارد المشتركة (الخطوط والصور المكررة في كل صفحة) تُنسخ مرة واحدة لكل ملف مصدر
+  ما دامت في خريطة النسخ - إذا خرجت منها تُنسخ مرة أخرى (ملف أكبر قليلاً لكنه صحيح)
+
+PdfAssembler هو كاتب PDF الوحيد في المشروع: ملف الإنتاج والتركيب والشهادات،
+وأيضاً الصفحات النقطية (صور الطباعة، مستندات الطلبات) عبر add_image_page
+"""
+import bisect
+import io
+import os
+import zlib
+from array import array
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+from PyPDF2 import PageObject
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    EncodedStreamObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+from cache import LRUCache
+from document_analysis import POINTS_PER_MM, _open_pdf, _pdf_page_count
+
+# قياسات الورق المدعومة (ملم، عمودي)
+PRODUCTION_PAPER_SIZES_MM = {
+    "A3": (297, 420),
+    "A4": (210, 297),
+    "A5": (148, 210),
+    "B5": (176, 250),
+    "SRA3": (320, 450),
+}
+IMPOSITIONS = ("none", "2up", "booklet")
+# حجم الدفعة المرسلة للعميل
+OUTPUT_CHUNK_SIZE = 256 * 1024
+# عند تجاوز هذا العدد من الكائنات المقروءة نفرغ cache القارئ (الكائنات المنسوخة محفوظة بأرقامها)
+READER_CACHE_LIMIT = 2000
+# أقصى عدد مراجع منسوخة نتذكرها لإعادة استخدامها (الأقدم استخداماً يُنسى)
+COPIED_OBJECTS_LIMIT = 20000
+# السمات التي ترثها الصفحة من عقد شجرة الصفحات
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+_COLOR_SPACES = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+
+
+class ProductionPdfError(ValueError):
+    """خيارات غير صالحة أو ملف مصدر تالف"""
+
+
+def paper_size_points(paper: str) -> Tuple[float, float]:
+    size = PRODUCTION_PAPER_SIZES_MM.get((paper or "").upper())
+    if not size:
+        raise ProductionPdfError(
+            f"قياس الورق غير مدعوم: {paper}. القياسات المتاحة: {', '.join(PRODUCTION_PAPER_SIZES_MM)}"
+        )
+    return size[0] * POINTS_PER_MM, size[1] * POINTS_PER_MM
+
+
+def page_at(reader: Any, index: int) -> PageObject:
+    """
+    الصفحة رقم index بالنزول في شجرة الصفحات عبر /Count - دون reader.pages
+    الذي يحمّل قاموس كل صفحات الملف عند أول استخدام
+    السمات الموروثة من العقد الأم تُضاف للصفحة كما يفعل PyPDF2؛ الشجرة التالفة تعود لـ reader.pages
+    """
+    try:
+        node = reader.trailer["/Root"]["/Pages"].get_object()
+        reference = None
+        inherited: Dict[str, Any] = {}
+        remaining = index
+        for _ in range(64):
+            if "/Kids" not in node:
+                break
+            for key in INHERITABLE_PAGE_KEYS:
+                if key in node:
+                    inherited[key] = node.raw_get(key)
+            for kid_reference in node["/Kids"]:
+                kid = kid_reference.get_object()
+                count = int(kid["/Count"]) if "/Kids" in kid else 1
+                if remaining < count:
+                    node, reference = kid, kid_reference
+                    break
+                remaining -= count
+            else:
+                raise IndexError(index)
+        if "/Kids" in node or remaining:
+            raise IndexError(index)
+    except Exception:
+        return reader.pages[index]
+    page = PageObject(reader, reference)
+    page.update(node)
+    for key, value in inherited.items():
+        if key not in page:
+            page[NameObject(key)] = value
+    return page
+
+
+class PdfAssembler:
+    """
+    كاتب PDF تزايدي: صفحات وصور موجودة على أوراق جديدة، أو صفحات نقطية مباشرة
+    الكائنات تُكتب بالترتيب ويُحتفظ فقط بمواقعها لجدول xref
+
+    الاستخدام:
+        writer = PdfAssembler(title="Orders")
+        for image in pages:
+            writer.add_image_page(image, dpi=300)
+            yield writer.drain(OUTPUT_CHUNK_SIZE)
+        yield writer.finish()
+    """
+
+    def __init__(self, title: Optional[str] = None) -> None:
+        self.title = title
+        self._buffer = io.BytesIO()
+        self._flushed = 0
+        self._offsets = array("q")
+        self._copied = LRUCache(max_items=COPIED_OBJECTS_LIMIT)
+        self._pending: List[Tuple[int, IndirectObject, int]] = []
+        self._page_numbers = array("q")
+        self._catalog = self._reserve()
+        self._pages_root = self._reserve()
+        self._buffer.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_numbers)
+
+    def _reserve(self) -> int:
+        self._offsets.append(0)
+        return len(self._offsets)
+
+    def _tell(self) -> int:
+        return self._flushed + self._buffer.tell()
+
+    def _write_object(self, number: int, obj: Any) -> None:
+        self._offsets[number - 1] = self._tell()
+        self._buffer.write(b"%d 0 obj\n" % number)
+        obj.write_to_stream(self._buffer, None)
+        self._buffer.write(b"\nendobj\n")
+
+    def drain(self, minimum: int = 0) -> bytes:
+        """إخراج البيانات المكتوبة حتى الآن (إذا تجاوزت minimum)"""
+        if self._buffer.tell() < minimum:
+            return b""
+        data = self._buffer.getvalue()
+        self._flushed += len(data)
+        self._buffer = io.BytesIO()
+        return data
+
+    def copy(self, obj: Any, source: int) -> Any:
+        """نسخ كائن من ملف مصدر مع إعادة ترقيم المراجع (كل مرجع يُنسخ مرة واحدة)"""
+        if isinstance(obj, IndirectObject):
+            key = (source, obj.idnum, obj.generation)
+            number = self._copied.get(key)
+            if number is None:
+                number = self._reserve()
+                self._copied.set(key, number)
+                self._pending.append((number, obj, source))
+            return IndirectObject(number, 0, None)
+        if isinstance(obj, StreamObject):
+            stream = EncodedStreamObject() if isinstance(obj, EncodedStreamObject) else DecodedStreamObject()
+            stream._data = obj._data
+            for key, value in obj.items():
+                if key != "/Length":
+                    stream[NameObject(key)] = self.copy(value, source)
+            return stream
+        if isinstance(obj, DictionaryObject):
+            # /Parent يربط بشجرة صفحات المصدر - لا ننسخه حتى لا نسحب المستند كله
+            return DictionaryObject({
+                NameObject(key): self.copy(value, source) for key, value in obj.items() if key != "/Parent"
+            })
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(value, source) for value in obj)
+        return obj
+
+    def flush_pending(self) -> None:
+        while self._pending:
+            number, reference, source = self._pending.pop()
+            self._write_object(number, self.copy(reference.get_object(), source))
+
+    def add_form(self, page: Any, source: int) -> Tuple[int, Tuple[float, float, float, float]]:
+        """تحويل صفحة مصدر إلى Form XObject - يعيد (رقم الكائن، الإطار x0, y0, w, h)"""
+        box = page.cropbox
+        x0, y0 = float(box.left), float(box.bottom)
+        width, height = float(box.width), float(box.height)
+
+        contents = page.get("/Contents")
+        contents = contents.get_object() if contents is not None else None
+        if isinstance(contents, ArrayObject):
+            data = b"\n".join(part.get_object().get_data() for part in contents)
+        elif contents is not None:
+            data = contents.get_data()
+        else:
+            data = b""
+
+        form = EncodedStreamObject()
+        form._data = zlib.compress(data)
+        form[NameObject("/Type")] = NameObject("/XObject")
+        form[NameObject("/Subtype")] = NameObject("/Form")
+        form[NameObject("/Filter")] = NameObject("/FlateDecode")
+        form[NameObject("/BBox")] = ArrayObject(FloatObject(v) for v in (x0, y0, x0 + width, y0 + height))
+        resources = page.raw_get("/Resources") if "/Resources" in page else DictionaryObject()
+        form[NameObject("/Resources")] = self.copy(resources, source)
+
+        number = self._reserve()
+        self._write_object(number, form)
+        self.flush_pending()
+        return number, (x0, y0, width, height)
+
+    def add_image(self, source: Union[str, bytes]) -> Tuple[int, Tuple[float, float, float, float]]:
+        """
+        تضمين صورة (مسار أو محتوى الملف) داخل Form XObject بإطار أبعادها بالبكسل
+        JPEG يُضمّن كما هو بدون فك ترميز أو إعادة ضغط
+        """
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            width, height = image.size
+            image_stream = EncodedStreamObject()
+            if image.format == "JPEG" and image.mode in ("RGB", "L"):
+                if isinstance(source, bytes):
+                    image_stream._data = source
+                else:
+                    with open(source, "rb") as fp:
+                        image_stream._data = fp.read()
+                image_stream[NameObject("/Filter")] = NameObject("/DCTDecode")
+                mode = image.mode
+            else:
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    flattened = Image.new("RGB", image.size, "white")
+                    flattened.paste(image, mask=image.getchannel("A"))
+                    image = flattened
+                elif image.mode not in ("RGB", "L", "CMYK"):
+                    image = image.convert("RGB")
+                mode = image.mode
+                image_stream._data = zlib.compress(image.tobytes())
+                image_stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+        image_stream[NameObject("/Type")] = NameObject("/XObject")
+        image_stream[NameObject("/Subtype")] = NameObject("/Image")
+        image_stream[NameObject("/Width")] = NumberObject(width)
+        image_stream[NameObject("/Height")] = NumberObject(height)
+        image_stream[NameObject("/BitsPerComponent")] = NumberObject(8)
+        image_stream[NameObject("/ColorSpace")] = NameObject(
+            {"L": "/DeviceGray", "CMYK": "/DeviceCMYK"}.get(mode, "/DeviceRGB")
+        )
+        image_number = self._reserve()
+        self._write_object(image_number, image_stream)
+
+        form = EncodedStreamObject()
+        form._data = zlib.compress(b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (width, height))
+        form[NameObject("/Type")] = NameObject("/XObject")
+        form[NameObject("/Subtype")] = NameObject("/Form")
+        form[NameObject("/Filter")] = NameObject("/FlateDecode")
+        form[NameObject("/BBox")] = ArrayObject([NumberObject(0), NumberObject(0), NumberObject(width), NumberObject(height)])
+        form[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): IndirectObject(image_number, 0, None)})
+        })
+        number = self._reserve()
+        self._write_object(number, form)
+        return number, (0.0, 0.0, float(width), float(height))
+
+    def add_masked_color(self, mask: bytes, size: Tuple[int, int], color: Tuple[int, int, int]) -> int:
+        """
+        لون واحد يظهر عبر قناع شفافية (نص منقوط بحواف ناعمة فوق قالب)
+        mask: بكسلات رمادية 8-bit مضغوطة بـ zlib - يعيد رقم Image XObject يُرسم كمربع الوحدة
+        الصورة نفسها بكسل واحد باللون، فالقناع بدقته الكاملة هو كل ما يُخزن
+        """
+        soft_mask = EncodedStreamObject()
+        soft_mask._data = mask
+        soft_mask[NameObject("/Type")] = NameObject("/XObject")
+        soft_mask[NameObject("/Subtype")] = NameObject("/Image")
+        soft_mask[NameObject("/Width")] = NumberObject(size[0])
+        soft_mask[NameObject("/Height")] = NumberObject(size[1])
+        soft_mask[NameObject("/BitsPerComponent")] = NumberObject(8)
+        soft_mask[NameObject("/ColorSpace")] = NameObject("/DeviceGray")
+        soft_mask[NameObject("/Filter")] = NameObject("/FlateDecode")
+        mask_number = self._reserve()
+        self._write_object(mask_number, soft_mask)
+
+        image = DecodedStreamObject()
+        image._data = bytes(color)
+        image[NameObject("/Type")] = NameObject("/XObject")
+        image[NameObject("/Subtype")] = NameObject("/Image")
+        image[NameObject("/Width")] = NumberObject(1)
+        image[NameObject("/Height")] = NumberObject(1)
+        image[NameObject("/BitsPerComponent")] = NumberObject(8)
+        image[NameObject("/ColorSpace")] = NameObject("/DeviceRGB")
+        image[NameObject("/SMask")] = IndirectObject(mask_number, 0, None)
+        number = self._reserve()
+        self._write_object(number, image)
+        return number
+
+    def add_sheet(
+        self,
+        width: float,
+        height: float,
+        placements: List[Tuple[int, List[float]]],
+        clips: Optional[List[Tuple[float, float, float, float]]] = None,
+        extra_operations: str = "",
+    ) -> None:
+        """
+        ورقة ناتجة: كل عنصر (رقم Form، مصفوفة التحويل a b c d e f)
+        clips: مستطيل قص لكل عنصر (x, y, w, h) حتى لا يتجاوز التصميم خانته
+        extra_operations: أوامر رسم إضافية فوق المحتوى (علامات القص)
+        """
+        xobjects = DictionaryObject()
+        operations = []
+        for index, (form_number, matrix) in enumerate(placements):
+            name = f"/P{index}"
+            xobjects[NameObject(name)] = IndirectObject(form_number, 0, None)
+            values = " ".join(f"{value:.4f}" for value in matrix)
+            clip = ""
+            if clips and clips[index]:
+                clip = "{:.4f} {:.4f} {:.4f} {:.4f} re W n ".format(*clips[index])
+            operations.append(f"q {clip}{values} cm {name} Do Q")
+        if extra_operations:
+            operations.append(extra_operations)
+
+        self._add_page(width, height, xobjects, "\n".join(operations).encode("ascii"))
+
+    def _add_page(self, width: float, height: float, xobjects: DictionaryObject, operations: bytes) -> None:
+        content = EncodedStreamObject()
+        content._data = zlib.compress(operations)
+        content[NameObject("/Filter")] = NameObject("/FlateDecode")
+        content_number = self._reserve()
+        self._write_object(content_number, content)
+
+        page = DictionaryObject({
+            NameObject("/Type"): NameObject("/Page"),
+            NameObject("/Parent"): IndirectObject(self._pages_root, 0, None),
+            NameObject("/MediaBox"): ArrayObject([NumberObject(0), NumberObject(0), FloatObject(width), FloatObject(height)]),
+            NameObject("/Resources"): DictionaryObject({NameObject("/XObject"): xobjects}),
+            NameObject("/Contents"): IndirectObject(content_number, 0, None),
+        })
+        page_number = self._reserve()
+        self._write_object(page_number, page)
+        self._page_numbers.append(page_number)
+
+    def add_image_page(self, image: Image.Image, dpi: int = 300, jpeg_quality: Optional[int] = None) -> None:
+        """
+        صفحة بحجم الصورة عند الـ DPI المحدد
+        jpeg_quality=None: ضغط Flate بدون فقد (مناسب لخطوط القص والنصوص)
+        """
+        if image.mode not in _COLOR_SPACES:
+            image = image.convert("RGB")
+        if jpeg_quality and image.mode != "CMYK":
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=jpeg_quality, dpi=(dpi, dpi))
+            data, image_filter = buffer.getvalue(), "/DCTDecode"
+        else:
+            data, image_filter = zlib.compress(image.tobytes(), 6), "/FlateDecode"
+        self.add_encoded_image_page(data, image_filter, image.mode, image.size, dpi)
+
+    def add_encoded_image_page(
+        self, data: bytes, image_filter: str, mode: str, size: Tuple[int, int], dpi: int = 300
+    ) -> None:
+        """صفحة من بيانات صورة مضغوطة مسبقاً (مثلاً قالب مخزّن مؤقتاً)"""
+        width_px, height_px = size
+        width, height = width_px * 72.0 / dpi, height_px * 72.0 / dpi
+
+        image_stream = EncodedStreamObject()
+        image_stream._data = data
+        image_stream[NameObject("/Type")] = NameObject("/XObject")
+        image_stream[NameObject("/Subtype")] = NameObject("/Image")
+        image_stream[NameObject("/Width")] = NumberObject(width_px)
+        image_stream[NameObject("/Height")] = NumberObject(height_px)
+        image_stream[NameObject("/BitsPerComponent")] = NumberObject(8)
+        image_stream[NameObject("/ColorSpace")] = NameObject(_COLOR_SPACES[mode])
+        image_stream[NameObject("/Filter")] = NameObject(image_filter)
+        image_number = self._reserve()
+        self._write_object(image_number, image_stream)
+
+        xobjects = DictionaryObject({NameObject("/Im0"): IndirectObject(image_number, 0, None)})
+        self._add_page(width, height, xobjects, b"q %.3f 0 0 %.3f 0 0 cm /Im0 Do Q" % (width, height))
+
+    def finish(self) -> bytes:
+        """كتابة شجرة الصفحات والـ catalog وجدول xref - يعيد ما تبقى من البيانات"""
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(number, 0, None) for number in self._page_numbers),
+            NameObject("/Count"): NumberObject(len(self._page_numbers)),
+        })
+        self._write_object(self._pages_root, pages)
+        self._write_object(self._catalog, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self._pages_root, 0, None),
+        }))
+        info = b""
+        if self.title:
+            info_number = self._reserve()
+            self._write_object(info_number, DictionaryObject({
+                NameObject("/Title"): TextStringObject(self.title),
+                NameObject("/Producer"): TextStringObject("Khawam"),
+            }))
+            info = b" /Info %d 0 R" % info_number
+
+        xref_offset = self._tell()
+        self._buffer.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self._offsets) + 1))
+        for offset in self._offsets:
+            self._buffer.write(b"%010d 00000 n \n" % offset)
+        self._buffer.write(
+            b"trailer\n<< /Size %d /Root %d 0 R%s >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(self._offsets) + 1, self._catalog, info, xref_offset)
+        )
+        return self.drain()
+
+
+def placement_matrix(
+    box: Tuple[float, float, float, float],
+    rotate: int,
+    slot: Tuple[float, float, float, float],
+) -> List[float]:
+    """
+    مصفوفة وضع صفحة (الإطار box مع /Rotate) داخل خانة slot (x, y, w, h):
+    تدوير تلقائي 90° إذا اختلف اتجاه الصفحة عن الخانة، ثم ملاءمة مع التوسيط
+    """
+    x0, y0, width, height = box
+    slot_x, slot_y, slot_width, slot_height = slot
+    rotate %= 360
+    shown_landscape = (width > height) != bool(rotate % 180)
+    if shown_landscape != (slot_width > slot_height) and abs(width - height) > 1:
+        rotate = (rotate + 90) % 360
+
+    # تدوير باتجاه عقارب الساعة مع إبقاء الصفحة في الربع الموجب
+    a, b, c, d, e, f = {
+        0: (1, 0, 0, 1, 0, 0),
+        90: (0, -1, 1, 0, 0, width),
+        180: (-1, 0, 0, -1, width, height),
+        270: (0, 1, -1, 0, height, 0),
+    }[rotate - rotate % 90]
+    e, f = e - a * x0 - c * y0, f - b * x0 - d * y0
+    rotated_width, rotated_height = (height, width) if rotate % 180 else (width, height)
+
+    scale = min(slot_width / rotated_width, slot_height / rotated_height)
+    offset_x = slot_x + (slot_width - rotated_width * scale) / 2
+    offset_y = slot_y + (slot_height - rotated_height * scale) / 2
+    return [a * scale, b * scale, c * scale, d * scale, e * scale + offset_x, f * scale + offset_y]
+
+
+def impose_sequence(page_count: int, imposition: str) -> List[List[Optional[int]]]:
+    """ترتيب الصفحات على الأوراق - None = خانة فارغة"""
+    if imposition == "none":
+        return [[index] for index in range(page_count)]
+    if imposition == "2up":
+        return [
+            [index, index + 1 if index + 1 < page_count else None]
+            for index in range(0, page_count, 2)
+        ]
+    # كتيب (تدبيس من المنتصف): عدد الصفحات يُكمل لمضاعف 4، وكل وجه يحمل صفحتين متقابلتين
+    padded = (page_count + 3) // 4 * 4
+    sides: List[List[Optional[int]]] = []
+    for side in range(padded // 2):
+        outer, inner = padded - 1 - side, side
+        left, right = (outer, inner) if side % 2 == 0 else (inner, outer)
+        sides.append([page if page < page_count else None for page in (left, right)])
+    return sides
+
+
+class ProductionJob:
+    """ملفات المصدر المفتوحة (بدون تحميل محتواها) - تُغلق بعد انتهاء الإرسال"""
+
+    def __init__(self, paths: List[str], paper: str, imposition: str = "none") -> None:
+        if imposition not in IMPOSITIONS:
+            raise ProductionPdfError(f"نوع التركيب غير مدعوم: {imposition}. المتاح: {', '.join(IMPOSITIONS)}")
+        if not paths:
+            raise ProductionPdfError("لا توجد ملفات PDF في هذا الطلب")
+        self.paper = paper.upper()
+        self.imposition = imposition
+        self.sheet_size = paper_size_points(paper)
+        self._files: List[BinaryIO] = []
+        self._readers: List[Any] = []
+        # رقم أول صفحة من كل ملف ضمن الترقيم الكلي (بدل قائمة بكل الصفحات)
+        self._starts: List[int] = []
+        self._page_count = 0
+        try:
+            for path in paths:
+                fp = open(path, "rb")
+                self._files.append(fp)
+                try:
+                    reader = _open_pdf(fp)
+                    page_count = _pdf_page_count(reader)
+                except Exception as e:
+                    raise ProductionPdfError(f"تعذر قراءة ملف PDF ({os.path.basename(path)}): {e}") from e
+                self._readers.append(reader)
+                self._starts.append(self._page_count)
+                self._page_count += page_count
+        except Exception:
+            self.close()
+            raise
+        if not self._page_count:
+            raise ProductionPdfError("ملفات PDF في هذا الطلب لا تحتوي على صفحات")
+        self.sequence = impose_sequence(self._page_count, imposition)
+
+    @property
+    def page_count(self) -> int:
+        return self._page_count
+
+    def _locate(self, page_index: int) -> Tuple[int, int]:
+        """(رقم الملف، رقم الصفحة داخله) لصفحة من الترقيم الكلي"""
+        source = bisect.bisect_right(self._starts, page_index) - 1
+        return source, page_index - self._starts[source]
+
+    @property
+    def sheet_count(self) -> int:
+        return len(self.sequence)
+
+    def close(self) -> None:
+        for fp in self._files:
+            fp.close()
+        self._files = []
+
+    def _slots(self) -> List[Tuple[float, float, float, float]]:
+        width, height = self.sheet_size
+        if self.imposition == "none":
+            return [(0, 0, width, height)]
+        # صفحتان بالعرض على الورقة بوضع أفقي
+        return [(0, 0, height / 2, width), (height / 2, 0, height / 2, width)]
+
+    def iter_pdf(self) -> Iterator[bytes]:
+        """توليد ملف الإنتاج على دفعات - مناسب لـ StreamingResponse"""
+        writer = PdfAssembler()
+        slots = self._slots()
+        sheet_width, sheet_height = self.sheet_size if self.imposition == "none" else self.sheet_size[::-1]
+        try:
+            for sheet in self.sequence:
+                placements = []
+                for slot, page_index in zip(slots, sheet):
+                    if page_index is None:
+                        continue
+                    source, index = self._locate(page_index)
+                    reader = self._readers[source]
+                    page = page_at(reader, index)
+                    form_number, box = writer.add_form(page, source)
+                    rotate = int(page.get("/Rotate", 0) or 0)
+                    placements.append((form_number, placement_matrix(box, rotate, slot)))
+                    if len(reader.resolved_objects) > READER_CACHE_LIMIT:
+                        reader.resolved_objects.clear()
+                writer.add_sheet(sheet_width, sheet_height, placements)
+                chunk = writer.drain(OUTPUT_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+            yield writer.finish()
+        finally:
+            self.close()
@@ -0,0 +1,178 @@
+"""
+ترتيب قطع الفليكس والبانرات والفينيل على رولات بعرض ثابت لتقليل الطول المستهلك والهدر
+
+- خوارزمية Skyline (أسفل-يسار): كل قطعة توضع في أخفض موضع متاح على "خط الأفق" الحالي
+  مع تجربة التدوير 90°، ونجرب عدة ترتيبات للقطع ونأخذ الأقصر - بضع مئات من القطع في أجزاء من الثانية
+- بين القطع مسافة قص (gap) وعلى طرفي الرول هامش غير قابل للطباعة
+- plan_rolls يجرب كل عروض الرولات المتاحة ويختار الأقل هدراً، والقطع الأعرض من كل الرولات تُعاد منفصلة
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# عروض الرولات المتوفرة (سم)
+ROLL_WIDTHS_CM = [
+    float(value) for value in os.getenv("ROLL_WIDTHS_CM", "100,127,152,160,220,320").split(",") if value.strip()
+]
+# مسافة القص بين القطع (سم)
+NESTING_GAP_CM = 1.0
+# الهامش غير المطبوع على حافتي الرول وفي بدايته ونهايته (سم)
+ROLL_MARGIN_CM = 2.0
+
+_EPSILON = 1e-6
+
+# ترتيبات القطع التي نجربها - أطول ضلع، المساحة، الارتفاع
+_SORT_KEYS = (
+    lambda size: (max(size[1], size[2]), min(size[1], size[2])),
+    lambda size: (size[1] * size[2], max(size[1], size[2])),
+    lambda size: (size[2], size[1]),
+)
+
+
+def _skyline_pack(
+    sizes: Sequence[Tuple[int, float, float]],
+    width: float,
+    allow_rotation: bool = True,
+) -> Tuple[float, List[Tuple[int, float, float, float, float, bool]]]:
+    """
+    sizes: (رقم القطعة، العرض، الارتفاع) بعد إضافة مسافة القص
+    يعيد (أعلى نقطة، [(رقم القطعة، x، y، العرض، الارتفاع، مدورة)])
+    """
+    # خط الأفق: مقاطع [x, الارتفاع, العرض] تغطي عرض الرول كاملاً
+    skyline: List[List[float]] = [[0.0, 0.0, width]]
+    placements = []
+    top_edge = 0.0
+    for index, piece_width, piece_height in sizes:
+        best = None
+        orientations = [(piece_width, piece_height, False)]
+        if allow_rotation and abs(piece_width - piece_height) > _EPSILON:
+            orientations.append((piece_height, piece_width, True))
+        for item_width, item_height, rotated in orientations:
+            if item_width > width + _EPSILON:
+                continue
+            for start, segment in enumerate(skyline):
+                x = segment[0]
+                if x + item_width > width + _EPSILON:
+                    break
+                y, remaining, position = 0.0, item_width, start
+                while remaining > _EPSILON and position < len(skyline):
+                    y = max(y, skyline[position][1])
+                    remaining -= skyline[position][2]
+                    position += 1
+                score = (y + item_height, y, x)
+                if best is None or score < best[0]:
+                    best = (score, start, x, y, item_width, item_height, rotated)
+        if best is None:
+            continue
+        _, start, x, y, item_width, item_height, rotated = best
+        placements.append((index, x, y, item_width, item_height, rotated))
+        top_edge = max(top_edge, y + item_height)
+
+        # تحديث خط الأفق: المقطع الجديد يغطي [x, x + العرض)
+        end = x + item_width
+        position = start
+        while position < len(skyline) and skyline[position][0] < end - _EPSILON:
+            segment_end = skyline[position][0] + skyline[position][2]
+            if segment_end <= end + _EPSILON:
+                del skyline[position]
+            else:
+                skyline[position][2] = segment_end - end
+                skyline[position][0] = end
+                break
+        skyline.insert(start, [x, y + item_height, item_width])
+        # دمج المقاطع المتجاورة بنفس الارتفاع
+        merged: List[List[float]] = []
+        for segment in skyline:
+            if merged and abs(merged[-1][1] - segment[1]) < _EPSILON:
+                merged[-1][2] += segment[2]
+            else:
+                merged.append(segment)
+        skyline = merged
+    return top_edge, placements
+
+
+def nest_on_roll(
+    pieces: List[Dict[str, Any]],
+    roll_width_cm: float,
+    gap_cm: float = NESTING_GAP_CM,
+    margin_cm: float = ROLL_MARGIN_CM,
+    allow_rotation: bool = True,
+) -> Dict[str, Any]:
+    """
+    ترتيب القطع [{key, width_cm, height_cm}] على رول واحد
+    الإحداثيات بالسنتيمتر من بداية الرول وحافته اليسرى (داخل الهامش)
+    """
+    usable_width = roll_width_cm - 2 * margin_cm + gap_cm
+    sizes = [(index, piece["width_cm"] + gap_cm, piece["height_cm"] + gap_cm) for index, piece in enumerate(pieces)]
+
+    best: Optional[Tuple[float, List[Tuple[int, float, float, float, float, bool]]]] = None
+    for sort_key in _SORT_KEYS:
+        ordered = sorted(sizes, key=sort_key, reverse=True)
+        top_edge, placements = _skyline_pack(ordered, usable_width, allow_rotation)
+        if best is None or (len(placements), -top_edge) > (len(best[1]), -best[0]):
+            best = (top_edge, placements)
+
+    top_edge, placements = best
+    placed = {index for index, *_ in placements}
+    used_area = sum(pieces[index]["width_cm"] * pieces[index]["height_cm"] for index in placed)
+    length_cm = top_edge - gap_cm + 2 * margin_cm if placements else 0.0
+    roll_area = roll_width_cm * length_cm
+    return {
+        "roll_width_cm": roll_width_cm,
+        "length_cm": round(length_cm, 1),
+        "length_m": round(length_cm / 100, 2),
+        "used_area_m2": round(used_area / 10000, 3),
+        "roll_area_m2": round(roll_area / 10000, 3),
+        "waste_percent": round(100 * (1 - used_area / roll_area), 1) if roll_area else 0.0,
+        "placements": [
+            {
+                "key": pieces[index]["key"],
+                "x_cm": round(margin_cm + x, 1),
+                "y_cm": round(margin_cm + y, 1),
+                "width_cm": round(item_width - gap_cm, 1),
+                "height_cm": round(item_height - gap_cm, 1),
+                "rotated": rotated,
+            }
+            for index, x, y, item_width, item_height, rotated in sorted(placements, key=lambda p: (p[2], p[1]))
+        ],
+        "unplaced": [pieces[index]["key"] for index in range(len(pieces)) if index not in placed],
+    }
+
+
+def plan_rolls(
+    pieces: List[Dict[str, Any]],
+    roll_widths_cm: Optional[List[float]] = None,
+    gap_cm: float = NESTING_GAP_CM,
+    margin_cm: float = ROLL_MARGIN_CM,
+    allow_rotation: bool = True,
+) -> Dict[str, Any]:
+    """
+    أفضل عرض رول لمجموعة قطع (نفس الخامة): الأقل هدراً بين العروض التي تتسع لكل القطع
+    القطع الأعرض من أعرض رول (حتى بعد التدوير) تُعاد في oversized لتُقسم يدوياً
+    """
+    widths = sorted(roll_widths_cm or ROLL_WIDTHS_CM)
+    if not widths:
+        raise ValueError("لا توجد عروض رولات معرّفة")
+    widest = widths[-1] - 2 * margin_cm
+
+    fitting, oversized = [], []
+    for piece in pieces:
+        shortest = min(piece["width_cm"], piece["height_cm"]) if allow_rotation else piece["width_cm"]
+        (fitting if shortest <= widest + _EPSILON else oversized).append(piece)
+
+    options = []
+    if fitting:
+        needed = max(
+            min(piece["width_cm"], piece["height_cm"]) if allow_rotation else piece["width_cm"] for piece in fitting
+        ) + 2 * margin_cm
+        for width in widths:
+            if width + _EPSILON >= needed:
+                options.append(nest_on_roll(fitting, width, gap_cm, margin_cm, allow_rotation))
+    best = min(options, key=lambda option: (option["waste_percent"], option["length_cm"])) if options else None
+    return {
+        "best": best,
+        "alternatives": [
+            {key: option[key] for key in ("roll_width_cm", "length_m", "waste_percent")} for option in options
+        ],
+        "oversized": [piece["key"] for piece in oversized],
+        "pieces": len(pieces),
+    }
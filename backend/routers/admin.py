@@ -4,9 +4,10 @@ from sqlalchemy import inspect
 from database import get_db
 from models import Product, Service, PortfolioWork, Order, OrderItem, ProductCategory, OrderStatusHistory, User
 from routers.auth import get_current_active_user
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, validator
 from utils import handle_error, success_response, validate_price, validate_string
+from print_queue import print_queue
 from datetime import datetime, timedelta, date
 import os
 import uuid
@@ -32,6 +33,9 @@ class OrderRatingUpdate(BaseModel):
 class CustomerNotesUpdate(BaseModel):
     notes: str
 
+class PrintBatchDone(BaseModel):
+    item_ids: Optional[List[int]] = None  # الافتراضي: كل عناصر المجموعة
+
 # --------------------------------------------
 # Helpers for public image URLs
 # --------------------------------------------
@@ -2023,6 +2027,10 @@ async def update_order_status(order_id: int, status_data: OrderStatusUpdate, db:
         
         db.commit()
         db.refresh(order)
+        try:
+            print_queue.refresh_order(db, order_id)
+        except Exception as queue_error:
+            print(f"Warning: Could not refresh print queue: {queue_error}")
         
         # If order is completed, send rating request to customer via WhatsApp
         if status == 'completed':
@@ -2223,6 +2231,7 @@ async def delete_order(order_id: int, db: Session = Depends(get_db)):
         # Delete the order
         db.delete(order)
         db.commit()
+        print_queue.remove_orders([order_id])
         
         return {
             "success": True,
@@ -2273,6 +2282,7 @@ async def delete_orders_by_status(
         deleted_orders_count = db.query(Order).filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
         
         db.commit()
+        print_queue.remove_orders(order_ids)
         
         print(f"✅ Deleted {deleted_orders_count} orders with status '{status}' and {deleted_items_count} order items")
         
@@ -2292,6 +2302,135 @@ async def delete_orders_by_status(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"خطأ في حذف الطلبات: {str(e)}")
 
+def _require_staff(current_user: User, db: Session) -> None:
+    from routers.auth import _get_user_type_name
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية للوصول إلى طابور الطباعة")
+
+@router.get("/print-queue")
+async def get_print_queue(
+    include_items: bool = Query(False),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """طابور الطباعة: مجموعات العناصر المتوافقة (نفس الورق والإعدادات) مرتبة حسب موعد التسليم ثم الأقدم"""
+    _require_staff(current_user, db)
+    print_queue.ensure_loaded(db)
+    return {"success": True, "batches": print_queue.snapshot(include_items, limit), "stats": print_queue.stats()}
+
+@router.get("/print-queue/batches/{batch_id}")
+async def get_print_batch(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    _require_staff(current_user, db)
+    print_queue.ensure_loaded(db)
+    batch = print_queue.batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="المجموعة غير موجودة في الطابور")
+    return {"success": True, "batch": batch}
+
+@router.put("/print-queue/batches/{batch_id}/printed")
+async def mark_print_batch_printed(
+    batch_id: str,
+    payload: PrintBatchDone,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """تعليم عناصر المجموعة (أو بعضها) كمطبوعة - تخرج من الطابور"""
+    _require_staff(current_user, db)
+    print_queue.ensure_loaded(db)
+    batch = print_queue.batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="المجموعة غير موجودة في الطابور")
+    batch_items = {item["item_id"] for item in batch["items"]}
+    item_ids = sorted(batch_items if payload.item_ids is None else batch_items & set(payload.item_ids))
+    if not item_ids:
+        raise HTTPException(status_code=400, detail="لا توجد عناصر من هذه المجموعة للتعليم")
+    try:
+        db.query(OrderItem).filter(OrderItem.id.in_(item_ids)).update({"status": "printed"}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error marking print batch {batch_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في تحديث حالة العناصر: {str(e)}")
+    print_queue.remove_items(item_ids)
+    return {"success": True, "printed_items": item_ids, "remaining": len(batch_items) - len(item_ids)}
+
+# الخدمات المسعّرة بالمساحة والمطبوعة على رولات
+ROLL_SERVICE_KEYWORDS = ("فليكس", "بانر", "فينيل", "ستيكر", "flex", "banner", "vinyl")
+MAX_NESTING_PIECES = 2000
+
+@router.get("/roll-nesting")
+async def get_roll_nesting(
+    roll_width_cm: Optional[float] = Query(None, gt=0, description="عرض رول محدد (الافتراضي: كل العروض المتاحة)"),
+    gap_cm: Optional[float] = Query(None, ge=0),
+    allow_rotation: bool = Query(True),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    ترتيب قطع الفليكس/البانرات المعلقة على الرولات لكل خامة: طول الرول المطلوب ونسبة الهدر
+    يُحسب من جديد في كل طلب (أجزاء من الثانية) فيمكن إعادة التخطيط مع كل طلب جديد
+    """
+    from image_inspect import dimensions_to_cm
+    from print_queue import DONE_ITEM_STATUSES, QUEUE_ORDER_STATUSES
+    from roll_nesting import NESTING_GAP_CM, plan_rolls
+
+    _require_staff(current_user, db)
+    rows = db.query(OrderItem, Order).join(Order, Order.id == OrderItem.order_id).filter(
+        Order.status.in_(QUEUE_ORDER_STATUSES)
+    ).all()
+
+    groups = {}
+    skipped = []
+    piece_count = 0
+    for item, order in rows:
+        if (item.status or "pending") in DONE_ITEM_STATUSES:
+            continue
+        service = item.product_name or ""
+        if not any(keyword in service.lower() for keyword in ROLL_SERVICE_KEYWORDS):
+            continue
+        specs = item.specifications if isinstance(item.specifications, dict) else {}
+        size_cm = dimensions_to_cm(specs.get("dimensions"))
+        if not size_cm:
+            skipped.append({"order_item_id": item.id, "order_number": order.order_number, "reason": "الأبعاد غير محددة"})
+            continue
+        material = specs.get("paper_type") or specs.get("material") or ""
+        pieces = groups.setdefault((service, str(material)), [])
+        for copy in range(max(1, item.quantity or 1)):
+            if piece_count >= MAX_NESTING_PIECES:
+                break
+            pieces.append({
+                "key": {"order_item_id": item.id, "order_number": order.order_number, "copy": copy + 1},
+                "width_cm": size_cm[0],
+                "height_cm": size_cm[1],
+            })
+            piece_count += 1
+
+    plans = []
+    for (service, material), pieces in groups.items():
+        plan = plan_rolls(
+            pieces,
+            [roll_width_cm] if roll_width_cm else None,
+            NESTING_GAP_CM if gap_cm is None else gap_cm,
+            allow_rotation=allow_rotation,
+        )
+        plans.append({"service": service, "material": material or None, **plan})
+
+    return {
+        "success": True,
+        "plans": plans,
+        "total_length_m": round(sum(plan["best"]["length_m"] for plan in plans if plan["best"]), 2),
+        "pieces": piece_count,
+        "truncated": piece_count >= MAX_NESTING_PIECES,
+        "skipped": skipped,
+    }
+
 @router.put("/orders/{order_id}/staff-notes")
 async def update_staff_notes(order_id: int, notes_data: StaffNotesUpdate, db: Session = Depends(get_db)):
     """Update staff notes for an order"""
@@ -3,18 +3,44 @@ Analytics router for tracking visitors and page views
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func, and_, or_, inspect as sql_inspect
 from database import get_db
-from models import VisitorTracking, PageView, User
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
-from routers.auth import get_current_active_user, get_current_user_optional
+from models import User
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Dict, Any
+import json
+from datetime import date
+from routers.auth import get_current_active_user, get_current_user_id_optional
+from user_agents import classify_user_agent
 
 router = APIRouter()
 
-class TrackVisitRequest(BaseModel):
-    session_id: str
+# أطوال أعمدة جداول التحليلات - النص الأطول يُقص (كما في analytics_beacon._text) بدل رفض الحدث
+# أو إسقاط دفعة الكتابة كاملة بخطأ "value too long"
+TEXT_LIMITS = {
+    "session_id": 255,
+    "page_path": 500,
+    "referrer": 2000,
+    "user_agent": 1000,
+    "device_type": 50,
+    "browser": 100,
+    "os": 100,
+    "ip_address": 45,
+    "country": 100,
+    "city": 100,
+}
+ACTIONS_MAX_BYTES = 16 * 1024
+
+class _TrackRequest(BaseModel):
+    @field_validator("*", mode="before")
+    @classmethod
+    def clip_text(cls, value, info):
+        limit = TEXT_LIMITS.get(info.field_name)
+        if limit and isinstance(value, str):
+            return value[:limit]
+        return value
+
+class TrackVisitRequest(_TrackRequest):
+    session_id: str = Field(min_length=1)
     page_path: str
     referrer: Optional[str] = None
     user_agent: Optional[str] = None
@@ -27,311 +53,157 @@ class TrackVisitRequest(BaseModel):
     entry_page: bool = False
     exit_page: bool = False
 
-class TrackPageViewRequest(BaseModel):
-    session_id: str
+class TrackPageViewRequest(_TrackRequest):
+    session_id: str = Field(min_length=1)
     page_path: str
-    time_spent: int = 0
-    scroll_depth: int = 0
+    time_spent: int = Field(0, ge=0, le=86400)
+    scroll_depth: int = Field(0, ge=0, le=100)
     actions: Optional[Dict[str, Any]] = None
 
-def parse_user_agent(user_agent: Optional[str]) -> Dict[str, Optional[str]]:
-    """Parse user agent to extract browser and OS"""
-    if not user_agent:
-        return {"browser": None, "os": None, "device_type": None}
-    
-    user_agent_lower = user_agent.lower()
-    
-    # Detect browser
-    browser = None
-    if "chrome" in user_agent_lower and "edg" not in user_agent_lower:
-        browser = "Chrome"
-    elif "firefox" in user_agent_lower:
-        browser = "Firefox"
-    elif "safari" in user_agent_lower and "chrome" not in user_agent_lower:
-        browser = "Safari"
-    elif "edg" in user_agent_lower:
-        browser = "Edge"
-    elif "opera" in user_agent_lower:
-        browser = "Opera"
-    
-    # Detect OS
-    os_name = None
-    if "windows" in user_agent_lower:
-        os_name = "Windows"
-    elif "mac" in user_agent_lower or "darwin" in user_agent_lower:
-        os_name = "macOS"
-    elif "linux" in user_agent_lower:
-        os_name = "Linux"
-    elif "android" in user_agent_lower:
-        os_name = "Android"
-    elif "ios" in user_agent_lower or "iphone" in user_agent_lower or "ipad" in user_agent_lower:
-        os_name = "iOS"
-    
-    # Detect device type
-    device_type = None
-    if "mobile" in user_agent_lower or "android" in user_agent_lower or "iphone" in user_agent_lower:
-        device_type = "mobile"
-    elif "tablet" in user_agent_lower or "ipad" in user_agent_lower:
-        device_type = "tablet"
-    else:
-        device_type = "desktop"
-    
-    return {"browser": browser, "os": os_name, "device_type": device_type}
+    @field_validator("actions")
+    @classmethod
+    def limit_actions(cls, value):
+        if value is not None and len(json.dumps(value, ensure_ascii=False, default=str)) > ACTIONS_MAX_BYTES:
+            raise ValueError(f"actions أكبر من {ACTIONS_MAX_BYTES} بايت")
+        return value
+
+def _client_ip(request_obj: Request) -> Optional[str]:
+    """IP الزائر - من X-Forwarded-For / X-Real-IP خلف بروكسي Railway"""
+    ip_address = request_obj.client.host if request_obj.client else None
+    if not ip_address or ip_address == "127.0.0.1":
+        forwarded_for = request_obj.headers.get("X-Forwarded-For")
+        if forwarded_for:
+            ip_address = forwarded_for.split(",")[0].strip()
+        else:
+            real_ip = request_obj.headers.get("X-Real-IP")
+            if real_ip:
+                ip_address = real_ip
+    return ip_address
+
+def _visit_event(
+    request: TrackVisitRequest, ip_address: Optional[str], user_id: Optional[int], agent: Dict[str, Any]
+) -> Dict[str, Any]:
+    """حقول صف visitor_tracking لحدث زيارة - تصنيف user agent يتم هنا وليس أثناء الكتابة"""
+    event = request.model_dump()
+    event["ip_address"] = request.ip_address or ip_address
+    event["user_id"] = user_id
+    for key in ("browser", "os", "device_type"):
+        if not event[key]:
+            event[key] = agent[key]
+    return event
+
+def _bot_response() -> Dict[str, Any]:
+    """الزواحف لا تُخزن - تُعد فقط ونرد بنجاح حتى لا تعيد المحاولة"""
+    from analytics_ingest import ingest_queue
+    ingest_queue.bots += 1
+    return {"success": True, "queued": False, "bot": True}
 
-@router.post("/track")
+@router.post("/track", status_code=202)
 async def track_visit(
     request: TrackVisitRequest,
     request_obj: Request,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    user_id: Optional[int] = Depends(get_current_user_id_optional)
 ):
-    """Track a visitor visit"""
+    """Track a visitor visit - يُضاف للطابور ويُكتب مع الدفعة التالية (analytics_ingest)"""
+    from analytics_ingest import VISIT, enqueue
+    if not request.user_agent:
+        request.user_agent = (request_obj.headers.get("User-Agent") or "")[:TEXT_LIMITS["user_agent"]] or None
+    agent = classify_user_agent(request.user_agent)
+    if agent["is_bot"]:
+        return _bot_response()
+    queued = enqueue(VISIT, _visit_event(request, _client_ip(request_obj), user_id, agent))
+    # لا نرفع خطأ عند امتلاء الطابور - Analytics ليس حرجاً والموقع يجب أن يستمر
+    return {"success": True, "queued": queued}
+
+@router.post("/page-view", status_code=202)
+async def track_page_view(request: TrackPageViewRequest, request_obj: Request):
+    """Track a page view - visitor_id يُربط بآخر زيارة للجلسة عند كتابة الدفعة"""
+    from analytics_ingest import PAGE_VIEW, enqueue
+    if classify_user_agent(request_obj.headers.get("User-Agent"))["is_bot"]:
+        return _bot_response()
+    queued = enqueue(PAGE_VIEW, request.model_dump())
+    return {"success": True, "queued": queued}
+
+@router.post("/beacon", status_code=202)
+async def track_beacon(request_obj: Request):
+    """
+    دفعة أحداث مختلطة (زيارات، مشاهدات، أحداث) من navigator.sendBeacon - انظر analytics_beacon للصيغة
+    الجسم يُقرأ خاماً لأن sendBeacon يرسله كـ text/plain
+    """
+    from analytics_beacon import BeaconError, parse_beacon
+    from analytics_ingest import enqueue_many
+    user_agent = (request_obj.headers.get("User-Agent") or "")[:TEXT_LIMITS["user_agent"]] or None
+    agent = classify_user_agent(user_agent)
+    if agent["is_bot"]:
+        return {**_bot_response(), "accepted": 0, "rejected": 0}
+    visit_defaults = {
+        "user_id": None,
+        "user_agent": user_agent,
+        "ip_address": _client_ip(request_obj),
+        "country": None,
+        "city": None,
+        "browser": agent["browser"],
+        "os": agent["os"],
+        "device_type": agent["device_type"],
+    }
     try:
-        # Get IP address from request
-        ip_address = request_obj.client.host if request_obj.client else None
-        if not ip_address or ip_address == "127.0.0.1":
-            # Try to get from headers (for Railway/proxy)
-            forwarded_for = request_obj.headers.get("X-Forwarded-For")
-            if forwarded_for:
-                ip_address = forwarded_for.split(",")[0].strip()
-            else:
-                real_ip = request_obj.headers.get("X-Real-IP")
-                if real_ip:
-                    ip_address = real_ip
-        
-        if not request.ip_address:
-            request.ip_address = ip_address
-        
-        # التحقق من وجود جدول visitor_tracking
-        inspector = sql_inspect(db.bind)
-        # SQLAlchemy returns a list of table names (strings)
-        tables = list(inspector.get_table_names())
-        
-        if 'visitor_tracking' not in tables:
-            # الجدول غير موجود - محاولة إنشائه تلقائياً
-            print("⚠️ visitor_tracking table not found - attempting to create...")
-            try:
-                from sqlalchemy import text
-                db.execute(text("""
-                    CREATE TABLE IF NOT EXISTS visitor_tracking (
-                        id SERIAL PRIMARY KEY,
-                        session_id VARCHAR(255) NOT NULL,
-                        user_id INTEGER REFERENCES users(id),
-                        page_path VARCHAR(500) NOT NULL,
-                        referrer TEXT,
-                        user_agent TEXT,
-                        device_type VARCHAR(50),
-                        browser VARCHAR(100),
-                        os VARCHAR(100),
-                        ip_address VARCHAR(45),
-                        country VARCHAR(100),
-                        city VARCHAR(100),
-                        time_on_page INTEGER DEFAULT 0,
-                        exit_page BOOLEAN DEFAULT FALSE,
-                        entry_page BOOLEAN DEFAULT FALSE,
-                        visit_count INTEGER DEFAULT 1,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """))
-                db.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_visitor_tracking_session_id 
-                    ON visitor_tracking(session_id)
-                """))
-                db.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_visitor_tracking_created_at 
-                    ON visitor_tracking(created_at)
-                """))
-                db.commit()
-                print("✅ visitor_tracking table created successfully")
-            except Exception as create_error:
-                db.rollback()
-                print(f"⚠️ Failed to create visitor_tracking table: {create_error}")
-                return {"success": True, "message": "Tracking table not available", "visitor_id": None}
-        
-        # Parse user agent if not provided
-        if not request.browser or not request.os:
-            parsed = parse_user_agent(request.user_agent)
-            if not request.browser:
-                request.browser = parsed["browser"]
-            if not request.os:
-                request.os = parsed["os"]
-            if not request.device_type:
-                request.device_type = parsed["device_type"]
-        
-        # Check if visitor exists
-        existing_visitor = db.query(VisitorTracking).filter(
-            VisitorTracking.session_id == request.session_id
-        ).order_by(VisitorTracking.created_at.desc()).first()
-        
-        visit_count = 1
-        if existing_visitor:
-            visit_count = existing_visitor.visit_count + 1
-        
-        # Create new visitor tracking entry
-        visitor = VisitorTracking(
-            session_id=request.session_id,
-            user_id=current_user.id if current_user else None,
-            page_path=request.page_path,
-            referrer=request.referrer,
-            user_agent=request.user_agent,
-            device_type=request.device_type,
-            browser=request.browser,
-            os=request.os,
-            ip_address=request.ip_address,
-            country=request.country,
-            city=request.city,
-            entry_page=request.entry_page,
-            exit_page=request.exit_page,
-            visit_count=visit_count
-        )
-        
-        db.add(visitor)
-        db.commit()
-        db.refresh(visitor)
-        
-        return {"success": True, "visitor_id": visitor.id}
-    except Exception as e:
-        db.rollback()
-        # لا نرفع خطأ - نرجع success لتجنب كسر الموقع
-        # Analytics ليس حرجاً - الموقع يجب أن يعمل حتى لو فشل التتبع
-        print(f"⚠️ Error tracking visit (non-critical): {str(e)}")
-        import traceback
-        traceback.print_exc()
-        # إرجاع success حتى لو فشل - Analytics ليس حرجاً
-        return {"success": True, "message": "Tracking failed but site continues", "error": str(e)[:100]}
+        events, rejected = parse_beacon(await request_obj.body(), visit_defaults)
+    except BeaconError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    queued = enqueue_many(events)
+    return {"success": True, "accepted": len(events), "rejected": rejected, "queued": queued}
 
-@router.post("/page-view")
-async def track_page_view(
-    request: TrackPageViewRequest,
-    db: Session = Depends(get_db)
+@router.get("/ingest-stats")
+async def get_ingest_stats(
+    current_user: Optional[User] = Depends(get_current_active_user)
 ):
-    """Track a page view"""
-    try:
-        # التحقق من وجود جدول page_views
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'page_views' not in tables:
-            # الجدول غير موجود - محاولة إنشائه تلقائياً
-            print("⚠️ page_views table not found - attempting to create...")
-            try:
-                from sqlalchemy import text
-                db.execute(text("""
-                    CREATE TABLE IF NOT EXISTS page_views (
-                        id SERIAL PRIMARY KEY,
-                        visitor_id INTEGER REFERENCES visitor_tracking(id),
-                        session_id VARCHAR(255) NOT NULL,
-                        page_path VARCHAR(500) NOT NULL,
-                        time_spent INTEGER DEFAULT 0,
-                        scroll_depth INTEGER DEFAULT 0,
-                        actions JSONB,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """))
-                db.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_page_views_session_id 
-                    ON page_views(session_id)
-                """))
-                db.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_page_views_created_at 
-                    ON page_views(created_at)
-                """))
-                db.commit()
-                print("✅ page_views table created successfully")
-            except Exception as create_error:
-                db.rollback()
-                print(f"⚠️ Failed to create page_views table: {create_error}")
-                return {"success": True, "message": "Page views table not available", "page_view_id": None}
-        
-        # Get visitor_id from session_id
-        visitor = db.query(VisitorTracking).filter(
-            VisitorTracking.session_id == request.session_id
-        ).order_by(VisitorTracking.created_at.desc()).first()
-        
-        visitor_id = visitor.id if visitor else None
-        
-        page_view = PageView(
-            visitor_id=visitor_id,
-            session_id=request.session_id,
-            page_path=request.page_path,
-            time_spent=request.time_spent,
-            scroll_depth=request.scroll_depth,
-            actions=request.actions
-        )
-        
-        db.add(page_view)
-        db.commit()
-        db.refresh(page_view)
-        
-        return {"success": True, "page_view_id": page_view.id}
-    except Exception as e:
-        db.rollback()
-        # لا نرفع خطأ - Analytics ليس حرجاً
-        print(f"⚠️ Error tracking page view (non-critical): {str(e)}")
-        # إرجاع success حتى لو فشل
-        return {"success": True, "message": "Tracking failed but site continues", "error": str(e)[:100]}
+    """حالة طابور التتبع: المقبول، المرفوض عند الامتلاء، المكتوب، والدفعات الفاشلة - مع التجميع والأقسام الشهرية"""
+    from analytics_ingest import ingest_queue
+    from analytics_partitions import partition_status
+    from analytics_rollup import rollup_status
+    from geoip import geoip_status
+    from user_agents import classifier_stats
+    return {
+        **ingest_queue.stats(),
+        "rollup": rollup_status,
+        "partitions": partition_status,
+        "user_agent_cache": classifier_stats(),
+        "geoip": geoip_status,
+    }
+
+_ROLLUPS_MISSING = "Analytics rollups not available yet - they are created by the background rollup task"
 
 @router.get("/stats")
 async def get_analytics_stats(
     period: str = Query("day", description="Period: day, week, month"),
+    exact: bool = Query(False, description="عدّ دقيق من جدول الجلسات بدلاً من HyperLogLog (للتدقيق - أبطأ)"),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
-    """Get analytics statistics"""
+    """Get analytics statistics - من جداول التجميع (analytics_rollup) وليس من الجداول الخام"""
+    from analytics_rollup import page_totals, period_window, rollups_available, unique_visitors
     try:
-        # التحقق من وجود الجداول
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'visitor_tracking' not in tables or 'page_views' not in tables:
-            # الجداول غير موجودة - إرجاع بيانات فارغة
+        if not rollups_available(db):
             return {
                 "period": period,
                 "total_visitors": 0,
                 "total_page_views": 0,
                 "unique_pages": 0,
                 "average_time_on_site": 0,
-                "message": "Analytics tables not available - run migration first"
+                "message": _ROLLUPS_MISSING
             }
         
-        # Calculate date range
-        now = datetime.now()
-        if period == "day":
-            start_date = now - timedelta(days=1)
-        elif period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=1)
-        
-        # Total visitors
-        total_visitors = db.query(func.count(func.distinct(VisitorTracking.session_id))).filter(
-            VisitorTracking.created_at >= start_date
-        ).scalar() or 0
-        
-        # Total page views
-        total_page_views = db.query(func.count(PageView.id)).filter(
-            PageView.created_at >= start_date
-        ).scalar() or 0
-        
-        # Unique pages
-        unique_pages = db.query(func.count(func.distinct(PageView.page_path))).filter(
-            PageView.created_at >= start_date
-        ).scalar() or 0
-        
-        # Average time on site
-        avg_time = db.query(func.avg(PageView.time_spent)).filter(
-            PageView.created_at >= start_date
-        ).scalar() or 0
+        start_date, end_date = period_window(period)
+        pages = page_totals(db, start_date, end_date)
+        total_page_views = sum(page["views"] for page in pages)
+        total_time = sum(page["time_spent"] for page in pages)
         
         return {
             "period": period,
-            "total_visitors": total_visitors,
+            "total_visitors": unique_visitors(db, start_date, end_date, exact),
             "total_page_views": total_page_views,
-            "unique_pages": unique_pages,
-            "average_time_on_site": round(float(avg_time), 2) if avg_time else 0
+            "unique_pages": sum(1 for page in pages if page["views"]),
+            "average_time_on_site": round(total_time / total_page_views, 2) if total_page_views else 0
         }
     except Exception as e:
         print(f"⚠️ Error getting analytics stats: {str(e)}")
@@ -354,49 +226,23 @@ async def get_exit_rates(
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """Get exit rates by page"""
+    from analytics_rollup import page_totals, period_window, rollups_available
     try:
-        # التحقق من وجود الجدول
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'visitor_tracking' not in tables:
-            return {"period": period, "exit_rates": [], "message": "Analytics table not available"}
-        
-        # Calculate date range
-        now = datetime.now()
-        if period == "day":
-            start_date = now - timedelta(days=1)
-        elif period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=1)
-        
-        # Get exit rates by page
-        exit_stats = db.execute(text("""
-            SELECT 
-                page_path,
-                COUNT(*) as total_visits,
-                SUM(CASE WHEN exit_page = true THEN 1 ELSE 0 END) as exits,
-                ROUND(
-                    (SUM(CASE WHEN exit_page = true THEN 1 ELSE 0 END)::float / COUNT(*)::float) * 100, 
-                    2
-                ) as exit_rate
-            FROM visitor_tracking
-            WHERE created_at >= :start_date
-            GROUP BY page_path
-            ORDER BY exit_rate DESC
-        """), {"start_date": start_date}).fetchall()
-        
-        result = []
-        for row in exit_stats:
-            result.append({
-                "page_path": row[0],
-                "total_visits": row[1],
-                "exits": row[2],
-                "exit_rate": float(row[3]) if row[3] else 0
-            })
+        if not rollups_available(db):
+            return {"period": period, "exit_rates": [], "message": _ROLLUPS_MISSING}
+        
+        start_date, end_date = period_window(period)
+        result = [
+            {
+                "page_path": page["page_path"],
+                "total_visits": page["visits"],
+                "exits": page["exits"],
+                "exit_rate": round(page["exits"] / page["visits"] * 100, 2)
+            }
+            for page in page_totals(db, start_date, end_date)
+            if page["visits"]
+        ]
+        result.sort(key=lambda row: row["exit_rate"], reverse=True)
         
         return {"period": period, "exit_rates": result}
     except Exception as e:
@@ -409,50 +255,30 @@ async def get_exit_rates(
 @router.get("/pages")
 async def get_page_stats(
     period: str = Query("day", description="Period: day, week, month"),
+    exact: bool = Query(False, description="عدّ دقيق من جدول الجلسات بدلاً من HyperLogLog (للتدقيق - أبطأ)"),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """Get statistics for each page"""
+    from analytics_rollup import page_reach, page_totals, period_window, rollups_available
     try:
-        # التحقق من وجود الجدول
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'page_views' not in tables:
-            return {"period": period, "pages": [], "message": "Analytics table not available"}
-        
-        # Calculate date range
-        now = datetime.now()
-        if period == "day":
-            start_date = now - timedelta(days=1)
-        elif period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=1)
-        
-        # Get page statistics
-        page_stats = db.execute(text("""
-            SELECT 
-                page_path,
-                COUNT(*) as views,
-                AVG(time_spent) as avg_time_spent,
-                AVG(scroll_depth) as avg_scroll_depth
-            FROM page_views
-            WHERE created_at >= :start_date
-            GROUP BY page_path
-            ORDER BY views DESC
-        """), {"start_date": start_date}).fetchall()
-        
-        result = []
-        for row in page_stats:
-            result.append({
-                "page_path": row[0],
-                "views": row[1],
-                "avg_time_spent": round(float(row[2]), 2) if row[2] else 0,
-                "avg_scroll_depth": round(float(row[3]), 2) if row[3] else 0
-            })
+        if not rollups_available(db):
+            return {"period": period, "pages": [], "message": _ROLLUPS_MISSING}
+        
+        start_date, end_date = period_window(period)
+        reach = page_reach(db, start_date, end_date, exact=exact)
+        result = [
+            {
+                "page_path": page["page_path"],
+                "views": page["views"],
+                "unique_visitors": reach.get(page["page_path"], {}).get("viewed", 0),
+                "avg_time_spent": round(page["time_spent"] / page["views"], 2),
+                "avg_scroll_depth": round(page["scroll_depth"] / page["views"], 2)
+            }
+            for page in page_totals(db, start_date, end_date)
+            if page["views"]
+        ]
+        result.sort(key=lambda row: row["views"], reverse=True)
         
         return {"period": period, "pages": result}
     except Exception as e:
@@ -465,48 +291,26 @@ async def get_page_stats(
 @router.get("/visitors")
 async def get_visitor_count(
     period: str = Query("day", description="Period: day, week, month"),
+    exact: bool = Query(False, description="عدّ دقيق من جدول الجلسات بدلاً من HyperLogLog (للتدقيق - أبطأ)"),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """Get visitor count"""
+    from analytics_rollup import page_totals, period_window, rollups_available, unique_visitors
     try:
-        # التحقق من وجود الجدول
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'visitor_tracking' not in tables:
+        if not rollups_available(db):
             return {
                 "period": period,
                 "unique_visitors": 0,
                 "total_visits": 0,
-                "message": "Analytics table not available"
+                "message": _ROLLUPS_MISSING
             }
         
-        # Calculate date range
-        now = datetime.now()
-        if period == "day":
-            start_date = now - timedelta(days=1)
-        elif period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=1)
-        
-        # Get unique visitors
-        unique_visitors = db.query(func.count(func.distinct(VisitorTracking.session_id))).filter(
-            VisitorTracking.created_at >= start_date
-        ).scalar() or 0
-        
-        # Get total visits
-        total_visits = db.query(func.count(VisitorTracking.id)).filter(
-            VisitorTracking.created_at >= start_date
-        ).scalar() or 0
-        
+        start_date, end_date = period_window(period)
         return {
             "period": period,
-            "unique_visitors": unique_visitors,
-            "total_visits": total_visits
+            "unique_visitors": unique_visitors(db, start_date, end_date, exact),
+            "total_visits": sum(page["visits"] for page in page_totals(db, start_date, end_date))
         }
     except Exception as e:
         print(f"⚠️ Error getting visitor count: {str(e)}")
@@ -523,63 +327,32 @@ async def get_visitor_count(
 @router.get("/funnels")
 async def get_funnel_analysis(
     period: str = Query("day", description="Period: day, week, month"),
-    db: Session = Depends(get_db),
+    funnel: str = Query("main", description="اسم قمع معرف (انظر /funnels/definitions)"),
+    steps: Optional[str] = Query(None, description="خطوات مباشرة مفصولة بفواصل، مثل: /,/services,/orders - بدل funnel"),
+    exact: bool = Query(False, description="مسح جديد حتى اللحظة بدلاً من النتيجة المحفوظة (للتدقيق - أبطأ)"),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
-    """Get funnel analysis - user journey through the site"""
+    """Get funnel analysis - تحويل مرتب بين الخطوات داخل كل جلسة (analytics_funnels) بمسح واحد"""
+    from analytics_funnels import FunnelError, compute_funnel, configured_funnels, parse_steps
+    from analytics_rollup import PERIODS
     try:
-        # التحقق من وجود الجداول
-        inspector = sql_inspect(db.bind)
-        tables = list(inspector.get_table_names())
-        
-        if 'visitor_tracking' not in tables or 'page_views' not in tables:
-            return {
-                "period": period,
-                "funnel": [],
-                "message": "Analytics tables not available"
-            }
-        
-        # Calculate date range
-        now = datetime.now()
-        if period == "day":
-            start_date = now - timedelta(days=1)
-        elif period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
+        if steps:
+            funnel_steps = parse_steps(steps.split(","))
+            funnel = "custom"
         else:
-            start_date = now - timedelta(days=1)
-        
-        # Get common page paths
-        common_paths = ["/", "/services", "/portfolio", "/contact", "/orders"]
-        
-        # Get visitor flow
-        funnel_data = []
-        for i, path in enumerate(common_paths):
-            if i == 0:
-                # Entry point
-                count = db.query(func.count(func.distinct(VisitorTracking.session_id))).filter(
-                    and_(
-                        VisitorTracking.page_path == path,
-                        VisitorTracking.entry_page == True,
-                        VisitorTracking.created_at >= start_date
-                    )
-                ).scalar() or 0
-            else:
-                # Subsequent pages
-                count = db.query(func.count(func.distinct(PageView.session_id))).filter(
-                    and_(
-                        PageView.page_path == path,
-                        PageView.created_at >= start_date
-                    )
-                ).scalar() or 0
-            
-            funnel_data.append({
-                "page": path,
-                "visitors": count
-            })
-        
-        return {"period": period, "funnel": funnel_data}
+            funnels = configured_funnels()
+            if funnel not in funnels:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"القمع غير موجود: {funnel}. المتاح: {', '.join(funnels)}"
+                )
+            funnel_steps = parse_steps(funnels[funnel])
+    except FunnelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result = await compute_funnel(funnel_steps, PERIODS.get(period, PERIODS["day"]), exact=exact)
+        return {"period": period, "name": funnel, "steps": funnel_steps, **result}
     except Exception as e:
         print(f"⚠️ Error getting funnel analysis: {str(e)}")
         import traceback
@@ -587,3 +360,58 @@ async def get_funnel_analysis(
         # إرجاع بيانات فارغة بدلاً من رفع خطأ
         return {"period": period, "funnel": [], "error": str(e)[:100]}
 
+@router.get("/funnels/definitions")
+async def get_funnel_definitions(
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """الأقماع المعرفة (DEFAULT_FUNNELS + ANALYTICS_FUNNELS)"""
+    from analytics_funnels import configured_funnels
+    return {"funnels": configured_funnels()}
+
+@router.get("/archive")
+async def get_archive_summary(
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """الأقسام المؤرشفة وملفات الأيام لكل جدول (analytics_archive)"""
+    from analytics_archive import archive_status, load_manifest
+    manifest = load_manifest()
+    tables: Dict[str, Dict[str, Any]] = {}
+    for entry in manifest["files"].values():
+        summary = tables.setdefault(entry["table"], {"files": 0, "rows": 0, "bytes": 0, "first_day": None, "last_day": None})
+        summary["files"] += 1
+        summary["rows"] += entry["rows"]
+        summary["bytes"] += entry.get("bytes", 0)
+        summary["first_day"] = min(summary["first_day"] or entry["day"], entry["day"])
+        summary["last_day"] = max(summary["last_day"] or entry["day"], entry["day"])
+    return {**archive_status, "tables": tables, "partitions": manifest["partitions"]}
+
+@router.get("/archive/query")
+async def query_archived_events(
+    table: str = Query("page_views", description="page_views أو visitor_tracking"),
+    start: date = Query(..., description="أول يوم (YYYY-MM-DD)"),
+    end: date = Query(..., description="آخر يوم (شامل)"),
+    columns: Optional[str] = Query(None, description="أعمدة مفصولة بفواصل - الافتراضي كل الأعمدة"),
+    page_path: Optional[str] = None,
+    session_id: Optional[str] = None,
+    country: Optional[str] = Query(None, description="visitor_tracking فقط"),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """قراءة الأحداث المؤرشفة من ملفات الأيام (للاستعلامات التاريخية) - يُفك كل يوم الأعمدة المطلوبة فقط"""
+    from analytics_archive import ArchiveError, query_archive
+    from workers import run_in_analysis_pool
+    if end < start:
+        raise HTTPException(status_code=400, detail="end يجب أن يكون بعد start")
+    filters = {
+        name: value
+        for name, value in (("page_path", page_path), ("session_id", session_id), ("country", country))
+        if value is not None
+    }
+    try:
+        return await run_in_analysis_pool(
+            query_archive, table, start, end,
+            [column.strip() for column in columns.split(",") if column.strip()] if columns else None,
+            filters, limit,
+        )
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -539,6 +539,25 @@ async def get_current_user_optional(
     except Exception:
         return None
 
+async def get_current_user_id_optional(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer_optional)
+) -> Optional[int]:
+    """
+    معرف المستخدم من الـ token فقط بدون أي استعلام - لمسارات التتبع عالية التكرار
+    لا يتحقق من أن المستخدم ما زال نشطاً (Token مخصص غير موجود في cache يُعامل كزائر)
+    """
+    token = credentials.credentials if credentials else None
+    if not token:
+        return None
+    cached_user = _CUSTOM_TOKEN_USER_CACHE.get(token)
+    if cached_user:
+        return cached_user["user_id"]
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
 def require_role(allowed_roles: list[str]):
     """Decorator للتحقق من الصلاحيات"""
     async def role_checker(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
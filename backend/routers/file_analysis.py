@@ -1,85 +1,101 @@
 """
 Router لتحليل الملفات (PDF, Word) لعد الصفحات
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import Any, Dict, List, Optional
+import asyncio
 import os
-import tempfile
+from image_inspect import inspect_image_header, dimensions_to_cm, check_print_resolution
+from document_analysis import DOCUMENT_EXTENSIONS, DocumentAnalysisError
+from analysis_cache import analyze_document_cached
+from workers import run_in_analysis_pool
 
 router = APIRouter()
 
-async def count_pdf_pages(file_path: str) -> int:
-    """عد صفحات ملف PDF"""
-    try:
-        import PyPDF2
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            return len(pdf_reader.pages)
-    except Exception as e:
-        print(f"Error counting PDF pages: {e}")
-        raise HTTPException(status_code=400, detail=f"خطأ في قراءة ملف PDF: {str(e)}")
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff']
+
+# المهلة القصوى لتحليل ملف واحد (ثانية)
+ANALYSIS_FILE_TIMEOUT = float(os.getenv("ANALYSIS_FILE_TIMEOUT", "20"))
+
+
+async def _analyze_upload(file: UploadFile, print_size_cm) -> Dict[str, Any]:
+    """تحليل ملف مرفوع واحد - المستندات تُحلل على مجمع العمال مباشرة من ملف الرفع"""
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+
+    if suffix in IMAGE_EXTENSIONS:
+        # الصور: قراءة الترويسة مباشرة من الملف المرفوع بدون نسخه أو فكه
+        image_info = inspect_image_header(file.file)
+        if not image_info:
+            raise HTTPException(status_code=400, detail=f"تعذر قراءة أبعاد الصورة: {file.filename}")
+        entry = {
+            "filename": file.filename,
+            "pages": 1,
+            "file_type": suffix,
+            "image": image_info
+        }
+        if print_size_cm:
+            entry["resolution"] = check_print_resolution(image_info, *print_size_cm)
+        return entry
+
+    if suffix not in DOCUMENT_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"نوع الملف غير مدعوم: {suffix}. الملفات المدعومة: PDF, DOC, DOCX, JPG, PNG, TIFF"
+        )
 
-async def count_word_pages(file_path: str) -> int:
-    """عد صفحات ملف Word"""
     try:
-        from docx import Document
-        doc = Document(file_path)
-        # تقدير عدد الصفحات بناءً على عدد الفقرات والأسطر
-        # كل ~50 سطر = صفحة واحدة تقريباً
-        total_lines = sum(len(para.text.split('\n')) for para in doc.paragraphs)
-        pages = max(1, int(total_lines / 50))
-        return pages
-    except Exception as e:
-        print(f"Error counting Word pages: {e}")
-        raise HTTPException(status_code=400, detail=f"خطأ في قراءة ملف Word: {str(e)}")
+        # إعادة رفع نفس الملف = حساب SHA-256 فقط بدون إعادة التحليل
+        result = await run_in_analysis_pool(analyze_document_cached, file.file, suffix, timeout=ANALYSIS_FILE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail=f"استغرق تحليل الملف وقتاً طويلاً: {file.filename}")
+    except DocumentAnalysisError as e:
+        print(f"Error analyzing {file.filename}: {e}")
+        raise HTTPException(status_code=400, detail=f"{str(e)} ({file.filename})")
+    return {"filename": file.filename, **result}
+
 
 @router.post("/analyze-files")
-async def analyze_files(files: List[UploadFile] = File(...)):
+async def analyze_files(
+    files: List[UploadFile] = File(...),
+    width: Optional[float] = Form(None),
+    height: Optional[float] = Form(None),
+    unit: str = Form("cm")
+):
     """
-    تحليل الملفات (PDF/Word) لعد الصفحات
+    تحليل الملفات (PDF/Word) لعد الصفحات - كل الملفات تُحلل بالتوازي مع مهلة لكل ملف
+    صفحات PDF تُصنف ملونة أو أبيض وأسود (total_color_pages / total_bw_pages) لتسعير المحاضرات
+    الصور (JPG/PNG/TIFF) تُفحص من الترويسة فقط، وإذا أُرسل القياس (width/height/unit)
+    نحسب الدقة الفعلية عند الطباعة ونعيد تحذيراً إذا كانت منخفضة
     """
     try:
-        total_pages = 0
-        file_analysis = []
-        
-        for file in files:
-            # حفظ الملف مؤقتاً
-            suffix = os.path.splitext(file.filename)[1].lower()
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                content = await file.read()
-                tmp_file.write(content)
-                tmp_path = tmp_file.name
-            
-            try:
-                pages = 0
-                if suffix == '.pdf':
-                    pages = await count_pdf_pages(tmp_path)
-                elif suffix in ['.doc', '.docx']:
-                    pages = await count_word_pages(tmp_path)
-                else:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"نوع الملف غير مدعوم: {suffix}. الملفات المدعومة: PDF, DOC, DOCX"
-                    )
-                
-                total_pages += pages
-                file_analysis.append({
-                    "filename": file.filename,
-                    "pages": pages,
-                    "file_type": suffix
-                })
-            finally:
-                # حذف الملف المؤقت
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
+        print_size_cm = dimensions_to_cm({"width": width, "height": height, "widthUnit": unit, "heightUnit": unit})
+
+        # كل الملفات تُحلل بالتوازي - زمن الطلب ≈ زمن أبطأ ملف وليس مجموع الأزمنة
+        outcomes = await asyncio.gather(
+            *(_analyze_upload(file, print_size_cm) for file in files),
+            return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+        file_analysis = list(outcomes)
+        total_pages = sum(entry["pages"] for entry in file_analysis)
+        # صفحات PDF المصنفة ملونة/أبيض وأسود (Word والصور غير مصنفة)
+        classified = [entry["color"] for entry in file_analysis if entry.get("color")]
+        warnings = [
+            f"{entry['filename']}: {entry['resolution']['warning']}"
+            for entry in file_analysis
+            if entry.get("resolution", {}).get("warning")
+        ]
         
         return {
             "success": True,
             "total_pages": total_pages,
-            "files": file_analysis
+            "total_color_pages": sum(color["color"] for color in classified),
+            "total_bw_pages": sum(color["bw"] for color in classified),
+            "files": file_analysis,
+            "warnings": warnings
         }
     
     except HTTPException:
@@ -16,6 +16,8 @@ import base64
 import mimetypes
 import re
 from notifications import order_notifications
+from print_queue import print_queue
+from utils import resolve_upload_path
 import asyncio
 from routers.auth import get_current_active_user, get_current_user_optional
 from io import BytesIO
@@ -705,6 +707,49 @@ def _persist_design_files(
     print(f"✅ _persist_design_files completed: {len(persisted_entries)} entries persisted")
     return persisted_entries
 
+
+def _check_design_files_resolution(design_files: List[Any], dimensions: Any) -> List[Dict[str, Any]]:
+    """
+    فحص دقة صور التصميم عند القياس المطلوب (فليكس، بانرات، بوسترات)
+    يقرأ ترويسة الصورة فقط من الملف المحفوظ أو من بداية data URL بدون فك البكسلات
+    """
+    from image_inspect import inspect_data_url, inspect_image_header, dimensions_to_cm, check_print_resolution
+
+    print_size_cm = dimensions_to_cm(dimensions)
+    if not print_size_cm:
+        return []
+
+    results: List[Dict[str, Any]] = []
+    for entry in design_files:
+        try:
+            if isinstance(entry, dict):
+                filename = entry.get("filename") or entry.get("name")
+                source = entry.get("raw_path") or entry.get("url") or entry.get("data_url")
+            else:
+                filename, source = None, entry
+            if not source or not isinstance(source, str):
+                continue
+
+            image_info = None
+            local_path = resolve_upload_path(source)
+            if local_path:
+                if os.path.isfile(local_path):
+                    image_info = inspect_image_header(local_path)
+            elif source.startswith("data:image"):
+                # تُفك المقاطع التي يقرأها الفحص فقط حتى SOF - لا حاجة لفك كامل الـ data URL
+                image_info = inspect_data_url(source)
+            if not image_info:
+                continue
+
+            resolution = check_print_resolution(image_info, *print_size_cm)
+            resolution["filename"] = filename or os.path.basename(source.split("?")[0])[:100]
+            results.append(resolution)
+            if resolution["warning"]:
+                print(f"⚠️ {resolution['filename']}: {resolution['warning']}")
+        except Exception as check_error:
+            print(f"⚠️ Failed to check design file resolution: {check_error}")
+    return results
+
 @router.post("/")
 async def create_order(
     order_data: OrderCreate,
@@ -866,6 +911,8 @@ async def create_order(
         
         # متغير لحفظ أول صورة للطلب (لإظهارها في الإشعار)
         first_order_image_url = None
+        # (order_item_id, الملفات المحفوظة) - مستنداتها تُحلل في الخلفية بعد commit الطلب
+        documents_to_analyze: List[Tuple[int, List[Any]]] = []
         
         # Create order items using raw SQL (بدون commit بعد)
         for item_index, item_data in enumerate(order_data.items):
@@ -942,6 +989,11 @@ async def create_order(
             )
             print(f"📎 Order {order_number}, Item {item_index}: Persisted {len(persisted_design_files)} design_files")
             
+            # فحص دقة الصور بالقياس المطلوب (من الترويسة فقط) - يظهر للموظفين كتحذير في مواصفات العنصر
+            resolution_checks = _check_design_files_resolution(persisted_design_files, specs.get("dimensions"))
+            if resolution_checks:
+                specs["print_resolution"] = resolution_checks
+            
             # إذا لم نجد صورة من data URL، نحاول الحصول على رابط من persisted files
             if item_index == 0 and not first_order_image_url and persisted_design_files:
                 try:
@@ -994,13 +1046,14 @@ async def create_order(
             
             # Insert order item using raw SQL with proper JSONB casting
             # Use CAST instead of ::jsonb in VALUES to avoid SQL syntax error
-            db.execute(text("""
+            item_id = db.execute(text("""
                 INSERT INTO order_items 
                 (order_id, product_id, product_name, quantity, unit_price, total_price, 
                  specifications, design_files, status)
                 VALUES 
                 (:order_id, :product_id, :product_name, :quantity, :unit_price, :total_price,
                  CAST(:specifications AS jsonb), CAST(:design_files AS jsonb), :status)
+                RETURNING id
             """), {
                 "order_id": order_id,
                 "product_id": item_data.product_id,
@@ -1011,7 +1064,9 @@ async def create_order(
                 "specifications": specs_json,
                 "design_files": design_files_json,
                 "status": "pending"
-            })
+            }).scalar()
+            if persisted_design_files:
+                documents_to_analyze.append((item_id, persisted_design_files))
         
             print(f"✅ Order item {item_index + 1} inserted for order {order_number} (not committed yet)")
         
@@ -1041,6 +1096,11 @@ async def create_order(
             raise HTTPException(status_code=500, detail=f"فشل التحقق: الطلب موجود لكن بدون items")
         
         print(f"✅ Order verification passed: order {order_number} (ID: {order_id}) exists with {items_count} items")
+
+        try:
+            print_queue.refresh_order(db, order_id)
+        except Exception as queue_error:
+            print(f"⚠️ Failed to add order {order_id} to print queue: {queue_error}")
         
         # Create a simple order object for response
         order_dict_response = {
@@ -1073,6 +1133,11 @@ async def create_order(
         # Add background task for external notifications (email/SMS)
         background_tasks.add_task(send_order_notification, notification_payload)
 
+        # عدد صفحات ملفات PDF/Word من الخادم (من cache التحليل غالباً) - للتحقق من عدد الصفحات المسعّر
+        # يُحلل بعد الرد: إنشاء الطلب لا ينتظر التحليل ولا تبقى transaction مفتوحة أثناءه
+        if documents_to_analyze:
+            background_tasks.add_task(_store_design_document_analysis, order_number, documents_to_analyze)
+
         # بث الإشعار الفوري للموظفين عبر WebSocket
         try:
             await order_notifications.broadcast({
@@ -1805,6 +1870,459 @@ async def get_orders(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الطلبات: {str(e)}")
 
+# أقصى انتظار لتحليل مستندات عنصر واحد بعد إنشاء الطلب - بعدها يبقى العنصر دون تحليل
+ORDER_ANALYSIS_TIMEOUT = float(os.getenv("ORDER_ANALYSIS_TIMEOUT", "20"))
+
+def _analyze_design_documents(design_files: List[Any]) -> List[Dict[str, Any]]:
+    """
+    عدد صفحات وقياسات ملفات PDF/Word المحفوظة مع الطلب (محاضرات، بروشورات)
+    النتيجة تأتي من cache التحليل إذا سبق وحلل العميل نفس الملف في المعالج
+    دالة متزامنة - تُشغَّل على مجمع عمال التحليل
+    """
+    from analysis_cache import analyze_local_file_cached
+    from document_analysis import DOCUMENT_EXTENSIONS
+
+    results: List[Dict[str, Any]] = []
+    for entry in design_files:
+        source = entry.get("raw_path") or entry.get("url") if isinstance(entry, dict) else entry
+        local_path = resolve_upload_path(source)
+        if not local_path:
+            continue
+        if os.path.splitext(local_path)[1].lower() not in DOCUMENT_EXTENSIONS or not os.path.isfile(local_path):
+            continue
+        try:
+            analysis = analyze_local_file_cached(local_path)
+            results.append({"filename": os.path.basename(local_path), **analysis})
+        except Exception as analysis_error:
+            print(f"⚠️ Failed to analyze design document {local_path}: {analysis_error}")
+    return results
+
+
+async def _store_design_document_analysis(order_number: str, items: List[Tuple[int, List[Any]]]) -> None:
+    """
+    مهمة خلفية بعد إنشاء الطلب: تحليل مستندات كل عنصر وإضافة النتيجة لمواصفاته (document_analysis)
+    كل عنصر يُحدَّث في transaction قصيرة خاصة به، وفشل التحليل لا يمس الطلب المحفوظ
+    """
+    from database import SessionLocal
+    from workers import run_in_analysis_pool
+
+    for item_id, design_files in items:
+        try:
+            document_checks = await run_in_analysis_pool(
+                _analyze_design_documents, design_files, timeout=ORDER_ANALYSIS_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"⚠️ Document analysis timed out after {ORDER_ANALYSIS_TIMEOUT}s - order {order_number} item {item_id} kept without it")
+            continue
+        except Exception as analysis_error:
+            print(f"⚠️ Failed to analyze design documents for order {order_number} item {item_id}: {analysis_error}")
+            continue
+        if not document_checks:
+            continue
+
+        db = SessionLocal()
+        try:
+            # jsonb_set يضيف المفتاح فقط - لا يكتب فوق تعديلات الموظفين على باقي المواصفات
+            db.execute(text("""
+                UPDATE order_items
+                SET specifications = jsonb_set(
+                    COALESCE(CAST(specifications AS jsonb), CAST('{}' AS jsonb)),
+                    '{document_analysis}',
+                    CAST(:document_analysis AS jsonb)
+                )
+                WHERE id = :item_id
+            """), {"item_id": item_id, "document_analysis": json.dumps(document_checks)})
+            db.commit()
+            print(f"✅ Document analysis stored for order {order_number} item {item_id}")
+        except Exception as store_error:
+            db.rollback()
+            print(f"⚠️ Failed to store document analysis for order {order_number} item {item_id}: {store_error}")
+        finally:
+            db.close()
+
+
+# صيغ الصور التي يمكن تحويلها إلى CMYK للمطبعة
+CMYK_CONVERTIBLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+def _convert_design_files_to_cmyk(
+    design_files: List[Any],
+    profile: Optional[str] = None,
+    dpi: int = 300,
+    force: bool = False
+) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """
+    تحويل صور التصميم المحفوظة محلياً إلى TIFF بصيغة CMYK في مجلد print-cmyk بجانب الملف
+    يعيد (قائمة الملفات بعد إضافة print_cmyk لكل مرفق، نتائج التحويل)
+    دالة متزامنة - تُشغَّل على مجمع عمال الصور
+    """
+    from color_management import convert_file_to_cmyk
+
+    updated: List[Any] = []
+    results: List[Dict[str, Any]] = []
+    for entry in design_files:
+        source = entry.get("raw_path") or entry.get("url") if isinstance(entry, dict) else entry
+        local_path = resolve_upload_path(source)
+        if not local_path:
+            updated.append(entry)
+            continue
+
+        name, extension = os.path.splitext(os.path.basename(local_path))
+        if extension.lower() not in CMYK_CONVERTIBLE_EXTENSIONS or not os.path.isfile(local_path):
+            updated.append(entry)
+            continue
+
+        existing = entry.get("print_cmyk") if isinstance(entry, dict) else None
+        if existing and not force and (not profile or existing.get("profile_used") == profile):
+            results.append({"filename": os.path.basename(local_path), "skipped": True, **existing})
+            updated.append(entry)
+            continue
+
+        output_dir = os.path.join(os.path.dirname(local_path), "print-cmyk")
+        os.makedirs(output_dir, exist_ok=True)
+        output_name = _secure_filename(f"{name}-cmyk.tif")
+        output_path = os.path.join(output_dir, output_name)
+        try:
+            with open(output_path, "wb") as output:
+                info = convert_file_to_cmyk(local_path, output, dpi=dpi, profile=profile)
+        except Exception as convert_error:
+            print(f"⚠️ Failed to convert {local_path} to CMYK: {convert_error}")
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            results.append({"filename": os.path.basename(local_path), "error": str(convert_error)})
+            updated.append(entry)
+            continue
+
+        web_dir = "/" + os.path.dirname(local_path).replace(os.sep, "/")
+        print_entry = {
+            "url": f"{web_dir}/print-cmyk/{output_name}",
+            "filename": output_name,
+            "size_in_bytes": os.path.getsize(output_path),
+            "prepared_at": datetime.now().isoformat(),
+            **info,
+        }
+        print(f"🎨 CMYK print file ready: {print_entry['url']} ({info['profile_used']})")
+        results.append({"filename": os.path.basename(local_path), **print_entry})
+        if isinstance(entry, dict):
+            entry = {**entry, "print_cmyk": print_entry}
+        updated.append(entry)
+    return updated, results
+
+
+@router.post("/{order_id}/attachments/prepare-cmyk")
+async def prepare_order_attachments_cmyk(
+    order_id: int,
+    profile: Optional[str] = Query(None, description="اسم ملف ICC (الافتراضي CMYK_PROFILE)"),
+    dpi: int = Query(300, ge=72, le=2400),
+    force: bool = Query(False, description="إعادة التحويل حتى لو كان الملف جاهزاً"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    تجهيز مرفقات الطلب للمطبعة: تحويل صور التصميم إلى CMYK مع ملف ICC
+    الملفات الناتجة تُحفظ بجانب الأصل وتُسجل في design_files تحت print_cmyk
+    """
+    from routers.auth import _get_user_type_name
+    from workers import run_in_imaging_pool
+    from color_management import ColorProfileError, resolve_cmyk_profile
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية لتجهيز ملفات الطباعة")
+
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="الطلب غير موجود")
+
+    try:
+        profile_name = resolve_cmyk_profile(profile)
+    except ColorProfileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+    prepared: List[Dict[str, Any]] = []
+    try:
+        for item in items:
+            design_files = _safe_design_file_list(item.design_files)
+            if not design_files:
+                continue
+            updated, results = await run_in_imaging_pool(
+                _convert_design_files_to_cmyk, design_files, profile_name, dpi, force
+            )
+            if any("url" in result and not result.get("skipped") for result in results):
+                item.design_files = updated
+            for result in results:
+                result["order_item_id"] = item.id
+            prepared.extend(results)
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error preparing CMYK files for order {order_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"خطأ في تجهيز ملفات الطباعة: {str(e)}")
+
+    return {
+        "success": True,
+        "order_id": order_id,
+        "profile_used": profile_name,
+        "files": prepared,
+        "count": len([result for result in prepared if "url" in result]),
+    }
+
+
+def _local_design_paths(items: List[OrderItem], extensions: Any = (".pdf",)) -> List[str]:
+    """مسارات ملفات التصميم المحفوظة محلياً لعناصر الطلب بالترتيب (حسب الامتداد)"""
+    paths: List[str] = []
+    for item in items:
+        for entry in _safe_design_file_list(item.design_files):
+            source = entry.get("raw_path") or entry.get("url") if isinstance(entry, dict) else entry
+            local_path = resolve_upload_path(source)
+            if local_path and os.path.splitext(local_path)[1].lower() in extensions and os.path.isfile(local_path):
+                paths.append(local_path)
+    return paths
+
+
+@router.get("/{order_id}/production-pdf")
+async def download_production_pdf(
+    order_id: int,
+    paper: Optional[str] = Query(None, description="قياس الورق (الافتراضي paper_size من مواصفات الطلب أو A4)"),
+    imposition: str = Query("none", description="none | 2up | booklet"),
+    item_id: Optional[int] = Query(None, description="عنصر واحد فقط من الطلب"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    ملف إنتاج واحد لكل ملفات PDF في الطلب: توحيد قياس الصفحات مع قياس الطلب،
+    مع خيار صفحتين في الورقة أو كتيب - يُرسل على دفعات أثناء التجهيز
+    """
+    from routers.auth import _get_user_type_name
+    from production_pdf import ProductionJob, ProductionPdfError
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية لتجهيز ملفات الطباعة")
+
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="الطلب غير موجود")
+
+    query = db.query(OrderItem).filter(OrderItem.order_id == order_id)
+    if item_id is not None:
+        query = query.filter(OrderItem.id == item_id)
+    items = query.order_by(OrderItem.id).all()
+
+    if not paper:
+        paper = next(
+            (item.specifications.get("paper_size") for item in items
+             if isinstance(item.specifications, dict) and item.specifications.get("paper_size")),
+            "A4"
+        )
+
+    try:
+        job = ProductionJob(_local_design_paths(items), paper, imposition)
+    except ProductionPdfError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    print(f"🖨️ Production PDF for order {order_id}: {job.page_count} pages → {job.sheet_count} sheets ({job.paper}, {imposition})")
+    filename = f"{order.order_number or order_id}-{job.paper}-{imposition}.pdf"
+    return StreamingResponse(
+        job.iter_pdf(),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{_secure_filename(filename)}"',
+            "X-Page-Count": str(job.page_count),
+            "X-Sheet-Count": str(job.sheet_count),
+        }
+    )
+
+def _document_url_builder(request: Request):
+    base_url = get_public_base_url(request)
+    return lambda order_id: f"{base_url}/api/orders/{order_id}"
+
+
+async def _documents_response(orders: List[Dict[str, Any]], kinds: List[str], request: Request, filename: str):
+    from arabic_text import FontsMissingError
+    from order_documents import prepare_templates, stream_documents
+    from workers import run_in_imaging_pool
+
+    try:
+        await run_in_imaging_pool(prepare_templates, kinds)
+    except FontsMissingError as e:
+        raise HTTPException(status_code=503, detail=f"طباعة مستندات الطلبات غير متاحة حالياً: {e}")
+    except OSError as e:
+        # ملف الخط موجود لكنه تالف أو غير مقروء
+        raise HTTPException(status_code=503, detail=f"طباعة مستندات الطلبات غير متاحة حالياً: تعذر تحميل الخط ({e})")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        stream_documents(orders, kinds, _document_url_builder(request)),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{_secure_filename(filename)}"',
+            "X-Order-Count": str(len(orders)),
+        }
+    )
+
+
+@router.get("/documents/batch")
+async def download_documents_batch(
+    request: Request,
+    kind: str = Query("ticket", description="invoice | ticket | both"),
+    status: str = Query("accepted", description="حالة الطلبات"),
+    day: Optional[str] = Query(None, description="YYYY-MM-DD (الافتراضي اليوم)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    بطاقات العمل و/أو الفواتير لكل طلبات اليوم المقبولة في ملف PDF واحد (للطباعة عند بدء الدوام)
+    الطلب يدخل الدفعة إذا أُنشئ أو انتقل إلى الحالة المطلوبة في ذلك اليوم
+    """
+    from datetime import date
+    from routers.auth import _get_user_type_name
+    from order_documents import DocumentError, batch_order_ids, load_orders, parse_kinds
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية لطباعة مستندات الطلبات")
+
+    try:
+        batch_day = date.fromisoformat(day) if day else date.today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="صيغة التاريخ يجب أن تكون YYYY-MM-DD")
+    try:
+        kinds = parse_kinds(kind)
+        orders = load_orders(db, batch_order_ids(db, status, batch_day))
+    except DocumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not orders:
+        raise HTTPException(status_code=404, detail="لا توجد طلبات بهذه الحالة في هذا اليوم")
+
+    print(f"🧾 Documents batch: {len(orders)} orders ({status}, {batch_day}) × {'+'.join(kinds)}")
+    return await _documents_response(orders, kinds, request, f"{kind}-{status}-{batch_day}.pdf")
+
+
+@router.get("/{order_id}/documents/{kind}")
+async def download_order_document(
+    order_id: int,
+    kind: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """فاتورة (invoice) أو بطاقة عمل (ticket) أو كلاهما (both) لطلب واحد"""
+    from routers.auth import _get_user_type_name
+    from order_documents import DocumentError, load_orders, parse_kinds
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية لطباعة مستندات الطلبات")
+
+    try:
+        kinds = parse_kinds(kind)
+    except DocumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    orders = load_orders(db, [order_id])
+    if not orders:
+        raise HTTPException(status_code=404, detail="الطلب غير موجود")
+
+    return await _documents_response(orders, kinds, request, f"{orders[0]['order_number'] or order_id}-{kind}.pdf")
+
+
+class GangImpositionRequest(BaseModel):
+    order_ids: List[int]
+    sheet: str = "SRA3"
+    bleed_mm: float = 2.0
+    margin_mm: float = 10.0
+    setup_sheets: Optional[int] = None
+    crop_marks: bool = True
+    output: str = "json"  # json | pdf
+
+
+def _item_size_mm(item: OrderItem) -> Optional[Tuple[float, float]]:
+    """قياس القطعة من أبعاد الطلب، أو القياس المعتاد حسب الخدمة (كروت شخصية / صور شخصية)"""
+    from image_inspect import dimensions_to_cm
+    from imposition import ITEM_PRESETS_MM
+
+    specs = item.specifications if isinstance(item.specifications, dict) else {}
+    size_cm = dimensions_to_cm(specs.get("dimensions"))
+    if size_cm:
+        return size_cm[0] * 10, size_cm[1] * 10
+    name = (item.product_name or "").lower()
+    if "كروت" in name or "card" in name:
+        return ITEM_PRESETS_MM["business_card"]
+    if "صور شخصية" in name or "passport" in name:
+        return ITEM_PRESETS_MM["passport_photo"]
+    return None
+
+
+@router.post("/imposition/gang")
+async def gang_imposition(
+    payload: GangImpositionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    تجميع كروت/صور عدة طلبات على أفرخ مشتركة بدلاً من فرخ لكل طلب
+    output=json: خطة التركيب (عدد القطع في الفرخ، طول التشغيل، الأفرخ الموفرة)
+    output=pdf: ملف PDF متجهي للقوالب مع علامات القص
+    """
+    from routers.auth import _get_user_type_name
+    from imposition import FORM_SETUP_SHEETS, IMAGE_DESIGN_EXTENSIONS, plan_gang_run, render_gang_pdf
+    from production_pdf import ProductionPdfError
+
+    user_role = _get_user_type_name(current_user.user_type_id, db) if current_user.user_type_id else None
+    if user_role == "عميل":
+        raise HTTPException(status_code=403, detail="ليس لديك صلاحية لتجهيز ملفات الطباعة")
+    if not payload.order_ids:
+        raise HTTPException(status_code=400, detail="يرجى تحديد الطلبات")
+
+    items = db.query(OrderItem).filter(OrderItem.order_id.in_(payload.order_ids)).order_by(OrderItem.id).all()
+    jobs: List[Dict[str, Any]] = []
+    designs: Dict[int, str] = {}
+    skipped: List[Dict[str, Any]] = []
+    for item in items:
+        size = _item_size_mm(item)
+        if not size:
+            skipped.append({"order_item_id": item.id, "order_id": item.order_id, "reason": "قياس القطعة غير معروف"})
+            continue
+        jobs.append({"key": item.id, "width_mm": size[0], "height_mm": size[1], "quantity": item.quantity or 1})
+        # أول تصميم PDF (متجهي) وإلا أول صورة
+        paths = _local_design_paths([item]) or _local_design_paths([item], IMAGE_DESIGN_EXTENSIONS)
+        if paths:
+            designs[item.id] = paths[0]
+
+    if not jobs:
+        raise HTTPException(status_code=400, detail="لا توجد عناصر قابلة للتركيب في الطلبات المحددة")
+
+    setup_sheets = FORM_SETUP_SHEETS if payload.setup_sheets is None else payload.setup_sheets
+    try:
+        plan = plan_gang_run(jobs, payload.sheet, payload.bleed_mm, payload.margin_mm, setup_sheets)
+    except ProductionPdfError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    item_orders = {item.id: item.order_id for item in items}
+    for group in plan["groups"]:
+        for job in group["jobs"]:
+            job["order_item_id"] = job.pop("key")
+            job["order_id"] = item_orders.get(job["order_item_id"])
+            job["has_design"] = job["order_item_id"] in designs
+    print(f"🧩 Gang imposition for {len(payload.order_ids)} orders: {plan['total_sheets']} sheets "
+          f"(saved {plan['sheets_saved']})")
+
+    if payload.output == "pdf":
+        return StreamingResponse(
+            render_gang_pdf(plan, designs, payload.crop_marks),
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f'attachment; filename="gang-{plan["sheet"]}.pdf"',
+                "X-Total-Sheets": str(plan["total_sheets"]),
+            }
+        )
+    return {"success": True, **plan, "skipped": skipped}
+
 @router.get("/{order_id}/attachments")
 async def get_order_attachments(order_id: int, db: Session = Depends(get_db), request: Request = None):
     """Get all attachments for an order, verifying file existence"""
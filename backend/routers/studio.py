@@ -1,12 +1,26 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
 import requests
 import os
 import base64
 import aiofiles
+import tempfile
+import asyncio
+import zipfile
 from PIL import Image, ImageDraw
 import io
-from typing import Optional
+from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from imaging import (
+    IMAGING_RETRY_AFTER_SECONDS, ImageTooLargeError, ImagingBusyError, convert_for_print, make_preview, stamp_dpi
+)
+from workers import run_in_imaging_pool
+from production_pdf import OUTPUT_CHUNK_SIZE, PdfAssembler
+from color_management import ColorProfileError, convert_file_to_cmyk, list_profiles, parse_rendering_intent
+from mockups import GARMENT_COLORS, MockupError, mockup_options, register_design, render_mockup
+from arabic_text import FontsMissingError, available_fonts, shaping_engine
+from certificates import CertificateError, load_template, parse_fields, parse_recipients, stream_certificates
 
 router = APIRouter()
 REMOVE_BG_API_KEY = os.getenv("REMOVE_BG_API_KEY", "QP2YU5oSDaLwXpzDRKv4fjo9")
@@ -17,6 +31,13 @@ if not REMOVE_BG_API_KEY:
 # ثابت DPI للطباعة
 PRINT_DPI = 300
 
+
+def _imaging_busy(error: ImagingBusyError) -> HTTPException:
+    """ميزانية الذاكرة مشغولة بصور أخرى: 503 مع Retry-After (الملف نفسه مقبول، بخلاف 413)"""
+    return HTTPException(
+        status_code=503, detail=str(error), headers={"Retry-After": str(IMAGING_RETRY_AFTER_SECONDS)}
+    )
+
 # وظيفة ضغط الصور
 def compress_image(image: Image.Image, max_size_mb: float = 5.0, quality: int = 85) -> io.BytesIO:
     """
@@ -90,6 +111,24 @@ def image_to_base64(image: Image.Image, format: str = 'PNG', dpi: int = PRINT_DP
     img_data = base64.b64encode(buffer.read()).decode('utf-8')
     return f"data:image/{format.lower()};base64,{img_data}"
 
+# مهلة remove.bg: (الاتصال، القراءة) بالثواني - طلب معلّق لا يحجز عامل الصور إلى الأبد
+REMOVE_BG_TIMEOUT = (5, 30)
+
+def _remove_bg_request(image_file) -> requests.Response:
+    """إرسال الصورة إلى remove.bg - انتهاء المهلة 504 وتعذر الاتصال 502"""
+    try:
+        return requests.post(
+            'https://api.remove.bg/v1.0/removebg',
+            files={'image_file': image_file},
+            data={'size': 'auto'},
+            headers={'X-Api-Key': REMOVE_BG_API_KEY},
+            timeout=REMOVE_BG_TIMEOUT,
+        )
+    except requests.Timeout:
+        raise HTTPException(status_code=504, detail="انتهت مهلة الاتصال بخدمة إزالة الخلفية، يرجى المحاولة مرة أخرى")
+    except requests.RequestException:
+        raise HTTPException(status_code=502, detail="تعذر الاتصال بخدمة إزالة الخلفية، يرجى المحاولة لاحقاً")
+
 @router.post("/remove-background")
 async def remove_background(file: UploadFile = File(...)):
     try:
@@ -102,12 +141,7 @@ async def remove_background(file: UploadFile = File(...)):
         compressed_image.seek(0)
         
         # Call remove.bg API مع الصورة المضغوطة
-        response = requests.post(
-            'https://api.remove.bg/v1.0/removebg',
-            files={'image_file': compressed_image},
-            data={'size': 'auto'},
-            headers={'X-Api-Key': REMOVE_BG_API_KEY},
-        )
+        response = _remove_bg_request(compressed_image)
         
         if response.status_code == 200:
             # قراءة الصورة الناتجة
@@ -121,9 +155,229 @@ async def remove_background(file: UploadFile = File(...)):
             error_detail = response.text if hasattr(response, 'text') else "Unknown error"
             raise HTTPException(status_code=response.status_code, detail=f"Failed to remove background: {error_detail}")
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# قالب الصور الشخصية: 2 صفوف × 4 أعمدة على ورقة 14 × 9.6 سم
+PASSPORT_SHEET_ROWS = 2
+PASSPORT_SHEET_COLS = 4
+PASSPORT_SHEET_SLOTS = PASSPORT_SHEET_ROWS * PASSPORT_SHEET_COLS
+# الحد الأقصى لعدد الأشخاص في طلب دفعة واحد
+PASSPORT_BATCH_MAX_FILES = int(os.getenv("PASSPORT_BATCH_MAX_FILES", "100"))
+
+def _passport_photo_size():
+    """أبعاد الصورة الشخصية بالبكسل: 3.5 × 4.8 سم عند 300 DPI (413 × 567)"""
+    pixels_per_cm = PRINT_DPI / 2.54
+    return int(3.5 * pixels_per_cm + 0.5), int(4.8 * pixels_per_cm + 0.5)
+
+def _prepare_passport_photo(file_content: bytes) -> Image.Image:
+    """
+    تجهيز صورة شخصية واحدة: إزالة الخلفية + قص وتحويل الحجم إلى 3.5 × 4.8 سم بالضبط
+    دالة متزامنة (طلب remove.bg + Pillow) - تُشغَّل على مجمع عمال الصور
+    """
+    original_image = Image.open(io.BytesIO(file_content))
+    
+    # التحقق من أن الصورة بالضبط 3.5 × 4.8 سم (413 × 567 بكسل عند 300 DPI)
+    pixels_per_cm = PRINT_DPI / 2.54
+    expected_width = int(3.5 * pixels_per_cm + 0.5)  # 413 بكسل
+    expected_height = int(4.8 * pixels_per_cm + 0.5)  # 567 بكسل
+    
+    img_width, img_height = original_image.size
+    
+    # إذا كانت الصورة بالضبط 3.5 × 4.8 سم، نستخدمها مباشرة (تم قصها مسبقاً)
+    if abs(img_width - expected_width) <= 2 and abs(img_height - expected_height) <= 2:
+        # الصورة مقطوعة بالفعل بالضبط 3.5 × 4.8 سم - نستخدمها مباشرة
+        target_width = expected_width
+        target_height = expected_height
+        single_photo = Image.new('RGB', (target_width, target_height), (255, 255, 255))
+        if original_image.mode == 'RGBA':
+            single_photo.paste(original_image, (0, 0), original_image)
+        else:
+            single_photo.paste(original_image, (0, 0))
+    else:
+        # ضغط الصورة قبل الإرسال لـ remove.bg
+        compressed_image = compress_image(original_image, max_size_mb=5.0, quality=85)
+        compressed_image.seek(0)
+        
+        # إزالة الخلفية باستخدام remove.bg
+        response = _remove_bg_request(compressed_image)
+        
+        if response.status_code != 200:
+            error_detail = response.text if hasattr(response, 'text') else "Unknown error"
+            raise HTTPException(status_code=response.status_code, detail=f"Failed to remove background: {error_detail}")
+        
+        # قراءة الصورة بعد إزالة الخلفية
+        no_bg_image = Image.open(io.BytesIO(response.content))
+        
+        # تحويل الحجم إلى 3.5 سم (عرض) × 4.8 سم (ارتفاع) بجودة 300 DPI
+        target_width = int(3.5 * pixels_per_cm + 0.5)  # 413 بكسل بالضبط عند 300 DPI
+        target_height = int(4.8 * pixels_per_cm + 0.5)  # 567 بكسل بالضبط عند 300 DPI
+        
+        # حساب النسبة للحفاظ على الأبعاد الأصلية للصورة
+        # الهدف: ملء الصورة في إطار 3.5 سم × 4.8 سم بالضبط مع الحفاظ على النسبة
+        # نستخدم "cover" strategy: نكبر الصورة لتملأ الإطار بالكامل ثم نستخدم crop
+        img_width, img_height = no_bg_image.size
+        aspect_ratio = img_width / img_height
+        target_aspect = target_width / target_height  # 3.5 / 4.8 = 0.729
+        
+        # حساب الحجم المطلوب لملء الإطار بالكامل
+        # نكبر الصورة بحيث تغطي الإطار بالكامل (أكبر من الإطار)
+        if aspect_ratio > target_aspect:
+            # الصورة أوسع من المطلوب - نكبرها بناءً على الارتفاع
+            # نريد أن يكون الارتفاع = target_height بالضبط
+            scale = target_height / img_height
+            new_width = int(img_width * scale + 0.5)
+            new_height = target_height
+        else:
+            # الصورة أطول من المطلوب - نكبرها بناءً على العرض
+            # نريد أن يكون العرض = target_width بالضبط
+            scale = target_width / img_width
+            new_width = target_width
+            new_height = int(img_height * scale + 0.5)
+        
+        # التأكد من أن الحجم الجديد أكبر من أو يساوي الحجم المطلوب
+        if new_width < target_width:
+            new_width = target_width
+            scale = new_width / img_width
+            new_height = int(img_height * scale + 0.5)
+        if new_height < target_height:
+            new_height = target_height
+            scale = new_height / img_height
+            new_width = int(img_width * scale + 0.5)
+        
+        # تغيير الحجم مع الحفاظ على الجودة (LANCZOS للجودة العالية)
+        resized_image = no_bg_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        
+        # قص الصورة من المنتصف للحصول على الأبعاد الدقيقة 3.5 × 4.8 سم
+        left = (new_width - target_width) // 2
+        top = (new_height - target_height) // 2
+        right = left + target_width
+        bottom = top + target_height
+        
+        # التأكد من أن الإحداثيات صحيحة
+        left = max(0, min(left, new_width - target_width))
+        top = max(0, min(top, new_height - target_height))
+        right = left + target_width
+        bottom = top + target_height
+        
+        cropped_image = resized_image.crop((left, top, right, bottom))
+        
+        # التأكد من أن الصورة المقطوعة بالضبط target_width × target_height
+        if cropped_image.size[0] != target_width or cropped_image.size[1] != target_height:
+            # إعادة ضبط الحجم إذا لزم الأمر
+            cropped_image = cropped_image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        
+        # إنشاء صورة جديدة بالحجم المطلوب بالضبط: 3.5 سم × 4.8 سم
+        single_photo = Image.new('RGB', (target_width, target_height), (255, 255, 255))
+        
+        # وضع الصورة المقطوعة (التي هي بالضبط target_width × target_height)
+        if cropped_image.mode == 'RGBA':
+            single_photo.paste(cropped_image, (0, 0), cropped_image)
+        else:
+            single_photo.paste(cropped_image, (0, 0))
+    
+    return single_photo
+
+def _build_passport_sheet(photos: List[Optional[Image.Image]]) -> Image.Image:
+    """
+    بناء قالب 8 خانات (2 صفوف × 4 أعمدة) بقياس 14 × 9.6 سم مع خطوط قص 1px
+    photos: صورة لكل خانة بالترتيب، None للخانة الفارغة
+    """
+    # إنشاء قالب 8 صور (2 صفوف × 4 أعمدة)
+    # القالب يجب أن يكون بالضبط: 14 سم عرض × 9.6 سم ارتفاع
+    rows = PASSPORT_SHEET_ROWS
+    cols = PASSPORT_SHEET_COLS
+    
+    # حساب أبعاد القالب بالضبط: 14 سم × 9.6 سم
+    pixels_per_cm = PRINT_DPI / 2.54
+    template_width_cm = 14.0
+    template_height_cm = 9.6
+    template_width = int(template_width_cm * pixels_per_cm + 0.5)  # 1654 بكسل عند 300 DPI
+    template_height = int(template_height_cm * pixels_per_cm + 0.5)  # 1134 بكسل عند 300 DPI
+    
+    # حساب خطوط القص بين الصور
+    # 3 خطوط عمودية بين 4 أعمدة، 1 خط أفقي بين صفين
+    cut_line_width = 1  # خط القص بسماكة 1px
+    
+    # حساب المساحة المتاحة للصور (بعد خصم خطوط القص)
+    # القالب = 14 سم × 9.6 سم بالضبط
+    # كل صورة = 3.5 سم × 4.8 سم بالضبط
+    # 4 صور × 3.5 سم = 14 سم (مع 3 خطوط قص بينها)
+    # 2 صفوف × 4.8 سم = 9.6 سم (مع 1 خط قص بينهما)
+    total_cut_lines_width = (cols - 1) * cut_line_width  # 3px
+    total_cut_lines_height = (rows - 1) * cut_line_width  # 1px
+    
+    # حساب حجم كل صورة في القالب
+    # يجب أن تكون الصور بالضبط target_width × target_height
+    # لكن مع خطوط القص، يجب أن نتحقق من أن القالب = 14 × 9.6 سم
+    # 4 × 3.5 سم = 14 سم، 2 × 4.8 سم = 9.6 سم
+    # مع خطوط القص: (4 × 3.5) + (3 × 1px) = 14 سم + 3px
+    # لكن 1px عند 300 DPI = 0.00847 سم (صغير جداً)
+    # لذلك يمكننا تجاهل خطوط القص في الحساب أو تضمينها
+    
+    # استخدام target_width و target_height للصور (3.5 × 4.8 سم)
+    target_width, target_height = _passport_photo_size()
+    photo_width_in_template = target_width
+    photo_height_in_template = target_height
+    
+    # التحقق من أن القالب بالضبط 14 × 9.6 سم
+    # حساب القالب الفعلي مع خطوط القص
+    calculated_template_width = cols * photo_width_in_template + (cols - 1) * cut_line_width
+    calculated_template_height = rows * photo_height_in_template + (rows - 1) * cut_line_width
+    
+    # إذا كان هناك فرق بسيط، نضبط القالب ليكون بالضبط 14 × 9.6 سم
+    if abs(calculated_template_width - template_width) > 1 or abs(calculated_template_height - template_height) > 1:
+        # ضبط حجم الصور قليلاً لتناسب القالب بالضبط
+        available_width = template_width - total_cut_lines_width
+        available_height = template_height - total_cut_lines_height
+        photo_width_in_template = available_width // cols
+        photo_height_in_template = available_height // rows
+        
+        # إعادة ضبط حجم الصور لتناسب القالب
+        photos = [
+            photo.resize((photo_width_in_template, photo_height_in_template), Image.Resampling.LANCZOS) if photo else None
+            for photo in photos
+        ]
+    
+    # إنشاء القالب بخلفية بيضاء بالضبط 14 سم × 9.6 سم
+    template = Image.new('RGB', (template_width, template_height), (255, 255, 255))
+    draw = ImageDraw.Draw(template)
+    
+    # وضع الصور في الخانات (صفاً صفاً) - الخانات الفارغة تبقى بيضاء
+    for slot, photo in enumerate(photos[:PASSPORT_SHEET_SLOTS]):
+        if photo is None:
+            continue
+        row, col = divmod(slot, cols)
+        # حساب موضع الصورة
+        x_pos = col * (photo_width_in_template + cut_line_width)
+        y_pos = row * (photo_height_in_template + cut_line_width)
+        
+        # وضع الصورة
+        template.paste(photo, (x_pos, y_pos))
+    
+    # رسم خطوط القص السوداء بين الصور (1px)
+    cut_line_color = (0, 0, 0)  # أسود
+    
+    # رسم الخطوط العمودية بين الأعمدة
+    for col in range(1, cols):
+        x_line = col * photo_width_in_template + (col - 1) * cut_line_width
+        draw.rectangle(
+            [x_line, 0, x_line + cut_line_width - 1, template_height - 1],
+            fill=cut_line_color
+        )
+    
+    # رسم الخطوط الأفقية بين الصفوف
+    for row in range(1, rows):
+        y_line = row * photo_height_in_template + (row - 1) * cut_line_width
+        draw.rectangle(
+            [0, y_line, template_width - 1, y_line + cut_line_width - 1],
+            fill=cut_line_color
+        )
+    
+    return template
+
 @router.post("/passport-photos")
 async def create_passport_photos(file: UploadFile = File(...)):
     """
@@ -132,206 +386,146 @@ async def create_passport_photos(file: UploadFile = File(...)):
     الأبعاد الدقيقة: 3.5 سم = 413 بكسل، 4.8 سم = 567 بكسل عند 300 DPI
     """
     try:
-        # قراءة الصورة
         file_content = await file.read()
-        original_image = Image.open(io.BytesIO(file_content))
-        
-        # التحقق من أن الصورة بالضبط 3.5 × 4.8 سم (413 × 567 بكسل عند 300 DPI)
-        pixels_per_cm = PRINT_DPI / 2.54
-        expected_width = int(3.5 * pixels_per_cm + 0.5)  # 413 بكسل
-        expected_height = int(4.8 * pixels_per_cm + 0.5)  # 567 بكسل
-        
-        img_width, img_height = original_image.size
-        
-        # إذا كانت الصورة بالضبط 3.5 × 4.8 سم، نستخدمها مباشرة (تم قصها مسبقاً)
-        if abs(img_width - expected_width) <= 2 and abs(img_height - expected_height) <= 2:
-            # الصورة مقطوعة بالفعل بالضبط 3.5 × 4.8 سم - نستخدمها مباشرة
-            target_width = expected_width
-            target_height = expected_height
-            single_photo = Image.new('RGB', (target_width, target_height), (255, 255, 255))
-            if original_image.mode == 'RGBA':
-                single_photo.paste(original_image, (0, 0), original_image)
-            else:
-                single_photo.paste(original_image, (0, 0))
-        else:
-            # ضغط الصورة قبل الإرسال لـ remove.bg
-            compressed_image = compress_image(original_image, max_size_mb=5.0, quality=85)
-            compressed_image.seek(0)
-            
-            # إزالة الخلفية باستخدام remove.bg
-            response = requests.post(
-                'https://api.remove.bg/v1.0/removebg',
-                files={'image_file': compressed_image},
-                data={'size': 'auto'},
-                headers={'X-Api-Key': REMOVE_BG_API_KEY},
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text if hasattr(response, 'text') else "Unknown error"
-                raise HTTPException(status_code=response.status_code, detail=f"Failed to remove background: {error_detail}")
-            
-            # قراءة الصورة بعد إزالة الخلفية
-            no_bg_image = Image.open(io.BytesIO(response.content))
-            
-            # تحويل الحجم إلى 3.5 سم (عرض) × 4.8 سم (ارتفاع) بجودة 300 DPI
-            target_width = int(3.5 * pixels_per_cm + 0.5)  # 413 بكسل بالضبط عند 300 DPI
-            target_height = int(4.8 * pixels_per_cm + 0.5)  # 567 بكسل بالضبط عند 300 DPI
-            
-            # حساب النسبة للحفاظ على الأبعاد الأصلية للصورة
-            # الهدف: ملء الصورة في إطار 3.5 سم × 4.8 سم بالضبط مع الحفاظ على النسبة
-            # نستخدم "cover" strategy: نكبر الصورة لتملأ الإطار بالكامل ثم نستخدم crop
-            img_width, img_height = no_bg_image.size
-            aspect_ratio = img_width / img_height
-            target_aspect = target_width / target_height  # 3.5 / 4.8 = 0.729
-            
-            # حساب الحجم المطلوب لملء الإطار بالكامل
-            # نكبر الصورة بحيث تغطي الإطار بالكامل (أكبر من الإطار)
-            if aspect_ratio > target_aspect:
-                # الصورة أوسع من المطلوب - نكبرها بناءً على الارتفاع
-                # نريد أن يكون الارتفاع = target_height بالضبط
-                scale = target_height / img_height
-                new_width = int(img_width * scale + 0.5)
-                new_height = target_height
-            else:
-                # الصورة أطول من المطلوب - نكبرها بناءً على العرض
-                # نريد أن يكون العرض = target_width بالضبط
-                scale = target_width / img_width
-                new_width = target_width
-                new_height = int(img_height * scale + 0.5)
-            
-            # التأكد من أن الحجم الجديد أكبر من أو يساوي الحجم المطلوب
-            if new_width < target_width:
-                new_width = target_width
-                scale = new_width / img_width
-                new_height = int(img_height * scale + 0.5)
-            if new_height < target_height:
-                new_height = target_height
-                scale = new_height / img_height
-                new_width = int(img_width * scale + 0.5)
-            
-            # تغيير الحجم مع الحفاظ على الجودة (LANCZOS للجودة العالية)
-            resized_image = no_bg_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # قص الصورة من المنتصف للحصول على الأبعاد الدقيقة 3.5 × 4.8 سم
-            left = (new_width - target_width) // 2
-            top = (new_height - target_height) // 2
-            right = left + target_width
-            bottom = top + target_height
-            
-            # التأكد من أن الإحداثيات صحيحة
-            left = max(0, min(left, new_width - target_width))
-            top = max(0, min(top, new_height - target_height))
-            right = left + target_width
-            bottom = top + target_height
-            
-            cropped_image = resized_image.crop((left, top, right, bottom))
-            
-            # التأكد من أن الصورة المقطوعة بالضبط target_width × target_height
-            if cropped_image.size[0] != target_width or cropped_image.size[1] != target_height:
-                # إعادة ضبط الحجم إذا لزم الأمر
-                cropped_image = cropped_image.resize((target_width, target_height), Image.Resampling.LANCZOS)
-            
-            # إنشاء صورة جديدة بالحجم المطلوب بالضبط: 3.5 سم × 4.8 سم
-            single_photo = Image.new('RGB', (target_width, target_height), (255, 255, 255))
-            
-            # وضع الصورة المقطوعة (التي هي بالضبط target_width × target_height)
-            if cropped_image.mode == 'RGBA':
-                single_photo.paste(cropped_image, (0, 0), cropped_image)
-            else:
-                single_photo.paste(cropped_image, (0, 0))
-        
-        # إنشاء قالب 8 صور (2 صفوف × 4 أعمدة)
-        # القالب يجب أن يكون بالضبط: 14 سم عرض × 9.6 سم ارتفاع
-        rows = 2
-        cols = 4
-        
-        # حساب أبعاد القالب بالضبط: 14 سم × 9.6 سم
-        template_width_cm = 14.0
-        template_height_cm = 9.6
-        template_width = int(template_width_cm * pixels_per_cm + 0.5)  # 1654 بكسل عند 300 DPI
-        template_height = int(template_height_cm * pixels_per_cm + 0.5)  # 1134 بكسل عند 300 DPI
-        
-        # حساب خطوط القص بين الصور
-        # 3 خطوط عمودية بين 4 أعمدة، 1 خط أفقي بين صفين
-        cut_line_width = 1  # خط القص بسماكة 1px
-        
-        # حساب المساحة المتاحة للصور (بعد خصم خطوط القص)
-        # القالب = 14 سم × 9.6 سم بالضبط
-        # كل صورة = 3.5 سم × 4.8 سم بالضبط
-        # 4 صور × 3.5 سم = 14 سم (مع 3 خطوط قص بينها)
-        # 2 صفوف × 4.8 سم = 9.6 سم (مع 1 خط قص بينهما)
-        total_cut_lines_width = (cols - 1) * cut_line_width  # 3px
-        total_cut_lines_height = (rows - 1) * cut_line_width  # 1px
-        
-        # حساب حجم كل صورة في القالب
-        # يجب أن تكون الصور بالضبط target_width × target_height
-        # لكن مع خطوط القص، يجب أن نتحقق من أن القالب = 14 × 9.6 سم
-        # 4 × 3.5 سم = 14 سم، 2 × 4.8 سم = 9.6 سم
-        # مع خطوط القص: (4 × 3.5) + (3 × 1px) = 14 سم + 3px
-        # لكن 1px عند 300 DPI = 0.00847 سم (صغير جداً)
-        # لذلك يمكننا تجاهل خطوط القص في الحساب أو تضمينها
-        
-        # استخدام target_width و target_height للصور (3.5 × 4.8 سم)
-        photo_width_in_template = target_width
-        photo_height_in_template = target_height
-        
-        # التحقق من أن القالب بالضبط 14 × 9.6 سم
-        # حساب القالب الفعلي مع خطوط القص
-        calculated_template_width = cols * photo_width_in_template + (cols - 1) * cut_line_width
-        calculated_template_height = rows * photo_height_in_template + (rows - 1) * cut_line_width
-        
-        # إذا كان هناك فرق بسيط، نضبط القالب ليكون بالضبط 14 × 9.6 سم
-        if abs(calculated_template_width - template_width) > 1 or abs(calculated_template_height - template_height) > 1:
-            # ضبط حجم الصور قليلاً لتناسب القالب بالضبط
-            available_width = template_width - total_cut_lines_width
-            available_height = template_height - total_cut_lines_height
-            photo_width_in_template = available_width // cols
-            photo_height_in_template = available_height // rows
-            
-            # إعادة ضبط حجم الصورة لتناسب القالب
-            single_photo = single_photo.resize((photo_width_in_template, photo_height_in_template), Image.Resampling.LANCZOS)
-        
-        # إنشاء القالب بخلفية بيضاء بالضبط 14 سم × 9.6 سم
-        template = Image.new('RGB', (template_width, template_height), (255, 255, 255))
-        draw = ImageDraw.Draw(template)
-        
-        # وضع 8 نسخ من الصورة في القالب
-        for row in range(rows):
-            for col in range(cols):
-                # حساب موضع الصورة
-                x_pos = col * (photo_width_in_template + cut_line_width)
-                y_pos = row * (photo_height_in_template + cut_line_width)
-                
-                # وضع الصورة
-                template.paste(single_photo, (x_pos, y_pos))
-        
-        # رسم خطوط القص السوداء بين الصور (1px)
-        cut_line_color = (0, 0, 0)  # أسود
-        
-        # رسم الخطوط العمودية بين الأعمدة
-        for col in range(1, cols):
-            x_line = col * photo_width_in_template + (col - 1) * cut_line_width
-            draw.rectangle(
-                [x_line, 0, x_line + cut_line_width - 1, template_height - 1],
-                fill=cut_line_color
-            )
-        
-        # رسم الخطوط الأفقية بين الصفوف
-        for row in range(1, rows):
-            y_line = row * photo_height_in_template + (row - 1) * cut_line_width
-            draw.rectangle(
-                [0, y_line, template_width - 1, y_line + cut_line_width - 1],
-                fill=cut_line_color
-            )
+        single_photo = await run_in_imaging_pool(_prepare_passport_photo, file_content)
+        template = await run_in_imaging_pool(_build_passport_sheet, [single_photo] * PASSPORT_SHEET_SLOTS)
         
         # تحويل إلى base64 مع DPI = 300 للطباعة
         img_data = image_to_base64(template, format='PNG', dpi=PRINT_DPI)
         
         return {"success": True, "image": img_data}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class _ZipChunkBuffer:
+    """مخزن مؤقت يجمع ما يكتبه zipfile لإرساله قطعة قطعة (zipfile يدعم الكتابة بدون seek)"""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+@router.post("/passport-photos/batch")
+async def create_passport_photos_batch(
+    files: List[UploadFile] = File(...),
+    copies: int = Form(PASSPORT_SHEET_SLOTS),
+    output: str = Form("pdf")
+):
+    """
+    صور شخصية لمجموعة أشخاص (صف كامل أو عائلة) في طلب واحد
+    - كل صورة تُجهَّز (إزالة خلفية + قص) بالتوازي على مجمع عمال الصور
+    - كل شخص يأخذ copies نسخة، والخانات تُملأ بالترتيب على قوالب 2 × 4 بقدر الحاجة
+    - الناتج: ملف PDF متعدد الصفحات (output=pdf) أو ZIP من صور PNG (output=zip) يُرسل تدفقياً
+    """
+    output = (output or "pdf").lower()
+    if output not in ("pdf", "zip"):
+        raise HTTPException(status_code=400, detail="صيغة الناتج يجب أن تكون pdf أو zip")
+    if not files:
+        raise HTTPException(status_code=400, detail="لم يتم إرسال صور")
+    if len(files) > PASSPORT_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"الحد الأقصى {PASSPORT_BATCH_MAX_FILES} صورة في الطلب الواحد")
+    copies = max(1, min(copies, PASSPORT_SHEET_SLOTS))
+    
+    try:
+        contents = [await file.read() for file in files]
+        photos = await asyncio.gather(*[
+            run_in_imaging_pool(_prepare_passport_photo, content) for content in contents
+        ])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # توزيع النسخ على الخانات ثم تقسيمها على القوالب
+    slots = [photo for photo in photos for _ in range(copies)]
+    sheets = [slots[i:i + PASSPORT_SHEET_SLOTS] for i in range(0, len(slots), PASSPORT_SHEET_SLOTS)]
+    print(f"📸 Passport batch: {len(photos)} photos × {copies} copies -> {len(sheets)} sheets ({output})")
+    
+    async def pdf_stream():
+        writer = PdfAssembler(title="Passport photos")
+        for sheet_photos in sheets:
+            sheet = await run_in_imaging_pool(_build_passport_sheet, sheet_photos)
+            await run_in_imaging_pool(writer.add_image_page, sheet, PRINT_DPI, 95)
+            chunk = writer.drain(OUTPUT_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+        yield writer.finish()
+    
+    async def zip_stream():
+        buffer = _ZipChunkBuffer()
+        # PNG مضغوطة أصلاً - لا فائدة من ضغطها مرة ثانية
+        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            for index, sheet_photos in enumerate(sheets, start=1):
+                sheet = await run_in_imaging_pool(_build_passport_sheet, sheet_photos)
+                png = io.BytesIO()
+                await run_in_imaging_pool(sheet.save, png, format='PNG', dpi=(PRINT_DPI, PRINT_DPI))
+                archive.writestr(f"passport-sheet-{index:03d}.png", png.getvalue())
+                yield buffer.drain()
+        yield buffer.drain()
+    
+    if output == "zip":
+        return StreamingResponse(
+            zip_stream(),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="passport-photos.zip"'}
+        )
+    return StreamingResponse(
+        pdf_stream(),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="passport-photos.pdf"'}
+    )
+
+@router.get("/certificates/fonts")
+async def get_certificate_fonts():
+    """الخطوط المتاحة لحقول الشهادات ومحرك تشكيل النص العربي المستخدم"""
+    return JSONResponse({"success": True, "fonts": available_fonts(), "shaping": shaping_engine()})
+
+@router.post("/certificates/batch")
+async def create_certificates_batch(
+    template: UploadFile = File(...),
+    fields: str = Form(...),
+    recipients: UploadFile = File(...)
+):
+    """
+    طباعة شهادات دفعة واحدة (إجازات حفظ القرآن الكريم، تكريم طلاب مدرسة)
+    - template: صورة أو PDF (الصفحة الأولى) - يُضمّن مرة واحدة وكل الشهادات تشير إليه
+    - fields: JSON بالحقول النصية ومواضعها بالملم (راجع certificates.parse_fields)
+    - recipients: ملف CSV أو JSON، كل سطر شهادة وأسماء الأعمدة هي أسماء الحقول
+    - الناتج: ملف PDF واحد متعدد الصفحات يُرسل تدفقياً أثناء الرسم
+    """
+    try:
+        template_content = await template.read()
+        recipients_content = await recipients.read()
+        certificate_template = await run_in_imaging_pool(load_template, template_content)
+        certificate_fields = await run_in_imaging_pool(parse_fields, fields)
+        rows = parse_recipients(recipients_content, recipients.filename or "")
+    except CertificateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FontsMissingError as e:
+        raise HTTPException(status_code=503, detail=f"طباعة الشهادات غير متاحة حالياً: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    print(f"🎓 Certificates batch: {len(rows)} certificates, {len(certificate_fields)} fields ({certificate_template.kind} template, {shaping_engine()} shaping)")
+    return StreamingResponse(
+        stream_certificates(certificate_template, certificate_fields, rows),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="certificates.pdf"'}
+    )
+
 @router.post("/crop-rotate")
 async def crop_rotate(
     file: UploadFile = File(...),
@@ -378,6 +572,14 @@ async def add_dpi(file: UploadFile = File(...)):
     try:
         # قراءة الصورة
         file_content = await file.read()
+        
+        # ملفات PNG: نكتب pHYs في الترويسة مباشرة بدون فك البكسلات وإعادة الضغط
+        if file_content[:8] == b"\x89PNG\r\n\x1a\n":
+            output = io.BytesIO()
+            stamp_dpi(io.BytesIO(file_content), output, PRINT_DPI)
+            img_data = base64.b64encode(output.getvalue()).decode('utf-8')
+            return {"success": True, "image": f"data:image/png;base64,{img_data}"}
+        
         image = Image.open(io.BytesIO(file_content))
         
         # تحويل إلى base64 مع DPI = 300 للطباعة
@@ -433,4 +635,203 @@ async def apply_filter(
         return {"success": True, "image": img_data}
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============================================
+# الصور الكبيرة (فليكس، بانرات، رول أب)
+# ============================================
+
+@router.post("/large/preview")
+async def large_image_preview(
+    file: UploadFile = File(...),
+    max_side: int = Form(1600)
+):
+    """
+    معاينة لصورة كبيرة جداً بدون فكها كاملة في الذاكرة
+    الملف يُقرأ من الملف المؤقت الذي يحفظه FastAPI ولا يُحمَّل كاملاً في الذاكرة
+    """
+    try:
+        max_side = max(64, min(max_side, 4096))
+        preview = await run_in_imaging_pool(make_preview, file.file, max_side)
+        img_data = image_to_base64(preview, format='JPEG', dpi=PRINT_DPI)
+        return {"success": True, "image": img_data, "width": preview.size[0], "height": preview.size[1]}
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagingBusyError as e:
+        raise _imaging_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/large/prepare")
+async def prepare_large_image(
+    file: UploadFile = File(...),
+    dpi: int = Form(PRINT_DPI),
+    output_format: str = Form("auto")
+):
+    """
+    تجهيز صورة كبيرة للطباعة مع ذاكرة محدودة:
+    - auto: ملفات JPEG/PNG يُعدَّل DPI في ترويستها فقط وتُنسخ كما هي
+    - tiff (أو الصيغ الأخرى في auto): تحويل شريطاً شريطاً إلى TIFF بـ DPI المطلوب
+    """
+    dpi = max(1, min(dpi, 2400))
+    output_format = (output_format or "auto").lower()
+    base_name = os.path.splitext(file.filename or "artwork")[0]
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        fmt = None
+        if output_format == "auto":
+            fmt = await run_in_imaging_pool(stamp_dpi, file.file, tmp, dpi)
+        if fmt is None:
+            tmp.seek(0)
+            tmp.truncate()
+            await run_in_imaging_pool(convert_for_print, file.file, tmp, dpi)
+            fmt = "TIFF"
+        tmp.close()
+    except ImageTooLargeError as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagingBusyError as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise _imaging_busy(e)
+    except Exception as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    extension = {"JPEG": ".jpg", "PNG": ".png", "TIFF": ".tif"}[fmt]
+    return FileResponse(
+        tmp.name,
+        media_type=f"image/{fmt.lower()}",
+        filename=f"{base_name}-{dpi}dpi{extension}",
+        background=BackgroundTask(os.unlink, tmp.name)
+    )
+
+
+@router.get("/color-profiles")
+async def get_color_profiles():
+    """ملفات ICC المتوفرة لتحويل الطباعة"""
+    return JSONResponse({"success": True, "profiles": list_profiles()})
+
+
+@router.post("/convert-cmyk")
+async def convert_to_cmyk(
+    file: UploadFile = File(...),
+    dpi: int = Form(PRINT_DPI),
+    profile: Optional[str] = Form(None),
+    intent: Optional[str] = Form(None)
+):
+    """
+    تحويل صورة RGB إلى TIFF بصيغة CMYK جاهز للمطبعة (شريطاً شريطاً مع ملف ICC مضمَّن)
+    profile: اسم ملف ICC من /color-profiles (الافتراضي CMYK_PROFILE)
+    """
+    dpi = max(1, min(dpi, 2400))
+    base_name = os.path.splitext(file.filename or "artwork")[0]
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".tif")
+    try:
+        rendering_intent = parse_rendering_intent(intent)
+        result = await run_in_imaging_pool(
+            convert_file_to_cmyk, file.file, tmp, dpi, profile, rendering_intent
+        )
+        tmp.close()
+    except ImageTooLargeError as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagingBusyError as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise _imaging_busy(e)
+    except ColorProfileError as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return FileResponse(
+        tmp.name,
+        media_type="image/tiff",
+        filename=f"{base_name}-cmyk-{dpi}dpi.tif",
+        headers={"X-Color-Profile": result["profile_used"]},
+        background=BackgroundTask(os.unlink, tmp.name)
+    )
+
+
+# ============================================
+# معاينة الطباعة على الملابس
+# ============================================
+
+class MockupPlacement(BaseModel):
+    location: str
+    design_id: str
+    scale: float = 1.0
+    offset_x: float = 0.0
+    offset_y: float = 0.0
+
+
+class MockupRequest(BaseModel):
+    garment: str = "tshirt"
+    color: str = "أبيض"
+    side: str = "front"
+    placements: List[MockupPlacement] = []
+
+    @field_validator("color")
+    @classmethod
+    def color_must_be_known(cls, color: str) -> str:
+        # اللون جزء من مسار ملف القالب - القيم المعروفة فقط (422 لغيرها)
+        if color not in GARMENT_COLORS:
+            raise ValueError(f"لون غير متوفر: {color}. الألوان المتاحة: {'، '.join(GARMENT_COLORS)}")
+        return color
+
+
+@router.get("/clothing-mockup/options")
+async def get_clothing_mockup_options():
+    """القطع والألوان ومواضع الطباعة المتاحة للمعاينة"""
+    return JSONResponse({"success": True, **mockup_options()})
+
+
+@router.post("/clothing-mockup/designs")
+async def upload_mockup_design(file: UploadFile = File(...)):
+    """
+    رفع تصميم للمعاينة مرة واحدة - يعيد design_id يُستخدم في كل تعديلات الموضع والحجم
+    """
+    try:
+        result = await run_in_imaging_pool(register_design, file.file)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagingBusyError as e:
+        raise _imaging_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"تعذر قراءة التصميم: {str(e)}")
+    return JSONResponse({"success": True, **result})
+
+
+@router.post("/clothing-mockup")
+async def create_clothing_mockup(request: MockupRequest):
+    """رسم معاينة القطعة مع التصاميم في المواضع المحددة (JPEG)"""
+    try:
+        image_bytes, cached = await run_in_imaging_pool(
+            render_mockup,
+            request.garment,
+            request.color,
+            request.side,
+            [placement.model_dump() for placement in request.placements],
+        )
+    except MockupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagingBusyError as e:
+        raise _imaging_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return Response(
+        content=image_bytes,
+        media_type="image/jpeg",
+        headers={"X-Mockup-Cache": "hit" if cached else "miss", "Cache-Control": "private, max-age=600"}
+    )
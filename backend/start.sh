@@ -19,6 +19,15 @@ if [ -n "$DATABASE_URL" ]; then
     else
         echo "⚠️ Migration script not found - skipping (non-critical)"
     fi
+
+    # Analytics tables: dimension ids + monthly partitions (creates them on a fresh database,
+    # converts older tables once - a no-op afterwards). Until it succeeds analytics events are queued, not stored
+    echo "🔄 Running analytics migration..."
+    if [ -f "/app/migrate_partition_analytics.py" ]; then
+        python /app/migrate_partition_analytics.py || echo "❌ Analytics migration FAILED - analytics will not be stored until it succeeds (see errors above)"
+    else
+        echo "❌ migrate_partition_analytics.py not found in /app - analytics will not be stored"
+    fi
 else
     echo "⚠️ DATABASE_URL not set - app may not work correctly"
 fi
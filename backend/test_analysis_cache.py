@@ -0,0 +1,73 @@
+"""
+اختبارات cache تحليل المستندات (analysis_cache.py) وتحليل مستندات الطلب في الخلفية (routers/orders.py)
+تشغيل: cd backend && python -m pytest -q test_analysis_cache.py
+"""
+import asyncio
+
+import pytest
+
+import analysis_cache
+import database
+import workers
+from routers import orders
+
+
+class _FakeSession:
+    def __init__(self):
+        self.merged = []
+        self.executed = []
+        self.committed = False
+        self.closed = False
+
+    def merge(self, row):
+        self.merged.append(row)
+
+    def execute(self, statement, params=None):
+        self.executed.append((str(statement), params))
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = _FakeSession()
+    monkeypatch.setattr(analysis_cache, "SessionLocal", lambda: fake)
+    monkeypatch.setattr(database, "SessionLocal", lambda: fake)
+    monkeypatch.setattr(analysis_cache, "_memory_cache", analysis_cache.LRUCache(max_items=8))
+    return fake
+
+
+def test_page_count_source_survives_the_database_round_trip(session):
+    result = {"pages": 12, "page_sizes": [], "file_type": ".docx", "page_count_source": "estimate"}
+    analysis_cache.store_analysis("a" * 64, 2048, result)
+    row = session.merged[0]
+    assert row.page_count_source == "estimate"
+    assert analysis_cache._row_to_result(row) == result
+
+
+def test_order_documents_are_analyzed_after_the_order_is_saved(session, monkeypatch):
+    calls = []
+
+    async def fake_pool(func, design_files, timeout=None):
+        calls.append(design_files)
+        if design_files == ["slow.pdf"]:
+            raise asyncio.TimeoutError()
+        return [{"filename": "lecture.pdf", "pages": 40}]
+
+    monkeypatch.setattr(workers, "run_in_analysis_pool", fake_pool)
+    asyncio.run(orders._store_design_document_analysis("ORD-1", [(5, ["slow.pdf"]), (6, ["lecture.pdf"])]))
+
+    assert calls == [["slow.pdf"], ["lecture.pdf"]]
+    # العنصر الذي انتهت مهلته لا يُحدَّث، والآخر يُضاف له document_analysis فقط
+    assert len(session.executed) == 1
+    statement, params = session.executed[0]
+    assert "jsonb_set" in statement and "{document_analysis}" in statement
+    assert params["item_id"] == 6 and '"pages": 40' in params["document_analysis"]
+    assert session.committed and session.closed
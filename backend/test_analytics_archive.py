@@ -0,0 +1,170 @@
+"""
+اختبارات أرشيف التحليلات (analytics_archive.py): صيغة ملف اليوم، وتصدير قسم ثم قراءته من الأرشيف
+قاعدة البيانات مستبدلة باتصال وهمي
+تشغيل: cd backend && python -m pytest -q test_analytics_archive.py
+"""
+import asyncio
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import analytics_archive
+from analytics_archive import TEXT, archive_partition, query_archive, read_day_file, scan_archive, write_day_file
+
+MONTH = date(2026, 1, 1)
+PARTITION = "page_views_y2026m01"
+
+
+def _rows():
+    rows = []
+    for index in range(1, 301):
+        created_at = datetime(2026, 1, 1 + index % 5, index % 24, index % 60, 0, index)
+        rows.append((
+            index, index // 3 or None, f"s-{index % 7}", "/services" if index % 2 else "/طلب",
+            index % 120, None if index % 11 == 0 else index % 100, '{"clicks": 1}' if index % 4 == 0 else None,
+            created_at,
+        ))
+    return rows
+
+
+class _Cursor:
+    def __init__(self, database):
+        self.database = database
+        self.pending = []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement, params=None):
+        self.database.statements.append(" ".join(statement.split()))
+        rows = self.database.rows
+        if "MAX(id)" in statement:
+            self.pending = [(max(row[0] for row in rows), len(rows))]
+        elif "analytics_rollup_state" in statement:
+            self.pending = [(self.database.marker,)]
+        elif "SELECT f.id" in statement:
+            start, end = params
+            self.pending = sorted(
+                (row for row in rows if start <= row[-1].date() < end), key=lambda row: (row[-1], row[0])
+            )
+        else:
+            self.pending = []
+
+    def fetchone(self):
+        return self.pending[0] if self.pending else None
+
+    def fetchmany(self, size):
+        batch, self.pending = self.pending[:size], self.pending[size:]
+        return batch
+
+
+class _Connection:
+    def __init__(self, rows, marker):
+        self.rows = rows
+        self.marker = marker
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self, name=None):
+        return _Cursor(self)
+
+    def rollback(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_archive, "ANALYTICS_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_day_file_round_trip_with_nulls_and_column_subset(tmp_path):
+    columns = [("id", "int"), ("flag", "bool"), ("at", "time"), ("path", TEXT)]
+    data = {
+        "id": [1, None, -5, 2 ** 40],
+        "flag": [True, False, None, True],
+        "at": [datetime(2026, 1, 3, 4, 5, 6, 789), None, datetime(1969, 12, 31, 23, 59), datetime(2026, 1, 3)],
+        "path": ["/", None, "/خدمات", "/"],
+    }
+    path = str(tmp_path / "page_views" / "2026-01-03.kac")
+    assert write_day_file(path, "page_views", date(2026, 1, 3), columns, data) > 0
+    header, decoded = read_day_file(path)
+    assert header["rows"] == 4 and decoded == data
+    assert read_day_file(path, ["path"])[1] == {"path": data["path"]}
+    with pytest.raises(analytics_archive.ArchiveError):
+        read_day_file(path, ["missing"])
+
+
+def test_partition_round_trip_then_drop(archive_dir):
+    rows = _rows()
+    connection = _Connection(rows, marker=300)
+    assert archive_partition(connection, "page_views", PARTITION, MONTH) == 300
+
+    restored = list(scan_archive("page_views", MONTH, date(2026, 1, 31)))
+    expected = sorted(rows, key=lambda row: (row[-1], row[0]))
+    names = [name for name, _ in analytics_archive._EXPORTS["page_views"][1]]
+    assert restored == [dict(zip(names, row)) for row in expected]
+
+    manifest = analytics_archive.load_manifest()
+    assert len(manifest["files"]) == 5
+    assert analytics_archive.archived_partitions("page_views") == {PARTITION}
+    assert connection.statements[-2:] == [
+        f"ALTER TABLE page_views DETACH PARTITION {PARTITION}", f"DROP TABLE {PARTITION}",
+    ]
+
+    # إعادة التصدير (بعد تراجع DETACH) لا تكرر القسم في الـ manifest
+    archive_partition(_Connection(rows, marker=300), "page_views", PARTITION, MONTH)
+    assert len(analytics_archive.load_manifest()["partitions"]) == 1
+
+    result = query_archive("page_views", MONTH, date(2026, 1, 31), ["id", "created_at"], {"page_path": "/طلب"}, limit=3)
+    assert result["matched"] == 150 and len(result["rows"]) == 3
+    assert isinstance(result["rows"][0]["created_at"], str)
+
+
+def test_partition_waits_for_rollup(archive_dir):
+    connection = _Connection(_rows(), marker=299)
+    assert archive_partition(connection, "page_views", PARTITION, MONTH) is None
+    assert not any("DROP" in statement for statement in connection.statements)
+    assert analytics_archive.load_manifest()["partitions"] == []
+
+
+def test_archive_runs_on_its_own_thread_and_connection(archive_dir, monkeypatch):
+    seen = {}
+
+    class _Engine:
+        def raw_connection(self):
+            seen["thread"] = threading.current_thread().name
+            return _ConnectionWithoutTables()
+
+    class _ConnectionWithoutTables(_Connection):
+        def __init__(self):
+            super().__init__([], marker=None)
+
+        def close(self):
+            seen["closed"] = True
+
+    monkeypatch.setattr(analytics_archive, "get_archive_engine", lambda: _Engine())
+    assert asyncio.run(analytics_archive.run_in_archive_thread(analytics_archive.run_archive)) == {}
+    assert seen["closed"] and seen["thread"].startswith("analytics-archive")
+
+
+def test_archive_engine_has_long_statement_timeout(monkeypatch):
+    import sqlalchemy
+
+    created = {}
+    monkeypatch.setattr(sqlalchemy, "create_engine", lambda url, **options: created.update(options) or object())
+    monkeypatch.setattr(analytics_archive, "_archive_engine", None)
+    analytics_archive.get_archive_engine()
+    monkeypatch.setattr(analytics_archive, "_archive_engine", None)
+    assert created["poolclass"].__name__ == "NullPool"
+    timeout = analytics_archive.ANALYTICS_ARCHIVE_STATEMENT_TIMEOUT
+    assert timeout > 30000
+    assert f"statement_timeout={timeout}" in created["connect_args"]["options"]
@@ -0,0 +1,84 @@
+"""
+اختبارات تحليل دفعات sendBeacon (analytics_beacon.py)
+تشغيل: cd backend && python -m pytest -q test_analytics_beacon.py
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import analytics_beacon
+from analytics_beacon import BeaconError, parse_beacon
+from analytics_ingest import PAGE_VIEW, VISIT
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+DEFAULTS = {"user_agent": "UA", "browser": "Chrome", "os": "Android", "device_type": "mobile", "ip_address": "1.2.3.4"}
+
+
+def _parse(payload):
+    return parse_beacon(json.dumps(payload).encode(), DEFAULTS, now=NOW)
+
+
+def test_mixed_batch_is_converted_with_server_time():
+    events, rejected = _parse({"sid": "s1", "now": 100000, "e": [
+        ["v", "/", "https://google.com", 1, 40000],
+        ["p", "/", 12, 80, 90000],
+        ["a", "/", "click", {"id": "order"}, 95000],
+        ["a", "/services", "scroll", None, 100000],
+        ["v", "/services", None, 2, 99000],
+    ]})
+    assert rejected == 0
+    assert [kind for kind, _ in events] == [VISIT, PAGE_VIEW, VISIT, PAGE_VIEW]
+    visit = events[0][1]
+    assert visit["entry_page"] and not visit["exit_page"] and visit["browser"] == "Chrome"
+    assert visit["created_at"] == NOW - timedelta(seconds=60)
+    view = events[1][1]
+    assert (view["time_spent"], view["scroll_depth"]) == (12, 80)
+    assert view["actions"]["events"][0]["name"] == "click"
+    # حدث بدون مشاهدة لنفس الصفحة يُنشئ مشاهدة خاصة به
+    assert events[3][1]["page_path"] == "/services" and events[3][1]["actions"]["events"][0]["name"] == "scroll"
+    assert events[2][1]["exit_page"]
+
+
+def test_bad_events_are_rejected_one_by_one():
+    events, rejected = _parse({"sid": "s1", "e": [
+        ["v", "/"],
+        ["x", "/"],
+        ["p", "", 1, 1],
+        ["p", "/", "long", 1],
+        ["p", "/", True, 1],
+        ["a", "/", "", None],
+        ["a", "/", "big", {"blob": "x" * 5000}],
+        "not-a-list",
+        ["p", "/ok", 10 ** 9, -5],
+        # حدث مرفوض لصفحة بدون مشاهدة لا يُنشئ مشاهدة فارغة
+        ["a", "/nothing", None, None],
+    ]})
+    assert rejected == 8 and len(events) == 2
+    assert (events[1][1]["time_spent"], events[1][1]["scroll_depth"]) == (86400, 0)
+
+
+def test_device_clock_is_ignored_and_age_is_bounded():
+    events, _ = _parse({"sid": "s1", "now": 10 ** 13, "e": [["p", "/", 1, 1, 0], ["p", "/", 1, 1, 2 * 10 ** 13]]})
+    assert events[0][1]["created_at"] == NOW - timedelta(seconds=analytics_beacon.BEACON_MAX_AGE_SECONDS)
+    assert events[1][1]["created_at"] == NOW
+
+
+def test_extra_events_beyond_the_limit_are_counted(monkeypatch):
+    monkeypatch.setattr(analytics_beacon, "BEACON_MAX_EVENTS", 3)
+    events, rejected = _parse({"sid": "s1", "e": [["p", f"/{index}", 1, 1] for index in range(5)]})
+    assert len(events) == 3 and rejected == 2
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b"\xff\xfe",
+    b"[]",
+    b'{"e": []}',
+    b'{"sid": "", "e": []}',
+    b'{"sid": "s1", "e": {}}',
+    b'{"sid": "s1", "e": [' + b'["p", "/", 1, 1],' * 10000 + b'["p", "/", 1, 1]]}',
+])
+def test_invalid_body_rejects_the_whole_batch(body):
+    with pytest.raises(BeaconError):
+        parse_beacon(body, DEFAULTS, now=NOW)
@@ -0,0 +1,102 @@
+"""
+اختبارات محرك القمع (analytics_funnels.py) - اتصال قاعدة البيانات مستبدل بكائنات وهمية
+تشغيل: cd backend && python -m pytest -q test_analytics_funnels.py
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import analytics_funnels
+import analytics_ingest
+
+PAGES = {1: "/", 2: "/services", 3: "/orders", 4: "/work/logo"}
+T0 = datetime(2026, 3, 1, 10, 0)
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params):
+        if "analytics_pages" in query:
+            self.rows = list(PAGES.items())
+        else:
+            self.rows = sorted(
+                (row for row in self.rows if row[1] in params["page_ids"]), key=lambda row: (row[0], row[2])
+            )
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class _Connection:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def cursor(self, name=None):
+        return _Cursor(self.events)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class _Engine:
+    def __init__(self, events):
+        self.events = events
+        self.connections = []
+
+    def raw_connection(self):
+        connection = _Connection(self.events)
+        self.connections.append(connection)
+        return connection
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    events = [
+        # جلسة a: / ثم /services ثم /orders - تحويل كامل
+        ("a", 1, T0), ("a", 2, T0 + timedelta(minutes=1)), ("a", 3, T0 + timedelta(minutes=4)),
+        # جلسة b: /orders قبل /services - لا تُحسب خطوة الطلب
+        ("b", 1, T0), ("b", 3, T0 + timedelta(minutes=1)), ("b", 2, T0 + timedelta(minutes=2)),
+        # جلسة c: فجوة خمول أطول من 30 دقيقة تبدأ جلسة جديدة
+        ("c", 1, T0), ("c", 2, T0 + timedelta(hours=2)),
+    ]
+    fake = _Engine(events)
+    monkeypatch.setattr(analytics_ingest, "get_analytics_engine", lambda: fake)
+    analytics_funnels._funnel_cache = analytics_funnels.LRUCache(max_items=8)
+    return fake
+
+
+def test_scan_uses_analytics_engine_and_orders_steps(engine):
+    result = analytics_funnels._scan(["/", "/services", "/orders"], T0 - timedelta(days=1), T0 + timedelta(days=1))
+    assert [step["visitors"] for step in result["funnel"]] == [3, 2, 1]
+    assert result["sessions"] == 4
+    assert result["funnel"][2]["avg_seconds_from_previous"] == 180.0
+    assert len(engine.connections) == 1 and engine.connections[0].closed
+
+
+def test_exact_bypasses_the_cached_window(engine):
+    steps = ["/", "/services"]
+    now = T0 + timedelta(hours=3)
+    cached = asyncio.run(analytics_funnels.compute_funnel(steps, timedelta(days=1), now=now))
+    asyncio.run(analytics_funnels.compute_funnel(steps, timedelta(days=1), now=now))
+    assert len(engine.connections) == 1
+    exact = asyncio.run(analytics_funnels.compute_funnel(steps, timedelta(days=1), now=now, exact=True))
+    assert len(engine.connections) == 2
+    assert exact["exact"] and exact["end"] == now.isoformat()
+    assert cached["end"] <= now.isoformat()
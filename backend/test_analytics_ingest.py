@@ -0,0 +1,129 @@
+"""
+اختبارات استقبال أحداث التحليلات (analytics_ingest.py و /api/analytics/track و /page-view)
+قاعدة البيانات مستبدلة بدالة كتابة وهمية
+تشغيل: cd backend && python -m pytest -q test_analytics_ingest.py
+"""
+import psycopg2
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import analytics_ingest
+from analytics_ingest import PAGE_VIEW, VISIT, IngestQueue
+from routers import analytics
+
+app = FastAPI()
+app.include_router(analytics.router, prefix="/api/analytics")
+client = TestClient(app)
+
+BROWSER = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = IngestQueue(max_size=100)
+    monkeypatch.setattr(analytics_ingest, "ingest_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """قاعدة بيانات وهمية: ترفض أي دفعة فيها حدث bad، وتنقطع عند down"""
+    state = {"rows": [], "calls": 0, "down": False}
+
+    def write_batch(batch):
+        state["calls"] += 1
+        if state["down"]:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if any(event.get("bad") for _, event in batch):
+            raise psycopg2.DataError("value too long for type character varying(500)")
+        state["rows"].extend(event["n"] for _, event in batch)
+
+    monkeypatch.setattr(analytics_ingest, "_write_batch", write_batch)
+    return state
+
+
+def _events(count, bad=()):
+    return [(PAGE_VIEW, {"n": index, "bad": index in bad}) for index in range(count)]
+
+
+def test_bad_row_is_isolated_not_the_whole_batch(queue, database):
+    queue.put_many(_events(64, bad={37}))
+    assert analytics_ingest.flush_once(64) == 63
+    assert database["rows"] == [index for index in range(64) if index != 37]
+    assert (queue.flushed, queue.failed) == (63, 1)
+    # تقسيم ثنائي: محاولات قليلة وليس صفاً صفاً
+    assert database["calls"] <= 2 * 6 + 1
+
+
+def test_connection_failure_puts_batch_back_in_order(queue, database):
+    queue.put_many(_events(10))
+    database["down"] = True
+    assert analytics_ingest.flush_once(10) == 0
+    assert (len(queue), queue.retried, queue.failed) == (10, 10, 0)
+    assert analytics_ingest.flush_all() == 0
+    database["down"] = False
+    assert analytics_ingest.flush_all() == 10
+    assert database["rows"] == list(range(10))
+
+
+def test_outage_during_split_keeps_unwritten_events_only(queue, database, monkeypatch):
+    queue.put_many(_events(8, bad={1}))
+    original = analytics_ingest._write_batch
+
+    def write_batch(batch):
+        # ينقطع الاتصال بعد كتابة النصف الأول المقسم
+        if batch[0][1]["n"] >= 4:
+            database["down"] = True
+        original(batch)
+
+    monkeypatch.setattr(analytics_ingest, "_write_batch", write_batch)
+    assert analytics_ingest.flush_once(8) == 3
+    assert database["rows"] == [0, 2, 3]
+    assert [event["n"] for _, event in queue.take(100)] == [4, 5, 6, 7]
+
+
+def test_put_back_respects_queue_bound(queue):
+    queue.put_many(_events(95))
+    assert queue.put_back(_events(10)) == 5
+    assert len(queue) == 100 and queue.dropped == 5
+
+
+def test_track_clips_long_text_fields(queue):
+    response = client.post(
+        "/api/analytics/track",
+        json={"session_id": "s" * 400, "page_path": "/" + "a" * 900, "referrer": "r" * 5000, "city": "c" * 300},
+        headers={"User-Agent": BROWSER + " " + "x" * 3000},
+    )
+    assert response.status_code == 202 and response.json()["queued"]
+    kind, event = queue.take(1)[0]
+    assert kind == VISIT
+    limits = analytics.TEXT_LIMITS
+    assert len(event["session_id"]) == limits["session_id"]
+    assert len(event["page_path"]) == limits["page_path"]
+    assert len(event["referrer"]) == limits["referrer"]
+    assert len(event["city"]) == limits["city"]
+    assert len(event["user_agent"]) == limits["user_agent"]
+
+
+def test_beacon_clips_user_agent_header(queue):
+    response = client.post(
+        "/api/analytics/beacon",
+        content='{"sid": "s1", "e": [["v", "/", null, 1]]}',
+        headers={"User-Agent": BROWSER + " " + "x" * 3000, "Content-Type": "text/plain"},
+    )
+    assert response.status_code == 202 and response.json()["accepted"] == 1
+    _, event = queue.take(1)[0]
+    assert len(event["user_agent"]) == analytics.TEXT_LIMITS["user_agent"]
+
+
+@pytest.mark.parametrize("body", [
+    {"session_id": "s", "page_path": "/", "time_spent": 2 ** 31},
+    {"session_id": "s", "page_path": "/", "scroll_depth": -1},
+    {"session_id": "s", "page_path": "/", "actions": {"clicks": ["x" * 1000] * 20}},
+    {"session_id": "", "page_path": "/"},
+])
+def test_page_view_rejects_out_of_range_values(queue, body):
+    response = client.post("/api/analytics/page-view", json=body, headers={"User-Agent": BROWSER})
+    assert response.status_code == 422
+    assert len(queue) == 0
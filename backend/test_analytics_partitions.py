@@ -0,0 +1,176 @@
+"""
+اختبارات الأقسام الشهرية لجداول التحليلات (analytics_partitions.py ونماذج models.py)
+تشغيل: cd backend && python -m pytest -q test_analytics_partitions.py
+"""
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+import analytics_archive
+import analytics_ingest
+import models
+from analytics_partitions import apply_retention, partition_name
+
+TODAY = date(2026, 10, 15)
+
+
+class _Cursor:
+    def __init__(self, months):
+        self.names = [partition_name("page_views", month) for month in months]
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+    def fetchall(self):
+        return [(name,) for name in self.names]
+
+
+@pytest.mark.parametrize("model", [models.VisitorTracking, models.PageView])
+def test_fact_tables_get_a_generated_id(model):
+    ddl = str(CreateTable(model.__table__).compile(dialect=postgresql.dialect()))
+    assert "id SERIAL NOT NULL" in ddl
+    assert "PRIMARY KEY (id, created_at)" in ddl
+
+
+def test_retention_without_archive_drops_old_months(monkeypatch):
+    monkeypatch.setattr(analytics_archive, "ANALYTICS_ARCHIVE_DIR", None)
+    cursor = _Cursor([date(2025, 1, 1), date(2025, 2, 1), date(2026, 9, 1)])
+    dropped = apply_retention(cursor, "page_views", months=12, today=TODAY)
+    assert dropped == ["page_views_y2025m01", "page_views_y2025m02"]
+
+
+def test_retention_keeps_partitions_missing_from_archive(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics_archive, "ANALYTICS_ARCHIVE_DIR", str(tmp_path))
+    (tmp_path / "manifest.json").write_text(json.dumps({"files": {}, "partitions": [
+        {"table": "page_views", "partition": "page_views_y2025m01", "rows": 10, "archived_at": "2025-03-08T03:00:00"},
+        {"table": "visitor_tracking", "partition": "page_views_y2025m02", "rows": 5, "archived_at": "2025-04-08T03:00:00"},
+    ]}))
+    cursor = _Cursor([date(2025, 1, 1), date(2025, 2, 1), date(2026, 9, 1)])
+    dropped = apply_retention(cursor, "page_views", months=12, today=TODAY)
+    assert dropped == ["page_views_y2025m01"]
+    assert not any("page_views_y2025m02" in statement for statement in cursor.statements)
+
+
+class _CatalogCursor:
+    """يجيب استعلامات الكتالوج: أعمدة page_path القديمة لجداول legacy، وكل الجداول مقسمة"""
+
+    def __init__(self, legacy, statements):
+        self.legacy = legacy
+        self.statements = statements
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+        if "information_schema.columns" in statement:
+            self.row = (1,) if params[0] in self.legacy else None
+        elif "relkind" in statement:
+            self.row = ("p",)
+        else:
+            self.row = (True,)
+
+    def fetchone(self):
+        return self.row
+
+
+class _CatalogConnection:
+    def __init__(self, legacy=()):
+        self.legacy = legacy
+        self.statements = []
+
+    def cursor(self):
+        return _CatalogCursor(self.legacy, self.statements)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def fresh_process(monkeypatch):
+    monkeypatch.setattr(analytics_ingest, "_tables_ready", False)
+
+
+def _writes(statements):
+    return [s for s in statements if s.lstrip().upper().startswith(("LOCK", "ALTER", "UPDATE", "DROP"))]
+
+
+def test_runtime_refuses_legacy_tables_without_converting(fresh_process):
+    connection = _CatalogConnection(legacy={"page_views"})
+    with pytest.raises(analytics_ingest.AnalyticsMigrationRequired, match="migrate_partition_analytics"):
+        analytics_ingest.ensure_fact_tables(connection)
+    assert _writes(connection.statements) == []
+    assert analytics_ingest._tables_ready is False
+
+
+def test_runtime_prepares_converted_tables(fresh_process):
+    connection = _CatalogConnection()
+    analytics_ingest.ensure_fact_tables(connection)
+    assert _writes(connection.statements) == []
+    assert analytics_ingest._tables_ready is True
+
+
+class _MigrationEngine:
+    def __init__(self, kinds):
+        self.connection = _CatalogConnection()
+        self.connection.close = lambda: None
+        self.connection.rollback = lambda: None
+        self.kinds = kinds
+
+    def raw_connection(self):
+        return self.connection
+
+
+@pytest.fixture
+def migration(monkeypatch):
+    import migrate_partition_analytics
+
+    calls = []
+    engine = _MigrationEngine({})
+    monkeypatch.setattr(migrate_partition_analytics, "get_analytics_engine", lambda: engine)
+    monkeypatch.setattr(migrate_partition_analytics, "relation_kind", lambda cursor, table: engine.kinds.get(table))
+    monkeypatch.setattr(migrate_partition_analytics, "create_partitioned", lambda cursor, table: calls.append(("create", table)))
+    monkeypatch.setattr(migrate_partition_analytics, "encode_legacy_table", lambda connection, table: calls.append(("encode", table)))
+    monkeypatch.setattr(
+        migrate_partition_analytics, "convert_to_partitioned",
+        lambda connection, table: calls.append(("convert", table)) or engine.kinds[table] == "r",
+    )
+    monkeypatch.setattr(migrate_partition_analytics, "run_maintenance", lambda: {})
+    return migrate_partition_analytics, engine, calls
+
+
+def test_migration_creates_partitioned_tables_on_a_fresh_database(migration):
+    module, engine, calls = migration
+    assert module.migrate() is True
+    assert calls == [("create", "visitor_tracking"), ("create", "page_views")]
+    assert engine.connection.statements[0] == "SET statement_timeout = 0"
+
+
+def test_migration_converts_legacy_tables(migration):
+    module, engine, calls = migration
+    engine.kinds.update(visitor_tracking="r", page_views="p")
+    assert module.migrate() is True
+    assert calls == [
+        ("encode", "visitor_tracking"), ("convert", "visitor_tracking"),
+        ("encode", "page_views"), ("convert", "page_views"),
+    ]
+
+
+def test_migration_failure_is_reported(migration, monkeypatch):
+    module, engine, calls = migration
+    engine.kinds.update(visitor_tracking="r", page_views="r")
+
+    def fail(connection, table):
+        raise RuntimeError("lock timeout")
+
+    monkeypatch.setattr(module, "encode_legacy_table", fail)
+    assert module.migrate() is False
+    assert calls == []
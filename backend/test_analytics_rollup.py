@@ -0,0 +1,83 @@
+"""
+اختبارات التجميع المسبق للتحليلات (analytics_rollup.py): نوافذ الفترات ودمج مخططات الجلسات
+قاعدة البيانات مستبدلة بـ cursor وهمي
+تشغيل: cd backend && python -m pytest -q test_analytics_rollup.py
+"""
+from datetime import datetime
+
+import psycopg2.extras
+import pytest
+
+from analytics_rollup import ALL_PAGES, FLAG_ENTRY, FLAG_VIEW, FLAG_VISIT, _merge_sketches, _window_params, period_window
+from hyperloglog import HyperLogLog
+
+NOW = datetime(2026, 3, 10, 14, 37, 12)
+
+
+def test_period_window_starts_on_the_hour():
+    start, end = period_window("week", NOW)
+    assert (start, end) == (datetime(2026, 3, 3, 14, 0), NOW)
+    assert period_window("unknown", NOW)[0] == datetime(2026, 3, 9, 14, 0)
+
+
+def test_window_splits_whole_days_from_edge_hours():
+    params = _window_params(datetime(2026, 3, 3, 14, 0), NOW)
+    assert params["first_day"] == datetime(2026, 3, 4) and params["last_day"] == datetime(2026, 3, 10)
+    # بداية عند منتصف الليل: اليوم الأول كامل من الجدول اليومي
+    assert _window_params(datetime(2026, 3, 3), NOW)["first_day"] == datetime(2026, 3, 3)
+
+
+class _Cursor:
+    def __init__(self, existing):
+        self.existing = existing
+        self.rows = []
+
+    def execute(self, query, params):
+        grain = "hourly" if "hourly" in query else "daily"
+        self.rows = [
+            (bucket, path, kind, sketch) for (g, bucket, path, kind), sketch in self.existing.items() if g == grain
+        ]
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = {}
+
+    def execute_values(cursor, query, values, page_size=100):
+        grain = "hourly" if "hourly" in query else "daily"
+        for bucket, path, kind, sketch in values:
+            saved[(grain, bucket, path, kind)] = HyperLogLog.from_bytes(bytes(sketch.adapted)).count()
+
+    monkeypatch.setattr(psycopg2.extras, "execute_values", execute_values)
+    return saved
+
+
+def test_merge_sketches_per_page_site_hour_and_day(saved):
+    hour_a, hour_b = datetime(2026, 3, 10, 9), datetime(2026, 3, 10, 10)
+    rows = [
+        (hour_a, "/", "s1", FLAG_VISIT | FLAG_ENTRY),
+        (hour_a, "/", "s2", FLAG_VISIT),
+        (hour_a, "/orders", "s1", FLAG_VIEW),
+        (hour_b, "/", "s1", FLAG_VISIT),
+    ]
+    updated = _merge_sketches(_Cursor({}), rows)
+    assert updated == len(saved)
+    assert saved[("hourly", hour_a, "/", FLAG_VISIT)] == 2
+    assert saved[("hourly", hour_a, "/", FLAG_ENTRY)] == 1
+    assert saved[("hourly", hour_a, ALL_PAGES, FLAG_VISIT)] == 2
+    assert saved[("daily", datetime(2026, 3, 10), "/", FLAG_VISIT)] == 2
+    assert saved[("daily", datetime(2026, 3, 10), ALL_PAGES, FLAG_VIEW)] == 1
+    assert ("hourly", hour_b, "/orders", FLAG_VIEW) not in saved
+
+
+def test_merge_sketches_adds_to_existing(saved):
+    day = datetime(2026, 3, 10)
+    existing = HyperLogLog()
+    existing.update(f"old-{index}" for index in range(100))
+    cursor = _Cursor({("daily", day, "/", FLAG_VISIT): memoryview(existing.to_bytes())})
+    _merge_sketches(cursor, [(datetime(2026, 3, 10, 11), "/", "new", FLAG_VISIT)])
+    assert abs(saved[("daily", day, "/", FLAG_VISIT)] - 101) <= 2
+    assert saved[("hourly", datetime(2026, 3, 10, 11), "/", FLAG_VISIT)] == 1
@@ -0,0 +1,117 @@
+"""
+اختبارات الشهادات (certificates.py و /api/studio/certificates/batch)
+تشغيل: cd backend && python -m pytest -q test_certificates.py
+"""
+import glob
+import io
+import json
+import os
+import shutil
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from PyPDF2 import PdfReader
+
+import arabic_text
+from certificates import CertificateError, parse_fields
+from routers import studio
+
+app = FastAPI()
+app.include_router(studio.router, prefix="/api/studio")
+client = TestClient(app)
+
+# أي خط TrueType متاح على الجهاز يكفي للاختبار (الخطوط العربية تُضاف عند النشر)
+SYSTEM_FONTS = [
+    path
+    for root in ("/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~"))
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.ttf"), recursive=True))
+]
+
+
+@pytest.fixture
+def fonts(tmp_path, monkeypatch):
+    monkeypatch.setattr(arabic_text, "FONT_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def one_font(fonts):
+    if not SYSTEM_FONTS:
+        pytest.skip("لا يوجد خط TrueType على الجهاز")
+    shutil.copy(SYSTEM_FONTS[0], fonts / "Amiri-Regular.ttf")
+    return fonts
+
+
+def _fields(text=None, **extra):
+    field = {"name": "name", "x_mm": 100, "y_mm": 50, **extra}
+    if text is not None:
+        field["text"] = text
+    return json.dumps([field])
+
+
+@pytest.mark.parametrize("text", [
+    "أتم حفظ {} جزءاً",
+    "أتم حفظ {0} جزءاً",
+    "{juz!r}",
+    "{juz:d} جزءاً",
+    "{juz:>{width}}",
+    "{name.__class__}",
+    "{name[0]}",
+    "{ }",
+    "أتم حفظ {juz",
+])
+def test_unsupported_text_templates_are_rejected(one_font, text):
+    with pytest.raises(CertificateError):
+        parse_fields(_fields(text))
+
+
+def test_column_placeholders_are_accepted(one_font):
+    field = parse_fields(_fields("أتم حفظ {juz} جزءاً برواية {riwaya}"))[0]
+    assert field["font_path"].endswith("Amiri-Regular.ttf")
+
+
+def test_unknown_font_is_a_request_error(one_font):
+    with pytest.raises(CertificateError):
+        parse_fields(_fields(font="Missing.ttf"))
+
+
+def test_missing_fonts_is_503_not_400(fonts):
+    assert arabic_text.check_fonts() is None
+    template = io.BytesIO()
+    Image.new("RGB", (297, 210), "white").save(template, format="PNG")
+    response = client.post(
+        "/api/studio/certificates/batch",
+        data={"fields": _fields()},
+        files={
+            "template": ("t.png", template.getvalue(), "image/png"),
+            "recipients": ("r.csv", "name\nأحمد\n".encode(), "text/csv"),
+        },
+    )
+    assert response.status_code == 503
+    assert "خطوط" in response.json()["detail"]
+
+
+def test_default_font_lookup_is_case_insensitive(fonts):
+    if not SYSTEM_FONTS:
+        pytest.skip("لا يوجد خط TrueType على الجهاز")
+    shutil.copy(SYSTEM_FONTS[0], fonts / "amiri-bold.ttf")
+    shutil.copy(SYSTEM_FONTS[0], fonts / "amiri-regular.ttf")
+    assert arabic_text.font_path().endswith("amiri-regular.ttf")
+    assert arabic_text.font_path(bold=True).endswith("amiri-bold.ttf")
+
+
+def test_batch_renders_one_page_per_recipient(one_font):
+    template = io.BytesIO()
+    Image.new("RGB", (1169, 827), "white").save(template, format="PNG", dpi=(100, 100))
+    response = client.post(
+        "/api/studio/certificates/batch",
+        data={"fields": _fields("{name} - {juz}")},
+        files={
+            "template": ("t.png", template.getvalue(), "image/png"),
+            "recipients": ("r.csv", "name,juz\nAhmad,30\nSara,15\n".encode(), "text/csv"),
+        },
+    )
+    assert response.status_code == 200
+    assert len(PdfReader(io.BytesIO(response.content)).pages) == 2
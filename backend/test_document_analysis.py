@@ -0,0 +1,119 @@
+"""
+اختبارات تحليل المستندات (document_analysis.py) وعمليات التحليل (workers.run_in_process_pool)
+تشغيل: cd backend && python -m pytest -q test_document_analysis.py
+"""
+import io
+import os
+import signal
+import tempfile
+import time
+
+import pytest
+from PIL import Image
+
+import workers
+from document_analysis import DocumentAnalysisError, analyze_document, analyze_document_isolated
+
+
+def _pdf(pages: int, size=(595, 842)) -> bytes:
+    images = [Image.new("RGB", size, (255, 255, 255) if index % 2 else (200, 20, 20)) for index in range(pages)]
+    output = io.BytesIO()
+    images[0].save(output, format="PDF", save_all=True, append_images=images[1:], resolution=72)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def process_pool():
+    previous = workers.ANALYSIS_PROCESSES
+    workers.ANALYSIS_PROCESSES = 1
+    yield
+    workers.ANALYSIS_PROCESSES = previous
+    if workers._process_pool is not None:
+        workers._process_pool.shutdown(wait=True)
+        workers._process_pool = None
+
+
+def test_parsing_runs_in_another_process():
+    assert workers.run_in_process_pool(os.getpid) != os.getpid()
+
+
+def test_isolated_matches_in_thread_result(tmp_path):
+    data = _pdf(6)
+    expected = analyze_document(io.BytesIO(data), ".pdf")
+    assert expected["pages"] == 6
+    assert expected["color"]["color"] == 3 and expected["color"]["bw"] == 3
+    assert analyze_document_isolated(io.BytesIO(data), ".pdf") == expected
+    path = tmp_path / "lecture.pdf"
+    path.write_bytes(data)
+    with open(path, "rb") as fp:
+        assert analyze_document_isolated(fp, ".pdf") == expected
+
+
+def _ignore_deadline_and_sleep(seconds: float) -> None:
+    # تحاكي عملية عالقة في كود C لا يقطعه SIGALRM
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(seconds)
+
+
+def test_timeout_stops_the_task_inside_the_process():
+    pool = workers._get_process_pool()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        workers.run_in_process_pool(time.sleep, 30, timeout=0.5)
+    assert time.monotonic() - started < 5
+    # العملية عادت للمجمع - لا حاجة لإعادة إنشائه
+    assert workers._process_pool is pool
+    assert workers.run_in_process_pool(os.getpid) != os.getpid()
+
+
+def test_stuck_process_is_killed_and_pool_recycled(monkeypatch):
+    monkeypatch.setattr(workers, "PROCESS_KILL_GRACE", 0.5)
+    pool = workers._get_process_pool()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        workers.run_in_process_pool(_ignore_deadline_and_sleep, 30, timeout=0.5)
+    assert time.monotonic() - started < 5
+    assert workers._process_pool is not pool
+    assert workers.run_in_process_pool(os.getpid) != os.getpid()
+
+
+def test_spooled_upload_is_sent_as_a_temp_file_path(monkeypatch):
+    data = _pdf(2)
+    sources = []
+
+    def in_thread(func, source, suffix, timeout=None):
+        sources.append(source)
+        return func(source, suffix)
+
+    monkeypatch.setattr(workers, "run_in_process_pool", in_thread)
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    upload.write(data)
+    assert analyze_document_isolated(upload, ".pdf")["pages"] == 2
+    assert isinstance(sources[0], str) and sources[0].endswith(".pdf")
+    # الملف المؤقت يُحذف بعد التحليل
+    assert not os.path.exists(sources[0])
+
+
+def test_errors_cross_the_process_boundary():
+    with pytest.raises(DocumentAnalysisError):
+        analyze_document_isolated(io.BytesIO(b"not a pdf at all"), ".pdf")
+    with pytest.raises(DocumentAnalysisError):
+        analyze_document_isolated(io.BytesIO(b"\xd0\xcf\x11\xe0 old word"), ".doc")
+
+
+def test_page_size_sample_is_bounded_and_spread():
+    from document_analysis import PAGE_SIZE_SAMPLE, sample_page_indices
+
+    assert sample_page_indices(5) == [0, 1, 2, 3, 4]
+    indices = sample_page_indices(2000)
+    assert len(indices) <= PAGE_SIZE_SAMPLE
+    assert indices[0] == 0 and indices[-1] == 1999
+
+
+def test_sampled_page_sizes_are_extrapolated():
+    from document_analysis import summarize_page_sizes
+
+    a4, a3 = (210.0, 297.0), (297.0, 420.0)
+    summary = summarize_page_sizes([a4] * 48 + [a3] * 16, 1000, sampled=True)
+    assert [(size["width_mm"], size["pages"]) for size in summary] == [(210, 750), (297, 250)]
+    assert sum(size["pages"] for size in summarize_page_sizes([a4, a3, a3], 1000, sampled=True)) == 1000
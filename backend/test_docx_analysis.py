@@ -0,0 +1,71 @@
+"""
+اختبارات عد صفحات DOCX (docx_analysis.py) بملفات مولدة في الاختبار
+تشغيل: cd backend && python -m pytest -q test_docx_analysis.py
+"""
+import io
+import zipfile
+
+import pytest
+
+from docx_analysis import analyze_docx
+from document_analysis import DocumentAnalysisError, analyze_word
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+A4_PORTRAIT = '<w:pgSz w:w="11906" w:h="16838"/><w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440"/>'
+A4_LANDSCAPE = '<w:pgSz w:w="16838" w:h="11906" w:orient="landscape"/><w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440"/>'
+
+
+def _paragraph(text="سطر قصير", extra=""):
+    return f"<w:p><w:r>{extra}<w:t>{text}</w:t></w:r></w:p>"
+
+
+def _docx(body, sect=A4_PORTRAIT, app=None):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", f'<?xml version="1.0" encoding="UTF-8"?><w:document {W}><w:body>'
+                                         f"{body}<w:sectPr>{sect}</w:sectPr></w:body></w:document>")
+        if app is not None:
+            zf.writestr("docProps/app.xml", '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/'
+                                            f'2006/extended-properties">{app}</Properties>')
+    output.seek(0)
+    return output
+
+
+def test_word_metadata_is_trusted():
+    result = analyze_docx(_docx(_paragraph(), app="<Pages>12</Pages><Words>3400</Words>"))
+    assert (result["pages"], result["page_count_source"]) == (12, "metadata")
+    assert [tuple(round(value) for value in size) for size in result["section_sizes_mm"]] == [(210, 297)]
+
+
+def test_template_metadata_on_generated_file_is_ignored():
+    body = "".join(_paragraph("نص " * 40) for _ in range(150))
+    result = analyze_docx(_docx(body, app="<Pages>1</Pages><Words>0</Words><Characters>0</Characters>"))
+    assert result["page_count_source"] == "estimate" and result["pages"] > 1
+
+
+def test_explicit_page_breaks_and_sections():
+    body = _paragraph() + _paragraph(extra='<w:br w:type="page"/>') + _paragraph(extra='<w:br w:type="page"/>')
+    body += f"<w:p><w:pPr><w:sectPr>{A4_PORTRAIT}</w:sectPr></w:pPr></w:p>" + _paragraph()
+    result = analyze_docx(_docx(body, sect=A4_LANDSCAPE))
+    assert (result["pages"], result["page_count_source"]) == (4, "estimate")
+    assert [round(width) for width, _ in result["section_sizes_mm"]] == [210, 210, 210, 297]
+
+
+def test_rendered_page_breaks_win_over_the_estimate():
+    body = "".join(_paragraph(extra="<w:lastRenderedPageBreak/>" if index % 10 == 9 else "") for index in range(50))
+    result = analyze_docx(_docx(body))
+    assert (result["pages"], result["page_count_source"]) == (6, "rendered_breaks")
+
+
+def test_estimate_scales_with_content():
+    # A4 بهوامش 2.54 سم: نحو 31 فقرة من سطر واحد (Calibri 11، تباعد 1.08 + 8pt) في الصفحة
+    pages = [analyze_docx(_docx("".join(_paragraph() for _ in range(count))))["pages"] for count in (10, 200, 2000)]
+    assert pages[0] == 1
+    assert 5 <= pages[1] <= 9
+    assert 55 <= pages[2] <= 80
+
+
+def test_old_doc_format_is_rejected():
+    with pytest.raises(DocumentAnalysisError):
+        analyze_word(io.BytesIO(b"\xd0\xcf\x11\xe0" + b"\0" * 100))
+    assert analyze_word(_docx(_paragraph(), app="<Pages>3</Pages><Words>10</Words>"))["pages"] == 3
@@ -0,0 +1,66 @@
+"""
+اختبارات تحديد الدولة والمدينة من IP (geoip.py) بملف نطاقات صغير
+تشغيل: cd backend && python -m pytest -q test_geoip.py
+"""
+import gzip
+import os
+
+import pytest
+
+import geoip
+
+ROWS = [
+    "ip_start,ip_end,continent,country,state,city",
+    "1.0.0.0,1.0.0.255,OC,AU,Queensland,Brisbane",
+    "5.0.0.0,5.0.255.255,AS,SY,Damascus,Damascus",
+    "16777472,16778239,AS,CN,Fujian,Fuzhou",
+    "5.1.0.0,5.1.0.255,AS,ZZ,-,-",
+    "2001:db8::,2001:db8::ffff,EU,DE,Berlin,Berlin",
+    "9.9.9.9,9.9.9.1,NA,US,,Broken",
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(geoip, "GEOIP_COUNTRY_COLUMN", 3)
+    monkeypatch.setattr(geoip, "GEOIP_CITY_COLUMN", 5)
+    monkeypatch.setattr(geoip, "_table", None)
+    path = str(tmp_path / "ip-location.csv.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        handle.write("\n".join(ROWS) + "\n")
+    assert geoip.reload_if_changed(path)
+    return path
+
+
+@pytest.mark.parametrize("address, location", [
+    ("1.0.0.1", ("AU", "Brisbane")),
+    ("5.0.200.7", ("SY", "Damascus")),
+    ("1.0.1.10", ("CN", "Fuzhou")),
+    ("::ffff:5.0.0.1", ("SY", "Damascus")),
+    ("2001:db8::42", ("DE", "Berlin")),
+    ("5.1.0.3", (None, None)),
+    ("1.0.0.0 ", ("AU", "Brisbane")),
+    ("8.8.8.8", (None, None)),
+    ("9.9.9.5", (None, None)),
+    ("not-an-ip", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_lookup(database, address, location):
+    assert geoip.lookup(address) == location
+
+
+def test_reload_only_when_file_changes(database):
+    first = geoip._table
+    assert not geoip.reload_if_changed(database)
+    assert geoip._table is first and first.stats()["ipv4_ranges"] == 3
+    os.utime(database, (first.mtime + 10, first.mtime + 10))
+    assert geoip.reload_if_changed(database)
+    assert geoip._table is not first
+
+
+def test_missing_file_keeps_lookups_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(geoip, "_table", None)
+    assert not geoip.reload_if_changed(str(tmp_path / "missing.csv"))
+    assert geoip.geoip_status["enabled"] is False
+    assert geoip.lookup("1.0.0.1") == (None, None)
@@ -0,0 +1,71 @@
+"""
+اختبارات HyperLogLog (hyperloglog.py) ودمج مخططات الفترة (analytics_rollup._sketch_counts)
+تشغيل: cd backend && python -m pytest -q test_hyperloglog.py
+"""
+from datetime import datetime, timedelta
+
+import analytics_rollup
+from hyperloglog import HyperLogLog
+
+
+def _sketch(values):
+    sketch = HyperLogLog()
+    sketch.update(values)
+    return sketch
+
+
+def test_count_is_within_two_percent():
+    for exact in (100, 5000, 200000):
+        estimate = _sketch(f"session-{index}" for index in range(exact)).count()
+        assert abs(estimate - exact) <= max(2, exact * 0.02)
+
+
+def test_merge_of_overlapping_sketches_counts_the_union():
+    # 48 ساعة، كل ساعة 3000 جلسة، نصفها متكرر من الساعة السابقة - الاتحاد 72000+1500 جلسة
+    hours = [_sketch(f"s-{index}" for index in range(hour * 1500, hour * 1500 + 3000)) for hour in range(48)]
+    exact = 47 * 1500 + 3000
+    running = HyperLogLog()
+    for sketch in hours:
+        running.merge(sketch)
+    assert abs(running.count() - exact) <= exact * 0.02
+    assert running.registers == HyperLogLog.union(hours).registers
+
+
+def test_serialization_round_trip():
+    sketch = _sketch(str(index) for index in range(1000))
+    assert HyperLogLog.from_bytes(sketch.to_bytes()).registers == sketch.registers
+
+
+class _FakeDb:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, statement, params):
+        self.statements.append(statement)
+        return iter(self.rows)
+
+
+def test_sketch_counts_merge_per_key_while_streaming(monkeypatch):
+    rows = []
+    for hour in range(24):
+        rows.append(("/", 1, _sketch(f"v-{index}" for index in range(hour * 100, hour * 100 + 200)).to_bytes()))
+        rows.append(("/about", 2, _sketch(f"v-{index}" for index in range(50)).to_bytes()))
+    db = _FakeDb(rows)
+
+    merged_into = []
+    original_merge = HyperLogLog.merge
+
+    def merge(self, other):
+        merged_into.append(id(self))
+        return original_merge(self, other)
+
+    monkeypatch.setattr(HyperLogLog, "merge", merge)
+    end = datetime(2026, 1, 2)
+    counts = analytics_rollup._sketch_counts(db, end - timedelta(days=1), end, [1, 2], None)
+
+    assert abs(counts[("/", 1)] - 2500) <= 50
+    assert abs(counts[("/about", 2)] - 50) <= 1
+    # مخطط واحد يتراكم فيه الدمج لكل مفتاح
+    assert len(set(merged_into)) == 2 and len(merged_into) == 46
+    assert db.statements[0].get_execution_options().get("stream_results")
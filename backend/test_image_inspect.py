@@ -0,0 +1,57 @@
+"""
+اختبارات فحص ترويسة الصور (image_inspect.py)
+تشغيل: cd backend && python -m pytest -q test_image_inspect.py
+"""
+import base64
+import io
+import os
+
+from PIL import Image
+
+from image_inspect import Base64Reader, check_print_resolution, inspect_data_url, inspect_image_header
+
+
+def _jpeg(size=(640, 480), dpi=(300, 300), icc_size=0) -> bytes:
+    output = io.BytesIO()
+    # محتوى ICC ثابت بدون بايت 0xFF - حتى لا يظهر فيه نمط يشبه علامة SOF
+    extra = {"icc_profile": bytes(index % 255 for index in range(icc_size))} if icc_size else {}
+    Image.new("RGB", size, (200, 30, 30)).save(output, format="JPEG", dpi=dpi, **extra)
+    return output.getvalue()
+
+
+def test_jpeg_and_png_headers():
+    assert inspect_image_header(_jpeg())["width"] == 640
+    png = io.BytesIO()
+    Image.new("RGB", (120, 90)).save(png, format="PNG", dpi=(150, 150))
+    info = inspect_image_header(png.getvalue())
+    assert (info["width"], info["height"]) == (120, 90)
+    assert round(info["dpi"][0]) == 150
+
+
+def test_base64_reader_matches_bytes():
+    data = os.urandom(10001)
+    reader = Base64Reader(base64.b64encode(data).decode())
+    assert reader.read(5) == data[:5]
+    reader.seek(7777)
+    assert reader.read(100) == data[7777:7877]
+    reader.seek(-3, io.SEEK_END)
+    assert reader.read() == data[-3:]
+    assert reader.read(10) == b""
+
+
+def test_data_url_with_large_icc_before_sof():
+    """مقطع ICC بحجم 300KB قبل SOF - الفحص يصل إلى الأبعاد رغم ذلك"""
+    jpeg = _jpeg(size=(3000, 2000), icc_size=300 * 1024)
+    assert jpeg.index(b"\xff\xc0") > 64 * 1024
+    data_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+    info = inspect_data_url(data_url)
+    assert (info["width"], info["height"]) == (3000, 2000)
+    assert info["dpi"] == (300, 300)
+
+
+def test_print_resolution_warning():
+    info = {"width": 1000, "height": 500, "dpi": (72, 72)}
+    low = check_print_resolution(info, 100, 50)
+    assert not low["ok"] and low["warning"]
+    assert low["effective_dpi"] == 25.4
+    assert check_print_resolution(info, 10, 5)["ok"]
@@ -0,0 +1,96 @@
+"""
+اختبارات مسار الصور الكبيرة (imaging.py)
+تشغيل: cd backend && python -m pytest -q test_imaging.py
+"""
+import io
+import struct
+import threading
+import zlib
+
+import pytest
+from PIL import Image
+
+import imaging
+from imaging import (
+    ImageTooLargeError, ImagingBusyError, MemoryBudget, convert_for_print, large_image_limit, open_large,
+    open_lazy, write_tiff_strips,
+)
+
+
+def _png_header(width: int, height: int) -> bytes:
+    """ترويسة PNG فقط (بدون بكسلات حقيقية) - تكفي لـ Image.open"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", b"") + chunk(b"IEND", b"")
+
+
+def test_import_keeps_pillow_pixel_limit():
+    """الاستيراد لا يغير حد Pillow العام - بقية مسارات الرفع محمية من decompression bombs"""
+    assert Image.MAX_IMAGE_PIXELS == imaging._default_max_pixels
+    assert Image.MAX_IMAGE_PIXELS < imaging.IMAGING_MAX_PIXELS
+
+
+def test_large_limit_is_scoped_and_restored():
+    original = Image.MAX_IMAGE_PIXELS
+    with large_image_limit():
+        assert Image.MAX_IMAGE_PIXELS == imaging.IMAGING_MAX_PIXELS
+        with large_image_limit():
+            assert Image.MAX_IMAGE_PIXELS == imaging.IMAGING_MAX_PIXELS
+        # الخروج الداخلي لا يُرجع الحد ما دام مستخدم آخر داخل النطاق
+        assert Image.MAX_IMAGE_PIXELS == imaging.IMAGING_MAX_PIXELS
+    assert Image.MAX_IMAGE_PIXELS == original
+
+
+def test_huge_header_rejected_by_default_but_opened_by_large_path():
+    header = _png_header(20000, 20000)
+    with pytest.raises(Image.DecompressionBombError):
+        open_lazy(header)
+    image = open_large(header)
+    assert image.size == (20000, 20000)
+
+
+def test_budget_timeout_is_busy_not_too_large():
+    budget = MemoryBudget(100)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with budget.reserve(80):
+            held.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    try:
+        held.wait(5)
+        with pytest.raises(ImagingBusyError):
+            with budget.reserve(50, timeout=0.05):
+                pass
+        with pytest.raises(ImageTooLargeError):
+            with budget.reserve(200):
+                pass
+    finally:
+        release.set()
+        worker.join()
+    assert budget.used_bytes == 0
+
+
+def test_tiff_over_4gb_is_rejected_before_writing():
+    output = io.BytesIO()
+    with pytest.raises(ImageTooLargeError):
+        write_tiff_strips(output, (40000, 40000), "RGB", iter(()))
+    assert output.getvalue() == b""
+
+
+def test_convert_for_print_round_trip():
+    source = io.BytesIO()
+    Image.new("RGB", (300, 700), (10, 200, 30)).save(source, format="PNG")
+    output = io.BytesIO()
+    assert convert_for_print(source.getvalue(), output, dpi=150) == (300, 700)
+    output.seek(0)
+    result = Image.open(output)
+    assert result.size == (300, 700)
+    assert result.getpixel((299, 699)) == (10, 200, 30)
+    assert round(result.info["dpi"][0]) == 150
@@ -0,0 +1,103 @@
+"""
+اختبارات تركيب القطع الصغيرة على أفرخ الطباعة (imposition.py)
+تشغيل: cd backend && python -m pytest -q test_imposition.py
+"""
+import io
+import random
+
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader
+
+from imposition import compute_layout, plan_gang_run, render_gang_pdf
+from production_pdf import PRODUCTION_PAPER_SIZES_MM, ProductionPdfError
+
+
+def _overlaps(a, b, bleed):
+    return (
+        a["x"] - bleed < b["x"] + b["width"] + bleed - 1e-6 and b["x"] - bleed < a["x"] + a["width"] + bleed - 1e-6
+        and a["y"] - bleed < b["y"] + b["height"] + bleed - 1e-6 and b["y"] - bleed < a["y"] + a["height"] + bleed - 1e-6
+    )
+
+
+@pytest.mark.parametrize("size", [(90, 50), (35, 48), (148, 105)])
+def test_layout_slots_stay_inside_margins_without_overlap(size):
+    layout = compute_layout(*size, sheet="SRA3", bleed=2, margin=10)
+    sheet_width, sheet_height = PRODUCTION_PAPER_SIZES_MM["SRA3"]
+    slots = layout["slots"]
+    assert layout["count"] == len(slots) > 0
+    for slot in slots:
+        assert sorted((slot["width"], slot["height"])) == sorted(size)
+        assert slot["x"] - 2 >= 10 - 1e-6 and slot["x"] + slot["width"] + 2 <= sheet_width - 10 + 1e-6
+        assert slot["y"] - 2 >= 10 - 1e-6 and slot["y"] + slot["height"] + 2 <= sheet_height - 10 + 1e-6
+    assert not any(_overlaps(a, b, 2) for index, a in enumerate(slots) for b in slots[index + 1:])
+
+
+def test_mixed_orientation_beats_a_single_grid():
+    # 300×430 قابلة للطباعة، خانة 94×54: شبكة واحدة 3×7=21 (المدورة 5×4=20)،
+    # و 3×6 + صف مدور من 5 فوقها = 23
+    layout = compute_layout(90, 50, sheet="SRA3", bleed=2, margin=10)
+    assert layout["count"] == 23 and layout["blocks"] == 2
+    assert {slot["rotated"] for slot in layout["slots"]} == {False, True}
+
+
+def test_layout_rejects_unknown_sheet_and_oversized_item():
+    with pytest.raises(ProductionPdfError):
+        compute_layout(90, 50, sheet="B9")
+    assert compute_layout(500, 500, sheet="SRA3")["count"] == 0
+    with pytest.raises(ProductionPdfError):
+        plan_gang_run([{"key": 1, "width_mm": 500, "height_mm": 500, "quantity": 10}])
+
+
+def test_gang_run_covers_every_quantity_and_saves_setup():
+    jobs = [
+        {"key": "a", "width_mm": 90, "height_mm": 50, "quantity": 1000},
+        {"key": "b", "width_mm": 50, "height_mm": 90, "quantity": 500},
+        {"key": "c", "width_mm": 90, "height_mm": 50, "quantity": 100},
+        {"key": "p", "width_mm": 35, "height_mm": 48, "quantity": 40},
+    ]
+    plan = plan_gang_run(jobs, sheet="SRA3", setup_sheets=5)
+    assert len(plan["groups"]) == 2
+    assert plan["total_sheets"] <= plan["separate_sheets"] and plan["sheets_saved"] > 0
+    for group in plan["groups"]:
+        per_form = group["layout"]["count"]
+        slots = [key for form in group["forms"] for key in form["slots"]]
+        assert all(len(form["slots"]) == per_form and form["sheets"] in group["run_lengths"] for form in group["forms"])
+        for job in group["jobs"]:
+            assert slots.count(job["key"]) == job["slots"]
+            assert job["produced"] >= job["quantity"]
+            # كل خانات الطلب على قوالب بطول تشغيله
+            assert all(
+                form["sheets"] == job["run_length"] for form in group["forms"] if job["key"] in form["slots"]
+            )
+        assert group["total_sheets"] == sum(form["sheets"] + 5 for form in group["forms"])
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_gang_run_never_costs_more_than_separate_runs(seed):
+    generator = random.Random(seed)
+    quantity = [
+        lambda: generator.choice([100, 200, 250, 500, 1000, 2000, 5000]),
+        lambda: generator.randint(1, 10000),
+        lambda: generator.randint(50, 300),
+        lambda: generator.choice([50, 20000]),
+    ][seed]
+    jobs = [{"key": index, "width_mm": 90, "height_mm": 50, "quantity": quantity()} for index in range(300)]
+    plan = plan_gang_run(jobs, sheet="SRA3", setup_sheets=5)
+    assert plan["total_sheets"] <= plan["separate_sheets"]
+    produced = {job["key"]: job["produced"] for job in plan["groups"][0]["jobs"]}
+    assert all(produced[job["key"]] >= job["quantity"] for job in jobs)
+
+
+def test_gang_pdf_has_a_page_per_form(tmp_path):
+    design = tmp_path / "card.png"
+    Image.new("RGB", (1063, 591), "navy").save(design)
+    plan = plan_gang_run([
+        {"key": "a", "width_mm": 90, "height_mm": 50, "quantity": 300},
+        {"key": "b", "width_mm": 90, "height_mm": 50, "quantity": 30},
+    ])
+    reader = PdfReader(io.BytesIO(b"".join(render_gang_pdf(plan, {"a": str(design), "b": str(design)}))))
+    forms = sum(len(group["forms"]) for group in plan["groups"])
+    assert len(reader.pages) == forms
+    width_mm = float(reader.pages[0].mediabox.width) * 25.4 / 72
+    assert abs(width_mm - PRODUCTION_PAPER_SIZES_MM["SRA3"][0]) < 0.5
@@ -0,0 +1,61 @@
+"""
+اختبارات معاينة الملابس (mockups.py و /api/studio/clothing-mockup)
+تشغيل: cd backend && python -m pytest -q test_mockups.py
+"""
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import mockups
+from routers import studio
+
+app = FastAPI()
+app.include_router(studio.router, prefix="/api/studio")
+client = TestClient(app)
+
+
+def _design_id() -> str:
+    design = io.BytesIO()
+    Image.new("RGBA", (200, 100), (255, 0, 0, 255)).save(design, format="PNG")
+    response = client.post("/api/studio/clothing-mockup/designs", files={"file": ("d.png", design.getvalue(), "image/png")})
+    assert response.status_code == 200
+    return response.json()["design_id"]
+
+
+@pytest.mark.parametrize("color", ["../../../etc/passwd", "../hoodie/front", "بنفسجي", ""])
+def test_unknown_color_is_rejected_with_422(color):
+    response = client.post("/api/studio/clothing-mockup", json={"color": color})
+    assert response.status_code == 422
+
+
+def test_template_path_never_leaves_template_dir():
+    with pytest.raises(mockups.MockupError):
+        mockups._template_path("tshirt", "../../secret", "front")
+    with pytest.raises(mockups.MockupError):
+        mockups._template_path("../tshirt", "أبيض", "front")
+    with pytest.raises(mockups.MockupError):
+        mockups.render_mockup("tshirt", "../../secret", "front", [])
+
+
+def test_render_and_cache_hit():
+    body = {
+        "garment": "hoodie",
+        "color": "كحلي",
+        "side": "front",
+        "placements": [{"location": "front", "design_id": _design_id(), "scale": 0.8}],
+    }
+    first = client.post("/api/studio/clothing-mockup", json=body)
+    second = client.post("/api/studio/clothing-mockup", json=body)
+    assert first.status_code == second.status_code == 200
+    assert first.headers["content-type"] == "image/jpeg"
+    assert (first.headers["x-mockup-cache"], second.headers["x-mockup-cache"]) == ("miss", "hit")
+    assert first.content == second.content
+    assert Image.open(io.BytesIO(first.content)).size == mockups.TEMPLATE_SIZE
+
+
+def test_expired_design_is_400():
+    body = {"placements": [{"location": "front", "design_id": "missing"}]}
+    assert client.post("/api/studio/clothing-mockup", json=body).status_code == 400
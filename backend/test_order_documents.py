@@ -0,0 +1,77 @@
+"""
+اختبارات فواتير وبطاقات عمل الطلبات (order_documents.py)
+تشغيل: cd backend && python -m pytest -q test_order_documents.py
+"""
+import asyncio
+import glob
+import io
+import os
+import shutil
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from PyPDF2 import PdfReader
+
+import arabic_text
+import order_documents
+from routers import orders
+
+# أي خط TrueType متاح على الجهاز يكفي للاختبار (الخطوط العربية تُضاف عند النشر)
+SYSTEM_FONTS = [
+    path
+    for root in ("/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~"))
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.ttf"), recursive=True))
+]
+
+
+@pytest.fixture
+def fonts(tmp_path, monkeypatch):
+    monkeypatch.setattr(arabic_text, "FONT_DIR", str(tmp_path))
+    order_documents._template.cache_clear()
+    yield tmp_path
+    order_documents._template.cache_clear()
+
+
+def _order(items: int = 3):
+    return {
+        "id": 7, "order_number": "ORD-7", "customer_name": "أحمد", "customer_phone": "0999", "shop_name": None,
+        "status": "accepted", "total_amount": 3000, "final_amount": 3000, "paid_amount": 1000,
+        "remaining_amount": 2000, "delivery_type": "delivery", "delivery_address": "دمشق",
+        "delivery_date": None, "notes": None, "created_at": datetime(2026, 1, 5, 10, 30),
+        "items": [
+            {"product_name": f"صنف {index}", "quantity": 1, "unit_price": 1000, "total_price": 1000,
+             "specifications": {"paper_size": "A4"}, "production_notes": None}
+            for index in range(items)
+        ],
+    }
+
+
+def test_missing_fonts_is_a_clear_503(fonts):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(orders._documents_response([_order()], ["invoice"], None, "x.pdf"))
+    assert error.value.status_code == 503
+    assert "خطوط" in error.value.detail
+
+
+def test_corrupt_font_is_a_clear_503(fonts):
+    (fonts / "Amiri-Regular.ttf").write_bytes(b"not a font")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(orders._documents_response([_order()], ["ticket"], None, "x.pdf"))
+    assert error.value.status_code == 503
+
+
+def test_documents_stream_with_font(fonts):
+    if not SYSTEM_FONTS:
+        pytest.skip("لا يوجد خط TrueType على الجهاز")
+    shutil.copy(SYSTEM_FONTS[0], fonts / "Amiri-Regular.ttf")
+    order_documents.prepare_templates(["invoice", "ticket"])
+
+    async def collect():
+        return b"".join([chunk async for chunk in order_documents.stream_documents(
+            [_order()], ["invoice", "ticket"], lambda order_id: f"https://example.test/api/orders/{order_id}"
+        )])
+
+    reader = PdfReader(io.BytesIO(asyncio.run(collect())))
+    assert len(reader.pages) == 2
+    assert reader.metadata.title == "Orders"
@@ -0,0 +1,77 @@
+"""
+اختبارات تصنيف صفحات PDF إلى ملونة أو أبيض وأسود (pdf_color.py)
+تشغيل: cd backend && python -m pytest -q test_pdf_color.py
+"""
+import io
+
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, StreamObject
+
+from pdf_color import classify_pdf_pages
+from production_pdf import PdfAssembler
+
+
+def _content_pdf(streams, resources=None):
+    writer = PdfWriter()
+    for data in streams:
+        writer.add_blank_page(200, 200)
+        page = writer.pages[-1]
+        stream = StreamObject()
+        stream._data = data
+        page[NameObject("/Contents")] = writer._add_object(stream)
+        if resources is not None:
+            page[NameObject("/Resources")] = resources
+    output = io.BytesIO()
+    writer.write(output)
+    output.seek(0)
+    return PdfReader(output)
+
+
+def _image_pdf(images, jpeg_quality=None):
+    assembler = PdfAssembler()
+    for image in images:
+        assembler.add_image_page(image, dpi=72, jpeg_quality=jpeg_quality)
+    return PdfReader(io.BytesIO(assembler.finish()))
+
+
+def test_content_stream_colors():
+    reader = _content_pdf([
+        b"1 0 0 rg 0 0 10 10 re f",
+        b"0.5 0.5 0.5 rg 0 0 10 10 re f 0 0 0 RG 1 1 m 5 5 l S",
+        b"0.3 0.3 0.3 1 k 0 0 10 10 re f",
+        b"0.2 0 0 0 K 1 1 m 5 5 l S",
+        b"0.4 g 0 G",
+        b"",
+    ])
+    assert classify_pdf_pages(reader) == {"color": 2, "bw": 4, "color_pages": [1, 4]}
+
+
+def test_spot_and_named_color_spaces():
+    black = ArrayObject([NameObject("/Separation"), NameObject("/Black"), NameObject("/DeviceCMYK"), NameObject("/x")])
+    gold = ArrayObject([NameObject("/Separation"), NameObject("/Gold"), NameObject("/DeviceCMYK"), NameObject("/x")])
+    resources = DictionaryObject({NameObject("/ColorSpace"): DictionaryObject({
+        NameObject("/CS0"): black, NameObject("/CS1"): gold, NameObject("/CS2"): NameObject("/DeviceRGB"),
+    })})
+    reader = _content_pdf([
+        b"/CS0 cs 1 scn 0 0 10 10 re f",
+        b"/CS1 cs 1 scn 0 0 10 10 re f",
+        b"/CS2 cs 0.2 0.2 0.2 scn 0 0 10 10 re f",
+        b"/CS2 CS 0 0.5 1 SCN 1 1 m 5 5 l S",
+    ], resources)
+    assert classify_pdf_pages(reader)["color_pages"] == [2, 4]
+
+
+def test_scanned_gray_stored_as_rgb_is_bw():
+    gray_scan = Image.new("RGB", (300, 400), "white")
+    ImageDraw.Draw(gray_scan).rectangle((20, 20, 280, 200), fill=(90, 90, 90))
+    photo = Image.new("RGB", (300, 400), "white")
+    ImageDraw.Draw(photo).ellipse((50, 50, 250, 250), fill=(200, 30, 40))
+    for quality in (None, 85):
+        result = classify_pdf_pages(_image_pdf([gray_scan, photo, gray_scan.convert("L")], jpeg_quality=quality))
+        assert result["color_pages"] == [2], quality
+
+
+def test_page_limit():
+    reader = _content_pdf([b"1 0 0 rg"] * 5)
+    assert classify_pdf_pages(reader, page_limit=2) == {"color": 2, "bw": 0, "color_pages": [1, 2]}
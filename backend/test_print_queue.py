@@ -0,0 +1,115 @@
+"""
+اختبارات طابور الطباعة (print_queue.py) - قاعدة البيانات مستبدلة بجدول في الذاكرة
+تشغيل: cd backend && python -m pytest -q test_print_queue.py
+"""
+from datetime import date, datetime
+
+import pytest
+
+from print_queue import PrintQueue, batch_id, batch_key
+
+A4_COLOR = {"paper_size": "a4", "paper_type": "glossy", "print_color": "color", "print_quality": "high"}
+A3_BW = {"paper_size": "A3", "paper_type": "plain", "print_type": "bw"}
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _Db:
+    """صفوف order_items × orders بنفس ترتيب أعمدة _ITEMS_QUERY"""
+
+    def __init__(self):
+        self.orders = {}
+        self.items = []
+        self.queries = 0
+
+    def order(self, order_id, status="pending", delivery=None, created=None):
+        self.orders[order_id] = {"status": status, "delivery": delivery, "created": created or datetime(2026, 1, order_id)}
+
+    def item(self, item_id, order_id, specs, quantity=100, status=None, service="طباعة"):
+        self.items.append({"id": item_id, "order_id": order_id, "specs": specs, "quantity": quantity, "status": status,
+                           "service": service})
+
+    def execute(self, query, params):
+        self.queries += 1
+        rows = []
+        for item in self.items:
+            order = self.orders[item["order_id"]]
+            if order["status"] not in params["order_statuses"] or (item["status"] or "pending") in params["done_statuses"]:
+                continue
+            if "order_id" in params and item["order_id"] != params["order_id"]:
+                continue
+            rows.append((
+                item["id"], item["order_id"], item["service"], item["quantity"], item["specs"], item["status"],
+                f"ORD-{item['order_id']}", "زبون", order["status"], order["delivery"], order["created"],
+            ))
+        return _Result(rows)
+
+
+@pytest.fixture
+def db():
+    db = _Db()
+    db.order(1, delivery=date(2026, 2, 10))
+    db.order(2, status="accepted", delivery=date(2026, 2, 3))
+    db.order(3, status="completed")
+    db.item(11, 1, A4_COLOR, quantity=200)
+    db.item(12, 1, A3_BW)
+    db.item(21, 2, {**A4_COLOR, "paper_size": "A4 "}, quantity=50)
+    db.item(22, 2, A4_COLOR, status="printed")
+    db.item(31, 3, A4_COLOR)
+    return db
+
+
+def test_key_normalizes_specs():
+    assert batch_key(" طباعة ", {"paper_size": "a4", "print_color": "color"}) == ("طباعة", "A4", "", "color", "")
+    assert batch_key("طباعة", None) == ("طباعة", "", "", "", "")
+    assert batch_id(batch_key("x", A4_COLOR)) == batch_id(batch_key("x", dict(A4_COLOR)))
+
+
+def test_load_groups_compatible_items_and_orders_by_delivery(db):
+    queue = PrintQueue()
+    queue.load(db)
+    batches = queue.snapshot(include_items=True)
+    assert [batch["paper_size"] for batch in batches] == ["A4", "A3"]
+    a4 = batches[0]
+    assert (a4["items_count"], a4["orders_count"], a4["total_quantity"]) == (2, 2, 250)
+    assert a4["earliest_delivery"] == date(2026, 2, 3)
+    assert [item["item_id"] for item in a4["items"]] == [21, 11]
+    assert queue.batch(a4["batch_id"])["items_count"] == 2
+    assert queue.stats()["items"] == 3
+
+
+def test_refresh_order_reindexes_one_order(db):
+    queue = PrintQueue()
+    queue.load(db)
+    db.items[0]["status"] = "printed"
+    db.item(13, 1, A3_BW, quantity=5)
+    queue.refresh_order(db, 1)
+    batches = {batch["paper_size"]: batch for batch in queue.snapshot()}
+    assert batches["A4"]["items_count"] == 1 and batches["A4"]["total_quantity"] == 50
+    assert batches["A3"]["items_count"] == 2
+
+    db.orders[2]["status"] = "completed"
+    queue.refresh_order(db, 2)
+    assert [batch["paper_size"] for batch in queue.snapshot()] == ["A3"]
+
+
+def test_refresh_before_load_does_not_query(db):
+    queue = PrintQueue()
+    queue.refresh_order(db, 1)
+    assert db.queries == 0 and queue.stats()["items"] == 0
+
+
+def test_remove_orders_and_items(db):
+    queue = PrintQueue()
+    queue.load(db)
+    queue.remove_items([12])
+    queue.remove_orders([2])
+    assert [(batch["paper_size"], batch["items_count"]) for batch in queue.snapshot()] == [("A4", 1)]
+    assert queue.stats()["orders"] == 1
+
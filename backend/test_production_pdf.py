@@ -0,0 +1,93 @@
+"""
+اختبارات كاتب PDF (production_pdf.PdfAssembler) وملف الإنتاج (ProductionJob)
+تشغيل: cd backend && python -m pytest -q test_production_pdf.py
+"""
+import io
+
+from PIL import Image
+from PyPDF2 import PdfReader
+
+import production_pdf
+from production_pdf import PdfAssembler, ProductionJob, page_at
+
+
+def _pdf(pages: int, size=(595, 842)) -> bytes:
+    images = [Image.new("RGB", size, (255, 255, 255)) for _ in range(pages)]
+    output = io.BytesIO()
+    images[0].save(output, format="PDF", save_all=True, append_images=images[1:], resolution=72)
+    return output.getvalue()
+
+
+def _nested_pdf() -> bytes:
+    """شجرة صفحات بمستويين و/MediaBox موروثة من العقدة الوسطى - كما تنتجها برامج التنضيد"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 3 >>",
+        b"<< /Type /Pages /Parent 2 0 R /Kids [5 0 R 6 0 R] /Count 2 /MediaBox [0 0 100 200] >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 400] /Rotate 90 >>",
+        b"<< /Type /Page /Parent 3 0 R >>",
+        b"<< /Type /Page /Parent 3 0 R /MediaBox [0 0 50 60] >>",
+    ]
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    output.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return output.getvalue()
+
+
+def test_page_at_walks_nested_tree_without_flattening():
+    reader = PdfReader(io.BytesIO(_nested_pdf()))
+    boxes = [[float(v) for v in page_at(reader, index).mediabox] for index in range(3)]
+    assert reader.flattened_pages is None
+    assert boxes == [[0, 0, 100, 200], [0, 0, 50, 60], [0, 0, 300, 400]]
+    assert page_at(reader, 2)["/Rotate"] == 90
+    assert boxes == [[float(v) for v in page.mediabox] for page in PdfReader(io.BytesIO(_nested_pdf())).pages]
+
+
+def test_production_job_streams_across_files(tmp_path):
+    paths = []
+    for index, count in enumerate((3, 2)):
+        path = tmp_path / f"part{index}.pdf"
+        path.write_bytes(_pdf(count))
+        paths.append(str(path))
+    job = ProductionJob(paths, "A5", "2up")
+    assert (job.page_count, job.sheet_count) == (5, 3)
+    assert job._locate(3) == (1, 0)
+    output = b"".join(job.iter_pdf())
+    assert all(reader.flattened_pages is None for reader in job._readers)
+    assert len(PdfReader(io.BytesIO(output)).pages) == 3
+
+
+def test_copied_objects_map_is_bounded(monkeypatch, tmp_path):
+    monkeypatch.setattr(production_pdf, "COPIED_OBJECTS_LIMIT", 4)
+    path = tmp_path / "lecture.pdf"
+    path.write_bytes(_pdf(12))
+    job = ProductionJob([str(path)], "A4")
+    chunks = []
+    writer_sizes = []
+    original = PdfAssembler.add_sheet
+
+    def add_sheet(self, *args, **kwargs):
+        writer_sizes.append(len(self._copied))
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(PdfAssembler, "add_sheet", add_sheet)
+    chunks.extend(job.iter_pdf())
+    assert max(writer_sizes) <= 4
+    assert len(PdfReader(io.BytesIO(b"".join(chunks))).pages) == 12
+
+
+def test_raster_pages_and_title():
+    writer = PdfAssembler(title="صور شخصية")
+    writer.add_image_page(Image.new("RGB", (600, 300), (10, 20, 30)), dpi=300, jpeg_quality=90)
+    writer.add_image_page(Image.new("L", (300, 600), 128), dpi=150)
+    data = writer.drain() + writer.finish()
+    reader = PdfReader(io.BytesIO(data))
+    assert reader.metadata.title == "صور شخصية"
+    assert [[round(float(v)) for v in page.mediabox] for page in reader.pages] == [[0, 0, 144, 72], [0, 0, 144, 288]]
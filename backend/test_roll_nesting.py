@@ -0,0 +1,58 @@
+"""
+اختبارات ترتيب قطع الفليكس والبانرات على الرولات (roll_nesting.py)
+تشغيل: cd backend && python -m pytest -q test_roll_nesting.py
+"""
+import random
+
+from roll_nesting import nest_on_roll, plan_rolls
+
+
+def _pieces(count, seed=7):
+    generator = random.Random(seed)
+    return [
+        {"key": index, "width_cm": generator.randint(20, 140), "height_cm": generator.randint(20, 300)}
+        for index in range(count)
+    ]
+
+
+def _assert_valid(result, pieces, gap, margin):
+    width = result["roll_width_cm"]
+    placed = result["placements"]
+    sizes = {piece["key"]: sorted((piece["width_cm"], piece["height_cm"])) for piece in pieces}
+    for item in placed:
+        assert sorted((item["width_cm"], item["height_cm"])) == sizes[item["key"]]
+        assert item["x_cm"] >= margin - 0.05 and item["x_cm"] + item["width_cm"] <= width - margin + 0.05
+        assert item["y_cm"] >= margin - 0.05 and item["y_cm"] + item["height_cm"] <= result["length_cm"] - margin + 0.05
+    for index, a in enumerate(placed):
+        for b in placed[index + 1:]:
+            apart = (
+                a["x_cm"] + a["width_cm"] + gap <= b["x_cm"] + 0.05 or b["x_cm"] + b["width_cm"] + gap <= a["x_cm"] + 0.05
+                or a["y_cm"] + a["height_cm"] + gap <= b["y_cm"] + 0.05 or b["y_cm"] + b["height_cm"] + gap <= a["y_cm"] + 0.05
+            )
+            assert apart, (a, b)
+
+
+def test_pieces_do_not_overlap_and_keep_the_cut_gap():
+    pieces = _pieces(60)
+    result = nest_on_roll(pieces, 160, gap_cm=1, margin_cm=2)
+    assert result["unplaced"] == [] and len(result["placements"]) == 60
+    _assert_valid(result, pieces, gap=1, margin=2)
+    assert 0 < result["waste_percent"] < 35
+
+
+def test_rotation_fits_a_tall_piece_on_a_narrow_roll():
+    pieces = [{"key": "banner", "width_cm": 300, "height_cm": 90}]
+    rotated = nest_on_roll(pieces, 100)
+    assert rotated["unplaced"] == [] and rotated["placements"][0]["rotated"]
+    assert nest_on_roll(pieces, 100, allow_rotation=False)["unplaced"] == ["banner"]
+
+
+def test_plan_picks_least_waste_and_reports_oversized():
+    pieces = [{"key": index, "width_cm": 150, "height_cm": 200} for index in range(4)]
+    pieces.append({"key": "huge", "width_cm": 400, "height_cm": 500})
+    plan = plan_rolls(pieces, roll_widths_cm=[100, 160, 320])
+    assert plan["oversized"] == ["huge"]
+    assert plan["best"]["waste_percent"] == min(option["waste_percent"] for option in plan["alternatives"])
+    # لا عرض أضيق من أصغر ضلع + الهامشين
+    assert {option["roll_width_cm"] for option in plan["alternatives"]} == {160, 320}
+    _assert_valid(plan["best"], pieces[:4], gap=1, margin=2)
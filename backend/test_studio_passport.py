@@ -0,0 +1,62 @@
+"""
+اختبارات الصور الشخصية (routers/studio.py) - remove.bg مستبدل بدالة وهمية
+تشغيل: cd backend && python -m pytest -q test_studio_passport.py
+"""
+import io
+
+import pytest
+import requests
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from routers import studio
+
+app = FastAPI()
+app.include_router(studio.router, prefix="/api/studio")
+client = TestClient(app)
+
+
+def _photo() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (600, 800), (180, 150, 120)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def _fake_remove_bg(calls, error=None):
+    def post(url, **kwargs):
+        calls.append(kwargs)
+        if error is not None:
+            raise error
+        response = requests.Response()
+        response.status_code = 200
+        output = io.BytesIO()
+        Image.new("RGBA", (600, 800), (180, 150, 120, 255)).save(output, format="PNG")
+        response._content = output.getvalue()
+        return response
+    return post
+
+
+def test_remove_bg_call_has_timeout(monkeypatch):
+    calls = []
+    monkeypatch.setattr(studio.requests, "post", _fake_remove_bg(calls))
+    response = client.post("/api/studio/passport-photos", files={"file": ("a.jpg", _photo(), "image/jpeg")})
+    assert response.status_code == 200
+    assert calls[0]["timeout"] == studio.REMOVE_BG_TIMEOUT
+
+
+@pytest.mark.parametrize("error, status", [
+    (requests.ReadTimeout("slow"), 504),
+    (requests.ConnectTimeout("slow"), 504),
+    (requests.ConnectionError("down"), 502),
+])
+def test_remove_bg_failures_map_to_gateway_errors(monkeypatch, error, status):
+    monkeypatch.setattr(studio.requests, "post", _fake_remove_bg([], error))
+    single = client.post("/api/studio/passport-photos", files={"file": ("a.jpg", _photo(), "image/jpeg")})
+    assert single.status_code == status
+    assert "إزالة الخلفية" in single.json()["detail"]
+    batch = client.post(
+        "/api/studio/passport-photos/batch",
+        files=[("files", ("a.jpg", _photo(), "image/jpeg")), ("files", ("b.jpg", _photo(), "image/jpeg"))],
+    )
+    assert batch.status_code == status
@@ -0,0 +1,85 @@
+"""
+اختبارات حماية مسارات الملفات المرفوعة (utils.resolve_upload_path) ومستخدميها في routers/orders.py
+تشغيل: cd backend && python -m pytest -q test_upload_paths.py
+"""
+import os
+
+import pytest
+from PIL import Image
+
+from utils import resolve_upload_path
+from routers import orders
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """مجلد عمل مؤقت فيه uploads/orders/ORD1 وملف سري خارج uploads"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "uploads" / "orders" / "ORD1").mkdir(parents=True)
+    Image.new("RGB", (20, 20), (255, 0, 0)).save(tmp_path / "uploads" / "orders" / "ORD1" / "design.png")
+    Image.new("RGB", (20, 20), (0, 0, 255)).save(tmp_path / "secret.png")
+    return tmp_path
+
+
+def test_valid_upload_paths(project):
+    assert resolve_upload_path("/uploads/orders/ORD1/design.png") == os.path.join("uploads", "orders", "ORD1", "design.png")
+    assert resolve_upload_path("/uploads/orders/ORD1/design.png?v=2") == os.path.join("uploads", "orders", "ORD1", "design.png")
+    assert resolve_upload_path("/uploads/orders/ORD1/../ORD1/design.png") == os.path.join("uploads", "orders", "ORD1", "design.png")
+
+
+@pytest.mark.parametrize("url", [
+    "/uploads/../secret.png",
+    "/uploads/orders/../../secret.png",
+    "/uploads/orders/ORD1/../../../secret.png?x=1",
+    "/uploads//etc/passwd",
+    "/uploads/",
+    "/uploads/..",
+    "/uploads/a\x00.png",
+    "uploads/orders/ORD1/design.png",
+    "/etc/passwd",
+    "data:image/png;base64,AAAA",
+    None,
+    42,
+])
+def test_rejected_upload_paths(project, url):
+    assert resolve_upload_path(url) is None
+
+
+def test_symlink_out_of_uploads_is_rejected(project):
+    os.symlink(project / "secret.png", project / "uploads" / "orders" / "ORD1" / "link.png")
+    assert resolve_upload_path("/uploads/orders/ORD1/link.png") is None
+
+
+def test_cmyk_conversion_ignores_traversal(project):
+    design_files = [{"url": "/uploads/orders/../../secret.png"}, {"url": "/uploads/orders/ORD1/design.png"}]
+    updated, results = orders._convert_design_files_to_cmyk(design_files, "naive")
+    assert updated[0] == design_files[0]
+    assert len(results) == 1
+    assert not (project / "print-cmyk").exists()
+    assert (project / "uploads" / "orders" / "ORD1" / "print-cmyk" / "design-cmyk.tif").is_file()
+    assert updated[1]["print_cmyk"]["url"] == "/uploads/orders/ORD1/print-cmyk/design-cmyk.tif"
+
+
+def test_design_path_helpers_ignore_traversal(project):
+    (project / "secret.pdf").write_bytes(b"%PDF-1.4")
+
+    class Item:
+        design_files = [{"url": "/uploads/../secret.pdf"}]
+
+    assert orders._local_design_paths([Item()]) == []
+    assert orders._analyze_design_documents(Item.design_files) == []
+    assert orders._check_design_files_resolution(
+        [{"url": "/uploads/../secret.png"}], {"width": 10, "height": 10}
+    ) == []
+
+
+def test_embedded_icc_profiles_are_bounded():
+    """كل ملف ICC مضمَّن مختلف يُحفظ في LRU محدود وليس في dict ينمو بلا حد"""
+    from PIL import ImageCms
+    import color_management
+
+    cache = color_management._embedded_profiles
+    for temperature in range(4000, 4000 + (cache.max_items + 10) * 50, 50):
+        profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("LAB", colorTemp=temperature))
+        assert color_management._source_profile_key(profile.tobytes()).startswith("embedded:")
+    assert len(cache) == cache.max_items
@@ -0,0 +1,59 @@
+"""
+اختبارات تصنيف user agent وكشف الزواحف (user_agents.py)
+تشغيل: cd backend && python -m pytest -q test_user_agents.py
+"""
+import pytest
+
+from user_agents import classify_user_agent, is_bot
+
+ANDROID_CHROME = (
+    "Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.6099.144 Mobile Safari/537.36"
+)
+
+
+@pytest.mark.parametrize("user_agent", [
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Googlebot-Image/1.0",
+    "AdsBot-Google (+http://www.google.com/adsbot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)",
+    "Twitterbot/1.0",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "WhatsApp/2.23.20.0 A",
+    "WhatsApp/2.2337.7 W",
+    "python-requests/2.31.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/120.0.0.0 Safari/537.36",
+])
+def test_crawlers_and_link_previews_are_bots(user_agent):
+    assert is_bot(user_agent)
+    assert classify_user_agent(user_agent)["device_type"] == "bot"
+
+
+@pytest.mark.parametrize("user_agent", [
+    ANDROID_CHROME,
+    # متصفح واتساب الداخلي: زائر حقيقي فتح رابطاً من محادثة
+    ANDROID_CHROME + " WhatsApp/2.23.20.76",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+    "Mobile/15E148 WhatsApp/23.20.79",
+    # أجهزة Cubot: "bot" داخل اسم العلامة
+    "Mozilla/5.0 (Linux; Android 12; Cubot-Note 30) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/119.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 11; CUBOT_X30) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/118.0.0.0 Mobile Safari/537.36",
+])
+def test_real_visitors_are_not_bots(user_agent):
+    assert not is_bot(user_agent)
+    assert classify_user_agent(user_agent)["device_type"] == "mobile"
+
+
+def test_browser_and_os_order():
+    edge = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36 Edg/120.0"
+    assert classify_user_agent(edge) == {"browser": "Edge", "os": "Windows", "device_type": "desktop", "is_bot": False}
+    ipad = "Mozilla/5.0 (iPad; CPU OS 17_1 like Mac OS X) AppleWebKit/605.1.15 Version/17.1 Mobile/15E148 Safari/604.1"
+    assert classify_user_agent(ipad) == {"browser": "Safari", "os": "iOS", "device_type": "tablet", "is_bot": False}
+
+
+def test_result_is_a_copy():
+    classify_user_agent(ANDROID_CHROME)["browser"] = "changed"
+    assert classify_user_agent(ANDROID_CHROME)["browser"] == "Chrome"
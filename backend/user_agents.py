@@ -0,0 +1,91 @@
+"""
+تصنيف user agent (المتصفح، نظام التشغيل، نوع الجهاز) وكشف الزواحف (bots)
+
+- الأنماط regex مُجمّعة مرة واحدة عند الاستيراد، وترتيبها مقصود: Edge و Opera و Samsung تحمل "Chrome/"
+  في نصها فتُفحص قبله، و Chrome يحمل "Safari/"، و Android يحمل "Linux"، و iOS يحمل "Mac OS X"
+- النتيجة تُحفظ في LRUCache بمفتاح النص الخام - عدد قيم user agent الحقيقية صغير، فأغلب الطلبات بدون أي regex
+- is_bot: زواحف محركات البحث، معاينات الروابط، أدوات المراقبة والمتصفحات الآلية - أحداثها لا تُخزن
+  "bot" يُطابق ككلمة مستقلة أو لاحقة اسم زاحف قبل "/" (Googlebot/، bingbot/) وليس داخل أسماء الأجهزة،
+  ومعاينة روابط واتساب فقط ("WhatsApp/" في أول النص) - متصفح واتساب الداخلي زائر حقيقي
+"""
+import re
+from typing import Dict, Optional
+
+from cache import LRUCache
+
+_BOT = re.compile(
+    r"\bbot\b|[a-z]bot/|googlebot|adsbot|crawl|spider|slurp|mediapartners|facebookexternalhit|embedly|^WhatsApp/|"
+    r"skypeuripreview|bingpreview|bytespider|ahrefs|semrush|mj12|chatgpt|perplexity|"
+    r"headlesschrome|phantomjs|puppeteer|playwright|selenium|lighthouse|pagespeed|pingdom|"
+    r"uptimerobot|statuscake|site24x7|datadog|newrelic|"
+    r"python-requests|python-urllib|aiohttp|httpx|curl/|wget|go-http-client|okhttp|java/|"
+    r"libwww|node-fetch|axios|postman|insomnia",
+    re.IGNORECASE,
+)
+
+# أسماء أجهزة ومتصفحات حقيقية تنتهي بـ "bot" - تُحذف قبل فحص _BOT
+_NOT_BOT = re.compile(r"\bcubot", re.IGNORECASE)
+
+_BROWSERS = tuple((name, re.compile(pattern)) for name, pattern in (
+    ("Edge", r"Edg(?:e|A|iOS)?/"),
+    ("Opera", r"OPR/|Opera|OPiOS/"),
+    ("Samsung Internet", r"SamsungBrowser/"),
+    ("Firefox", r"Firefox/|FxiOS/"),
+    ("Chrome", r"Chrome/|CriOS/|Chromium/"),
+    ("Safari", r"Version/[\d.]+.*Safari/"),
+))
+
+_OPERATING_SYSTEMS = tuple((name, re.compile(pattern)) for name, pattern in (
+    ("Android", r"Android"),
+    ("iOS", r"iPhone|iPad|iPod"),
+    ("Windows", r"Windows"),
+    ("ChromeOS", r"CrOS"),
+    ("macOS", r"Macintosh|Mac OS X"),
+    ("Linux", r"Linux|X11"),
+))
+
+_TABLET = re.compile(r"iPad|Tablet|Android(?!.*Mobile)", re.IGNORECASE)
+_MOBILE = re.compile(r"Mobi|iPhone|iPod|Android|Windows Phone", re.IGNORECASE)
+
+_EMPTY = {"browser": None, "os": None, "device_type": None, "is_bot": False}
+_classified = LRUCache(max_items=10000)
+
+
+def _first_match(rules, user_agent: str) -> Optional[str]:
+    for name, pattern in rules:
+        if pattern.search(user_agent):
+            return name
+    return None
+
+
+def classify_user_agent(user_agent: Optional[str]) -> Dict[str, Optional[object]]:
+    """{"browser", "os", "device_type", "is_bot"} - نسخة جديدة في كل استدعاء، فتعديلها لا يمس الذاكرة"""
+    if not user_agent:
+        return dict(_EMPTY)
+    cached = _classified.get(user_agent)
+    if cached is None:
+        if _BOT.search(_NOT_BOT.sub("", user_agent)):
+            cached = {"browser": None, "os": None, "device_type": "bot", "is_bot": True}
+        else:
+            if _TABLET.search(user_agent):
+                device_type = "tablet"
+            elif _MOBILE.search(user_agent):
+                device_type = "mobile"
+            else:
+                device_type = "desktop"
+            cached = {
+                "browser": _first_match(_BROWSERS, user_agent),
+                "os": _first_match(_OPERATING_SYSTEMS, user_agent),
+                "device_type": device_type,
+                "is_bot": False,
+            }
+        _classified.set(user_agent, cached)
+    return dict(cached)
+
+
+def is_bot(user_agent: Optional[str]) -> bool:
+    return bool(user_agent) and classify_user_agent(user_agent)["is_bot"]
+
+
+def classifier_stats() -> Dict[str, int]:
+    return _classified.stats()
@@ -2,7 +2,8 @@
 Utility functions for error handling, validation, and logging
 """
 import logging
-from typing import Dict, Any
+import os
+from typing import Dict, Any, Optional
 from fastapi import HTTPException
 
 # Setup logging
@@ -63,6 +64,25 @@ def validate_string(value: str, field_name: str, min_length: int = 1, max_length
     
     return value.strip()
 
+UPLOADS_DIR = "uploads"
+
+def resolve_upload_path(url: Any) -> Optional[str]:
+    """
+    المسار المحلي لرابط ملف مرفوع (/uploads/...) بعد التحقق من أنه داخل مجلد uploads
+    يعيد None لأي رابط آخر أو مسار يخرج من المجلد (../، مسار مطلق، رابط رمزي للخارج)
+    الروابط تأتي من design_files التي يرسلها العميل - لا تُستخدم كمسارات قبل المرور من هنا
+    """
+    if not isinstance(url, str) or not url.startswith("/uploads/") or "\x00" in url:
+        return None
+    relative = os.path.normpath(url.split("?")[0].split("#")[0][len("/uploads/"):].replace("/", os.sep))
+    if relative in (os.curdir, os.pardir) or relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+        return None
+    local_path = os.path.join(UPLOADS_DIR, relative)
+    root = os.path.realpath(UPLOADS_DIR)
+    if os.path.commonpath([root, os.path.realpath(local_path)]) != root:
+        return None
+    return local_path
+
 def success_response(data: Any = None, message: str = "تمت العملية بنجاح") -> Dict[str, Any]:
     """Standard success response"""
     response = {"success": True, "message": message}
@@ -0,0 +1,175 @@
+"""
+مجمعات العمال (worker pools) للمهام الثقيلة على المعالج
+تُشغَّل معالجة الصور خارج event loop حتى لا تتوقف بقية الطلبات أثناء فك ترميز صورة كبيرة
+
+- imaging_pool / analysis_pool: خيوط - تفرغ event loop فقط. Pillow يحرر GIL فالصور تتوازى فعلاً،
+  أما كود Python الخالص (PyPDF2، python-docx) فيبقى ملفاً واحداً في كل لحظة تحت GIL
+- run_in_process_pool: عمليات منفصلة للتحليل الخالص بـ Python - التوازي الفعلي على أكثر من نواة
+  مع مهلة تُفرض داخل العملية نفسها، وإن علقت العملية في كود C تُقتل عمليات المجمع ويُنشأ غيره
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+
+# عدد عمال معالجة الصور - Pillow يحرر GIL أثناء فك الترميز والتحويل
+IMAGING_WORKERS = int(os.getenv("IMAGING_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# عدد عمال تحليل المستندات (PDF/Word) - منفصل عن الصور حتى لا تنتظر معاينات الاستوديو خلف تحليل 30 ملف
+# هذه الخيوط تقرأ الملف وتحسب الـ hash وتبحث في cache التحليل، ثم تنتظر عملية التحليل
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(8, (os.cpu_count() or 1) * 2))))
+
+# عدد عمليات تحليل PDF/Word - 0 يعني التحليل داخل خيط العامل نفسه (بدون توازي فعلي)
+ANALYSIS_PROCESSES = int(os.getenv("ANALYSIS_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+# مهلة إضافية بعد مهلة المهمة قبل اعتبار العملية عالقة (في كود C لا يصله SIGALRM) وقتل المجمع
+PROCESS_KILL_GRACE = float(os.getenv("PROCESS_KILL_GRACE", "5"))
+
+imaging_pool = ThreadPoolExecutor(max_workers=IMAGING_WORKERS, thread_name_prefix="imaging")
+analysis_pool = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+
+_DONE = object()
+
+
+async def run_in_imaging_pool(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """تشغيل دالة متزامنة على مجمع عمال الصور وانتظار النتيجة"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(imaging_pool, partial(func, *args, **kwargs))
+
+
+async def map_in_imaging_pool(
+    func: Callable[..., Any], items: Iterable[Any], *args, window: Optional[int] = None
+) -> AsyncIterator[Any]:
+    """
+    func(item, *args) لكل عنصر بالتوازي على مجمع عمال الصور، والنتائج تُعاد بترتيب العناصر
+    لا يسبق التنفيذ الاستهلاك بأكثر من window مهمة (2 × عدد العمال افتراضياً)
+    حتى لا تتراكم نتائج مئات الصفحات في الذاكرة عندما يكون الإرسال أبطأ من الرسم
+    """
+    window = window or IMAGING_WORKERS * 2
+    remaining = iter(items)
+    pending: deque = deque()
+
+    def schedule() -> None:
+        while len(pending) < window:
+            item = next(remaining, _DONE)
+            if item is _DONE:
+                return
+            pending.append(asyncio.ensure_future(run_in_imaging_pool(func, item, *args)))
+
+    try:
+        schedule()
+        while pending:
+            result = await pending.popleft()
+            schedule()
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def run_in_analysis_pool(func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    تشغيل دالة تحليل على مجمع عمال التحليل مع مهلة اختيارية (asyncio.TimeoutError عند انتهائها)
+    ملاحظة: الخيط نفسه لا يمكن إيقافه، المهلة تحرر الطلب فقط - لذلك التحليل في العمليات
+    له مهلته الخاصة (run_in_process_pool) فلا يبقى الخيط محجوزاً بعد انتهاء الطلب
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(analysis_pool, partial(func, *args, **kwargs))
+    if timeout is None:
+        return await future
+    return await asyncio.wait_for(future, timeout=timeout)
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """المجمع يُنشأ عند أول تحليل - spawn وليس fork لأن العملية الأم فيها خيوط واتصالات قاعدة بيانات"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _on_deadline(signum, frame) -> None:
+    raise TimeoutError("انتهت مهلة المهمة في عملية التحليل")
+
+
+def _call_with_deadline(func: Callable[..., Any], timeout: float, *args) -> Any:
+    """
+    يُنفَّذ داخل عملية التحليل: SIGALRM بعد timeout يقطع كود Python الجاري (PyPDF2 مثلاً)
+    فتعود العملية للمجمع بدلاً من الاستمرار في تحليل ملف لم يعد أحد ينتظره
+    """
+    if not hasattr(signal, "setitimer"):
+        return func(*args)
+    previous = signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor, kill: bool = False) -> None:
+    """إخراج المجمع من الخدمة - المجمع التالي يُنشأ عند الطلب التالي"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    if kill:
+        # لا توجد واجهة عامة لإيقاف مهمة جارية - العمليات العالقة تُقتل مباشرة
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_in_process_pool(func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+    """
+    تشغيل func(*args) في عملية تحليل وانتظار النتيجة - متزامنة، تُستدعى من خيط على analysis_pool
+    func يجب أن تكون على مستوى وحدة، والوسائط والنتيجة قابلة للـ pickle (مسار ملف أو bytes وليس ملفاً مفتوحاً)
+    timeout: تُفرض داخل العملية (TimeoutError)، وإن لم تعد العملية خلال PROCESS_KILL_GRACE بعدها
+    تُقتل عمليات المجمع حتى لا تبقى خانات التحليل وخيط الانتظار محجوزة لملف عالق
+    """
+    if ANALYSIS_PROCESSES <= 0:
+        return func(*args)
+    pool = _get_process_pool()
+    future = None
+    try:
+        if timeout is None:
+            return pool.submit(func, *args).result()
+        future = pool.submit(_call_with_deadline, func, timeout, *args)
+        return future.result(timeout=timeout + PROCESS_KILL_GRACE)
+    except FutureTimeoutError:
+        # المهمة انتهت بمهلتها داخل العملية (TimeoutError نفسه منذ Python 3.11) - العملية سليمة
+        if future is None or future.done():
+            raise
+        print(f"⚠️ Analysis process did not stop after {timeout}s - recycling the process pool")
+        _discard_process_pool(pool, kill=True)
+        raise TimeoutError("انتهت مهلة المهمة في عملية التحليل")
+    except BrokenProcessPool:
+        # عملية ماتت (نفاد ذاكرة مثلاً) - المجمع لا يعود صالحاً، يُنشأ غيره في الطلب التالي
+        _discard_process_pool(pool)
+        raise
+
+
+def shutdown_pools() -> None:
+    """إيقاف مجمعات العمال عند إغلاق التطبيق"""
+    imaging_pool.shutdown(wait=False, cancel_futures=True)
+    analysis_pool.shutdown(wait=False, cancel_futures=True)
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,10 @@
 """
-Migration script to create analytics and order tracking tables
+Migration script to create order tracking tables
 Run this script to add:
-- visitor_tracking table
-- page_views table
 - order_status_history table
+
+The analytics fact tables (visitor_tracking, page_views) are partitioned by month and use
+dimension ids - they are created or converted by backend/migrate_partition_analytics.py
 """
 
 from sqlalchemy import create_engine, text
@@ -59,96 +60,10 @@ def run_migration():
         existing_table_names = [t[0] for t in existing_tables]
         print(f"📋 Found {len(existing_table_names)} existing tables")
         
-        # Create visitor_tracking table
-        if 'visitor_tracking' not in existing_table_names:
-            print("📊 Creating visitor_tracking table...")
-            db.execute(text("""
-                CREATE TABLE visitor_tracking (
-                    id SERIAL PRIMARY KEY,
-                    session_id VARCHAR(255) NOT NULL,
-                    user_id INTEGER REFERENCES users(id),
-                    page_path VARCHAR(500) NOT NULL,
-                    referrer TEXT,
-                    user_agent TEXT,
-                    device_type VARCHAR(50),
-                    browser VARCHAR(100),
-                    os VARCHAR(100),
-                    ip_address VARCHAR(45),
-                    country VARCHAR(100),
-                    city VARCHAR(100),
-                    time_on_page INTEGER DEFAULT 0,
-                    exit_page BOOLEAN DEFAULT FALSE,
-                    entry_page BOOLEAN DEFAULT FALSE,
-                    visit_count INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            print("✅ visitor_tracking table created")
-        else:
-            print("✅ visitor_tracking table already exists")
-        
-        # Create indexes for visitor_tracking
-        print("📊 Creating indexes for visitor_tracking...")
-        try:
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_visitor_tracking_session_id 
-                ON visitor_tracking(session_id)
-            """))
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_visitor_tracking_user_id 
-                ON visitor_tracking(user_id)
-            """))
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_visitor_tracking_created_at 
-                ON visitor_tracking(created_at)
-            """))
-            print("✅ Indexes for visitor_tracking created")
-        except Exception as e:
-            print(f"⚠️ Warning creating indexes for visitor_tracking: {e}")
-        
-        # Create page_views table
-        if 'page_views' not in existing_table_names:
-            print("📊 Creating page_views table...")
-            db.execute(text("""
-                CREATE TABLE page_views (
-                    id SERIAL PRIMARY KEY,
-                    visitor_id INTEGER REFERENCES visitor_tracking(id),
-                    session_id VARCHAR(255) NOT NULL,
-                    page_path VARCHAR(500) NOT NULL,
-                    time_spent INTEGER DEFAULT 0,
-                    scroll_depth INTEGER DEFAULT 0,
-                    actions JSONB,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            print("✅ page_views table created")
-        else:
-            print("✅ page_views table already exists")
-        
-        # Create indexes for page_views
-        print("📊 Creating indexes for page_views...")
-        try:
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_page_views_visitor_id 
-                ON page_views(visitor_id)
-            """))
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_page_views_session_id 
-                ON page_views(session_id)
-            """))
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_page_views_page_path 
-                ON page_views(page_path)
-            """))
-            db.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_page_views_created_at 
-                ON page_views(created_at)
-            """))
-            print("✅ Indexes for page_views created")
-        except Exception as e:
-            print(f"⚠️ Warning creating indexes for page_views: {e}")
-        
+        # visitor_tracking و page_views لا تُنشأ هنا: جداول مقسمة شهرياً بأعمدة أرقام الأبعاد
+        # ينشئها أو يحولها backend/migrate_partition_analytics.py (يشغله start.sh بعد هذا السكربت)
+        print("ℹ️ visitor_tracking / page_views are managed by migrate_partition_analytics.py")
+
         # Create order_status_history table
         if 'order_status_history' not in existing_table_names:
             print("📊 Creating order_status_history table...")
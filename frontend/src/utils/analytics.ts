@@ -15,73 +15,100 @@ function getSessionId(): string {
   return sessionId
 }
 
-// Track page view
-export async function trackPageView(pagePath: string, timeSpent: number = 0, scrollDepth: number = 0) {
-  try {
-    const sessionId = getSessionId()
-    
-    await fetch(`${API_BASE_URL}/analytics/page-view`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        session_id: sessionId,
-        page_path: pagePath,
-        time_spent: timeSpent,
-        scroll_depth: scrollDepth,
-      }),
-    })
-  } catch (error) {
-    console.warn('Failed to track page view:', error)
+// Events are buffered and sent together to /analytics/beacon (one request instead of one per event)
+// Compact format - see backend/analytics_beacon.py
+type BeaconEvent =
+  | ['v', string, string | null, number, number]
+  | ['p', string, number, number, number]
+  | ['a', string, string, Record<string, unknown> | null, number]
+
+const BEACON_URL = `${API_BASE_URL}/analytics/beacon`
+const FLUSH_INTERVAL_MS = 15000
+const MAX_BUFFERED_EVENTS = 50
+const MAX_BEACON_BYTES = 60000
+
+let eventBuffer: BeaconEvent[] = []
+let flushTimer: number | null = null
+
+function sendPayload(body: string) {
+  // text/plain Blob: no CORS preflight, and sendBeacon survives page unload
+  const blob = new Blob([body], { type: 'text/plain;charset=UTF-8' })
+  if (navigator.sendBeacon && navigator.sendBeacon(BEACON_URL, blob)) {
+    return
   }
+  fetch(BEACON_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'text/plain;charset=UTF-8' },
+    body,
+    keepalive: true,
+  }).catch((error) => console.warn('Failed to send analytics:', error))
+}
+
+// Send all buffered events now
+export function flushAnalytics() {
+  if (flushTimer !== null) {
+    clearTimeout(flushTimer)
+    flushTimer = null
+  }
+  if (eventBuffer.length === 0) {
+    return
+  }
+  const sessionId = getSessionId()
+  let events = eventBuffer
+  eventBuffer = []
+  // Split into chunks that fit the beacon size limit
+  while (events.length > 0) {
+    let count = events.length
+    let body = JSON.stringify({ sid: sessionId, now: Date.now(), e: events.slice(0, count) })
+    while (body.length > MAX_BEACON_BYTES && count > 1) {
+      count = Math.ceil(count / 2)
+      body = JSON.stringify({ sid: sessionId, now: Date.now(), e: events.slice(0, count) })
+    }
+    sendPayload(body)
+    events = events.slice(count)
+  }
+}
+
+function queueEvent(event: BeaconEvent) {
+  eventBuffer.push(event)
+  if (eventBuffer.length >= MAX_BUFFERED_EVENTS) {
+    flushAnalytics()
+  } else if (flushTimer === null) {
+    flushTimer = window.setTimeout(flushAnalytics, FLUSH_INTERVAL_MS)
+  }
+}
+
+// Flush when the page is hidden or closed (the last chance on mobile)
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'hidden') {
+    flushAnalytics()
+  }
+})
+window.addEventListener('pagehide', flushAnalytics)
+
+// Track page view
+export function trackPageView(pagePath: string, timeSpent: number = 0, scrollDepth: number = 0) {
+  queueEvent(['p', pagePath, timeSpent, scrollDepth, Date.now()])
 }
 
 // Track visit
-export async function trackVisit(
+export function trackVisit(
   pagePath: string,
   referrer: string | null = null,
   entryPage: boolean = false,
   exitPage: boolean = false
 ) {
-  try {
-    const sessionId = getSessionId()
-    const userAgent = navigator.userAgent
-    
-    // Get IP address from request (will be set by backend)
-    const response = await fetch(`${API_BASE_URL}/analytics/track`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        session_id: sessionId,
-        page_path: pagePath,
-        referrer: referrer,
-        user_agent: userAgent,
-        entry_page: entryPage,
-        exit_page: exitPage,
-      }),
-    })
-    
-    if (!response.ok) {
-      const errorText = await response.text()
-      console.warn('Failed to track visit:', response.status, response.statusText, errorText)
-    } else {
-      const data = await response.json()
-      if (import.meta.env.DEV) {
-        console.log('✅ Visit tracked:', pagePath, entryPage ? '(entry)' : exitPage ? '(exit)' : '', data)
-      }
-      return data
-    }
-    
-    return null
-  } catch (error) {
-    console.warn('Failed to track visit:', error)
-    return null
+  queueEvent(['v', pagePath, referrer, (entryPage ? 1 : 0) | (exitPage ? 2 : 0), Date.now()])
+  if (import.meta.env.DEV) {
+    console.log('✅ Visit queued:', pagePath, entryPage ? '(entry)' : exitPage ? '(exit)' : '')
   }
 }
 
+// Track a user action (click, form submission...) - stored with the page view of the same page
+export function trackAction(name: string, data: Record<string, unknown> | null = null, pagePath: string = window.location.pathname) {
+  queueEvent(['a', pagePath, name, data, Date.now()])
+}
+
 // Track scroll depth
 let scrollDepthTracked = 0
 export function trackScrollDepth() {